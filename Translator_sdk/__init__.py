@@ -1,5 +1,30 @@
 # ruff: noqa: F403, F405
+import importlib
+import typing
 
 from .translator_node import TranslatorNode as TranslatorNode
 
-from . import node_normalizer as node_normalizer, node_annotator as node_annotator, name_resolver as name_resolver, translator_query as translator_query
+# Submodules are imported on first access (e.g. `Translator_sdk.name_resolver`), so that `import Translator_sdk` stays
+# fast and the heavy dependencies (pandas, numpy, httpx) are only loaded by the modules that need them.
+_SUBMODULES = ('node_normalizer', 'node_annotator', 'name_resolver', 'translator_query',
+    'kp_health', 'query_cache', 'query_coalescer', 'multihop_query', 'trapi_stream', 'compiled_query',
+    'edge_normalization', 'translator_graph', 'async_client', 'single_flight', 'http_client',
+    'cassette', 'instrumentation', 'server', 'bulk_jobs', 'pipeline', 'json_codec',
+    'negative_cache', 'name_index')
+
+# `from Translator_sdk import *` keeps exporting only the original public names.
+__all__ = ['TranslatorNode', 'node_normalizer', 'node_annotator', 'name_resolver', 'translator_query']
+
+if typing.TYPE_CHECKING:
+    from . import node_normalizer as node_normalizer, node_annotator as node_annotator, name_resolver as name_resolver, translator_query as translator_query
+    from . import kp_health as kp_health, query_cache as query_cache, query_coalescer as query_coalescer, multihop_query as multihop_query, trapi_stream as trapi_stream, compiled_query as compiled_query, edge_normalization as edge_normalization, translator_graph as translator_graph, async_client as async_client, single_flight as single_flight, http_client as http_client, cassette as cassette, instrumentation as instrumentation, server as server, bulk_jobs as bulk_jobs, pipeline as pipeline, json_codec as json_codec, negative_cache as negative_cache, name_index as name_index
+
+
+def __getattr__(name:str):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULES))
@@ -0,0 +1,69 @@
+"""
+The shared HTTP connection pool used by the async API (`name_resolver.alookup`, `node_normalizer.aget_normalized_nodes`,
+`translator_query.aparallel_api_query`, ...).
+
+The async API requires the optional `httpx` package (`pip install Translator_sdk[async]`). One `httpx.AsyncClient` is
+created per event loop and reused by all async calls made from that loop, so that thousands of requests can be in
+flight on a bounded number of connections.
+
+Examples
+--------
+>>> async_client.configure(max_connections=200)
+>>> nodes = await asyncio.gather(*[name_resolver.alookup(name) for name in names])
+>>> await async_client.aclose()
+"""
+import weakref
+
+_client_kwargs = {'limits': {'max_connections': 100, 'max_keepalive_connections': 20}, 'timeout': None}
+"arguments to `httpx.AsyncClient`, set by `configure`"
+
+_clients = weakref.WeakKeyDictionary()
+"event loop : httpx.AsyncClient"
+
+
+def configure(max_connections:int=100, max_keepalive_connections:int=20, timeout:float | None=None, **client_kwargs):
+    """
+    Sets the connection pool limits and other arguments of the shared clients.
+
+    This applies to clients created afterwards, so it should be called before the first async request of an event loop
+    (or after `aclose`).
+
+    Parameters
+    ----------
+    max_connections : int
+        Maximum number of connections in the pool of each event loop. Default: 100
+    max_keepalive_connections : int
+        Maximum number of idle connections kept open. Default: 20
+    timeout : float | None
+        Request timeout in seconds. Default: None (no timeout, like `requests`)
+    **client_kwargs
+        Other arguments to `httpx.AsyncClient` (e.g. `headers` or `transport`).
+    """
+    _client_kwargs.clear()
+    _client_kwargs.update(limits={'max_connections': max_connections, 'max_keepalive_connections': max_keepalive_connections},
+            timeout=timeout, **client_kwargs)
+
+
+def get_client() -> 'httpx.AsyncClient':
+    """Returns the shared `httpx.AsyncClient` of the running event loop, creating it if needed."""
+    import asyncio
+    try:
+        import httpx
+    except ImportError:
+        raise ImportError('The async API requires httpx. Install it with `pip install httpx`.') from None
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        kwargs = dict(_client_kwargs)
+        kwargs['limits'] = httpx.Limits(**kwargs['limits'])
+        client = httpx.AsyncClient(**kwargs)
+        _clients[loop] = client
+    return client
+
+
+async def aclose():
+    """Closes the shared client of the running event loop."""
+    import asyncio
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,243 @@
+"""
+Resumable bulk resolution jobs (e.g. millions of names with `name_resolver.batch_lookup` or CURIEs with
+`node_normalizer.get_normalized_nodes`).
+
+A job reads its input file (one name or CURIE per line) in chunks, resolves each chunk, and appends one JSON line per
+input line (`{"input": ..., "result": ...}`) to its output file, in input order. After every chunk, the output is
+flushed to disk and a checkpoint (`<output>.checkpoint`) records the input and output offsets. When a job that was
+interrupted (crash, Ctrl-C) is run again, the output is truncated to the checkpointed offset, which drops a partially
+written chunk, and reading resumes after the last completed chunk. Completed chunks are never requested again and the
+output has exactly one line per input line.
+
+Examples
+--------
+>>> job = bulk_jobs.batch_lookup_job('names.txt', 'names.jsonl', chunk_size=1000, max_workers=4, only_taxa='NCBITaxon:9606')
+>>> job.run(progress=print)
+>>> for name, node in bulk_jobs.read_results('names.jsonl'):
+...     ...
+"""
+from collections import deque
+from collections.abc import Callable, Iterator
+import dataclasses
+import os
+import tempfile
+
+from . import json_codec
+from .single_flight import make_key
+from .translator_node import TranslatorNode
+
+CHECKPOINT_VERSION = 1
+
+
+def _jsonable(value):
+    """Converts dataclasses (e.g. TranslatorNode), also in lists, to dicts without their None fields."""
+    if dataclasses.is_dataclass(value):
+        return {k: v for k, v in dataclasses.asdict(value).items() if v is not None}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def read_checkpoint(path:str) -> dict | None:
+    """Returns the checkpoint stored at `path`, or None if there is none."""
+    try:
+        with open(path, 'rb') as f:
+            return json_codec.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(path:str, state:dict):
+    """Atomically replaces the checkpoint at `path`: readers see either the old or the new checkpoint."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(json_codec.dumps(state, sort_keys=True))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_results(path:str) -> Iterator[tuple[str, object]]:
+    """Yields (input, result) for every line of a job's output file."""
+    with open(path, 'rb') as f:
+        for line in f:
+            record = json_codec.loads(line)
+            yield record['input'], record['result']
+
+
+class BulkJob:
+    """
+    A resumable job that resolves every line of an input file.
+
+    Parameters
+    ----------
+    input_path : str
+        Input file, with one item (name or CURIE) per line. Blank lines are skipped.
+    output_path : str
+        Output JSON Lines file.
+    resolve : Callable[[list[str]], dict]
+        Resolves a chunk of items, returning a dict of item : result. Results must be JSON-serializable (dataclasses
+        such as TranslatorNode are converted to dicts), and items missing from the dict get a null result.
+    chunk_size : int
+        Number of items per chunk (and per checkpoint). Default: 1000
+    max_workers : int
+        Number of chunks resolved at the same time. Results are still written in input order. Default: 1
+    name : str
+        Identifies the job (the function and its arguments), so that a checkpoint is never resumed by a different job.
+        Default: 'job'
+    checkpoint_path : str | None
+        Default: `output_path + '.checkpoint'`
+    fsync : bool
+        If True, the output is synced to disk before every checkpoint, so that completed chunks survive a power loss
+        and not only a crash. Default: True
+    """
+
+    def __init__(self, input_path:str, output_path:str, resolve:Callable[[list[str]], dict], chunk_size:int=1000,
+            max_workers:int=1, name:str='job', checkpoint_path:str | None=None, fsync:bool=True):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.resolve = resolve
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.name = name
+        self.checkpoint_path = checkpoint_path if checkpoint_path is not None else output_path + '.checkpoint'
+        self.fsync = fsync
+
+    def status(self) -> dict | None:
+        """Returns the current checkpoint (items and chunks done, offsets, whether the job is done), or None."""
+        return read_checkpoint(self.checkpoint_path)
+
+    def _new_state(self) -> dict:
+        return {'version': CHECKPOINT_VERSION, 'job': self.name, 'input': os.path.abspath(self.input_path),
+            'input_size': os.path.getsize(self.input_path), 'chunk_size': self.chunk_size,
+            'input_offset': 0, 'output_offset': 0, 'items': 0, 'chunks': 0, 'done': False}
+
+    def _load_state(self, restart:bool) -> dict:
+        state = None if restart else read_checkpoint(self.checkpoint_path)
+        if state is None:
+            if not restart and os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0:
+                raise FileExistsError(f'{self.output_path} exists but has no checkpoint; use restart=True to overwrite it')
+            return self._new_state()
+        expected = self._new_state()
+        for key in ('version', 'job', 'input', 'input_size', 'chunk_size'):
+            if state.get(key) != expected[key]:
+                raise ValueError(f'The checkpoint {self.checkpoint_path} belongs to a different job or input '
+                    f'({key}: {state.get(key)!r} != {expected[key]!r}); use restart=True to start over')
+        return state
+
+    def _chunks(self, f, offset:int) -> Iterator[tuple[list[str], int]]:
+        """Yields (items, input offset after the chunk), starting at `offset`."""
+        f.seek(offset)
+        items = []
+        for line in f:
+            offset += len(line)
+            item = line.decode('utf-8').strip()
+            if item:
+                items.append(item)
+            if len(items) == self.chunk_size:
+                yield items, offset
+                items = []
+        if items:
+            yield items, offset
+
+    def run(self, restart:bool=False, progress:Callable[[dict], None] | None=None) -> dict:
+        """
+        Runs the job, or resumes it from its checkpoint, until the end of the input. Returns the final checkpoint.
+
+        Parameters
+        ----------
+        restart : bool
+            If True, ignores any checkpoint and overwrites the output. Default: False
+        progress : Callable[[dict], None] | None
+            Called with the checkpoint after every chunk.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        state = self._load_state(restart)
+        if state['done']:
+            return state
+        mode = 'r+b' if os.path.exists(self.output_path) and state['output_offset'] > 0 else 'wb'
+        with open(self.input_path, 'rb') as input_file, open(self.output_path, mode) as output:
+            # drop whatever was written after the last checkpoint
+            output.truncate(state['output_offset'])
+            output.seek(state['output_offset'])
+            executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='BulkJob')
+            try:
+                pending = deque()
+                for items, end in self._chunks(input_file, state['input_offset']):
+                    pending.append((items, end, executor.submit(self.resolve, items)))
+                    if len(pending) >= self.max_workers:
+                        self._commit(state, output, *pending.popleft(), progress)
+                while pending:
+                    self._commit(state, output, *pending.popleft(), progress)
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+        state['done'] = True
+        write_checkpoint(self.checkpoint_path, state)
+        return state
+
+    def _commit(self, state:dict, output, items:list[str], end:int, future, progress:Callable[[dict], None] | None):
+        results = future.result()
+        output.write(b''.join(json_codec.dumps({'input': item, 'result': _jsonable(results.get(item))}) + b'\n'
+            for item in items))
+        output.flush()
+        if self.fsync:
+            os.fsync(output.fileno())
+        state.update(input_offset=end, output_offset=output.tell(), items=state['items'] + len(items),
+            chunks=state['chunks'] + 1)
+        write_checkpoint(self.checkpoint_path, state)
+        if progress is not None:
+            progress(state)
+
+
+def batch_lookup_job(input_path:str, output_path:str, chunk_size:int=1000, max_workers:int=4,
+        return_top_response:bool=True, return_synonyms:bool=False, **kwargs) -> BulkJob:
+    """
+    Returns a job that resolves every name of `input_path` with `name_resolver.batch_lookup`. The results are
+    TranslatorNode dicts (or lists of them if `return_top_response` is False, or null if no CURIE was found).
+    `**kwargs` are passed to `batch_lookup` (e.g. `size`, `only_taxa` or `biolink_types`).
+    """
+    from . import name_resolver
+
+    def resolve(strings:list[str]) -> dict:
+        return name_resolver.batch_lookup(strings, return_top_response=return_top_response,
+            return_synonyms=return_synonyms, **kwargs)
+
+    return BulkJob(input_path, output_path, resolve, chunk_size, max_workers,
+        name=make_key('batch_lookup', return_top_response, return_synonyms, kwargs))
+
+
+def normalize_job(input_path:str, output_path:str, chunk_size:int=1000, max_workers:int=4,
+        return_equivalent_identifiers:bool=False, **kwargs) -> BulkJob:
+    """
+    Returns a job that normalizes every CURIE of `input_path` with `node_normalizer.get_normalized_nodes` (POST).
+    The results are TranslatorNode dicts, or null for unknown CURIEs.
+    """
+    from . import node_normalizer
+
+    def resolve(curies:list[str]) -> dict:
+        return node_normalizer.get_normalized_nodes(curies, return_equivalent_identifiers, mode='post', **kwargs)
+
+    return BulkJob(input_path, output_path, resolve, chunk_size, max_workers,
+        name=make_key('normalize', return_equivalent_identifiers, kwargs))
+
+
+def preferred_names_job(input_path:str, output_path:str, chunk_size:int=1000, max_workers:int=4, **kwargs) -> BulkJob:
+    """
+    Returns a job that maps every CURIE of `input_path` to its preferred name, like
+    `node_normalizer.get_preferred_names`: CURIEs that are unknown or have no label are mapped to themselves.
+    """
+    from . import node_normalizer
+
+    def resolve(curies:list[str]) -> dict:
+        nodes = node_normalizer.get_normalized_nodes(curies, mode='post', **kwargs)
+        return {curie: _label(nodes.get(curie), curie) for curie in curies}
+
+    return BulkJob(input_path, output_path, resolve, chunk_size, max_workers,
+        name=make_key('preferred_names', kwargs))
+
+
+def _label(node:TranslatorNode | None, curie:str) -> str:
+    if node is None or node.label is None:
+        return curie
+    return node.label
@@ -0,0 +1,423 @@
+"""
+Record and replay of HTTP traffic, for deterministic offline runs.
+
+Every request of the SDK (sync and async) goes through the transport installed in `http_client` (see
+`http_client.set_transport`):
+
+- `Transport` (passthrough): requests go to the network, nothing is recorded. This is the default.
+- `RecordTransport`: requests go to the network, and every request/response pair is appended to a `Cassette`.
+- `ReplayTransport`: responses are served from a `Cassette`, after their recorded latency (optionally scaled).
+
+A cassette is a single append-only file of compressed records, with a hash index (request key : record offsets)
+saved next to it (`<path>.idx`) when the cassette is closed. Replay looks requests up in the index and reads one
+record, so lookups don't depend on the size of the cassette. If the index is missing or out of date (e.g. after a
+crash while recording), it is rebuilt from the record headers.
+
+Requests are matched on their method, URL, query parameters (in any order) and body (`json` bodies in any key order).
+When the same request was recorded several times (e.g. a throttled response and its retry), its responses are
+replayed in the recorded order, and the last one is repeated.
+
+Examples
+--------
+>>> with cassette.use('workload.cassette', mode='record'):
+...     nodes = node_normalizer.get_normalized_nodes(curies, mode='post')
+>>> with cassette.use('workload.cassette', mode='replay', latency_scale=0):
+...     nodes = node_normalizer.get_normalized_nodes(curies, mode='post')
+"""
+from collections.abc import Iterator
+import contextlib
+import gzip
+import hashlib
+import http.client
+import json
+import os
+import struct
+import threading
+import time
+import typing
+import urllib.parse
+import zlib
+
+from . import http_client, json_codec, negative_cache
+
+if typing.TYPE_CHECKING:
+    import httpx
+    import requests
+
+_FRAME = struct.Struct('>II')
+"record frame: header size, body size"
+
+_DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'set-cookie'}
+"response headers that are not recorded (bodies are stored decoded)"
+
+MODES = ('record', 'replay', 'passthrough')
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request that is not in the cassette."""
+
+
+def _canonical_body(json_body=None, data=None, content=None, headers:dict | None=None) -> bytes:
+    if json_body is not None:
+        return json.dumps(json_body, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    body = data if data is not None else content
+    if body is None:
+        return b''
+    if isinstance(body, dict):
+        return urllib.parse.urlencode(sorted(body.items()), doseq=True).encode('utf-8')
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    headers = {k.lower(): v for k, v in (headers or {}).items()}
+    if headers.get('content-encoding') == 'gzip':
+        body = gzip.decompress(body)
+    if headers.get('content-type', '').startswith('application/json'):
+        # JSON bodies match in any key order and formatting, whichever codec encoded them
+        with contextlib.suppress(ValueError):
+            return _canonical_body(json.loads(body))
+    return bytes(body)
+
+
+def request_key(method:str, url:str, params:dict | None=None, json:object=None, data=None, content=None,
+        headers:dict | None=None, **kwargs) -> str:
+    """
+    Returns the key of a request in a cassette: a hash of the method, the URL with its query parameters sorted (those
+    of the URL and `params` alike) and the canonicalized body. The other arguments (e.g. `timeout`) are ignored.
+    """
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    for name, values in (params or {}).items():
+        for value in values if isinstance(values, (list, tuple)) else [values]:
+            if value is not None:
+                query.append((str(name), str(value)))
+    url = urllib.parse.urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urllib.parse.urlencode(sorted(query)), ''))
+    h = hashlib.blake2b(digest_size=16)
+    h.update(method.upper().encode('utf-8') + b'\0' + url.encode('utf-8') + b'\0')
+    h.update(_canonical_body(json, data, content, headers))
+    return h.hexdigest()
+
+
+class Cassette:
+    """
+    An append-only file of recorded HTTP interactions, with a hash index.
+
+    Parameters
+    ----------
+    path : str
+        The cassette file. The index is saved to `path + '.idx'`.
+    mode : str
+        'r' to read an existing cassette, 'a' to append to a cassette (created if needed). Default: 'r'
+    compress : bool
+        If True, response bodies are compressed with zlib. Default: True
+    """
+
+    def __init__(self, path:str, mode:str='r', compress:bool=True):
+        if mode not in ('r', 'a'):
+            raise ValueError("mode must be 'r' or 'a'")
+        self.path = os.path.expanduser(path)
+        self.mode = mode
+        self.compress = compress
+        if mode == 'a' and not os.path.exists(self.path):
+            open(self.path, 'wb').close()
+        self._file = open(self.path, 'rb' if mode == 'r' else 'r+b')
+        self._lock = threading.Lock()
+        self._index = {}
+        "request key : offsets of its records"
+        self._cursors = {}
+        "request key : number of times it was replayed"
+        self._dirty = False
+        self._size = self._load_index()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def _load_index(self) -> int:
+        """Loads the saved index if it matches the file, else rebuilds it. Returns the size of the valid records."""
+        size = os.path.getsize(self.path)
+        with contextlib.suppress(OSError, ValueError, KeyError):
+            with open(self.path + '.idx') as f:
+                saved = json_codec.loads(f.read())
+            if saved['size'] == size:
+                self._index = saved['index']
+                return size
+        self._index = {}
+        offset = 0
+        while offset + _FRAME.size <= size:
+            self._file.seek(offset)
+            header_size, body_size = _FRAME.unpack(self._file.read(_FRAME.size))
+            end = offset + _FRAME.size + header_size + body_size
+            if end > size:
+                break
+            try:
+                key = json_codec.loads(self._file.read(header_size))['key']
+            except (ValueError, KeyError):
+                break
+            self._index.setdefault(key, []).append(offset)
+            offset = end
+        if offset < size and self.mode == 'a':
+            # drop a partially written record
+            self._file.truncate(offset)
+        self._dirty = True
+        return offset
+
+    def __len__(self) -> int:
+        return sum(len(offsets) for offsets in self._index.values())
+
+    def __contains__(self, key:str) -> bool:
+        return key in self._index
+
+    def append(self, key:str, method:str, url:str, status:int, headers:dict, body:bytes, latency:float):
+        """Appends an interaction to the cassette."""
+        if self.mode != 'a':
+            raise ValueError('The cassette was opened for reading')
+        headers = {k: v for k, v in headers.items() if k.lower() not in _DROPPED_HEADERS}
+        encoding = None
+        if self.compress:
+            body, encoding = zlib.compress(body), 'zlib'
+        header = json_codec.dumps({'key': key, 'method': method, 'url': url, 'status': status, 'headers': headers,
+            'latency': latency, 'encoding': encoding, 'time': time.time()})
+        with self._lock:
+            self._file.seek(self._size)
+            self._file.write(_FRAME.pack(len(header), len(body)) + header + body)
+            self._file.flush()
+            self._index.setdefault(key, []).append(self._size)
+            self._size += _FRAME.size + len(header) + len(body)
+            self._dirty = True
+            self.recorded += 1
+
+    def _read(self, offset:int) -> tuple[dict, bytes]:
+        self._file.seek(offset)
+        header_size, body_size = _FRAME.unpack(self._file.read(_FRAME.size))
+        header = json_codec.loads(self._file.read(header_size))
+        body = self._file.read(body_size)
+        if header['encoding'] == 'zlib':
+            body = zlib.decompress(body)
+        return header, body
+
+    def next(self, key:str) -> tuple[dict, bytes] | None:
+        """
+        Returns the next recorded (header, body) of a request key, or None if it was not recorded. Successive calls
+        return the recorded responses in order, then repeat the last one.
+        """
+        with self._lock:
+            offsets = self._index.get(key)
+            if not offsets:
+                self.misses += 1
+                return None
+            n = self._cursors.get(key, 0)
+            self._cursors[key] = n + 1
+            self.hits += 1
+            return self._read(offsets[min(n, len(offsets) - 1)])
+
+    def rewind(self):
+        """Replays every request from its first recorded response again."""
+        with self._lock:
+            self._cursors.clear()
+
+    def __iter__(self) -> Iterator[tuple[dict, bytes]]:
+        """Yields the (header, body) of every record, in recording order."""
+        with self._lock:
+            offsets = sorted(offset for offsets in self._index.values() for offset in offsets)
+        for offset in offsets:
+            with self._lock:
+                record = self._read(offset)
+            yield record
+
+    def flush(self):
+        """Saves the index."""
+        with self._lock:
+            if not self._dirty:
+                return
+            if self.mode == 'r' and not os.access(os.path.dirname(os.path.abspath(self.path)), os.W_OK):
+                # a read-only cassette: the index is rebuilt when it is opened
+                return
+            tmp_path = f'{self.path}.idx.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(json_codec.dumps({'size': self._size, 'index': self._index}))
+            os.replace(tmp_path, self.path + '.idx')
+            self._dirty = False
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stats(self) -> dict:
+        """Returns the number of records, replayed requests (hits), unknown requests (misses) and new records."""
+        with self._lock:
+            return {'records': sum(len(offsets) for offsets in self._index.values()), 'hits': self.hits,
+                'misses': self.misses, 'recorded': self.recorded}
+
+
+class Transport:
+    """
+    Sends requests to the network (passthrough). Subclasses can record or replace the network.
+
+    `request` is called by `http_client.request` with the shared `requests.Session`, and `arequest` by
+    `http_client.arequest` with the shared `httpx.AsyncClient`, after rate limiting.
+    """
+
+    def request(self, session:'requests.Session', method:str, url:str, **kwargs) -> 'requests.Response':
+        return session.request(method, url, **kwargs)
+
+    async def arequest(self, client:'httpx.AsyncClient', method:str, url:str, **kwargs) -> 'httpx.Response':
+        return await client.request(method, url, **kwargs)
+
+    def close(self):
+        pass
+
+
+class RecordTransport(Transport):
+    """
+    Sends requests to the network and appends every request/response pair to a cassette.
+
+    Streamed responses are read in full before they are returned (from memory).
+
+    Parameters
+    ----------
+    cassette : Cassette | str
+        A cassette opened for appending, or the path of one.
+    """
+
+    def __init__(self, cassette:Cassette | str):
+        self.cassette = cassette if isinstance(cassette, Cassette) else Cassette(cassette, mode='a')
+
+    def request(self, session:'requests.Session', method:str, url:str, **kwargs) -> 'requests.Response':
+        import io
+        start = time.perf_counter()
+        response = session.request(method, url, **kwargs)
+        content = response.content
+        latency = time.perf_counter() - start
+        if kwargs.get('stream'):
+            response.raw = io.BytesIO(content)
+        self.cassette.append(request_key(method, url, **kwargs), method, url, response.status_code,
+                dict(response.headers), content, latency)
+        return response
+
+    async def arequest(self, client:'httpx.AsyncClient', method:str, url:str, **kwargs) -> 'httpx.Response':
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        content = await response.aread()
+        latency = time.perf_counter() - start
+        self.cassette.append(request_key(method, url, **kwargs), method, url, response.status_code,
+                dict(response.headers), content, latency)
+        return response
+
+    def close(self):
+        self.cassette.close()
+
+
+class ReplayTransport(Transport):
+    """
+    Serves responses from a cassette instead of the network.
+
+    Parameters
+    ----------
+    cassette : Cassette | str
+        A cassette, or the path of one.
+    latency_scale : float
+        Every response is returned after its recorded latency multiplied by this factor. Default: 1.0 (original
+        latencies); 0 replays as fast as possible.
+    passthrough_misses : bool
+        If True, requests that are not in the cassette are sent to the network; otherwise they raise `CassetteMiss`.
+        Default: False
+    """
+
+    def __init__(self, cassette:Cassette | str, latency_scale:float=1.0, passthrough_misses:bool=False):
+        self.cassette = cassette if isinstance(cassette, Cassette) else Cassette(cassette)
+        self.latency_scale = latency_scale
+        self.passthrough_misses = passthrough_misses
+
+    def _lookup(self, method:str, url:str, kwargs:dict) -> tuple[dict, bytes] | None:
+        record = self.cassette.next(request_key(method, url, **kwargs))
+        if record is None and not self.passthrough_misses:
+            raise CassetteMiss(f'{method} {url} is not in the cassette {self.cassette.path}')
+        return record
+
+    def request(self, session:'requests.Session', method:str, url:str, **kwargs) -> 'requests.Response':
+        record = self._lookup(method, url, kwargs)
+        if record is None:
+            return session.request(method, url, **kwargs)
+        header, body = record
+        if self.latency_scale:
+            time.sleep(header['latency'] * self.latency_scale)
+        return _requests_response(method, url, header, body)
+
+    async def arequest(self, client:'httpx.AsyncClient', method:str, url:str, **kwargs) -> 'httpx.Response':
+        import asyncio
+        import httpx
+        record = self._lookup(method, url, kwargs)
+        if record is None:
+            return await client.request(method, url, **kwargs)
+        header, body = record
+        if self.latency_scale:
+            await asyncio.sleep(header['latency'] * self.latency_scale)
+        return httpx.Response(header['status'], headers=header['headers'], content=body, request=httpx.Request(method, url))
+
+    def close(self):
+        self.cassette.close()
+
+
+def _requests_response(method:str, url:str, header:dict, body:bytes) -> 'requests.Response':
+    import datetime
+    import io
+    import requests
+    response = requests.Response()
+    response.status_code = header['status']
+    response.reason = http.client.responses.get(header['status'], '')
+    response.url = url
+    response.headers.update(header['headers'])
+    response._content = body
+    response._content_consumed = True
+    response.raw = io.BytesIO(body)
+    response.elapsed = datetime.timedelta(seconds=header['latency'])
+    response.request = requests.Request(method, url).prepare()
+    return response
+
+
+@contextlib.contextmanager
+def use(path:str, mode:str='replay', latency_scale:float=1.0, passthrough_misses:bool=False) -> Iterator[Transport]:
+    """
+    Installs a transport for every request of the SDK for the duration of the `with` block, then restores the
+    previous transport and saves the cassette index. The block starts with an empty `negative_cache`, so that a
+    workload sends the same requests when it is recorded and when it is replayed.
+
+    Parameters
+    ----------
+    path : str
+        The cassette file.
+    mode : str
+        'record', 'replay' or 'passthrough'. Default: 'replay'
+    latency_scale : float
+        See `ReplayTransport`. Default: 1.0
+    passthrough_misses : bool
+        See `ReplayTransport`. Default: False
+
+    Yields
+    ------
+    The installed transport (its `cassette` attribute has the statistics).
+    """
+    if mode == 'record':
+        transport = RecordTransport(path)
+    elif mode == 'replay':
+        transport = ReplayTransport(path, latency_scale, passthrough_misses)
+    elif mode == 'passthrough':
+        transport = Transport()
+    else:
+        raise ValueError(f'mode must be one of {MODES}')
+    previous = http_client.set_transport(transport)
+    previous_negative_cache = negative_cache.default_negative_cache
+    negative_cache.default_negative_cache = negative_cache.NegativeCache(ttl=previous_negative_cache.ttl,
+        enabled=previous_negative_cache.enabled)
+    try:
+        yield transport
+    finally:
+        negative_cache.default_negative_cache = previous_negative_cache
+        http_client.set_transport(previous)
+        transport.close()
@@ -0,0 +1,133 @@
+"""
+Compiled TRAPI queries for the KP fan-out in `translator_query`.
+
+When one query is sent to many KPs, the request bodies only differ in the predicate list of each edge (after
+`translator_query.optimize_query_json`) and, for sharded queries, in the slice of subject IDs. A `CompiledQuery`
+serializes the invariant parts of the query once into a byte template, and renders each KP's request body by filling
+in the predicate lists and the ID slice. This replaces a deep copy and a full JSON serialization per KP (and per shard)
+with a few small string joins. The rendered bodies are byte-for-byte what `requests.post(url, json=...)` would send
+for the optimized query.
+
+Examples
+--------
+>>> compiled = CompiledQuery(translator_query.build_query_json(gene_ids, ['biolink:Disease'], ['biolink:related_to']))
+>>> predicates = compiled.predicates_for(API_predicates['Multiomics KP - TRAPI 1.5.0'])
+>>> body = compiled.body(predicates, 0, 500)  # the first shard of 500 IDs
+"""
+import json
+import re
+
+from . import query_cache
+
+try:
+    from json.encoder import encode_basestring_ascii as _encode_string
+except ImportError:
+    _encode_string = json.dumps
+
+_PLACEHOLDER = '@@translator_sdk_placeholder_{}@@'
+_PLACEHOLDER_PATTERN = re.compile(r'"@@translator_sdk_placeholder_(\d+)@@"')
+
+
+def sharded_node(query_json:dict) -> str | None:
+    """Returns the query node with the most IDs (the node that gets sharded), or None if no node has IDs."""
+    nodes = query_json['message']['query_graph']['nodes']
+    sizes = {node_id: len(node['ids']) for node_id, node in nodes.items() if node.get('ids')}
+    if len(sizes) == 0:
+        return None
+    return max(sizes, key=sizes.get)
+
+
+def optimized_predicates(kp_predicates:list[str], predicates:list[str]) -> list[str]:
+    """
+    Returns the predicates of a query edge that the KP supports, or all of them if it supports none.
+    This is the optimization done by `translator_query.optimize_query_json`.
+    """
+    shared_predicates = list(set(kp_predicates).intersection(predicates))
+    if len(shared_predicates) > 0:
+        return shared_predicates
+    return predicates
+
+
+class CompiledQuery:
+    """
+    A TRAPI query serialized once, from which per-KP (and per-shard) request bodies are rendered.
+
+    The query is not copied, so it must not be modified while the CompiledQuery is in use.
+
+    Parameters
+    ----------
+    query_json : dict
+        A TRAPI query, e.g. the output of `translator_query.build_query_json`.
+    """
+
+    def __init__(self, query_json:dict):
+        self.query_json = query_json
+        query_graph = query_json['message']['query_graph']
+        self.edge_ids = [edge_id for edge_id, edge in query_graph['edges'].items() if 'predicates' in edge]
+        "the query edges whose predicates are optimized per KP"
+        self.edge_predicates = [query_graph['edges'][edge_id]['predicates'] for edge_id in self.edge_ids]
+        self.node_id = sharded_node(query_json)
+        "the query node whose IDs can be sharded, or None"
+        self.ids = query_graph['nodes'][self.node_id]['ids'] if self.node_id is not None else []
+
+        # Replace every variable part of the query by a placeholder string, and serialize the result once.
+        edges = dict(query_graph['edges'])
+        for i, edge_id in enumerate(self.edge_ids):
+            edges[edge_id] = {**edges[edge_id], 'predicates': _PLACEHOLDER.format(i)}
+        nodes = query_graph['nodes']
+        self._ids_slot = len(self.edge_ids)
+        if self.node_id is not None:
+            nodes = {**nodes, self.node_id: {**nodes[self.node_id], 'ids': _PLACEHOLDER.format(self._ids_slot)}}
+        skeleton = {**query_json, 'message': {**query_json['message'],
+            'query_graph': {**query_graph, 'edges': edges, 'nodes': nodes}}}
+        parts = _PLACEHOLDER_PATTERN.split(json.dumps(skeleton))
+        self._segments = [part.encode('utf-8') for part in parts[0::2]]
+        self._slots = [int(slot) for slot in parts[1::2]]
+        self._encoded_ids = [_encode_string(curie).encode('utf-8') for curie in self.ids]
+        self.base_hash = query_cache.query_hash(skeleton)
+        "a hash of the invariant parts of the query, used for cache keys"
+
+    @property
+    def n_ids(self) -> int:
+        """Number of IDs on the sharded node."""
+        return len(self.ids)
+
+    def predicates_for(self, kp_predicates:list[str]) -> list[list[str]]:
+        """Returns the optimized predicate list of every edge for a KP supporting `kp_predicates`."""
+        return [optimized_predicates(kp_predicates, predicates) for predicates in self.edge_predicates]
+
+    def body(self, predicates:list[list[str]], start:int=0, end:int | None=None) -> bytes:
+        """
+        Renders the JSON request body with the given per-edge predicates and the IDs `ids[start:end]`.
+        """
+        fills = {i: json.dumps(edge_predicates).encode('utf-8') for i, edge_predicates in enumerate(predicates)}
+        if self.node_id is not None:
+            fills[self._ids_slot] = b'[' + b', '.join(self._encoded_ids[start:end]) + b']'
+        out = [self._segments[0]]
+        for slot, segment in zip(self._slots, self._segments[1:]):
+            out.append(fills[slot])
+            out.append(segment)
+        return b''.join(out)
+
+    def to_dict(self, predicates:list[list[str]], start:int=0, end:int | None=None) -> dict:
+        """
+        Returns the query as a dict with the given per-edge predicates and IDs `ids[start:end]`, sharing all
+        unchanged parts with the original query.
+        """
+        query_graph = self.query_json['message']['query_graph']
+        edges = dict(query_graph['edges'])
+        for edge_id, edge_predicates in zip(self.edge_ids, predicates):
+            edges[edge_id] = {**edges[edge_id], 'predicates': edge_predicates}
+        nodes = query_graph['nodes']
+        if self.node_id is not None and (start != 0 or end is not None):
+            nodes = {**nodes, self.node_id: {**nodes[self.node_id], 'ids': self.ids[start:end]}}
+        return {**self.query_json, 'message': {**self.query_json['message'],
+            'query_graph': {**query_graph, 'edges': edges, 'nodes': nodes}}}
+
+    def cache_key(self, API_name:str, API_url:str, predicates:list[list[str]], start:int=0, end:int | None=None) -> str:
+        """
+        Returns a cache key for the rendered query sent to the given KP. Like `query_cache.QueryCache.key`, it does not
+        depend on the order of the IDs or predicates.
+        """
+        return query_cache.query_hash({'query': self.base_hash, 'predicates': predicates,
+            'ids': self.ids[start:end]}, API_name, API_url)
@@ -0,0 +1,188 @@
+"""
+Normalization of merged knowledge graph edges across KPs.
+
+Different KPs refer to the same concept through different CURIEs (e.g. NCBIGene vs HGNC, or MESH vs MONDO), so the
+edges merged by `translator_query.parallel_api_query` contain duplicates. `normalize_edges` collects every subject and
+object CURIE, normalizes them in a single deduplicated pass through `node_normalizer.get_normalized_nodes` (sent in
+concurrent POST batches), rewrites the edges to the canonical IDs and collapses edges that become identical, merging
+their sources and attributes.
+
+Examples
+--------
+>>> edges = translator_query.parallel_api_query(query_json, selected_APIs, APInames, API_predicates, max_workers=8)
+>>> normalized = normalize_edges(edges)
+"""
+import asyncio
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+from . import instrumentation
+from . import json_codec
+from . import node_normalizer
+from . import trapi_stream
+
+
+def collect_curies(edges:Mapping[str, dict]) -> list[str]:
+    """Returns the distinct subject and object CURIEs of the edges, in order of first appearance."""
+    curies = {}
+    for edge in edges.values():
+        for key in ('subject', 'object'):
+            curie = edge.get(key)
+            if curie is not None:
+                curies[curie] = None
+    return list(curies)
+
+
+def normalize_curies(curies:Iterable[str], batch_size:int=1000, max_workers:int=4, **kwargs) -> dict[str, str]:
+    """
+    Maps CURIEs to their canonical (preferred) identifiers using NodeNorm.
+
+    Parameters
+    ----------
+    curies : Iterable[str]
+        The CURIEs to normalize. Duplicates are only sent once.
+    batch_size : int
+        Number of CURIEs per NodeNorm request. Default: 1000
+    max_workers : int
+        Number of NodeNorm requests in flight at the same time. Default: 4
+    **kwargs
+        Other arguments to `node_normalizer.get_normalized_nodes` (e.g. `conflate`, `drug_chemical_conflate`)
+
+    Returns
+    -------
+    A dict of CURIE : canonical CURIE. CURIEs unknown to NodeNorm are mapped to themselves.
+    """
+    curies = list(dict.fromkeys(curies))
+    batches = [curies[i:i + batch_size] for i in range(0, len(curies), batch_size)]
+
+    def normalize_batch(batch:list[str]) -> dict:
+        return node_normalizer.get_normalized_nodes(batch, mode='post', **kwargs)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+        return _id_map(batches, executor.map(normalize_batch, batches))
+
+
+async def anormalize_curies(curies:Iterable[str], batch_size:int=1000, max_workers:int=4, **kwargs) -> dict[str, str]:
+    """Async version of `normalize_curies`, using `node_normalizer.aget_normalized_nodes`."""
+    curies = list(dict.fromkeys(curies))
+    batches = [curies[i:i + batch_size] for i in range(0, len(curies), batch_size)]
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def normalize_batch(batch:list[str]) -> dict:
+        async with semaphore:
+            return await node_normalizer.aget_normalized_nodes(batch, mode='post', **kwargs)
+
+    return _id_map(batches, await asyncio.gather(*[normalize_batch(batch) for batch in batches]))
+
+
+def _id_map(batches:list[list[str]], results:Iterable[dict]) -> dict[str, str]:
+    id_map = {}
+    for batch, normalized_nodes in zip(batches, results):
+        for curie in batch:
+            node = normalized_nodes.get(curie)
+            id_map[curie] = node.curie if node is not None else curie
+    return id_map
+
+
+def _json_key(value) -> bytes:
+    return json_codec.dumps(value, sort_keys=True)
+
+
+def _merge_sources(sources:list[dict], new_sources:list[dict]) -> list[dict]:
+    """Merges TRAPI edge sources, combining the upstream resources of sources with the same id and role."""
+    merged = {(source.get('resource_id'), source.get('resource_role')): dict(source) for source in sources}
+    for source in new_sources:
+        key = (source.get('resource_id'), source.get('resource_role'))
+        if key not in merged:
+            merged[key] = dict(source)
+            continue
+        upstream = merged[key].get('upstream_resource_ids') or []
+        for resource_id in source.get('upstream_resource_ids') or []:
+            if resource_id not in upstream:
+                upstream = upstream + [resource_id]
+        if upstream:
+            merged[key]['upstream_resource_ids'] = upstream
+    return list(merged.values())
+
+
+def _merge_attributes(attributes:list[dict], new_attributes:list[dict]) -> list[dict]:
+    """Concatenates edge attributes, dropping exact duplicates."""
+    seen = {_json_key(attribute) for attribute in attributes}
+    merged = list(attributes)
+    for attribute in new_attributes:
+        key = _json_key(attribute)
+        if key not in seen:
+            seen.add(key)
+            merged.append(attribute)
+    return merged
+
+
+def merge_edges(edge:dict, other:dict) -> dict:
+    """
+    Returns a copy of `edge` with the sources and attributes of `other` (an edge with the same subject, predicate,
+    object and qualifiers) merged into it.
+    """
+    merged = dict(edge)
+    if 'sources' in edge or 'sources' in other:
+        merged['sources'] = _merge_sources(edge.get('sources') or [], other.get('sources') or [])
+    if 'attributes' in edge or 'attributes' in other:
+        merged['attributes'] = _merge_attributes(edge.get('attributes') or [], other.get('attributes') or [])
+    return merged
+
+
+def normalize_edges(edges:Mapping[str, dict], id_map:dict[str, str] | None=None,
+        batch_size:int=1000, max_workers:int=4, **kwargs) -> Mapping[str, dict]:
+    """
+    Rewrites edges to canonical node IDs and collapses duplicate edges.
+
+    Two edges are duplicates if they have the same canonical subject and object, the same predicate and the same
+    qualifiers. A collapsed edge keeps the id and the other fields of the first such edge, and the union of the
+    sources and attributes of all of them.
+
+    Parameters
+    ----------
+    edges : Mapping[str, dict]
+        A dict of edge id : TRAPI edge, e.g. the output of `translator_query.parallel_api_query`.
+        This is not modified.
+    id_map : dict[str, str] | None
+        A precomputed dict of CURIE : canonical CURIE. Default: None (all CURIEs are normalized with NodeNorm).
+    batch_size : int
+        Number of CURIEs per NodeNorm request. Default: 1000
+    max_workers : int
+        Number of NodeNorm requests in flight at the same time. Default: 4
+    **kwargs
+        Other arguments to `node_normalizer.get_normalized_nodes` (e.g. `conflate`, `drug_chemical_conflate`)
+
+    Returns
+    -------
+    A dict of edge id : normalized edge. If `edges` is a `trapi_stream.EdgeStore`, the result is a new EdgeStore
+    using the same memory budget.
+
+    Examples
+    --------
+    >>> edges = {'a': {'subject': 'HGNC:5', 'predicate': 'biolink:related_to', 'object': 'MESH:D003920'},
+    ...          'b': {'subject': 'NCBIGene:1', 'predicate': 'biolink:related_to', 'object': 'MONDO:0005015'}}
+    >>> normalize_edges(edges)
+    {'a': {'subject': 'NCBIGene:1', 'predicate': 'biolink:related_to', 'object': 'MONDO:0005015'}}
+    """
+    if id_map is None:
+        id_map = normalize_curies(collect_curies(edges), batch_size=batch_size, max_workers=max_workers, **kwargs)
+    if isinstance(edges, trapi_stream.EdgeStore):
+        normalized = trapi_stream.EdgeStore(edges.budget)
+    else:
+        normalized = {}
+    edge_ids = {}
+    "collapse key : id of the edge kept for it"
+    with instrumentation.span('kg.merge', stage='normalize'):
+        for edge_id, edge in edges.items():
+            subject = id_map.get(edge.get('subject'), edge.get('subject'))
+            object_ = id_map.get(edge.get('object'), edge.get('object'))
+            edge = {**edge, 'subject': subject, 'object': object_}
+            key = (subject, edge.get('predicate'), object_, _json_key(edge.get('qualifiers') or []))
+            if key in edge_ids:
+                kept_id = edge_ids[key]
+                normalized[kept_id] = merge_edges(normalized[kept_id], edge)
+                continue
+            edge_ids[key] = edge_id
+            normalized[edge_id] = edge
+    return normalized
@@ -0,0 +1,617 @@
+"""
+The HTTP layer shared by all modules of the SDK.
+
+Every request to a Translator service (NameRes, NodeNorm, the Node Annotator, KPs, SmartAPI) goes through `request`
+(or `arequest` for the async API). Per host, requests are governed by:
+
+- a token-bucket rate limiter (`rate` requests per second, with bursts of up to `burst` requests),
+- a cap on the number of concurrent requests (`max_concurrency`), shared by threads and asyncio tasks,
+- retries of throttled responses (HTTP 429/502/503/504 by default) with jittered exponential backoff, honoring the
+  `Retry-After` header,
+- adaptive rate limiting: a rate-limited response (HTTP 429, or any retried response with a `Retry-After` header)
+  halves the host's rate, at most once per `adapt_interval`, and successful requests raise it again (additive
+  increase, multiplicative decrease). Once the host has not rate-limited requests for `recover_after` seconds, its
+  configured rate (or no limit) is restored. Server errors (502/503/504) are retried but don't lower the rate.
+
+The time spent waiting for tokens, for a concurrency slot and in backoff is recorded per host (see `get_http_stats`).
+
+`json` bodies are encoded with `json_codec`. For hosts that accept compressed request bodies (`compress_requests`,
+e.g. the `server` proxy), JSON bodies of at least `compress_min_bytes` are sent gzip-compressed; if the host rejects a
+compressed body, it is sent again uncompressed and compression is turned off for that host. Responses are negotiated
+with `Accept-Encoding: gzip, deflate` (the default of `requests` and `httpx`) and decompressed transparently.
+
+Below the limits, requests are sent by the installed transport (see `set_transport`), which can record them or replay
+them from a cassette (see `cassette`).
+
+Examples
+--------
+>>> http_client.configure_host('name-lookup.ci.transltr.io', rate=20, max_concurrency=8)
+>>> name_resolver.batch_lookup(names)
+>>> http_client.get_http_stats()
+"""
+from collections import deque
+from dataclasses import dataclass
+import email.utils
+import gzip
+import random
+import threading
+import time
+import typing
+import urllib.parse
+
+from . import async_client, instrumentation, json_codec
+
+if typing.TYPE_CHECKING:
+    import asyncio
+    import requests
+
+
+@dataclass
+class RetryPolicy:
+    """
+    When and how long to wait before retrying a request.
+    """
+
+    max_retries: int = 3
+    "Maximum number of retries of a request."
+
+    backoff: float = 0.5
+    "Base delay in seconds; the n-th retry waits a random time between 0 and backoff * 2**n seconds."
+
+    max_backoff: float = 30.0
+    "Maximum delay of a retry that has no Retry-After header."
+
+    max_retry_after: float = 120.0
+    "Maximum delay honored from a Retry-After header."
+
+    retry_statuses: tuple[int, ...] = (429, 502, 503, 504)
+    "HTTP statuses that are retried."
+
+    retry_connection_errors: bool = False
+    "If True, connection errors and timeouts are retried as well."
+
+    def delay(self, attempt:int, retry_after:float | None=None) -> float:
+        """Returns the delay before retry number `attempt` (starting at 0)."""
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+def parse_retry_after(value:str | None) -> float | None:
+    """Parses a Retry-After header (a number of seconds or an HTTP date) into a number of seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket. `reserve` takes a token (possibly going into debt) and returns how long the caller must
+    wait before using it, so that the waiting happens outside of the lock (with `time.sleep` or `asyncio.sleep`).
+
+    Parameters
+    ----------
+    rate : float | None
+        Tokens added per second. None means no limit.
+    burst : float | None
+        Maximum number of tokens. Default: max(1, rate)
+    """
+
+    def __init__(self, rate:float | None, burst:float | None=None):
+        self._lock = threading.Lock()
+        self.configure(rate, burst)
+
+    def configure(self, rate:float | None, burst:float | None=None):
+        with self._lock:
+            self.rate = rate
+            self.burst = burst if burst is not None else max(1.0, rate or 1.0)
+            self._tokens = self.burst
+            self._updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """Takes one token, returning the number of seconds to wait until it is available."""
+        with self._lock:
+            if self.rate is None:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def set_rate(self, rate:float | None):
+        """Changes the rate, keeping the current tokens."""
+        with self._lock:
+            if self.rate is not None:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+            self.rate = rate
+
+
+class ConcurrencyLimiter:
+    """
+    A semaphore shared by threads and asyncio tasks (possibly on different event loops).
+    Slots are handed to waiters in first-come, first-served order.
+    """
+
+    def __init__(self, max_concurrency:int | None):
+        self.max_concurrency = max_concurrency
+        self._available = max_concurrency
+        self._waiters = deque()
+        "threading.Event or (loop, asyncio.Future)"
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.max_concurrency is None:
+                return
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                return
+            event = threading.Event()
+            self._waiters.append(event)
+        event.wait()
+
+    async def aacquire(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.max_concurrency is None:
+                return
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                return
+            future = loop.create_future()
+            waiter = (loop, future)
+            self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    handed_over = False
+                except ValueError:
+                    handed_over = True
+            if handed_over and future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if self.max_concurrency is None:
+                return
+            if not self._waiters:
+                self._available += 1
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+        else:
+            loop, future = waiter
+            loop.call_soon_threadsafe(self._wake, future)
+
+    def _wake(self, future:'asyncio.Future'):
+        if future.cancelled():
+            # the waiter gave up after being handed the slot: pass it on
+            self.release()
+        else:
+            future.set_result(None)
+
+
+class HostLimiter:
+    """
+    Rate limit, concurrency cap, retry policy and statistics of one host.
+
+    Parameters
+    ----------
+    rate : float | None
+        Maximum number of requests per second. Default: None (no limit)
+    burst : float | None
+        Maximum number of requests sent at once after an idle period. Default: max(1, rate)
+    max_concurrency : int | None
+        Maximum number of requests in flight. Default: None (no limit)
+    retry : RetryPolicy | None
+        Default: `RetryPolicy()`
+    adaptive : bool
+        If True, rate-limited responses (HTTP 429, or a `Retry-After` header) halve the rate (down to `min_rate`), and
+        every successful request raises it by 1/rate requests per second, up to the configured `rate` (if any).
+        Default: True
+    min_rate : float
+        Lowest rate used by adaptive rate limiting. Default: 0.5
+    adapt_interval : float
+        Minimum number of seconds between two decreases of the rate, so that a burst of rate-limited responses to
+        concurrent requests only halves it once. Default: 1
+    recover_after : float
+        Number of seconds without rate-limited responses after which the configured rate (or no limit) is restored.
+        Default: 10
+    compress_requests : bool
+        If True, large JSON request bodies are sent gzip-compressed (`Content-Encoding: gzip`). Most Translator
+        services don't accept compressed bodies, so this is only for hosts known to (e.g. the `server` proxy).
+        Default: False
+    compress_min_bytes : int
+        Minimum size of the bodies that are compressed. Default: 16 KB
+    """
+
+    def __init__(self, rate:float | None=None, burst:float | None=None, max_concurrency:int | None=None,
+            retry:RetryPolicy | None=None, adaptive:bool=True, min_rate:float=0.5, adapt_interval:float=1.0,
+            recover_after:float=10.0, compress_requests:bool=False, compress_min_bytes:int=16384):
+        self.max_rate = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.slots = ConcurrencyLimiter(max_concurrency)
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.adaptive = adaptive
+        self.min_rate = min_rate
+        self.adapt_interval = adapt_interval
+        self.recover_after = recover_after
+        self._last_decrease = None
+        "time of the last decrease of the rate by adaptive rate limiting, or None if the configured rate is in use"
+        self.compress_requests = compress_requests
+        self.compress_min_bytes = compress_min_bytes
+        self._lock = threading.Lock()
+        self._recent = deque()
+        "start times of the requests of the last second, to estimate the current rate"
+        self._stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'errors': 0,
+            'rate_wait': 0.0, 'concurrency_wait': 0.0, 'backoff_wait': 0.0}
+
+    def record(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def started(self):
+        with self._lock:
+            now = time.monotonic()
+            self._recent.append(now)
+            while self._recent and self._recent[0] < now - 1.0:
+                self._recent.popleft()
+            self._stats['requests'] += 1
+
+    def throttled(self, rate_limited:bool=True):
+        """
+        Called when the host answers with a retryable status. Only rate-limited responses (`rate_limited`) lower the
+        rate, and only once per `adapt_interval`.
+        """
+        with self._lock:
+            self._stats['throttled'] += 1
+            if not (self.adaptive and rate_limited):
+                return
+            now = time.monotonic()
+            if self._last_decrease is not None and now - self._last_decrease < self.adapt_interval:
+                return
+            self._last_decrease = now
+            current = self.bucket.rate if self.bucket.rate is not None else max(len(self._recent), 2 * self.min_rate)
+            self.bucket.set_rate(max(self.min_rate, current / 2))
+
+    def succeeded(self):
+        with self._lock:
+            rate = self.bucket.rate
+            if not self.adaptive or self._last_decrease is None:
+                return
+            if time.monotonic() - self._last_decrease >= self.recover_after:
+                # no rate-limited responses for a while: back to the configured rate (or no limit)
+                self._last_decrease = None
+                self.bucket.set_rate(self.max_rate)
+                return
+            rate += 1.0 / rate
+            if self.max_rate is not None:
+                rate = min(rate, self.max_rate)
+            self.bucket.set_rate(rate)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['throttle_wait'] = stats['rate_wait'] + stats['concurrency_wait'] + stats['backoff_wait']
+        stats['rate'] = self.bucket.rate
+        stats['max_concurrency'] = self.slots.max_concurrency
+        return stats
+
+
+default_max_concurrency = 32
+"Concurrency cap of hosts that were not configured with `configure_host`."
+
+_session = None
+_session_lock = threading.Lock()
+
+_hosts = {}
+"host : HostLimiter"
+_hosts_lock = threading.Lock()
+
+_transport = None
+"The transport that sends the requests (a `cassette.Transport`), or None to send them with the session directly."
+
+
+def get_session() -> 'requests.Session':
+    """
+    Returns the `requests.Session` used for all synchronous requests (so that connections are reused).
+    `requests` is only imported when the first request is made.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            _session = requests.Session()
+            _session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=64))
+            _session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=64))
+        return _session
+
+
+def configure_host(host:str, **kwargs) -> HostLimiter:
+    """
+    Sets the limits of a host (e.g. 'nodenorm.ci.transltr.io'), replacing its current limiter and statistics.
+    The keyword arguments are those of `HostLimiter`.
+    """
+    limiter = HostLimiter(**kwargs)
+    with _hosts_lock:
+        _hosts[host] = limiter
+    return limiter
+
+
+def get_limiter(url:str) -> HostLimiter:
+    """Returns the limiter of the host of a URL, creating a default one if needed."""
+    return _host_limiter(urllib.parse.urlsplit(url).netloc)
+
+
+def _host_limiter(host:str) -> HostLimiter:
+    with _hosts_lock:
+        limiter = _hosts.get(host)
+        if limiter is None:
+            limiter = _hosts[host] = HostLimiter(max_concurrency=default_max_concurrency)
+        return limiter
+
+
+def set_transport(transport) -> object:
+    """
+    Installs a transport (e.g. `cassette.RecordTransport` or `cassette.ReplayTransport`) for all requests, or None to
+    send requests directly. Returns the previous transport.
+    """
+    global _transport
+    previous, _transport = _transport, transport
+    return previous
+
+
+def get_transport():
+    """Returns the installed transport, or None."""
+    return _transport
+
+
+def reset():
+    """Removes all host limiters and their statistics."""
+    with _hosts_lock:
+        _hosts.clear()
+
+
+def _record_transfer(host:str, kwargs:dict, response):
+    """Records the bytes sent and received by a request (if instrumentation is enabled)."""
+    body = kwargs.get('data', kwargs.get('content'))
+    if body is None and kwargs.get('json') is not None:
+        # the body that requests or httpx encoded
+        try:
+            request = response.request
+        except RuntimeError:
+            # an httpx response that was created without its request
+            request = None
+        body = getattr(request, 'body', None) or getattr(request, 'content', None)
+    if body is not None and not isinstance(body, dict):
+        instrumentation.count('http.bytes_sent', len(body), host=host)
+    length = response.headers.get('Content-Length')
+    if length is not None:
+        instrumentation.count('http.bytes_received', int(length), host=host)
+    elif not kwargs.get('stream'):
+        instrumentation.count('http.bytes_received', len(response.content), host=host)
+
+
+COMPRESSION_REJECTED_STATUSES = (400, 415, 422)
+"Statuses of a compressed request after which it is sent again uncompressed."
+
+
+def _encode_body(limiter:HostLimiter, kwargs:dict, body_argument:str) -> tuple[dict, dict | None]:
+    """
+    Encodes a `json` body with `json_codec` into `body_argument` ('data' for requests, 'content' for httpx), and
+    compresses it if the host accepts compressed bodies. Returns (kwargs to send, uncompressed kwargs or None).
+    """
+    if 'json' in kwargs:
+        kwargs = dict(kwargs)
+        value = kwargs.pop('json')
+        if value is not None:
+            kwargs[body_argument] = json_codec.dumps(value)
+            kwargs['headers'] = {'Content-Type': 'application/json', **(kwargs.get('headers') or {})}
+    body = kwargs.get(body_argument)
+    headers = kwargs.get('headers') or {}
+    names = {k.lower(): v for k, v in headers.items()}
+    if (not limiter.compress_requests or not isinstance(body, bytes) or len(body) < limiter.compress_min_bytes
+            or 'content-encoding' in names or not names.get('content-type', '').startswith('application/json')):
+        return kwargs, None
+    compressed = {**kwargs, body_argument: gzip.compress(body, compresslevel=5, mtime=0),
+        'headers': {**headers, 'Content-Encoding': 'gzip'}}
+    return compressed, kwargs
+
+
+def _rate_limited(response) -> bool:
+    """Returns True if a retryable response asks the client to slow down (as opposed to a server error)."""
+    return response.status_code == 429 or response.headers.get('Retry-After') is not None
+
+
+def _should_retry(limiter:HostLimiter, attempt:int, response=None, exception:Exception | None=None) -> bool:
+    if attempt >= limiter.retry.max_retries:
+        return False
+    if exception is not None:
+        return limiter.retry.retry_connection_errors
+    return response.status_code in limiter.retry.retry_statuses
+
+
+def request(method:str, url:str, retry:bool=True, **kwargs) -> 'requests.Response':
+    """
+    Sends a request with the shared session, subject to the limits of the URL's host.
+
+    Parameters
+    ----------
+    method : str
+        'GET', 'POST', ...
+    url : str
+    retry : bool
+        If False, throttled responses are returned as they are. Default: True
+    **kwargs
+        Other arguments to `requests.Session.request` (params, json, data, headers, timeout, stream, ...)
+
+    Returns
+    -------
+    The `requests.Response` of the last attempt.
+    """
+    import requests
+    session = get_session()
+    host = urllib.parse.urlsplit(url).netloc
+    limiter = _host_limiter(host)
+    kwargs, uncompressed = _encode_body(limiter, kwargs, 'data')
+    attempt = 0
+    while True:
+        wait = limiter.bucket.reserve()
+        if wait > 0:
+            time.sleep(wait)
+            limiter.record(rate_wait=wait)
+        start = time.perf_counter()
+        limiter.slots.acquire()
+        limiter.record(concurrency_wait=time.perf_counter() - start)
+        limiter.started()
+        try:
+            with instrumentation.span('http.request', method=method, host=host) as span:
+                transport = _transport
+                if transport is None:
+                    response = session.request(method, url, **kwargs)
+                else:
+                    response = transport.request(session, method, url, **kwargs)
+                span.tag(status=response.status_code)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            limiter.record(errors=1)
+            if not (retry and _should_retry(limiter, attempt, exception=exc)):
+                raise
+            response = None
+        finally:
+            limiter.slots.release()
+        if response is not None:
+            if instrumentation.enabled():
+                _record_transfer(host, kwargs, response)
+            if uncompressed is not None and response.status_code in COMPRESSION_REJECTED_STATUSES:
+                # the host doesn't accept compressed bodies: send this one again uncompressed, and stop compressing
+                limiter.compress_requests = False
+                kwargs, uncompressed = uncompressed, None
+                response.close()
+                continue
+            if response.status_code not in limiter.retry.retry_statuses:
+                limiter.succeeded()
+                return response
+            limiter.throttled(_rate_limited(response))
+            if not (retry and _should_retry(limiter, attempt, response)):
+                return response
+            response.close()
+        delay = limiter.retry.delay(attempt, parse_retry_after(response.headers.get('Retry-After')) if response is not None else None)
+        limiter.record(retries=1, backoff_wait=delay)
+        instrumentation.count('http.retries', host=host)
+        time.sleep(delay)
+        attempt += 1
+
+
+def get(url:str, **kwargs) -> 'requests.Response':
+    """Sends a GET request (see `request`)."""
+    return request('GET', url, **kwargs)
+
+
+def post(url:str, **kwargs) -> 'requests.Response':
+    """Sends a POST request (see `request`)."""
+    return request('POST', url, **kwargs)
+
+
+async def arequest(method:str, url:str, retry:bool=True, **kwargs):
+    """
+    Async version of `request`, using the shared `httpx.AsyncClient` of `async_client`. The host limits are shared
+    with the synchronous requests.
+
+    Returns
+    -------
+    The `httpx.Response` of the last attempt.
+    """
+    import asyncio
+    import httpx
+    client = async_client.get_client()
+    host = urllib.parse.urlsplit(url).netloc
+    limiter = _host_limiter(host)
+    kwargs, uncompressed = _encode_body(limiter, kwargs, 'content')
+    attempt = 0
+    while True:
+        wait = limiter.bucket.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+            limiter.record(rate_wait=wait)
+        start = time.perf_counter()
+        await limiter.slots.aacquire()
+        limiter.record(concurrency_wait=time.perf_counter() - start)
+        limiter.started()
+        try:
+            with instrumentation.span('http.request', method=method, host=host) as span:
+                transport = _transport
+                if transport is None:
+                    response = await client.request(method, url, **kwargs)
+                else:
+                    response = await transport.arequest(client, method, url, **kwargs)
+                span.tag(status=response.status_code)
+        except (httpx.ConnectError, httpx.TimeoutException) as exc:
+            limiter.record(errors=1)
+            if not (retry and _should_retry(limiter, attempt, exception=exc)):
+                raise
+            response = None
+        finally:
+            limiter.slots.release()
+        if response is not None:
+            if instrumentation.enabled():
+                _record_transfer(host, kwargs, response)
+            if uncompressed is not None and response.status_code in COMPRESSION_REJECTED_STATUSES:
+                limiter.compress_requests = False
+                kwargs, uncompressed = uncompressed, None
+                continue
+            if response.status_code not in limiter.retry.retry_statuses:
+                limiter.succeeded()
+                return response
+            limiter.throttled(_rate_limited(response))
+            if not (retry and _should_retry(limiter, attempt, response)):
+                return response
+        delay = limiter.retry.delay(attempt, parse_retry_after(response.headers.get('Retry-After')) if response is not None else None)
+        limiter.record(retries=1, backoff_wait=delay)
+        instrumentation.count('http.retries', host=host)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def aget(url:str, **kwargs):
+    """Sends a GET request (see `arequest`)."""
+    return await arequest('GET', url, **kwargs)
+
+
+async def apost(url:str, **kwargs):
+    """Sends a POST request (see `arequest`)."""
+    return await arequest('POST', url, **kwargs)
+
+
+def get_http_stats():
+    """
+    Returns the request statistics of every host as a pandas DataFrame, sorted by host.
+
+    Columns are host, requests, retries, throttled (responses with a retried status), errors (connection errors and
+    timeouts), rate_wait, concurrency_wait, backoff_wait and throttle_wait (their sum, in seconds), rate (the current
+    rate limit) and max_concurrency.
+    """
+    import pandas as pd
+    with _hosts_lock:
+        hosts = sorted(_hosts.items())
+    rows = [{'host': host, **limiter.stats()} for host, limiter in hosts]
+    return pd.DataFrame(rows, columns=['host', 'requests', 'retries', 'throttled', 'errors', 'rate_wait',
+        'concurrency_wait', 'backoff_wait', 'throttle_wait', 'rate', 'max_concurrency'])
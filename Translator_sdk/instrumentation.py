@@ -0,0 +1,410 @@
+"""
+Spans and metrics of the SDK's hot paths, sent to pluggable sinks.
+
+The SDK records:
+
+- spans (durations in seconds): `http.request` (per attempt, tagged with the method, host and status),
+  `json.decode` and `nodes.build` (tagged with the service), and `kg.merge` (merging KP results),
+- counts: `http.bytes_sent`, `http.bytes_received`, `http.retries`, `cache.hits` and `cache.misses` (tagged with
+  the cache), `single_flight.shared` (keys answered by another caller's request),
+- observations: `batch.size` (keys sent per batch request, tagged with the service).
+
+Nothing is recorded until a sink is added. Without sinks, `span` returns a shared no-op object and `count` and
+`observe` return immediately, so the instrumentation costs well under a microsecond per call.
+
+Sinks: `LoggingSink` (one log record per event), `HistogramSink` (in-memory histograms with percentiles) and
+`PrometheusSink` (Prometheus text exposition, optionally served over HTTP). Custom sinks implement `Sink`.
+
+Examples
+--------
+>>> histograms = instrumentation.HistogramSink()
+>>> with instrumentation.use(histograms):
+...     name_resolver.batch_lookup(names)
+>>> histograms.summary()
+>>> prometheus = instrumentation.PrometheusSink()
+>>> instrumentation.add_sink(prometheus)
+>>> prometheus.serve(port=9100)
+"""
+from bisect import bisect_left
+from collections.abc import Iterator
+import contextlib
+import logging
+import math
+import threading
+import time
+
+
+class Sink:
+    """Receives the events of the SDK. All methods may be called from several threads at once."""
+
+    def span(self, name:str, seconds:float, tags:dict):
+        pass
+
+    def count(self, name:str, value:float, tags:dict):
+        pass
+
+    def observe(self, name:str, value:float, tags:dict):
+        pass
+
+
+_sinks = ()
+"the active sinks (a tuple, replaced rather than modified, so that it can be read without a lock)"
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink:Sink) -> Sink:
+    """Starts sending events to a sink. Returns the sink."""
+    global _sinks
+    with _sinks_lock:
+        _sinks = (*_sinks, sink)
+    return sink
+
+
+def remove_sink(sink:Sink):
+    """Stops sending events to a sink."""
+    global _sinks
+    with _sinks_lock:
+        _sinks = tuple(s for s in _sinks if s is not sink)
+
+
+def enabled() -> bool:
+    """Returns True if any sink is active."""
+    return bool(_sinks)
+
+
+@contextlib.contextmanager
+def use(*sinks:Sink) -> Iterator[tuple[Sink, ...]]:
+    """Sends events to the given sinks for the duration of the `with` block."""
+    for sink in sinks:
+        add_sink(sink)
+    try:
+        yield sinks
+    finally:
+        for sink in sinks:
+            remove_sink(sink)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def tag(self, **tags):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Times a `with` block and sends its duration to the sinks. Failed blocks are tagged with the exception type."""
+
+    __slots__ = ('name', 'tags', 'start')
+
+    def __init__(self, name:str, tags:dict):
+        self.name = name
+        self.tags = tags
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.tags['error'] = exc_type.__name__
+        for sink in _sinks:
+            sink.span(self.name, seconds, self.tags)
+        return False
+
+    def tag(self, **tags):
+        """Adds tags that are only known at the end of the block (e.g. the HTTP status)."""
+        self.tags.update(tags)
+
+
+def span(name:str, **tags) -> Span:
+    """Returns a context manager timing a block as the span `name`."""
+    if not _sinks:
+        return _NOOP_SPAN
+    return Span(name, tags)
+
+
+def count(name:str, value:float=1, **tags):
+    """Adds `value` to the counter `name`."""
+    if not _sinks:
+        return
+    for sink in _sinks:
+        sink.count(name, value, tags)
+
+
+def observe(name:str, value:float, **tags):
+    """Records one observation (e.g. a batch size) of the distribution `name`."""
+    if not _sinks:
+        return
+    for sink in _sinks:
+        sink.observe(name, value, tags)
+
+
+def _format_tags(tags:dict) -> str:
+    return ' '.join(f'{k}={v}' for k, v in tags.items())
+
+
+class LoggingSink(Sink):
+    """
+    Logs every event, e.g. `span http.request 0.1234s method=GET host=nodenorm.ci.transltr.io status=200`.
+
+    Parameters
+    ----------
+    logger : logging.Logger | None
+        Default: the 'Translator_sdk.instrumentation' logger
+    level : int
+        Default: logging.DEBUG
+    """
+
+    def __init__(self, logger:logging.Logger | None=None, level:int=logging.DEBUG):
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+
+    def span(self, name:str, seconds:float, tags:dict):
+        self.logger.log(self.level, 'span %s %.4fs %s', name, seconds, _format_tags(tags))
+
+    def count(self, name:str, value:float, tags:dict):
+        self.logger.log(self.level, 'count %s %s %s', name, value, _format_tags(tags))
+
+    def observe(self, name:str, value:float, tags:dict):
+        self.logger.log(self.level, 'observe %s %s %s', name, value, _format_tags(tags))
+
+
+class Histogram:
+    """
+    A histogram with fixed bucket upper bounds, keeping the count, sum, minimum and maximum.
+
+    Percentiles are interpolated within buckets, so their precision is that of the buckets.
+    """
+
+    def __init__(self, buckets:list[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.n = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value:float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.n += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, q:float) -> float:
+        """Returns an estimate of the q-th percentile (0-100)."""
+        if self.n == 0:
+            return math.nan
+        rank = q / 100 * self.n
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else self.min
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+
+LOG_BUCKETS = [10 ** (e / 10) for e in range(-70, 91)]
+"Bucket bounds from 1e-7 to 1e9, ten per decade (about 26% apart)."
+
+
+class HistogramSink(Sink):
+    """
+    Aggregates events in memory: one histogram per span or observation name and tags, and one total per counter.
+
+    Parameters
+    ----------
+    buckets : list[float]
+        Bucket upper bounds of the histograms. Default: `LOG_BUCKETS`
+    """
+
+    def __init__(self, buckets:list[float] | None=None):
+        self.buckets = buckets or LOG_BUCKETS
+        self._histograms = {}
+        "(kind, name, sorted tags) : Histogram"
+        self._counters = {}
+        "(name, sorted tags) : total"
+        self._lock = threading.Lock()
+
+    def _add(self, kind:str, name:str, value:float, tags:dict):
+        key = (kind, name, tuple(sorted(tags.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.add(value)
+
+    def span(self, name:str, seconds:float, tags:dict):
+        self._add('span', name, seconds, tags)
+
+    def observe(self, name:str, value:float, tags:dict):
+        self._add('observe', name, value, tags)
+
+    def count(self, name:str, value:float, tags:dict):
+        key = (name, tuple(sorted(tags.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def histogram(self, name:str, **tags) -> Histogram | None:
+        """Returns the histogram of a span or observation with exactly these tags, or None."""
+        key = tuple(sorted(tags.items()))
+        with self._lock:
+            return self._histograms.get(('span', name, key)) or self._histograms.get(('observe', name, key))
+
+    def counter(self, name:str, **tags) -> float:
+        """Returns the total of a counter, summed over all tag values that are not given."""
+        with self._lock:
+            return sum(value for (counter, key), value in self._counters.items()
+                if counter == name and all(dict(key).get(k) == v for k, v in tags.items()))
+
+    def summary(self) -> list[dict]:
+        """
+        Returns one dict per histogram (kind, name, tags, count, sum, mean, min, p50, p90, p99, max) and per counter
+        (kind 'count', name, tags, sum). Span values are in seconds.
+        """
+        rows = []
+        with self._lock:
+            for (kind, name, tags), h in sorted(self._histograms.items(), key=lambda item: item[0][:2]):
+                rows.append({'kind': kind, 'name': name, 'tags': dict(tags), 'count': h.n, 'sum': h.sum,
+                    'mean': h.sum / h.n, 'min': h.min, 'p50': h.percentile(50), 'p90': h.percentile(90),
+                    'p99': h.percentile(99), 'max': h.max})
+            for (name, tags), value in sorted(self._counters.items(), key=lambda item: item[0][0]):
+                rows.append({'kind': 'count', 'name': name, 'tags': dict(tags), 'sum': value})
+        return rows
+
+    def to_dataframe(self):
+        """Returns `summary()` as a pandas DataFrame."""
+        import pandas as pd
+        return pd.DataFrame(self.summary())
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+SECONDS_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+"Bucket bounds of the Prometheus span histograms, in seconds."
+
+SIZE_BUCKETS = [1, 10, 100, 1000, 10000, 100000, 1000000]
+"Bucket bounds of the Prometheus observation histograms."
+
+
+def _metric_name(prefix:str, name:str) -> str:
+    return f'{prefix}_{name}'.replace('.', '_').replace('-', '_')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(tags:tuple, extra:str='') -> str:
+    labels = [f'{k}="{_escape(v)}"' for k, v in tags]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class PrometheusSink(Sink):
+    """
+    Keeps Prometheus counters and histograms of the events, and renders them in the text exposition format.
+
+    Spans become histograms `<prefix>_<name>_seconds`, observations histograms `<prefix>_<name>` and counts counters
+    `<prefix>_<name>_total`, with the tags as labels (e.g. `translator_sdk_http_request_seconds_bucket{host=...}`).
+
+    Parameters
+    ----------
+    prefix : str
+        Default: 'translator_sdk'
+    """
+
+    def __init__(self, prefix:str='translator_sdk'):
+        self.prefix = prefix
+        self._histograms = {}
+        "metric name : {sorted tags : Histogram}"
+        self._counters = {}
+        "metric name : {sorted tags : total}"
+        self._lock = threading.Lock()
+
+    def _add(self, metric:str, buckets:list[float], value:float, tags:dict):
+        key = tuple(sorted(tags.items()))
+        with self._lock:
+            series = self._histograms.setdefault(metric, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+            histogram.add(value)
+
+    def span(self, name:str, seconds:float, tags:dict):
+        self._add(_metric_name(self.prefix, name) + '_seconds', SECONDS_BUCKETS, seconds, tags)
+
+    def observe(self, name:str, value:float, tags:dict):
+        self._add(_metric_name(self.prefix, name), SIZE_BUCKETS, value, tags)
+
+    def count(self, name:str, value:float, tags:dict):
+        metric = _metric_name(self.prefix, name) + '_total'
+        key = tuple(sorted(tags.items()))
+        with self._lock:
+            series = self._counters.setdefault(metric, {})
+            series[key] = series.get(key, 0) + value
+
+    def exposition(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for metric, series in sorted(self._counters.items()):
+                lines.append(f'# TYPE {metric} counter')
+                for key, value in sorted(series.items()):
+                    lines.append(f'{metric}{_labels(key)} {value}')
+            for metric, series in sorted(self._histograms.items()):
+                lines.append(f'# TYPE {metric} histogram')
+                for key, h in sorted(series.items()):
+                    cumulative = 0
+                    for bound, n in zip(h.buckets, h.counts):
+                        cumulative += n
+                        le = f'le="{bound}"'
+                        lines.append(f'{metric}_bucket{_labels(key, le)} {cumulative}')
+                    le = 'le="+Inf"'
+                    lines.append(f'{metric}_bucket{_labels(key, le)} {h.n}')
+                    lines.append(f'{metric}_sum{_labels(key)} {h.sum}')
+                    lines.append(f'{metric}_count{_labels(key)} {h.n}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port:int=9100, host:str='127.0.0.1'):
+        """
+        Serves the metrics at `http://host:port/metrics` from a daemon thread, for Prometheus to scrape.
+        Returns the `http.server.ThreadingHTTPServer` (call its `shutdown` method to stop it).
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                content = sink.exposition().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='PrometheusSink', daemon=True).start()
+        return server
@@ -0,0 +1,131 @@
+"""
+The JSON codec used by all modules of the SDK to decode responses and encode request bodies, cached values and
+spilled edges.
+
+It uses `orjson` when it is installed (`pip install Translator_sdk[fast]`), which decodes large TRAPI and NodeNorm
+responses several times faster than the standard library, and the standard `json` module otherwise. Output is always
+compact UTF-8. Both codecs accept the same inputs: data that `orjson` can't decode (NaN and Infinity literals) and
+values it can't encode (non-string dict keys, integers beyond 64 bits) fall back to the standard library.
+
+The codecs differ in one respect: `orjson` encodes the non-finite floats NaN and ±Infinity as `null`, while the
+standard library writes the non-standard literals `NaN` and `Infinity`. Checking every value for them would cost more
+than orjson saves, so values holding them (e.g. cached KP responses, spilled edges, job outputs) read back as None
+when orjson is in use; set the codec to 'json' if they must round-trip.
+
+Hashes that must be stable across processes and installations (cache and cassette keys, `query_cache.query_hash`,
+`single_flight.make_key`) keep using the standard library, so that they don't depend on the installed codec.
+
+Examples
+--------
+>>> json_codec.get_codec().name
+'orjson'
+>>> previous = json_codec.set_codec('json')  # force the standard library
+>>> json_codec.loads(b'{"curies": ["MESH:D014867"]}')
+{'curies': ['MESH:D014867']}
+"""
+from collections.abc import Callable
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibCodec:
+    """The standard library `json` module."""
+
+    name = 'json'
+
+    def loads(self, data:bytes | str):
+        return json.loads(data)
+
+    def dumps(self, value, sort_keys:bool=False, default:Callable | None=None) -> bytes:
+        return json.dumps(value, sort_keys=sort_keys, separators=(',', ':'), ensure_ascii=False,
+            default=default).encode('utf-8')
+
+
+class OrjsonCodec:
+    """
+    `orjson`, falling back to the standard library for the data and values it can't handle. NaN and ±Infinity are
+    encoded as `null`.
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('OrjsonCodec requires orjson. Install it with `pip install orjson`.')
+        self._fallback = StdlibCodec()
+
+    def loads(self, data:bytes | str):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # e.g. NaN; raises the standard error if the data is not valid JSON
+            return json.loads(data)
+
+    def dumps(self, value, sort_keys:bool=False, default:Callable | None=None) -> bytes:
+        try:
+            return orjson.dumps(value, default=default, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+        except TypeError:
+            # e.g. non-string dict keys or integers beyond 64 bits (non-finite floats are encoded as null)
+            return self._fallback.dumps(value, sort_keys, default)
+
+
+CODECS = {'json': StdlibCodec, 'orjson': OrjsonCodec}
+"name : codec class"
+
+
+def _default_codec():
+    name = os.environ.get('TRANSLATOR_SDK_JSON')
+    if name is not None:
+        return CODECS[name]()
+    return OrjsonCodec() if orjson is not None else StdlibCodec()
+
+
+_codec = _default_codec()
+
+
+def get_codec():
+    """Returns the codec in use."""
+    return _codec
+
+
+def set_codec(codec) -> object:
+    """
+    Sets the codec used by the SDK: a name of `CODECS` or an object with `name`, `loads` and `dumps` methods
+    (see `StdlibCodec`). Returns the previous codec. The default is orjson if it is installed, unless the
+    `TRANSLATOR_SDK_JSON` environment variable names another codec.
+    """
+    global _codec
+    previous, _codec = _codec, CODECS[codec]() if isinstance(codec, str) else codec
+    return previous
+
+
+def loads(data:bytes | str):
+    """Decodes JSON from bytes or a string."""
+    return _codec.loads(data)
+
+
+def dumps(value, sort_keys:bool=False, default:Callable | None=None) -> bytes:
+    """Encodes a value to compact UTF-8 JSON bytes."""
+    return _codec.dumps(value, sort_keys, default)
+
+
+def response_json(response):
+    """Decodes the body of a `requests` or `httpx` response (like `response.json()`, but with the codec)."""
+    return _codec.loads(response.content)
+
+
+def parse_response(response, parse:Callable[[bytes], object] | None=None, executor=None):
+    """
+    Decodes the body of a `requests` or `httpx` response with `parse` (a function of the body, by default `loads`),
+    in `executor` (e.g. a process pool, so that parsing large responses doesn't hold the GIL) if given.
+    """
+    if parse is None:
+        return _codec.loads(response.content)
+    if executor is None:
+        return parse(response.content)
+    return executor.submit(parse, response.content).result()
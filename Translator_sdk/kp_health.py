@@ -0,0 +1,330 @@
+"""
+Rolling health statistics and circuit breakers for the KPs queried by `translator_query`.
+
+Every call made by `translator_query.query_KP` is recorded in a `KPHealthRegistry` (by default the module-level
+`default_registry`). For each KP the registry keeps a rolling window of recent calls, from which it computes latency
+percentiles, the error rate and the empty-result rate, and it runs a circuit breaker:
+
+- closed: requests are sent as usual.
+- open: the KP failed too often recently; requests are skipped until `open_seconds` have passed.
+- half_open: a single trial request is let through. If it succeeds the breaker closes, otherwise it opens again
+  (for twice as long, up to `max_open_seconds`).
+
+Examples
+--------
+>>> from Translator_sdk import kp_health
+>>> kp_health.get_kp_stats()  # a dataframe with one row per KP, for dashboards
+"""
+from collections import deque
+import math
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def _percentile(sorted_values:list[float], q:float) -> float | None:
+    """Nearest-rank percentile of an already sorted list (q between 0 and 100)."""
+    if len(sorted_values) == 0:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class KPHealth:
+    """
+    Rolling statistics and circuit-breaker state for a single KP.
+
+    Parameters
+    ----------
+    window : int
+        Number of most recent calls used for the rolling statistics. Default: 100
+    failure_threshold : float
+        The breaker opens when the error rate over the window reaches this value. Default: 0.5
+    min_calls : int
+        Minimum number of calls in the window before the error rate is considered. Default: 5
+    consecutive_failures : int
+        The breaker also opens after this many failures in a row. Default: 5
+    slow_threshold : float | None
+        If given, calls slower than this many seconds count as failures for the breaker (but not for the error rate).
+    open_seconds : float
+        How long the breaker stays open before a trial request is let through. Default: 60
+    max_open_seconds : float
+        Upper bound for the open period, which doubles each time a trial request fails. Default: 900
+    """
+
+    def __init__(self, window:int=100, failure_threshold:float=0.5, min_calls:int=5,
+            consecutive_failures:int=5, slow_threshold:float | None=None,
+            open_seconds:float=60.0, max_open_seconds:float=900.0):
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.consecutive_failures_threshold = consecutive_failures
+        self.slow_threshold = slow_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+
+        self.state = CLOSED
+        self.calls = deque(maxlen=window)
+        "(timestamp, latency, error, empty) for the most recent calls"
+        self.total_calls = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.opened_at = None
+        self.current_open_seconds = open_seconds
+        self.trial_started_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Returns True if a request to this KP should be sent now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self.opened_at < self.current_open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self.trial_started_at = now
+                return True
+            # Half-open: only one trial at a time, unless the trial never reported back.
+            if self.trial_started_at is None or now - self.trial_started_at > self.current_open_seconds:
+                self.trial_started_at = now
+                return True
+            return False
+
+    def record(self, latency:float | None, error:bool=False, empty:bool=False, error_message:str | None=None):
+        """Records the outcome of a single call."""
+        with self._lock:
+            self.calls.append((time.time(), latency, error, empty))
+            self.total_calls += 1
+            failed = error or (self.slow_threshold is not None and latency is not None and latency > self.slow_threshold)
+            if error:
+                self.last_error = error_message
+            if failed:
+                self.consecutive_failures += 1
+            else:
+                self.consecutive_failures = 0
+
+            if self.state == HALF_OPEN:
+                self.trial_started_at = None
+                if failed:
+                    self._open(backoff=True)
+                else:
+                    self.state = CLOSED
+                    self.current_open_seconds = self.open_seconds
+                    # Start with a clean window, so that old failures don't immediately trip the breaker again.
+                    self.calls.clear()
+                    self.consecutive_failures = 0
+            elif self.state == CLOSED and failed and self._should_open():
+                self._open(backoff=False)
+
+    def _should_open(self) -> bool:
+        if self.consecutive_failures >= self.consecutive_failures_threshold:
+            return True
+        if len(self.calls) < self.min_calls:
+            return False
+        errors = sum(1 for call in self.calls if call[2])
+        return errors / len(self.calls) >= self.failure_threshold
+
+    def _open(self, backoff:bool):
+        if backoff:
+            self.current_open_seconds = min(self.current_open_seconds * 2, self.max_open_seconds)
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def latency_percentile(self, q:float) -> float | None:
+        """Returns the q-th percentile (0-100) of the latencies in the rolling window, or None if there are none."""
+        with self._lock:
+            latencies = sorted(call[1] for call in self.calls if call[1] is not None)
+        return _percentile(latencies, q)
+
+    def stats(self) -> dict:
+        """Returns a dict summarizing the rolling statistics and breaker state."""
+        with self._lock:
+            calls = list(self.calls)
+            state = self.state
+            retry_in = None
+            if state == OPEN:
+                retry_in = max(0.0, self.current_open_seconds - (time.monotonic() - self.opened_at))
+            consecutive_failures = self.consecutive_failures
+            last_error = self.last_error
+            total_calls = self.total_calls
+        latencies = sorted(call[1] for call in calls if call[1] is not None)
+        n = len(calls)
+        return {
+            'state': state,
+            'calls': n,
+            'total_calls': total_calls,
+            'error_rate': sum(1 for call in calls if call[2]) / n if n else None,
+            'empty_rate': sum(1 for call in calls if call[3]) / n if n else None,
+            'latency_mean': sum(latencies) / len(latencies) if latencies else None,
+            'latency_p50': _percentile(latencies, 50),
+            'latency_p95': _percentile(latencies, 95),
+            'latency_p99': _percentile(latencies, 99),
+            'consecutive_failures': consecutive_failures,
+            'last_error': last_error,
+            'last_call': calls[-1][0] if calls else None,
+            'retry_in': retry_in,
+        }
+
+
+class ShardSizes:
+    """
+    The request sizes (number of subject IDs) learned per KP by `translator_query.query_KP_sharded`.
+
+    After a size-related failure (a timeout or HTTP 413), a KP's size is lowered to half the failed size, but not below
+    the largest size that has succeeded since. A server error that goes away once the request is split is only taken
+    as size-related if it happens again before a request of that size succeeds, so that transient errors don't
+    lower the size. After `grow_after` consecutive successful requests of the learned size it is raised by `growth`,
+    until the configured size is reached again and the KP is forgotten. Every raised size that fails again doubles the
+    number of successful requests needed before the next raise.
+
+    Parameters
+    ----------
+    grow_after : int
+        Number of successful requests of the learned size after which it is raised. Default: 8
+    growth : float
+        Factor by which the learned size is raised. Default: 1.5
+    """
+
+    def __init__(self, grow_after:int=8, growth:float=1.5):
+        self.grow_after = grow_after
+        self.growth = growth
+        self._sizes = {}
+        "API name : [learned size, consecutive successes, largest successful size, successes needed to grow]"
+        self._suspects = {}
+        "API name : size of a request whose server error went away once it was split"
+        self._lock = threading.Lock()
+
+    def get(self, API_name:str, configured:int) -> int:
+        """Returns the size to use for a KP: the smaller of `configured` and the learned size."""
+        with self._lock:
+            learned = self._sizes.get(API_name)
+            if learned is None:
+                return configured
+            if learned[0] >= configured:
+                del self._sizes[API_name]
+                return configured
+            return learned[0]
+
+    def failed(self, API_name:str, size:int):
+        """Records that a request of `size` IDs failed because of its size."""
+        with self._lock:
+            learned = self._sizes.get(API_name)
+            good = learned[2] if learned is not None and learned[2] < size else 0
+            target = max((size + 1) // 2, good)
+            if learned is None:
+                self._sizes[API_name] = [target, 0, good, self.grow_after]
+            elif target < learned[0]:
+                # if a smaller size worked, this was a raised size that failed: raise it less often
+                self._sizes[API_name] = [target, 0, good, 2 * learned[3] if good else learned[3]]
+
+    def server_error(self, API_name:str, size:int):
+        """
+        Records a server error of a request of `size` IDs that went away once the request was split. The second one
+        without a successful request of at least that size in between counts as a size-related failure.
+        """
+        with self._lock:
+            suspect = self._suspects.get(API_name)
+            if suspect is None or size < suspect:
+                self._suspects[API_name] = size
+                return
+            del self._suspects[API_name]
+        self.failed(API_name, size)
+
+    def succeeded(self, API_name:str, size:int):
+        """Records a successful request of `size` IDs."""
+        with self._lock:
+            if size >= self._suspects.get(API_name, size + 1):
+                del self._suspects[API_name]
+            learned = self._sizes.get(API_name)
+            if learned is None:
+                return
+            learned[2] = max(learned[2], size)
+            if size < learned[0]:
+                return
+            learned[1] += 1
+            if learned[1] >= learned[3]:
+                learned[0] = max(learned[0] + 1, int(learned[0] * self.growth))
+                learned[1] = 0
+
+    def learned(self) -> dict[str, int]:
+        """Returns a dict of API name : learned size, for the KPs that have one."""
+        with self._lock:
+            return {name: learned[0] for name, learned in self._sizes.items()}
+
+    def reset(self):
+        with self._lock:
+            self._sizes = {}
+            self._suspects = {}
+
+
+class KPHealthRegistry:
+    """
+    A thread-safe collection of `KPHealth` objects, one per KP name, and the `ShardSizes` learned for the KPs.
+
+    Parameters
+    ----------
+    **kp_health_kwargs
+        Passed to `KPHealth` for every KP (e.g. `open_seconds=30`, `slow_threshold=20`).
+    """
+
+    def __init__(self, **kp_health_kwargs):
+        self.kp_health_kwargs = kp_health_kwargs
+        self._kps = {}
+        self._lock = threading.Lock()
+        self.shard_sizes = ShardSizes()
+        "request sizes learned by `translator_query.query_KP_sharded`"
+
+    def get(self, API_name:str) -> KPHealth:
+        """Returns the `KPHealth` for the given KP, creating it if needed."""
+        with self._lock:
+            health = self._kps.get(API_name)
+            if health is None:
+                health = KPHealth(**self.kp_health_kwargs)
+                self._kps[API_name] = health
+            return health
+
+    def allow_request(self, API_name:str) -> bool:
+        """Returns True if the circuit breaker of the given KP lets a request through."""
+        return self.get(API_name).allow_request()
+
+    def record(self, API_name:str, latency:float | None, error:bool=False, empty:bool=False, error_message:str | None=None):
+        """Records the outcome of a call to the given KP."""
+        self.get(API_name).record(latency, error=error, empty=empty, error_message=error_message)
+
+    def stats(self) -> dict[str, dict]:
+        """Returns a dict of KP name : stats dict (see `KPHealth.stats`)."""
+        with self._lock:
+            kps = dict(self._kps)
+        return {name: health.stats() for name, health in kps.items()}
+
+    def reset(self):
+        """Forgets all statistics and learned shard sizes, and closes all breakers."""
+        with self._lock:
+            self._kps = {}
+        self.shard_sizes.reset()
+
+
+default_registry = KPHealthRegistry()
+"""The registry used by `translator_query` unless another one is passed in."""
+
+
+def get_kp_stats(registry:KPHealthRegistry | None=None):
+    """
+    Returns the rolling KP statistics as a pandas DataFrame with one row per KP, sorted by name.
+
+    Columns are API, state, calls, total_calls, error_rate, empty_rate, latency_mean, latency_p50, latency_p95,
+    latency_p99, consecutive_failures, last_error, last_call (unix time) and retry_in (seconds until an open breaker
+    lets a trial request through).
+    """
+    import pandas as pd
+    if registry is None:
+        registry = default_registry
+    rows = [{'API': name, **stats} for name, stats in sorted(registry.stats().items())]
+    return pd.DataFrame(rows, columns=['API', 'state', 'calls', 'total_calls', 'error_rate', 'empty_rate',
+        'latency_mean', 'latency_p50', 'latency_p95', 'latency_p99', 'consecutive_failures', 'last_error',
+        'last_call', 'retry_in'])
@@ -0,0 +1,166 @@
+"""
+Pipelined execution of multi-hop TRAPI queries.
+
+A multi-hop query (see `translator_query.build_multihop_query_json`) is run as a sequence of one-hop queries.
+Instead of waiting for every KP to finish a hop before starting the next one, `pipelined_multihop_query` issues the
+next hop's queries as soon as any KP returns objects for the current hop. Object IDs are deduplicated per hop and sent
+in batches, and the number of distinct nodes per hop can be capped to bound the fan-out.
+
+Examples
+--------
+>>> APInames, metaKG, API_predicates = translator_query.get_translator_API_predicates()
+>>> query_json = translator_query.build_multihop_query_json(['NCBIGene:3845'],
+...     [['biolink:Gene'], ['biolink:Disease']], [['biolink:physically_interacts_with'], ['biolink:related_to']])
+>>> result = pipelined_multihop_query(query_json, selected_APIs, APInames, API_predicates, max_intermediate_nodes=500)
+>>> result.edges[1]  # the edges of the second hop
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from . import kp_health
+from . import translator_query
+from .compiled_query import CompiledQuery
+
+
+@dataclass
+class MultihopQueryResult:
+    """
+    Results of `pipelined_multihop_query`.
+    """
+
+    edges: list[dict]
+    "For every hop, a dict of edge id : edge (merged over KPs and batches)."
+
+    node_ids: list[list[str]]
+    "For every node of the path (n00, n01, ...), the IDs that were used as subjects or returned as objects."
+
+    truncated: list[bool] = field(default_factory=list)
+    "For every node of the path, whether IDs were dropped because of `max_intermediate_nodes`."
+
+    requests: int = 0
+    "Number of one-hop sub-queries sent (one per KP and batch)."
+
+
+def _path(query_json:dict) -> list[dict]:
+    """Returns the query graph edges ordered along a linear path starting at the node with IDs."""
+    query_graph = query_json['message']['query_graph']
+    edges = list(query_graph['edges'].values())
+    start_nodes = [node_id for node_id, node in query_graph['nodes'].items() if node.get('ids')]
+    if len(start_nodes) != 1:
+        raise ValueError('A multi-hop query must have exactly one node with ids.')
+    path = []
+    current = start_nodes[0]
+    while len(path) < len(edges):
+        next_edges = [edge for edge in edges if edge['subject'] == current and edge not in path]
+        if len(next_edges) != 1:
+            raise ValueError('The query graph must be a linear path of edges starting at the node with ids.')
+        path.append(next_edges[0])
+        current = next_edges[0]['object']
+    return path
+
+
+def pipelined_multihop_query(query_json:dict, selected_APIs:list[str],
+        APInames:dict[str, str], API_predicates:dict[str, list[str]],
+        max_workers:int=8, batch_size:int=200, max_intermediate_nodes:int | None=None,
+        skip_unhealthy:bool=True, health_registry:kp_health.KPHealthRegistry | None=None,
+        **query_kwargs) -> MultihopQueryResult:
+    """
+    Runs a linear multi-hop query hop by hop, pipelining the hops.
+
+    Whenever a KP returns edges for hop k, the newly seen objects (deduplicated over the whole hop) are sent as
+    subjects of hop k+1 to every selected KP, in batches of at most `batch_size` IDs, without waiting for the other
+    KPs to finish hop k. Edges returned in the reverse direction (object is one of the queried IDs) are followed from
+    their subject.
+
+    Parameters
+    ----------
+    query_json : dict
+        A multi-hop query, e.g. the output of `translator_query.build_multihop_query_json`.
+    selected_APIs : list[str]
+        This is a list of API names (which are keys into APInames and API_predicates).
+    APInames : dict[str, str]
+        dict of API names to URLs. This is the first output of `translator_query.get_translator_API_predicates()`.
+    API_predicates : dict[str, list[str]]
+        A dict of API names to a list of their predicates. This is the third output of `get_translator_API_predicates()`.
+    max_workers : int
+        Number of sub-queries in flight at the same time. Default: 8
+    batch_size : int
+        Maximum number of subject IDs per sub-query for hops after the first. Default: 200
+    max_intermediate_nodes : int | None
+        Maximum number of distinct IDs per intermediate node; further IDs are dropped (and the node is marked as
+        truncated in the result). Default: None (no limit)
+    skip_unhealthy : bool
+        If True, KPs with an open circuit breaker are not queried. Default: True
+    health_registry
+        Where KP call statistics and breaker states are kept. Default: `kp_health.default_registry`
+    **query_kwargs
+        Other arguments to `translator_query.query_KP_sharded`, e.g. `cache`, `shard_size` or `hedge_policy`.
+
+    Returns
+    -------
+    A `MultihopQueryResult`.
+    """
+    if health_registry is None:
+        health_registry = kp_health.default_registry
+    path = _path(query_json)
+    query_graph = query_json['message']['query_graph']
+    n_hops = len(path)
+    node_names = [path[0]['subject']] + [edge['object'] for edge in path]
+    start_ids = list(dict.fromkeys(query_graph['nodes'][node_names[0]]['ids']))
+
+    result = MultihopQueryResult(edges=[{} for _ in range(n_hops)], node_ids=[start_ids] + [[] for _ in range(n_hops)],
+            truncated=[False] * (n_hops + 1))
+    seen = [set(start_ids)] + [set() for _ in range(n_hops)]
+
+    def submit(executor, hop:int, ids:list[str]) -> dict:
+        edge = path[hop]
+        # compiled once and rendered for every KP
+        sub_query = CompiledQuery(translator_query.build_query_json(ids,
+                query_graph['nodes'][edge['object']].get('categories', []), edge.get('predicates') or []))
+        id_set = set(ids)
+        futures = {}
+        for API_name_query in selected_APIs:
+            if skip_unhealthy and not health_registry.allow_request(API_name_query):
+                continue
+            future = executor.submit(translator_query.query_KP_sharded, API_name_query, sub_query, APInames,
+                    API_predicates, health_registry=health_registry, **query_kwargs)
+            futures[future] = (hop, id_set)
+            result.requests += 1
+        return futures
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = submit(executor, 0, start_ids)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            new_ids = []
+            for future in done:
+                hop, queried_ids = pending.pop(future)
+                try:
+                    message = future.result()
+                except Exception:
+                    continue
+                if message is None:
+                    continue
+                hop_edges = result.edges[hop]
+                for edge_id, edge in message['knowledge_graph']['edges'].items():
+                    translator_query.add_edge(hop_edges, edge_id, edge, len(hop_edges))
+                    next_id = edge.get('object') if edge.get('subject') in queried_ids else edge.get('subject')
+                    if next_id is None or next_id in seen[hop + 1]:
+                        continue
+                    if hop + 1 == n_hops:
+                        # The last node is not queried any further, so it is not capped.
+                        seen[n_hops].add(next_id)
+                        result.node_ids[n_hops].append(next_id)
+                    elif max_intermediate_nodes is not None and len(seen[hop + 1]) >= max_intermediate_nodes:
+                        result.truncated[hop + 1] = True
+                    else:
+                        seen[hop + 1].add(next_id)
+                        new_ids.append((hop + 1, next_id))
+
+            # Send the newly seen IDs on to the next hop straight away.
+            for hop in range(1, n_hops):
+                ids = [curie for h, curie in new_ids if h == hop]
+                result.node_ids[hop].extend(ids)
+                for i in range(0, len(ids), batch_size):
+                    pending.update(submit(executor, hop, ids[i:i + batch_size]))
+    return result
@@ -0,0 +1,649 @@
+"""
+An offline name index for autocomplete and fuzzy name lookup, e.g. on every keystroke of a UI, without a NameRes
+round trip per character.
+
+The index is built once (`build_index`) from NameRes results (`name_resolver.lookup`, `batch_lookup` or `synonyms`
+with synonyms, as raw dicts or TranslatorNodes) or from a NameRes bulk dump (`read_dump`), and written to one file
+that `NameIndex` memory-maps, so that opening it is instantaneous and the pages are shared by all processes using it.
+It holds:
+
+- a compressed (radix) trie of the normalized names (labels and synonyms, and their suffixes starting at each word,
+  so that 'leuk' also finds 'acute myeloid leukemia'). Every trie node stores its range of names and, for large
+  ranges, its best-ranked nodes, so that a prefix query costs one walk down the trie;
+- an index of the character trigrams of every name, for fuzzy matches (typos, word order);
+- the nodes (CURIE, label, biolink types and taxa), with their type and taxon sets numbered so that filters don't
+  decode them.
+
+Names are ranked by whether they are the label, where the match starts (first word or a later one), the length of
+the name, and the number of equivalent identifiers of the node (the NameRes `clique_identifier_count`).
+
+Examples
+--------
+>>> records = name_resolver.synonyms(curies)  # or read_dump('nameres_dump.jsonl')
+>>> name_index.build_index(records.values(), 'names.idx')
+>>> index = name_index.NameIndex('names.idx')
+>>> index.complete('acute myel', limit=5, biolink_types=['biolink:Disease'])
+[TranslatorNode(curie='MONDO:0018874', label='acute myeloid leukemia', ...), ...]
+>>> index.fuzzy('leukaemia myeloid')
+>>> index.lookup('IFNG', only_taxa='NCBITaxon:9606')  # falls back to name_resolver.lookup if nothing matches
+"""
+from array import array
+from collections import Counter
+from collections.abc import Iterable, Iterator
+import bisect
+import dataclasses
+import heapq
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import unicodedata
+import zlib
+
+from . import json_codec
+from .translator_node import TranslatorNode
+
+MAGIC = b'TCTNAMES'
+FORMAT_VERSION = 1
+
+MAX_SUFFIXES = 8
+"Number of words of a name at which a match can start."
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+_LABEL = 1
+_SUFFIX = 2
+
+
+def normalize_name(name:str) -> str:
+    """Returns the form of a name that is indexed and matched: case-folded, without accents and punctuation."""
+    if not name.isascii():
+        name = unicodedata.normalize('NFKD', name)
+        name = ''.join(c for c in name if not unicodedata.combining(c))
+    return _NON_WORD.sub(' ', name.casefold()).strip()
+
+
+def _trigrams(key:str) -> set[str]:
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _record_fields(record) -> tuple[str, str | None, list[str], list[str], list[str], int]:
+    """Returns (curie, label, synonyms, types, taxa, number of identifiers) of a NameRes result or TranslatorNode."""
+    if dataclasses.is_dataclass(record):
+        record = {k: v for k, v in dataclasses.asdict(record).items() if v is not None}
+    node = TranslatorNode.from_dict(record, return_synonyms=True)
+    label = node.label if node.label is not None else record.get('preferred_name')
+    count = record.get('clique_identifier_count') or len(record.get('curie_synonyms') or ()) or 1
+    return node.curie, label, node.synonyms or [], node.types or [], node.taxa or [], count
+
+
+def read_dump(path:str) -> Iterator[dict]:
+    """
+    Yields the records of a NameRes dump in JSON Lines (one clique per line, with `curie`, `preferred_name`,
+    `names`, `types`, `taxa` and `clique_identifier_count`), e.g. to build an index of a whole NameRes release.
+    """
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield json_codec.loads(line)
+
+
+def build_index(records:Iterable, path:str, top_k:int=10):
+    """
+    Builds a name index of `records` and writes it to `path` (atomically).
+
+    Parameters
+    ----------
+    records : Iterable[dict | TranslatorNode]
+        NameRes results (as returned by the `lookup`, `bulk-lookup` or `synonyms` endpoints, or by `read_dump`) or
+        TranslatorNodes. Their labels and synonyms are indexed.
+    path : str
+        The index file.
+    top_k : int
+        Best nodes stored per trie node, which answer prefix queries without filters for up to `top_k` results
+        without scanning. Default: 10
+    """
+    nodes = []
+    typesets, taxasets = {}, {}
+    entries = {}
+    "(key, node index) : (rank, flags)"
+    for record in records:
+        curie, label, synonyms, types, taxa, count = _record_fields(record)
+        node_index = len(nodes)
+        node = {'curie': curie, 'label': label, 'types': types or None, 'taxa': taxa or None}
+        nodes.append((json_codec.dumps({k: v for k, v in node.items() if v is not None}),
+            typesets.setdefault(tuple(types), len(typesets)), taxasets.setdefault(tuple(taxa), len(taxasets))))
+        popularity = 0.25 * math.log1p(count)
+        names = ([(label, _LABEL)] if label else []) + [(synonym, 0) for synonym in synonyms if synonym]
+        for name, flags in names:
+            tokens = normalize_name(name).split(' ')
+            if tokens == ['']:
+                continue
+            length = sum(map(len, tokens))
+            for start in range(min(len(tokens), MAX_SUFFIXES)):
+                entry_flags = flags | (_SUFFIX if start else 0)
+                rank = popularity + (1.0 if flags & _LABEL else 0.0) - (0.5 if start else 0.0) - 0.01 * length
+                key = (' '.join(tokens[start:]), node_index)
+                if key not in entries or entries[key][0] < rank:
+                    entries[key] = (rank, entry_flags)
+    if len(typesets) > 65535 or len(taxasets) > 65535:
+        raise ValueError('Too many distinct type or taxon sets for the index format')
+
+    # entries sorted by key, then by rank (best first)
+    sorted_entries = sorted(((key.encode('utf-8'), -rank, node, flags) for (key, node), (rank, flags) in entries.items()))
+    keys = [entry[0] for entry in sorted_entries]
+    sections = {}
+    key_blob, key_offs = _blob(keys)
+    sections['keys'] = key_blob
+    sections['entry.key_off'] = array('I', key_offs)
+    sections['entry.key_len'] = array('H', [min(len(key), 65535) for key in keys])
+    sections['entry.node'] = array('I', [entry[2] for entry in sorted_entries])
+    ranks = array('f', [-entry[1] for entry in sorted_entries])
+    sections['entry.rank'] = ranks
+    sections['entry.flags'] = array('B', [entry[3] for entry in sorted_entries])
+    sections.update(_build_trie(keys, ranks, sections['entry.node'], top_k))
+    sections.update(_build_words(keys, sections['entry.flags']))
+    node_blob, node_offs = _blob([node[0] for node in nodes])
+    sections['nodes'] = node_blob
+    sections['node.json_off'] = array('I', node_offs)
+    sections['node.json_len'] = array('I', [len(node[0]) for node in nodes])
+    sections['node.typeset'] = array('H', [node[1] for node in nodes])
+    sections['node.taxaset'] = array('H', [node[2] for node in nodes])
+    header = {'version': FORMAT_VERSION, 'byteorder': sys.byteorder, 'top_k': top_k, 'n_nodes': len(nodes),
+        'n_entries': len(keys), 'typesets': list(map(list, typesets)), 'taxasets': list(map(list, taxasets))}
+    _write(path, header, sections)
+
+
+def _blob(items:list[bytes]) -> tuple[bytes, list[int]]:
+    offsets = []
+    position = 0
+    for item in items:
+        offsets.append(position)
+        position += len(item)
+    return b''.join(items), offsets
+
+
+def _build_trie(keys:list[bytes], ranks:array, entry_nodes:array, top_k:int) -> dict:
+    """Returns the sections of a radix trie of the sorted `keys`, in breadth-first order (siblings are contiguous)."""
+    # node: [label, lo, hi, terminal_hi, first_child, n_children, depth]
+    trie = [[b'', 0, len(keys), 0, 0, 0, 0]]
+    i = 0
+    while i < len(trie):
+        node = trie[i]
+        lo, hi, depth = node[1], node[2], node[6]
+        end = depth
+        if hi > lo:
+            first, last = keys[lo], keys[hi - 1]
+            limit = min(len(first), len(last))
+            while end < limit and first[end] == last[end]:
+                end += 1
+            node[0] = first[depth:end]
+        start = lo
+        while start < hi and len(keys[start]) == end:
+            start += 1
+        node[3] = start
+        node[4] = len(trie)
+        prefix = keys[lo][:end] if hi > lo else b''
+        while start < hi:
+            byte = keys[start][end]
+            stop = hi if byte == 255 else bisect.bisect_left(keys, prefix + bytes([byte + 1]), start, hi)
+            # the child's label starts at the branching byte
+            trie.append([b'', start, stop, 0, 0, 0, end])
+            start = stop
+        node[5] = len(trie) - node[4]
+        i += 1
+
+    # best nodes per trie node, bottom-up (children come after their parents)
+    tops = [None] * len(trie)
+    for index in range(len(trie) - 1, -1, -1):
+        label, lo, hi, terminal_hi, first_child, n_children, _ = trie[index]
+        if hi - lo <= top_k and index != 0:
+            tops[index] = []
+            continue
+        candidates = list(range(lo, min(terminal_hi, lo + 4 * top_k)))
+        for child in range(first_child, first_child + n_children):
+            candidates.extend(tops[child] if tops[child] else range(trie[child][1], trie[child][2]))
+        best = []
+        seen = set()
+        for entry in sorted(candidates, key=lambda e: -ranks[e]):
+            if entry_nodes[entry] not in seen:
+                seen.add(entry_nodes[entry])
+                best.append(entry)
+                if len(best) == top_k:
+                    break
+        tops[index] = best
+
+    label_blob, label_offs = _blob([node[0] for node in trie])
+    top_blob = array('I')
+    top_offs = []
+    for top in tops:
+        top_offs.append(len(top_blob))
+        top_blob.extend(top)
+    return {
+        'trie.labels': label_blob,
+        'trie.label_off': array('I', label_offs),
+        'trie.label_len': array('H', [len(node[0]) for node in trie]),
+        'trie.lo': array('I', [node[1] for node in trie]),
+        'trie.hi': array('I', [node[2] for node in trie]),
+        'trie.terminal_hi': array('I', [node[3] for node in trie]),
+        'trie.first_child': array('I', [node[4] for node in trie]),
+        'trie.n_children': array('H', [node[5] for node in trie]),
+        'trie.top_off': array('I', top_offs),
+        'trie.top_len': array('H', [len(top) for top in tops]),
+        'trie.tops': top_blob,
+    }
+
+
+def _build_words(keys:list[bytes], flags:array) -> dict:
+    """
+    Returns the sections of the word index of the whole names (not their suffixes): the names containing each word
+    of the vocabulary, and the words containing each trigram.
+    """
+    postings = {}
+    "word : entries of the names containing it"
+    for entry, key in enumerate(keys):
+        if not flags[entry] & _SUFFIX:
+            for word in set(key.split(b' ')):
+                postings.setdefault(word, []).append(entry)
+    words = sorted(postings)
+    word_entries = array('I')
+    word_entry_offs = array('I', [0])
+    grams = {}
+    "trigram hash : words containing it"
+    for index, word in enumerate(words):
+        word_entries.extend(postings[word])
+        word_entry_offs.append(len(word_entries))
+        for gram in _trigrams(word.decode('utf-8')):
+            grams.setdefault(zlib.crc32(gram.encode('utf-8')), []).append(index)
+    hashes = sorted(grams)
+    gram_words = array('I')
+    gram_offs = array('I', [0])
+    for h in hashes:
+        gram_words.extend(grams[h])
+        gram_offs.append(len(gram_words))
+    return {
+        'word.len': array('H', [len(word) for word in words]),
+        'word.entry_off': word_entry_offs,
+        'word.entries': word_entries,
+        'gram.hashes': array('I', hashes),
+        'gram.offsets': gram_offs,
+        'gram.words': gram_words,
+    }
+
+
+def _write(path:str, header:dict, sections:dict):
+    layout = {}
+    position = 0
+    for name, data in sections.items():
+        size = len(data) * data.itemsize if isinstance(data, array) else len(data)
+        layout[name] = [position, size, data.typecode if isinstance(data, array) else 'B']
+        position += size + (-size % 8)
+    # magic, header length, header, then the sections, each aligned to 8 bytes
+    header = json_codec.dumps({**header, 'sections': layout})
+    header += b' ' * (-(len(MAGIC) + 8 + len(header)) % 8)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+        for data in sections.values():
+            data = data.tobytes() if isinstance(data, array) else data
+            f.write(data + b'\0' * (-len(data) % 8))
+    os.replace(tmp_path, path)
+
+
+class NameIndex:
+    """
+    A memory-mapped name index, built with `build_index`.
+
+    Parameters
+    ----------
+    path : str
+        The index file.
+    """
+
+    def __init__(self, path:str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f'{path} is not a name index')
+        (header_len,) = struct.unpack_from('<Q', self._mmap, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        self.header = json_codec.loads(self._mmap[header_start:header_start + header_len])
+        if self.header['version'] != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError(f'{path} has version {self.header["version"]} of the index format, expected {FORMAT_VERSION}')
+        start = header_start + header_len
+        self._view = memoryview(self._mmap)
+        self._sections = {name: self._column(self._view[start + offset:start + offset + size], typecode)
+            for name, (offset, size, typecode) in self.header['sections'].items()}
+        self.typesets = [set(types) for types in self.header['typesets']]
+        self.taxasets = [set(taxa) for taxa in self.header['taxasets']]
+
+    def _column(self, data:memoryview, typecode:str):
+        if self.header['byteorder'] == sys.byteorder:
+            return data.cast(typecode)
+        column = array(typecode, data.tobytes())
+        column.byteswap()
+        return column
+
+    def __len__(self) -> int:
+        """Returns the number of nodes."""
+        return self.header['n_nodes']
+
+    def close(self):
+        for data in self._sections.values():
+            if isinstance(data, memoryview):
+                data.release()
+        self._sections.clear()
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self) -> 'NameIndex':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # queries
+
+    def complete(self, prefix:str, limit:int=10, biolink_types:list[str] | None=None,
+            only_taxa:str | list[str] | None=None) -> list[TranslatorNode]:
+        """
+        Returns the best nodes with a name that starts with `prefix` (at any word), best first. Names equal to
+        `prefix` come first.
+
+        Parameters
+        ----------
+        prefix : str
+        limit : int
+            Maximum number of nodes. Default: 10
+        biolink_types : list[str] | None
+            Only return nodes of one of these types, e.g. ['biolink:Disease'].
+        only_taxa : str | list[str] | None
+            Only return nodes of these taxa (or without taxa, like NameRes), e.g. 'NCBITaxon:9606'. Several taxa can
+            be separated by '|'.
+        """
+        key = normalize_name(prefix).encode('utf-8')
+        found = self._walk(key)
+        if found is None:
+            return []
+        node, exact = found
+        s = self._sections
+        entry_nodes = s['entry.node']
+        allowed = self._filter(biolink_types, only_taxa)
+        lo, hi = s['trie.lo'][node], s['trie.hi'][node]
+        exact_hi = s['trie.terminal_hi'][node] if exact else lo
+        # names equal to the prefix first
+        entries = self._best(range(lo, exact_hi), limit, allowed) if exact_hi > lo else []
+        if len(entries) < limit:
+            entries += self._search(node, limit - len(entries), allowed, {entry_nodes[e] for e in entries})
+        return [self.node(entry_nodes[e]) for e in entries]
+
+    def fuzzy(self, query:str, limit:int=10, biolink_types:list[str] | None=None,
+            only_taxa:str | list[str] | None=None, min_similarity:float=0.5,
+            min_word_similarity:float=0.6) -> list[TranslatorNode]:
+        """
+        Returns the nodes with the names most similar to `query`, in any word order, best first. The filters are
+        those of `complete`.
+
+        Every word of the query is matched to the words of the index with a trigram similarity (Dice coefficient)
+        of at least `min_word_similarity`, which tolerates typos, and a name's similarity is the sum of the
+        similarities of its matched words, divided by the number of words of the query or the name (the larger).
+        """
+        tokens = normalize_name(query).split(' ')
+        if tokens == ['']:
+            return []
+        s = self._sections
+        entry_off, word_entries = s['word.entry_off'], s['word.entries']
+        matches = []
+        "per word of the query: [(posting list, word similarity)] of its similar words"
+        for token in dict.fromkeys(tokens):
+            matches.append([(word_entries[entry_off[word]:entry_off[word + 1]], similarity)
+                for word, similarity in self._similar_words(token, min_word_similarity)])
+        # A name with a similarity of at least `min_similarity` matches at least `needed` words of the query, so it
+        # is in the postings of one of the len(matches) - needed + 1 rarest words: only those are read in full, and
+        # the candidates are looked up in the others (posting lists are sorted).
+        needed = max(1, math.ceil(min_similarity * len(matches)))
+        matches.sort(key=lambda postings: sum(len(entries) for entries, _ in postings))
+        scores = {}
+        "entry : sum of the word similarities"
+        for postings in matches[:len(matches) - needed + 1]:
+            best = {}
+            for entries, similarity in postings:
+                for entry in entries.tolist():
+                    if best.get(entry, 0) < similarity:
+                        best[entry] = similarity
+            for entry, similarity in best.items():
+                scores[entry] = scores.get(entry, 0) + similarity
+        for postings in matches[len(matches) - needed + 1:]:
+            for entry in scores:
+                best = 0
+                for entries, similarity in postings:
+                    i = bisect.bisect_left(entries, entry)
+                    if similarity > best and i < len(entries) and entries[i] == entry:
+                        best = similarity
+                scores[entry] += best
+
+        allowed = self._filter(biolink_types, only_taxa)
+        key_off, key_len, entry_nodes, ranks = s['entry.key_off'], s['entry.key_len'], s['entry.node'], s['entry.rank']
+        keys = s['keys']
+        best = {}
+        "node : (similarity, rank, entry)"
+        for entry, score in scores.items():
+            n_words = keys[key_off[entry]:key_off[entry] + key_len[entry]].tobytes().count(b' ') + 1
+            similarity = score / max(len(matches), n_words)
+            if similarity < min_similarity:
+                continue
+            node = entry_nodes[entry]
+            candidate = (similarity, ranks[entry], entry)
+            if (node not in best or best[node] < candidate) and (allowed is None or self._allowed(node, allowed)):
+                best[node] = candidate
+        return [self.node(node) for node, _ in heapq.nlargest(limit, best.items(), key=lambda item: item[1])]
+
+    def lookup(self, query:str, limit:int=10, autocomplete:bool=True, biolink_types:list[str] | None=None,
+            only_taxa:str | list[str] | None=None, fallback:bool=True, **kwargs) -> list[TranslatorNode]:
+        """
+        Returns the nodes matching `query`: prefix matches if `autocomplete` (exact matches otherwise), then fuzzy
+        matches if there are none, then, if `fallback`, the results of `name_resolver.lookup` if there are still
+        none (`**kwargs` are passed to it).
+        """
+        if autocomplete:
+            nodes = self.complete(query, limit, biolink_types, only_taxa)
+        else:
+            nodes = self.exact(query, limit, biolink_types, only_taxa)
+        if not nodes:
+            nodes = self.fuzzy(query, limit, biolink_types, only_taxa)
+        if not nodes and fallback:
+            from . import name_resolver
+            if biolink_types:
+                kwargs['biolink_type'] = biolink_types
+            if only_taxa:
+                kwargs['only_taxa'] = only_taxa if isinstance(only_taxa, str) else '|'.join(only_taxa)
+            try:
+                nodes = name_resolver.lookup(query, return_top_response=False, limit=limit, autocomplete=autocomplete,
+                    **kwargs)
+            except LookupError:
+                nodes = []
+        return nodes
+
+    def exact(self, name:str, limit:int=10, biolink_types:list[str] | None=None,
+            only_taxa:str | list[str] | None=None) -> list[TranslatorNode]:
+        """Returns the nodes with a name (or a suffix of a name starting at a word) equal to `name`, best first."""
+        found = self._walk(normalize_name(name).encode('utf-8'))
+        if found is None or not found[1]:
+            return []
+        s = self._sections
+        node = found[0]
+        entries = self._best(range(s['trie.lo'][node], s['trie.terminal_hi'][node]), limit,
+            self._filter(biolink_types, only_taxa))
+        return [self.node(s['entry.node'][e]) for e in entries]
+
+    def node(self, index:int) -> TranslatorNode:
+        """Returns the node at `index` of the index."""
+        s = self._sections
+        offset = s['node.json_off'][index]
+        data = json_codec.loads(bytes(s['nodes'][offset:offset + s['node.json_len'][index]]))
+        return TranslatorNode(data['curie'], data.get('label'), data.get('types'), taxa=data.get('taxa'))
+
+    # internals
+
+    def _walk(self, key:bytes) -> tuple[int, bool] | None:
+        """
+        Returns (trie node, exact) for the trie node whose range holds the names starting with `key`; `exact` is True
+        if the node's path is `key` (so its terminal names are equal to `key`), or None if no name starts with `key`.
+        """
+        s = self._sections
+        label_off, label_len = s['trie.label_off'], s['trie.label_len']
+        first_child, n_children = s['trie.first_child'], s['trie.n_children']
+        labels = s['trie.labels']
+        node = 0
+        position = 0
+        while True:
+            offset, length = label_off[node], label_len[node]
+            rest = key[position:position + length]
+            if labels[offset:offset + len(rest)] != rest:
+                return None
+            if len(rest) < length:
+                return node, False
+            position += length
+            if position == len(key):
+                return node, True
+            # the children are sorted by their first byte
+            lo, hi = first_child[node], first_child[node] + n_children[node]
+            byte = key[position]
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if labels[label_off[mid]] < byte:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo == first_child[node] + n_children[node] or labels[label_off[lo]] != byte:
+                return None
+            node = lo
+
+    def _similar_words(self, token:str, min_similarity:float) -> list[tuple[int, float]]:
+        """Returns (word, similarity) for the words of the index whose trigrams are similar to those of `token`."""
+        s = self._sections
+        grams = _trigrams(token)
+        hashes, offsets, gram_words = s['gram.hashes'], s['gram.offsets'], s['gram.words']
+        lists = []
+        for gram in grams:
+            h = zlib.crc32(gram.encode('utf-8'))
+            i = bisect.bisect_left(hashes, h)
+            if i < len(hashes) and hashes[i] == h:
+                lists.append(gram_words[offsets[i]:offsets[i + 1]])
+        # like in `fuzzy`, only the shortest lists are read in full (the trigrams missing from the index count
+        # as empty lists)
+        needed = max(1, math.ceil(min_similarity * len(grams) / (2 - min_similarity)))
+        lists.sort(key=len)
+        n_full = len(grams) - needed + 1 - (len(grams) - len(lists))
+        counts = Counter()
+        for words in lists[:max(0, n_full)]:
+            counts.update(words.tolist())
+        for words in lists[max(0, n_full):]:
+            for word in counts:
+                i = bisect.bisect_left(words, word)
+                if i < len(words) and words[i] == word:
+                    counts[word] += 1
+        word_len = s['word.len']
+        similar = []
+        for word, count in counts.items():
+            # a word of n bytes has n + 1 trigrams (n characters for non-ASCII words, which then score lower)
+            similarity = 2 * count / (len(grams) + word_len[word] + 1)
+            if similarity >= min_similarity:
+                similar.append((word, similarity))
+        return similar
+
+    def _search(self, node:int, limit:int, allowed:tuple | None, exclude:set) -> list[int]:
+        """
+        Returns the best-ranked entries of distinct nodes in the subtree of a trie node that pass the filter.
+
+        The subtrees are visited best first: a trie node with stored best nodes holds the best nodes of its subtree,
+        so its children only need to be visited if more results are needed than pass the filter among them, and only
+        as long as their best node ranks higher than the results found so far.
+        """
+        s = self._sections
+        top_off, top_len, tops = s['trie.top_off'], s['trie.top_len'], s['trie.tops']
+        trie_lo, trie_hi, terminal_hi = s['trie.lo'], s['trie.hi'], s['trie.terminal_hi']
+        first_child, n_children = s['trie.first_child'], s['trie.n_children']
+        entry_nodes, ranks = s['entry.node'], s['entry.rank']
+        top_k = self.header['top_k']
+        found = {}
+        "node : (rank, entry)"
+
+        def collect(entries):
+            for entry in entries:
+                node = entry_nodes[entry]
+                rank = ranks[entry]
+                if node in exclude or (node in found and found[node][0] >= rank):
+                    continue
+                if allowed is None or self._allowed(node, allowed):
+                    found[node] = (rank, entry)
+
+        def bound(trie_node:int) -> float:
+            if top_len[trie_node]:
+                return ranks[tops[top_off[trie_node]]]
+            return max(ranks[entry] for entry in range(trie_lo[trie_node], trie_hi[trie_node]))
+
+        def enough(rank:float) -> bool:
+            # whether `limit` results rank at least `rank`
+            return len(found) >= limit and heapq.nlargest(limit, found.values())[-1][0] >= rank
+
+        frontier = [(-bound(node), node)]
+        while frontier:
+            best_rank, trie_node = heapq.heappop(frontier)
+            if enough(-best_rank):
+                break
+            if not top_len[trie_node]:
+                # a small subtree
+                collect(range(trie_lo[trie_node], trie_hi[trie_node]))
+                continue
+            node_tops = tops[top_off[trie_node]:top_off[trie_node] + top_len[trie_node]]
+            collect(node_tops)
+            # the other nodes of the subtree rank at most as high as its last stored node
+            if top_len[trie_node] == top_k and not enough(ranks[node_tops[-1]]):
+                # the subtree may have more nodes than the stored ones
+                collect(range(trie_lo[trie_node], terminal_hi[trie_node]))
+                for child in range(first_child[trie_node], first_child[trie_node] + n_children[trie_node]):
+                    heapq.heappush(frontier, (-bound(child), child))
+        return [entry for _, entry in heapq.nlargest(limit, found.values())]
+
+    def _best(self, entries:range, limit:int, allowed:tuple | None, exclude:set | None=None) -> list[int]:
+        """Returns the best-ranked entries of distinct nodes among `entries` that pass the filter."""
+        s = self._sections
+        entry_nodes, ranks = s['entry.node'], s['entry.rank']
+        best = {}
+        "node : (rank, entry)"
+        for entry in entries:
+            node = entry_nodes[entry]
+            rank = ranks[entry]
+            if (node in best and best[node][0] >= rank) or (exclude and node in exclude):
+                continue
+            if allowed is None or self._allowed(node, allowed):
+                best[node] = (rank, entry)
+        return [entry for _, entry in heapq.nlargest(limit, best.values())]
+
+    def _filter(self, biolink_types:list[str] | None, only_taxa:str | list[str] | None) -> tuple | None:
+        """Returns (allowed type set ids, allowed taxon set ids), or None without filters."""
+        if not biolink_types and not only_taxa:
+            return None
+        typesets = taxasets = None
+        if biolink_types:
+            wanted = set(biolink_types)
+            typesets = {i for i, types in enumerate(self.typesets) if types & wanted}
+        if only_taxa:
+            wanted = set(only_taxa.split('|') if isinstance(only_taxa, str) else only_taxa)
+            taxasets = {i for i, taxa in enumerate(self.taxasets) if not taxa or taxa & wanted}
+        return typesets, taxasets
+
+    def _allowed(self, node:int, allowed:tuple) -> bool:
+        typesets, taxasets = allowed
+        s = self._sections
+        return ((typesets is None or s['node.typeset'][node] in typesets)
+            and (taxasets is None or s['node.taxaset'][node] in taxasets))
@@ -3,10 +3,11 @@ This is a wrapper around the Name Resolver API.
 
 API docs: https://name-lookup.ci.transltr.io/docs
 """
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
 import urllib.parse
 
-import requests
-
+from . import http_client, instrumentation, json_codec, negative_cache
+from .single_flight import default_single_flight, make_key, parser_namespace
 from .translator_node import TranslatorNode
 
 URL = 'https://name-lookup.ci.transltr.io/'
@@ -16,9 +17,9 @@ def status():
     """
     Returns the status of the Name Resolver API.
     """
-    response = requests.get(URL + 'status')
+    response = http_client.get(URL + 'status')
     response.raise_for_status()
-    return response.json()
+    return json_codec.response_json(response)
 
 
 def lookup(query: str, return_top_response:bool=True, return_synonyms:bool=False, limit:int=10, **kwargs):
@@ -50,25 +51,54 @@ def lookup(query: str, return_top_response:bool=True, return_synonyms:bool=False
     TranslatorNode(curie='NCBIGene:3458', label='IFNG', types=['biolink:Gene', 'biolink:GeneOrGeneProduct', 'biolink:GenomicEntity', 'biolink:ChemicalEntityOrGeneOrGeneProduct', 'biolink:PhysicalEssence', 'biolink:OntologyClass', 'biolink:BiologicalEntity', 'biolink:ThingWithTaxon', 'biolink:NamedThing', 'biolink:Entity', 'biolink:PhysicalEssenceOrOccurrent', 'biolink:MacromolecularMachineMixin', 'biolink:Protein', 'biolink:GeneProductMixin', 'biolink:Polypeptide', 'biolink:ChemicalEntityOrProteinOrPolypeptide'], synonyms=None, curie_synonyms=None, attributes=None, taxa=['NCBITaxon:9606'])
     >>> lookup('AML', return_top_response=False, biolink_type="biolink:Disease")
     """
+    path, params = _lookup_request(query, limit, kwargs)
+    # identical concurrent lookups share one request
+    response = default_single_flight.do(path, make_key(params), lambda: http_client.get(path, params=params))
+    return _parse_lookup(response, query, return_top_response, return_synonyms)
+
+
+async def alookup(query: str, return_top_response:bool=True, return_synonyms:bool=False, limit:int=10, **kwargs):
+    """
+    Async version of `lookup`, using the shared connection pool of `async_client`. Returns the same results.
+
+    Examples
+    --------
+    >>> await alookup('AML')
+    TranslatorNode(curie='MONDO:0018874', label='acute myeloid leukemia', ...)
+    """
+    path, params = _lookup_request(query, limit, kwargs)
+    response = await default_single_flight.ado(path, make_key(params), lambda: http_client.aget(path, params=params))
+    return _parse_lookup(response, query, return_top_response, return_synonyms)
+
+
+def _lookup_request(query:str, limit:int, kwargs:dict) -> tuple[str, dict]:
+    """Returns the URL and query parameters of a `lookup` request."""
     path = urllib.parse.urljoin(URL, 'lookup')
     # set autocomplete to be false by default
     if 'autocomplete' not in kwargs:
         kwargs['autocomplete'] = False
-    response = requests.get(path, params={'string': query, 'limit': limit, **kwargs})
+    return path, {'string': query, 'limit': limit, **kwargs}
+
+
+def _parse_lookup(response, query:str, return_top_response:bool, return_synonyms:bool):
+    """Converts a `lookup` response (from `requests` or `httpx`) to TranslatorNodes."""
     if response.status_code == 200:
-        result = response.json()
+        with instrumentation.span('json.decode', service='nameres'):
+            result = json_codec.response_json(response)
         if len(result) == 0:
             raise LookupError('No matching CURIE found for the given string ' + query)
         else:
-            if return_top_response:
-                return TranslatorNode.from_dict(result[0], return_synonyms)
-            else:
-                all_nodes = []
-                for node in result:
-                    n = TranslatorNode.from_dict(node, return_synonyms)
-                    all_nodes.append(n)
-                return all_nodes
+            with instrumentation.span('nodes.build', service='nameres'):
+                if return_top_response:
+                    return TranslatorNode.from_dict(result[0], return_synonyms)
+                else:
+                    all_nodes = []
+                    for node in result:
+                        n = TranslatorNode.from_dict(node, return_synonyms)
+                        all_nodes.append(n)
+                    return all_nodes
     else:
+        import requests
         raise requests.RequestException('Response from server had error, code ' + str(response.status_code) + ' ' + str(response))
 
 
@@ -86,24 +116,42 @@ def synonyms(query: str, **kwargs):
     Returns
     -------
     Dict of CURIE id : TranslatorNode
+
+    See `batch_synonyms` for many CURIEs at once.
     """
     path = urllib.parse.urljoin(URL, 'synonyms')
-    # set autocomplete to be false by default
-    response = requests.get(path, params={'preferred_curies': query, **kwargs})
+    response = http_client.get(path, params={'preferred_curies': query, **kwargs})
+    return _parse_synonyms(response, query)
+
+
+async def asynonyms(query: str, **kwargs):
+    """
+    Async version of `synonyms`, using the shared connection pool of `async_client`. Returns the same results.
+    """
+    path = urllib.parse.urljoin(URL, 'synonyms')
+    response = await http_client.aget(path, params={'preferred_curies': query, **kwargs})
+    return _parse_synonyms(response, query)
+
+
+def _parse_synonyms(response, query:str) -> dict:
+    """Converts a `synonyms` response (from `requests` or `httpx`) to a dict of CURIE id : TranslatorNode."""
     if response.status_code == 200:
-        result = response.json()
+        with instrumentation.span('json.decode', service='nameres'):
+            result = json_codec.response_json(response)
         if len(result) == 0:
             raise LookupError('No matching CURIE found for the given string ' + query)
         else:
             all_nodes = {}
-            for k, node in result.items():
-                if not node:
-                    # If node is empty or None.
-                    all_nodes[k] = None
-                else:
-                    all_nodes[k] = TranslatorNode.from_dict(node, return_synonyms=True)
+            with instrumentation.span('nodes.build', service='nameres'):
+                for k, node in result.items():
+                    if not node:
+                        # If node is empty or None.
+                        all_nodes[k] = None
+                    else:
+                        all_nodes[k] = TranslatorNode.from_dict(node, return_synonyms=True)
             return all_nodes
     else:
+        import requests
         raise requests.RequestException('Response from server had error, code ' + str(response.status_code) + ' ' + str(response))
 
 
@@ -142,33 +190,295 @@ def batch_lookup(strings:list[str], size: int=25, return_top_response:bool=True,
     {'AML': TranslatorNode(curie='MONDO:0018874', label='acute myeloid leukemia',...),
      'CML': TranslatorNode(curie='MONDO:0010809', label='familial chronic myelocytic leukemia-like syndrome',...)}
     """
+    results = batch_lookup_results(strings, size, **kwargs)
+    return _parse_batch_lookup(results, strings, return_top_response, return_synonyms)
+
+
+def batch_lookup_results(strings:list[str], size:int=25, parse:Callable[[bytes], dict] | None=None, executor=None,
+        **kwargs) -> dict:
+    """
+    Returns the raw `bulk-lookup` results of `batch_lookup`: a dict of string : list of results (as dicts).
+
+    `parse` decodes a response body (see `json_codec.parse_response`), in `executor` if given. It may return smaller
+    results of the same shape, e.g. only the fields that the caller needs (see `pipeline.parse_lookup`); they are
+    only shared with concurrent callers using the same `parse`.
+    """
+    path = urllib.parse.urljoin(URL, 'bulk-lookup')
+    namespace = make_key(path, kwargs)
+
+    def fetch(new_strings:list[str]) -> dict:
+        # strings that NameRes matched nothing for recently are not sent again
+        cache = negative_cache.default_negative_cache
+        new_strings, unmatched = cache.split(namespace, new_strings)
+        results = dict.fromkeys(unmatched, [])
+        for chunk in chunk_list(new_strings, size):
+            payload = {
+                "strings": chunk,
+                **kwargs
+            }
+            instrumentation.observe('batch.size', len(chunk), service='nameres')
+            response = http_client.post(path, json = payload)
+            results.update(_bulk_lookup_results(response, chunk, strings, cache, namespace, parse, executor))
+        return results
+
+    # Strings already being looked up by another thread are not sent again.
+    return default_single_flight.do_batch(parser_namespace(namespace, parse), strings, fetch)
+
+
+async def abatch_lookup(strings:list[str], size: int=25, return_top_response:bool=True, return_synonyms:bool=False, **kwargs) -> dict:
+    """
+    Async version of `batch_lookup`, using the shared connection pool of `async_client`. Returns the same results.
+    The chunks are sent concurrently.
+
+    Examples
+    --------
+    >>> await abatch_lookup(['AML', 'CML'])
+    """
+    import asyncio
     path = urllib.parse.urljoin(URL, 'bulk-lookup')
+    namespace = make_key(path, kwargs)
+
+    async def fetch(new_strings:list[str]) -> dict:
+        cache = negative_cache.default_negative_cache
+        new_strings, unmatched = cache.split(namespace, new_strings)
+        chunks = chunk_list(new_strings, size)
+        for chunk in chunks:
+            instrumentation.observe('batch.size', len(chunk), service='nameres')
+        responses = await asyncio.gather(*[http_client.apost(path, json={"strings": chunk, **kwargs}) for chunk in chunks])
+        results = dict.fromkeys(unmatched, [])
+        for chunk, response in zip(chunks, responses):
+            results.update(_bulk_lookup_results(response, chunk, strings, cache, namespace))
+        return results
+
+    results = await default_single_flight.ado_batch(namespace, strings, fetch)
+    return _parse_batch_lookup(results, strings, return_top_response, return_synonyms)
+
+
+def _bulk_lookup_results(response, chunk:list[str], strings:list[str], cache:negative_cache.NegativeCache,
+        namespace:str, parse:Callable[[bytes], dict] | None=None, executor=None) -> dict:
+    """
+    Returns the raw results of a `bulk-lookup` response (from `requests` or `httpx`) for one chunk of strings, and
+    records the strings without a match in the negative cache.
+    """
+    if response.status_code == 200:
+        with instrumentation.span('json.decode', service='nameres'):
+            result = json_codec.parse_response(response, parse, executor)
+        if(len(result) == 0):
+            raise LookupError('No matching CURIE found for the given strings ' + str(strings))
+        results = {s: result.get(s, []) for s in chunk}
+        cache.add(namespace, [s for s in chunk if s in result and not result[s]])
+        return results
+    else:
+        import requests
+        raise requests.RequestException('Response from server had error, code ' + str(response.status_code) + ' ' + str(response))
+
+
+def _parse_batch_lookup(results:dict, strings:list[str], return_top_response:bool, return_synonyms:bool) -> dict:
+    """Converts the raw `bulk-lookup` results to TranslatorNodes."""
+    with instrumentation.span('nodes.build', service='nameres'):
+        return _build_batch_lookup(results, strings, return_top_response, return_synonyms)
+
+
+def _build_batch_lookup(results:dict, strings:list[str], return_top_response:bool, return_synonyms:bool) -> dict:
     curies = {}
-    chunks = chunk_list(strings, size)
-    for chunk in chunks:
-        payload = {
-            "strings": chunk,
-            **kwargs
-        }
-        response = requests.post(path, json = payload)
-        if response.status_code == 200:
-            result = response.json()
-            if(len(result) == 0):
-                raise LookupError('No matching CURIE found for the given strings ' + str(strings))
+    for s in strings:
+        nodes = results.get(s, [])
+        translator_nodes = []
+        for node in nodes:
+            n = TranslatorNode.from_dict(node, return_synonyms)
+            translator_nodes.append(n)
+        if return_top_response:
+            if translator_nodes:
+                curies[s] = translator_nodes[0]
             else:
-                for s in chunk:
-                    nodes = result.get(s, [])
-                    translator_nodes = []
-                    for node in nodes:
-                        n = TranslatorNode.from_dict(node, return_synonyms)
-                        translator_nodes.append(n)
-                    if return_top_response:
-                        if translator_nodes:
-                            curies[s] = translator_nodes[0]
-                        else:
-                            curies[s] = None
-                    else:
-                        curies[s] = translator_nodes
+                curies[s] = None
         else:
-            raise requests.RequestException('Response from server had error, code ' + str(response.status_code) + ' ' + str(response))
+            curies[s] = translator_nodes
     return curies
+
+
+SYNONYMS_CHUNK_SIZE = 500
+"Default number of CURIEs per `synonyms` POST request of `batch_synonyms`."
+
+SYNONYMS_GET_CHUNK_SIZE = 50
+"Number of CURIEs per `synonyms` GET request, when a server doesn't accept POST (the CURIEs go in the URL)."
+
+
+def iter_synonyms(curies:Iterable[str], size:int=SYNONYMS_CHUNK_SIZE, max_workers:int=4,
+        **kwargs) -> Iterator[tuple[str, TranslatorNode | None]]:
+    """
+    Streams (CURIE, TranslatorNode) pairs for any number of CURIEs, as the chunks of a batch `synonyms` query come
+    back. The chunks are POSTed concurrently; CURIEs that NameRes doesn't know are yielded with None instead of raising
+    `LookupError`, and are recorded in the negative cache, so that they aren't sent again.
+
+    Parameters
+    ----------
+    curies : Iterable[str]
+        Query CURIEs. Duplicates are only sent (and yielded) once. The iterable is consumed lazily.
+    size : int
+        Number of CURIEs per request. Default: 500
+    max_workers : int
+        Number of requests in flight at the same time. Default: 4
+    **kwargs
+        Other arguments to `synonyms`
+
+    Yields
+    ------
+    (CURIE, TranslatorNode or None), in the order in which the chunks complete
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    max_workers = max(1, max_workers)
+    path = urllib.parse.urljoin(URL, 'synonyms')
+    namespace = make_key(path, kwargs)
+    cache = negative_cache.default_negative_cache
+
+    def fetch(chunk:list[str]) -> dict:
+        instrumentation.observe('batch.size', len(chunk), service='nameres')
+        response = http_client.post(path, json={'preferred_curies': chunk, **kwargs})
+        if response.status_code == 405:
+            # servers without the POST endpoint get the chunk in URL-sized GET requests
+            results = {}
+            for part in chunk_list(chunk, SYNONYMS_GET_CHUNK_SIZE):
+                response = http_client.get(path, params={'preferred_curies': part, **kwargs})
+                results.update(_synonyms_results(response, part, cache, namespace))
+            return results
+        return _synonyms_results(response, chunk, cache, namespace)
+
+    executor = ThreadPoolExecutor(max_workers, thread_name_prefix='synonyms')
+    try:
+        pending = set()
+        for chunk in _unique_chunks(curies, size):
+            chunk, unknown = cache.split(namespace, chunk)
+            for curie in unknown:
+                yield curie, None
+            if chunk:
+                pending.add(executor.submit(fetch, chunk))
+            while len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result().items()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result().items()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def batch_synonyms(curies:Iterable[str], size:int=SYNONYMS_CHUNK_SIZE, max_workers:int=4, **kwargs) -> dict:
+    """
+    A batch version of `synonyms` for any number of CURIEs: they are sent in chunks of `size`, `max_workers` chunks
+    at a time, and the results are merged. See `iter_synonyms` to process the results as they arrive.
+
+    Returns
+    -------
+    Dict of CURIE id : TranslatorNode, in the order of `curies`, with None for the CURIEs that NameRes doesn't know
+
+    Examples
+    --------
+    >>> batch_synonyms(['MONDO:0018874', 'MONDO:0011996', 'NOT:A_CURIE'])
+    {'MONDO:0018874': TranslatorNode(curie='MONDO:0018874', label='acute myeloid leukemia',...),
+     'MONDO:0011996': TranslatorNode(curie='MONDO:0011996', label='chronic myeloid leukemia',...),
+     'NOT:A_CURIE': None}
+    """
+    curies = list(dict.fromkeys(curies))
+    results = dict(iter_synonyms(curies, size, max_workers, **kwargs))
+    return {curie: results.get(curie) for curie in curies}
+
+
+async def aiter_synonyms(curies:Iterable[str], size:int=SYNONYMS_CHUNK_SIZE, max_workers:int=4,
+        **kwargs) -> AsyncIterator[tuple[str, TranslatorNode | None]]:
+    """
+    Async version of `iter_synonyms`, using the shared connection pool of `async_client`.
+
+    Examples
+    --------
+    >>> async for curie, node in aiter_synonyms(curies):
+    ...     print(curie, node and node.synonyms)
+    """
+    import asyncio
+    max_workers = max(1, max_workers)
+    path = urllib.parse.urljoin(URL, 'synonyms')
+    namespace = make_key(path, kwargs)
+    cache = negative_cache.default_negative_cache
+
+    async def fetch(chunk:list[str]) -> dict:
+        instrumentation.observe('batch.size', len(chunk), service='nameres')
+        response = await http_client.apost(path, json={'preferred_curies': chunk, **kwargs})
+        if response.status_code == 405:
+            results = {}
+            for part in chunk_list(chunk, SYNONYMS_GET_CHUNK_SIZE):
+                response = await http_client.aget(path, params={'preferred_curies': part, **kwargs})
+                results.update(_synonyms_results(response, part, cache, namespace))
+            return results
+        return _synonyms_results(response, chunk, cache, namespace)
+
+    pending = set()
+    try:
+        for chunk in _unique_chunks(curies, size):
+            chunk, unknown = cache.split(namespace, chunk)
+            for curie in unknown:
+                yield curie, None
+            if chunk:
+                pending.add(asyncio.ensure_future(fetch(chunk)))
+            while len(pending) >= max_workers:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for item in task.result().items():
+                        yield item
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for item in task.result().items():
+                    yield item
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def abatch_synonyms(curies:Iterable[str], size:int=SYNONYMS_CHUNK_SIZE, max_workers:int=4, **kwargs) -> dict:
+    """
+    Async version of `batch_synonyms`. Returns the same results.
+
+    Examples
+    --------
+    >>> await abatch_synonyms(['MONDO:0018874', 'MONDO:0011996'])
+    """
+    curies = list(dict.fromkeys(curies))
+    results = {curie: node async for curie, node in aiter_synonyms(curies, size, max_workers, **kwargs)}
+    return {curie: results.get(curie) for curie in curies}
+
+
+def _unique_chunks(curies:Iterable[str], size:int) -> Iterator[list[str]]:
+    """Yields the distinct CURIEs in lists of `size`, consuming `curies` lazily."""
+    seen = set()
+    chunk = []
+    for curie in curies:
+        if curie in seen:
+            continue
+        seen.add(curie)
+        chunk.append(curie)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _synonyms_results(response, chunk:list[str], cache:negative_cache.NegativeCache, namespace:str) -> dict:
+    """
+    Converts a `synonyms` response (from `requests` or `httpx`) for one chunk of CURIEs to a dict of CURIE id :
+    TranslatorNode or None, and records the CURIEs without a result in the negative cache.
+    """
+    if response.status_code != 200:
+        import requests
+        raise requests.RequestException('Response from server had error, code ' + str(response.status_code) + ' ' + str(response))
+    with instrumentation.span('json.decode', service='nameres'):
+        result = json_codec.response_json(response)
+    nodes = {}
+    with instrumentation.span('nodes.build', service='nameres'):
+        for curie in chunk:
+            node = result.get(curie)
+            nodes[curie] = TranslatorNode.from_dict(node, return_synonyms=True) if node else None
+    cache.add(namespace, [curie for curie, node in nodes.items() if node is None])
+    return nodes
@@ -0,0 +1,226 @@
+"""
+A cache of negative results: CURIEs that NodeNorm or NameRes doesn't know (null results of `get_normalized_nodes` and
+`synonyms`) and strings that NameRes matches nothing for (empty results of `bulk-lookup`).
+
+Such items are usually permanently unknown, so `node_normalizer.get_normalized_nodes`,
+`node_normalizer.get_preferred_names`, `node_normalizer.ID_convert_to_preferred_name_nodeNormalizer`,
+`name_resolver.batch_lookup` and `name_resolver.batch_synonyms` (and their async versions) and the stages of
+`pipeline.Pipeline` remove the items of `default_negative_cache` from their outgoing batches and answer them with the
+negative result directly.
+
+The cache has two parts: a Bloom filter, which answers "not a known negative" for most items with a few bit tests and
+without taking the lock, and an exact store (item : expiry time), which confirms the filter's hits, so that an item is
+never filtered out because of a false positive. Entries expire after `ttl` seconds, since the services do learn new
+identifiers and names. Negative results depend on the request parameters (e.g. `only_taxa` for NameRes), so items
+are cached per namespace (the endpoint and its parameters).
+
+With `path`, the entries are appended to a JSON Lines file and loaded again by the next process, so that unknown
+identifiers are not sent again in later runs either.
+
+Examples
+--------
+>>> negative_cache.configure(path='~/.cache/translator_sdk/negative.jsonl', ttl=30 * 86400)
+>>> node_normalizer.get_preferred_names(curies)  # CURIEs that NodeNorm didn't know last time are not sent
+>>> negative_cache.default_negative_cache.stats()
+"""
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+import hashlib
+import math
+import os
+import tempfile
+import threading
+import time
+
+from . import instrumentation, json_codec
+
+
+class BloomFilter:
+    """
+    A Bloom filter of strings with `capacity` items at a false positive rate of `error_rate`.
+
+    Items can't be removed; `NegativeCache` rebuilds its filter from the exact store when it fills up.
+    """
+
+    def __init__(self, capacity:int=100_000, error_rate:float=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.n_bits = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.n_hashes = max(1, round(self.n_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.n_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item:str) -> list[int]:
+        # double hashing: position i is h1 + i * h2
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def add(self, item:str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item:str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+def _entry_key(namespace:Hashable, item:str) -> str:
+    return f'{namespace}\0{item}'
+
+
+class NegativeCache:
+    """
+    Items (CURIEs or names) known to have no result, per namespace, with a time-to-live.
+
+    Parameters
+    ----------
+    ttl : float
+        Time-to-live of an entry in seconds. Default: 86400 (one day)
+    max_entries : int
+        Maximum number of entries; the oldest are evicted first. Default: 1,000,000
+    error_rate : float
+        False positive rate of the Bloom filter (false positives only cost a lookup in the exact store). Default: 0.01
+    path : str | None
+        JSON Lines file that persists the entries across processes. Default: None (memory only)
+    enabled : bool
+        If False, nothing is filtered or recorded. Default: True
+    """
+
+    def __init__(self, ttl:float=86400, max_entries:int=1_000_000, error_rate:float=0.01, path:str | None=None,
+            enabled:bool=True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.error_rate = error_rate
+        self.path = os.path.expanduser(path) if path is not None else None
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        "entry key : expiry time, oldest first"
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self.hits = 0
+        "number of items that were filtered out"
+        self.false_positives = 0
+        "number of Bloom filter hits that the exact store rejected"
+        self._bloom = BloomFilter(1024, error_rate)
+        if self.path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._load()
+
+    def split(self, namespace:Hashable, items:Iterable[str]) -> tuple[list[str], list[str]]:
+        """Returns (unknown, negative): the items to send, and the items known to have no result."""
+        items = list(items)
+        if not self.enabled:
+            return items, []
+        bloom = self._bloom
+        candidates = [item for item in items if _entry_key(namespace, item) in bloom]
+        if not candidates:
+            return items, []
+        negative = set()
+        now = time.time()
+        with self._lock:
+            for item in candidates:
+                expires_at = self._entries.get(_entry_key(namespace, item))
+                if expires_at is None:
+                    self.false_positives += 1
+                elif expires_at > now:
+                    negative.add(item)
+                else:
+                    del self._entries[_entry_key(namespace, item)]
+            self.hits += len(negative)
+        if negative:
+            instrumentation.count('negative_cache.hits', len(negative))
+        return [item for item in items if item not in negative], [item for item in items if item in negative]
+
+    def add(self, namespace:Hashable, items:Iterable[str]):
+        """Records items that have no result."""
+        items = list(items)
+        if not self.enabled or not items:
+            return
+        expires_at = time.time() + self.ttl
+        self._add(namespace, items, expires_at)
+        if self.path is not None:
+            line = json_codec.dumps({'namespace': namespace, 'items': items, 'expires_at': expires_at}) + b'\n'
+            with self._file_lock, open(self.path, 'ab') as f:
+                f.write(line)
+
+    def _add(self, namespace:Hashable, items:list[str], expires_at:float):
+        with self._lock:
+            for item in items:
+                key = _entry_key(namespace, item)
+                self._entries.pop(key, None)
+                self._entries[key] = expires_at
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self._bloom.count + len(items) > self._bloom.capacity:
+                self._rebuild()
+            else:
+                for item in items:
+                    self._bloom.add(_entry_key(namespace, item))
+
+    def _rebuild(self):
+        # must be called with self._lock held; readers keep using the old filter until it is replaced
+        bloom = BloomFilter(max(1024, 2 * len(self._entries)), self.error_rate)
+        for key in self._entries:
+            bloom.add(key)
+        self._bloom = bloom
+
+    def _load(self):
+        """Loads the unexpired entries of `path`, and rewrites the file without the expired ones."""
+        now = time.time()
+        records = []
+        lines = 0
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json_codec.loads(line)
+                    except ValueError:
+                        # e.g. a line cut short by a crash
+                        continue
+                    if record['expires_at'] > now:
+                        records.append(record)
+        except FileNotFoundError:
+            return
+        for record in records:
+            self._add(record['namespace'], record['items'], record['expires_at'])
+        if len(records) < lines:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b''.join(json_codec.dumps(record) + b'\n' for record in records))
+            os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Removes all entries (and the file at `path`)."""
+        with self._lock:
+            self._entries.clear()
+            self._bloom = BloomFilter(1024, self.error_rate)
+        if self.path is not None:
+            with self._file_lock:
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        """Returns the number of entries and of filtered items, and the size of the Bloom filter."""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'false_positives': self.false_positives,
+                'bloom_bytes': len(self._bloom.bits)}
+
+
+default_negative_cache = NegativeCache()
+"The negative cache of the SDK's batch functions (memory only, one day TTL), replaced by `configure`."
+
+
+def configure(**kwargs) -> NegativeCache:
+    """
+    Replaces `default_negative_cache` with a new cache; the keyword arguments are those of `NegativeCache`
+    (e.g. `path` to keep the entries across runs, or `enabled=False`).
+    """
+    global default_negative_cache
+    default_negative_cache = NegativeCache(**kwargs)
+    return default_negative_cache
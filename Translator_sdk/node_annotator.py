@@ -3,9 +3,11 @@ This is a wrapper around the Node Annotator API.
 
 API docs: https://annotator.transltr.io/
 """
+from collections.abc import Callable
 import urllib.parse
 
-import requests
+from . import http_client, instrumentation, json_codec
+from .single_flight import default_single_flight, make_key, parser_namespace
 
 URL = 'https://annotator.transltr.io/'
 """This is the root URL for the API."""
@@ -14,15 +16,19 @@ def status():
     """
     Returns the status of the Node Annotator API.
     """
-    response = requests.get(f'{URL}status')
+    response = http_client.get(f'{URL}status')
     response.raise_for_status()
-    return response.json()
+    return json_codec.response_json(response)
 
 
 def lookup_curie(curie: str, **kwargs):
     return lookup_curies([curie], **kwargs)[curie]
 
 
+async def alookup_curie(curie: str, **kwargs):
+    return (await alookup_curies([curie], **kwargs))[curie]
+
+
 def lookup_curies(curies: list[str], **kwargs):
     """
     A wrapper around the `curies` API endpoint. Given a list of CURIEs, this returns a dictionary where each
@@ -46,15 +52,55 @@ def lookup_curies(curies: list[str], **kwargs):
     >>> lookup_curies(['MESH:D014867'])
     >>> lookup_curies(['NCIT:C34373', 'NCBIGene:1756'])
     """
+    return annotation_results(curies, **kwargs)
+
+
+def annotation_results(curies:list[str], parse:Callable[[bytes], dict] | None=None, executor=None, **kwargs) -> dict:
+    """
+    Returns the annotations of `lookup_curies`, with the response bodies decoded by `parse` (see
+    `json_codec.parse_response`) in `executor` if given. `parse` may return only the fields that the caller needs
+    (see `pipeline.parse_annotations`); its results are only shared with concurrent callers using the same `parse`.
+    """
     path = urllib.parse.urljoin(URL, 'curie')
-    response = requests.post(path, json={'ids': curies, **kwargs})
-    response.raise_for_status()
 
-    result = response.json()
-    if len(result) == 0:
-        raise LookupError('No matching CURIE found for the given string ' + curies)
+    def fetch(new_curies:list[str]) -> dict:
+        instrumentation.observe('batch.size', len(new_curies), service='annotator')
+        response = http_client.post(path, json={'ids': new_curies, **kwargs})
+        return _parse_curies(response, new_curies, parse, executor)
+
+    # CURIEs already being looked up by another thread are not sent again.
+    return default_single_flight.do_batch(parser_namespace(make_key(path, kwargs), parse), curies, fetch)
+
+
+async def alookup_curies(curies: list[str], **kwargs):
+    """
+    Async version of `lookup_curies`, using the shared connection pool of `async_client`. Returns the same results.
+
+    Examples
+    --------
+    >>> await alookup_curies(['NCIT:C34373', 'NCBIGene:1756'])
+    """
+    path = urllib.parse.urljoin(URL, 'curie')
+
+    async def fetch(new_curies:list[str]) -> dict:
+        instrumentation.observe('batch.size', len(new_curies), service='annotator')
+        response = await http_client.apost(path, json={'ids': new_curies, **kwargs})
+        return _parse_curies(response, new_curies)
+
+    return await default_single_flight.ado_batch(make_key(path, kwargs), curies, fetch)
+
+
+def _parse_curies(response, curies:list[str], parse:Callable[[bytes], dict] | None=None, executor=None) -> dict:
+    """Converts a `curie` response (from `requests` or `httpx`) to a dict of CURIE : annotations."""
+    response.raise_for_status()
 
-    results = response.json()
+    with instrumentation.span('json.decode', service='annotator'):
+        results = json_codec.parse_response(response, parse, executor)
+    if len(results) == 0:
+        raise LookupError('No matching CURIE found for the given string ' + str(curies))
+    if parse is not None:
+        # `parse` unwraps the annotations itself
+        return results
 
     for curie in results:
         # NodeAnnotator sometimes return a list of a single item. If so, we can unwrap it here.
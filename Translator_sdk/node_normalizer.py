@@ -3,10 +3,11 @@ This is a wrapper around the Node Normalizer API.
 
 API docs: https://nodenorm.transltr.io/docs
 """
+from collections.abc import Callable
 import urllib.parse
 
-import requests
-
+from . import http_client, instrumentation, json_codec, negative_cache
+from .single_flight import default_single_flight, make_key, parser_namespace
 from .translator_node import TranslatorNode
 
 
@@ -16,9 +17,9 @@ def status():
     """
     Returns the status of the Node Normalizer API.
     """
-    response = requests.get(f'{URL}status')
+    response = http_client.get(f'{URL}status')
     response.raise_for_status()
-    return response.json()
+    return json_codec.response_json(response)
 
 def get_normalized_nodes(query: str | list[str],
         return_equivalent_identifiers:bool=False,
@@ -49,50 +50,132 @@ def get_normalized_nodes(query: str | list[str],
     >>> get_normalized_nodes('MESH:D014867', return_equivalent_identifiers=False)
     TranslatorNode(curie='CHEBI:15377', label='Water', types=['biolink:SmallMolecule', 'biolink:MolecularEntity', 'biolink:ChemicalEntity', 'biolink:PhysicalEssence', 'biolink:ChemicalOrDrugOrTreatment', 'biolink:ChemicalEntityOrGeneOrGeneProduct', 'biolink:ChemicalEntityOrProteinOrPolypeptide', 'biolink:NamedThing', 'biolink:PhysicalEssenceOrOccurrent'], synonyms=None, curie_synonyms=None)
     """
+    result = normalized_nodes_results(_curie_list(query), mode, **kwargs)
+    return _parse_normalized_nodes(result, query, return_equivalent_identifiers)
+
+
+def normalized_nodes_results(curies:list[str], mode:str='get', parse:Callable[[bytes], dict] | None=None,
+        executor=None, **kwargs) -> dict:
+    """
+    Returns the raw `get_normalized_nodes` results of `get_normalized_nodes`: a dict of CURIE : node (as a dict), or
+    None for the CURIEs that NodeNorm doesn't know.
+
+    `parse` decodes a response body (see `json_codec.parse_response`), in `executor` if given. It may return smaller
+    nodes, e.g. only the fields that the caller needs (see `pipeline.parse_normalized`); they are only shared with
+    concurrent callers using the same `parse`.
+    """
     path = urllib.parse.urljoin(URL, 'get_normalized_nodes')
-    # default parameters: true for gene-protein conflation, false for drug-chemical conflation
-    if mode == 'post':
-        if isinstance(query, str):
-            # CURIEs sent to POST must be a list. If a single CURIE is given, we wrap it.
-            json_query = [query]
+    namespace = make_key(path, kwargs)
+
+    def fetch(curies:list[str]) -> dict:
+        # CURIEs that NodeNorm didn't know recently are not sent again.
+        cache = negative_cache.default_negative_cache
+        curies, unknown = cache.split(namespace, curies)
+        if not curies:
+            return dict.fromkeys(unknown)
+        # default parameters: true for gene-protein conflation, false for drug-chemical conflation
+        instrumentation.observe('batch.size', len(curies), service='nodenorm')
+        if mode == 'post':
+            response = http_client.post(path, json={'curies': curies, **kwargs})
         else:
-            json_query = query
-        response = requests.post(path, json={'curies': json_query, **kwargs})
-    else:
-        response = requests.get(path, params={'curie': query, **kwargs})
+            response = http_client.get(path, params={'curie': curies, **kwargs})
+        return _record_unknown(cache, namespace, _normalized_nodes_results(response, parse, executor), unknown)
+
+    # CURIEs already being normalized by another thread are not sent again.
+    return default_single_flight.do_batch(parser_namespace(namespace, parse), curies, fetch)
+
+
+async def aget_normalized_nodes(query: str | list[str],
+        return_equivalent_identifiers:bool=False,
+        mode:str='get',
+        **kwargs):
+    """
+    Async version of `get_normalized_nodes`, using the shared connection pool of `async_client`. Returns the same results.
+
+    Examples
+    --------
+    >>> await aget_normalized_nodes(['MESH:D014867', 'NCIT:C34373'], mode='post')
+    """
+    path = urllib.parse.urljoin(URL, 'get_normalized_nodes')
+    namespace = make_key(path, kwargs)
+
+    async def fetch(curies:list[str]) -> dict:
+        cache = negative_cache.default_negative_cache
+        curies, unknown = cache.split(namespace, curies)
+        if not curies:
+            return dict.fromkeys(unknown)
+        instrumentation.observe('batch.size', len(curies), service='nodenorm')
+        if mode == 'post':
+            response = await http_client.apost(path, json={'curies': curies, **kwargs})
+        else:
+            response = await http_client.aget(path, params={'curie': curies, **kwargs})
+        return _record_unknown(cache, namespace, _normalized_nodes_results(response), unknown)
+
+    result = await default_single_flight.ado_batch(namespace, _curie_list(query), fetch)
+    return _parse_normalized_nodes(result, query, return_equivalent_identifiers)
+
+
+def _curie_list(query:str | list[str]) -> list[str]:
+    if isinstance(query, str):
+        # CURIEs sent to POST must be a list. If a single CURIE is given, we wrap it.
+        return [query]
+    return query
+
+
+def _normalized_nodes_results(response, parse:Callable[[bytes], dict] | None=None, executor=None) -> dict:
+    """Returns the raw results of a `get_normalized_nodes` response (from `requests` or `httpx`)."""
     if response.status_code == 200:
-        result = response.json()
-        normalized_dict = {}
-        for k, node in result.items():
-            if node is None:
-                # No match found for CURIE `k`.
-                normalized_dict[k] = None
-                continue
-
-            n = TranslatorNode(node['id']['identifier'])
-            if 'label' in node['id']:
-                n.label = node['id']['label']
-            if 'type' in node:
-                n.types = node['type']
-            if return_equivalent_identifiers and 'equivalent_identifiers' in node:
-                synonyms = []
-                curie_synonyms = []
-                for eq in node['equivalent_identifiers']:
-                    if 'label' in eq:
-                        synonyms.append(eq['label'])
-                    else:
-                        synonyms.append(None)
-                    curie_synonyms.append(eq['identifier'])
-                n.synonyms = synonyms
-                n.curie_synonyms = curie_synonyms
-            normalized_dict[k] = n
-        if isinstance(query, str):
-            return normalized_dict[query]
-        return normalized_dict
+        with instrumentation.span('json.decode', service='nodenorm'):
+            return json_codec.parse_response(response, parse, executor)
     else:
+        import requests
         raise requests.RequestException('Response from server had error, code ' + str(response.status_code))
 
 
+def _record_unknown(cache:negative_cache.NegativeCache, namespace:str, result:dict, unknown:list[str]) -> dict:
+    """Records the CURIEs of `result` that NodeNorm doesn't know, and adds the CURIEs that were not sent."""
+    cache.add(namespace, [curie for curie, node in result.items() if node is None])
+    result.update(dict.fromkeys(unknown))
+    return result
+
+
+def _parse_normalized_nodes(result:dict, query:str | list[str], return_equivalent_identifiers:bool):
+    """Converts the raw `get_normalized_nodes` results to TranslatorNodes."""
+    with instrumentation.span('nodes.build', service='nodenorm'):
+        normalized_dict = _build_normalized_nodes(result, return_equivalent_identifiers)
+    if isinstance(query, str):
+        return normalized_dict[query]
+    return normalized_dict
+
+
+def _build_normalized_nodes(result:dict, return_equivalent_identifiers:bool) -> dict:
+    normalized_dict = {}
+    for k, node in result.items():
+        if node is None:
+            # No match found for CURIE `k`.
+            normalized_dict[k] = None
+            continue
+
+        n = TranslatorNode(node['id']['identifier'])
+        if 'label' in node['id']:
+            n.label = node['id']['label']
+        if 'type' in node:
+            n.types = node['type']
+        if return_equivalent_identifiers and 'equivalent_identifiers' in node:
+            synonyms = []
+            curie_synonyms = []
+            for eq in node['equivalent_identifiers']:
+                if 'label' in eq:
+                    synonyms.append(eq['label'])
+                else:
+                    synonyms.append(None)
+                curie_synonyms.append(eq['identifier'])
+            n.synonyms = synonyms
+            n.curie_synonyms = curie_synonyms
+        normalized_dict[k] = n
+    return normalized_dict
+
+
 def get_preferred_names(id_list:list[str], batch_limit=500, **kwargs) -> dict[str, str]:
     """
     Converts a list of CURIEs to their preferred names using NodeNorm. This calls get_normalized_nodes.
@@ -150,6 +233,18 @@ def ID_convert_to_preferred_name_nodeNormalizer(id_list):
     NODENORM_GENE_PROTEIN_CONFLATION = True             # Change to False if you don't want gene/protein conflation.
     NODENORM_DRUG_CHEMICAL_CONFLATION = False           # Change to True if you want drug/chemical conflation.
 
+    params = {
+        "description": False,   # Change to True if you want descriptions from any identifiers we know about.
+        "conflate": NODENORM_GENE_PROTEIN_CONFLATION,
+        "drug_chemical_conflate": NODENORM_DRUG_CHEMICAL_CONFLATION,
+    }
+    path = NODENORM_BASE_URL + '/get_normalized_nodes'
+    # CURIEs that NodeNorm didn't know recently are not sent again.
+    cache = negative_cache.default_negative_cache
+    namespace = make_key(path, params)
+    all_ids = id_list
+    id_list, cached_unknown_ids = cache.split(namespace, id_list)
+
     # split id_list into batches of at most NODENORM_BATCH_LIMIT entries
     for index in range(0, len(id_list), NODENORM_BATCH_LIMIT):
         id_sublist = id_list[index:index + NODENORM_BATCH_LIMIT]
@@ -157,16 +252,12 @@ def ID_convert_to_preferred_name_nodeNormalizer(id_list):
         # print(f"id_sublist: {id_sublist}")
 
         # Query NodeNorm with https://nodenorm.transltr.io/docs#/default/get_normalized_node_handler_get_normalized_nodes_get
-        response = requests.post(NODENORM_BASE_URL + '/get_normalized_nodes', json={
-            "curies": id_sublist,
-            "description": False,   # Change to True if you want descriptions from any identifiers we know about.
-            "conflate": NODENORM_GENE_PROTEIN_CONFLATION,
-            "drug_chemical_conflate": NODENORM_DRUG_CHEMICAL_CONFLATION,
-        })
+        response = http_client.post(path, json={"curies": id_sublist, **params})
         if not response.ok:
             raise RuntimeError("Error: NodeNorm request failed with status code " + str(response.status_code))
 
-        results = response.json()
+        results = json_codec.response_json(response)
+        cache.add(namespace, [curie for curie in id_sublist if results.get(curie) is None])
         for curie in id_sublist:
             if curie in results and results[curie]:
                 identifier = results[curie].get('id', {})
@@ -184,6 +275,11 @@ def ID_convert_to_preferred_name_nodeNormalizer(id_list):
                 unrecoglized_ids.append(curie)
 
                 dic_id_map[curie] = curie
+    for curie in cached_unknown_ids:
+        unrecoglized_ids.append(curie)
+        dic_id_map[curie] = curie
+    # keep the order of the input
+    dic_id_map = {curie: dic_id_map[curie] for curie in all_ids}
     if len(unrecoglized_ids) > 0:
         print("NodeNorm does not know about these identifiers: " + ",".join(unrecoglized_ids))
 
@@ -0,0 +1,389 @@
+"""
+A streaming name → CURIE → normalized node → annotations pipeline.
+
+Rows are read in batches and passed through three stages (`name_resolver` bulk lookup, `node_normalizer`
+normalization, `node_annotator` annotation) that run concurrently, each with its own worker threads, connected by
+bounded queues: while one batch is being annotated, the next ones are being normalized and looked up, and a slow stage
+slows the reader down instead of filling the memory. The stages send their requests through the SDK
+(`name_resolver.batch_lookup_results`, `node_normalizer.normalized_nodes_results` and
+`node_annotator.annotation_results`), so they share its negative cache and request coalescing. The JSON responses can
+be parsed in a process pool (`processes`), which only sends the few extracted fields back. Enriched rows come out in
+input order.
+
+`run_file` (and the `tct-pipeline` command) reads a CSV/TSV file and writes the enriched rows as they are completed.
+
+Examples
+--------
+>>> pipeline = Pipeline(name_column='disease', workers=4, lookup_kwargs={'biolink_types': ['biolink:Disease']})
+>>> for row in pipeline.run(rows):
+...     print(row['disease'], row['normalized_curie'], row['annotations'])
+>>> pipeline.run_file('diseases.tsv', 'diseases_enriched.tsv')
+
+$ tct-pipeline diseases.tsv diseases_enriched.tsv --name-column disease --processes 4
+"""
+from collections.abc import Callable, Iterable, Iterator
+import functools
+import queue
+import threading
+import time
+
+from . import instrumentation, json_codec
+
+LOOKUP_COLUMNS = ['curie', 'label']
+NORMALIZE_COLUMNS = ['normalized_curie', 'normalized_label', 'category']
+STAGES = ('lookup', 'normalize', 'annotate')
+
+_DONE = object()
+
+
+class _Aborted(Exception):
+    """Raised in the workers when another stage failed or the consumer stopped reading."""
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return json_codec.dumps(value).decode('utf-8')
+
+
+# Parsers of the raw responses. They are module-level functions, so that they can run in a process pool, and return
+# only the fields that the pipeline needs, in the shape of the SDK's raw results.
+
+def parse_lookup(content:bytes) -> dict[str, list[dict]]:
+    """Parses a `bulk-lookup` response into name : [{'curie', 'label'} of the top result], or [] if none matched."""
+    return {name: [{'curie': nodes[0].get('curie'), 'label': nodes[0].get('label')}] if nodes else []
+        for name, nodes in json_codec.loads(content).items()}
+
+
+def parse_normalized(content:bytes) -> dict[str, dict | None]:
+    """
+    Parses a `get_normalized_nodes` response into CURIE : {'normalized_curie', 'normalized_label', 'category'}, or
+    None for an unknown CURIE.
+    """
+    results = {}
+    for curie, node in json_codec.loads(content).items():
+        results[curie] = None if node is None else {'normalized_curie': node['id']['identifier'],
+            'normalized_label': node['id'].get('label'), 'category': (node.get('type') or [None])[0]}
+    return results
+
+
+def parse_annotations(content:bytes, fields:list[str] | None) -> dict[str, dict]:
+    """
+    Parses an annotator `curie` response into CURIE : {field : value} for the given dotted `fields`, or
+    CURIE : {'annotations': the whole annotation as JSON} if `fields` is None.
+    """
+    results = {}
+    for curie, annotation in json_codec.loads(content).items():
+        # like `node_annotator.lookup_curies`, unwrap lists of a single annotation
+        if isinstance(annotation, list) and len(annotation) == 1:
+            annotation = annotation[0]
+        if fields is None:
+            results[curie] = {'annotations': _json_value(annotation)}
+            continue
+        row = {}
+        for field in fields:
+            value = annotation
+            for part in field.split('.'):
+                value = value.get(part) if isinstance(value, dict) else None
+            row[field] = _json_value(value)
+        results[curie] = row
+    return results
+
+
+class Pipeline:
+    """
+    Enriches rows that contain a name with its CURIE, normalized node and annotations.
+
+    Parameters
+    ----------
+    name_column : str | None
+        The column holding the names. Default: 'name' if the rows have it, else their first column
+    batch_size : int
+        Number of rows per batch. Default: 100
+    workers : int | dict[str, int]
+        Number of worker threads per stage, or stage ('lookup', 'normalize', 'annotate') : number of workers. Default: 4
+    queue_size : int
+        Maximum number of batches waiting between two stages. Default: 8
+    processes : int
+        Number of processes parsing the responses, or 0 to parse them in the worker threads. Default: 0
+    annotate : bool
+        If False, the annotation stage is skipped. Default: True
+    annotation_fields : list[str] | None
+        Dotted annotation fields (e.g. 'symbol' or 'disease_ontology.doid') written to columns of the same name, and
+        requested with the annotator's `fields` argument. If None, the whole annotation is written to an
+        'annotations' column as JSON.
+    lookup_kwargs, normalize_kwargs, annotate_kwargs : dict | None
+        Other arguments of the `bulk-lookup`, `get_normalized_nodes` and annotator `curie` requests. `bulk-lookup`
+        only asks for the top result (`limit=1`) unless `lookup_kwargs` sets a limit. The names that matched nothing
+        are remembered in the negative cache of `batch_lookup` calls with the same arguments (including the limit).
+    lookup_size : int
+        Number of names per `bulk-lookup` request (see `name_resolver.batch_lookup`). Default: 25
+    """
+
+    def __init__(self, name_column:str | None=None, batch_size:int=100, workers:int | dict[str, int]=4,
+            queue_size:int=8, processes:int=0, annotate:bool=True, annotation_fields:list[str] | None=None,
+            lookup_kwargs:dict | None=None, normalize_kwargs:dict | None=None, annotate_kwargs:dict | None=None,
+            lookup_size:int=25):
+        self.name_column = name_column
+        self.batch_size = batch_size
+        self.workers = {stage: workers.get(stage, 4) if isinstance(workers, dict) else workers for stage in STAGES}
+        self.queue_size = queue_size
+        self.processes = processes
+        self.annotate = annotate
+        self.annotation_fields = annotation_fields
+        self.lookup_kwargs = {'limit': 1, **(lookup_kwargs or {})}
+        self.normalize_kwargs = normalize_kwargs or {}
+        self.annotate_kwargs = dict(annotate_kwargs or {})
+        if annotation_fields is not None and 'fields' not in self.annotate_kwargs:
+            self.annotate_kwargs['fields'] = ','.join(annotation_fields)
+        self.lookup_size = lookup_size
+
+    @property
+    def columns(self) -> list[str]:
+        """The columns added to every row."""
+        columns = LOOKUP_COLUMNS + NORMALIZE_COLUMNS
+        if self.annotate:
+            columns = columns + (self.annotation_fields if self.annotation_fields is not None else ['annotations'])
+        return columns
+
+    def run(self, rows:Iterable[dict]) -> Iterator[dict]:
+        """
+        Yields the enriched rows (copies of the input rows with the added `columns`), in input order.
+
+        The stages run in background threads while the rows are consumed. If a stage fails, its exception is raised
+        here; if the consumer stops early, the stages are stopped.
+        """
+        run = _Run(self, iter(rows))
+        try:
+            yield from run.results()
+        finally:
+            run.close()
+
+    def run_file(self, input_path:str, output_path:str, delimiter:str | None=None,
+            progress:Callable[[int], None] | None=None) -> dict:
+        """
+        Enriches a CSV/TSV file. The delimiter is a tab for '.tsv' and '.tab' files and a comma otherwise, unless
+        given. Rows are written (and flushed) as they are completed. `output_path` '-' writes to stdout.
+        Returns {'rows': number of rows, 'seconds': elapsed time}.
+        """
+        import csv
+        import sys
+        if delimiter is None:
+            delimiter = '\t' if input_path.endswith(('.tsv', '.tab')) else ','
+        start = time.perf_counter()
+        n_rows = 0
+        with open(input_path, newline='', encoding='utf-8') as input_file:
+            reader = csv.DictReader(input_file, delimiter=delimiter)
+            fieldnames = list(reader.fieldnames or [])
+            output = sys.stdout if output_path == '-' else open(output_path, 'w', newline='', encoding='utf-8')
+            try:
+                writer = csv.DictWriter(output, fieldnames + [c for c in self.columns if c not in fieldnames],
+                    delimiter=delimiter, extrasaction='ignore')
+                writer.writeheader()
+                batch = []
+                for row in self.run(reader):
+                    batch.append(row)
+                    if len(batch) == self.batch_size:
+                        writer.writerows(batch)
+                        output.flush()
+                        n_rows += len(batch)
+                        batch = []
+                        if progress is not None:
+                            progress(n_rows)
+                writer.writerows(batch)
+                n_rows += len(batch)
+            finally:
+                if output is not sys.stdout:
+                    output.close()
+        return {'rows': n_rows, 'seconds': time.perf_counter() - start}
+
+
+class _Run:
+    """The threads, queues and process pool of one `Pipeline.run`."""
+
+    def __init__(self, pipeline:Pipeline, rows:Iterator[dict]):
+        self.pipeline = pipeline
+        self.rows = rows
+        self.name_column = pipeline.name_column
+        self.abort = threading.Event()
+        self.error = None
+        self.pool = None
+        if pipeline.processes:
+            import concurrent.futures
+            import multiprocessing
+            self.pool = concurrent.futures.ProcessPoolExecutor(pipeline.processes, mp_context=multiprocessing.get_context('spawn'))
+
+        stages = [self._lookup, self._normalize] + ([self._annotate] if pipeline.annotate else [])
+        self.queues = [queue.Queue(pipeline.queue_size) for _ in range(len(stages) + 1)]
+        self.threads = [threading.Thread(target=self._read, name='Pipeline-read', daemon=True)]
+        for i, (stage, fn) in enumerate(zip(STAGES, stages)):
+            n_workers = pipeline.workers[stage]
+            # the number of running workers of the stage: the last one to finish passes _DONE on
+            remaining = [n_workers, threading.Lock()]
+            for j in range(n_workers):
+                self.threads.append(threading.Thread(target=self._work, name=f'Pipeline-{stage}-{j}', daemon=True,
+                    args=(stage, fn, self.queues[i], self.queues[i + 1], remaining)))
+        for thread in self.threads:
+            thread.start()
+
+    # queue operations that give up when the run is aborted
+
+    def _put(self, q:queue.Queue, item):
+        while not self.abort.is_set():
+            try:
+                return q.put(item, timeout=0.1)
+            except queue.Full:
+                pass
+        raise _Aborted()
+
+    def _get(self, q:queue.Queue):
+        while not self.abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        raise _Aborted()
+
+    def _fail(self, exc:BaseException):
+        if self.error is None:
+            self.error = exc
+        self.abort.set()
+
+    def _read(self):
+        try:
+            index = 0
+            batch = []
+            for row in self.rows:
+                if self.name_column is None:
+                    self.name_column = 'name' if 'name' in row else next(iter(row))
+                batch.append(dict(row))
+                if len(batch) == self.pipeline.batch_size:
+                    self._put(self.queues[0], (index, batch))
+                    index += 1
+                    batch = []
+            if batch:
+                self._put(self.queues[0], (index, batch))
+            self._put(self.queues[0], _DONE)
+        except _Aborted:
+            pass
+        except BaseException as exc:
+            self._fail(exc)
+
+    def _work(self, stage:str, fn:Callable[[list[dict]], None], in_queue:queue.Queue, out_queue:queue.Queue,
+            remaining:list):
+        try:
+            while True:
+                item = self._get(in_queue)
+                if item is _DONE:
+                    # let the other workers of the stage see it too
+                    self._put(in_queue, _DONE)
+                    break
+                index, batch = item
+                with instrumentation.span('pipeline.stage', stage=stage):
+                    fn(batch)
+                self._put(out_queue, (index, batch))
+            with remaining[1]:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._put(out_queue, _DONE)
+        except _Aborted:
+            pass
+        except BaseException as exc:
+            self._fail(exc)
+
+    def results(self) -> Iterator[dict]:
+        """Yields the rows of the completed batches in input order."""
+        completed = {}
+        next_index = 0
+        out_queue = self.queues[-1]
+        while True:
+            try:
+                item = self._get(out_queue)
+            except _Aborted:
+                raise self.error from None
+            if item is _DONE:
+                break
+            index, batch = item
+            completed[index] = batch
+            while next_index in completed:
+                yield from completed.pop(next_index)
+                next_index += 1
+
+    def close(self):
+        self.abort.set()
+        for thread in self.threads:
+            thread.join()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    # stages; each one adds its columns to the rows of a batch in place
+
+    def _lookup(self, batch:list[dict]):
+        from . import name_resolver
+        column = self.name_column
+        names = list(dict.fromkeys(row[column] for row in batch if row.get(column)))
+        results = {}
+        if names:
+            results = name_resolver.batch_lookup_results(names, self.pipeline.lookup_size, parse=parse_lookup,
+                executor=self.pool, **self.pipeline.lookup_kwargs)
+        for row in batch:
+            nodes = results.get(row.get(column))
+            row.update(nodes[0] if nodes else dict.fromkeys(LOOKUP_COLUMNS))
+
+    def _normalize(self, batch:list[dict]):
+        from . import node_normalizer
+        curies = list(dict.fromkeys(row['curie'] for row in batch if row['curie']))
+        results = {}
+        if curies:
+            results = node_normalizer.normalized_nodes_results(curies, 'post', parse=parse_normalized,
+                executor=self.pool, **self.pipeline.normalize_kwargs)
+        for row in batch:
+            row.update(results.get(row['curie']) or dict.fromkeys(NORMALIZE_COLUMNS))
+
+    def _annotate(self, batch:list[dict]):
+        from . import node_annotator
+        curies = list(dict.fromkeys(row['normalized_curie'] for row in batch if row['normalized_curie']))
+        fields = self.pipeline.annotation_fields
+        results = {}
+        if curies:
+            results = node_annotator.annotation_results(curies, parse=functools.partial(parse_annotations, fields=fields),
+                executor=self.pool, **self.pipeline.annotate_kwargs)
+        empty = dict.fromkeys(fields if fields is not None else ['annotations'])
+        for row in batch:
+            row.update(results.get(row['normalized_curie']) or empty)
+
+
+def main(argv:list[str] | None=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='tct-pipeline',
+        description='Adds the CURIE, normalized node and annotations of every name of a CSV/TSV file.')
+    parser.add_argument('input', help='input CSV/TSV file')
+    parser.add_argument('output', help="output file ('-' for stdout)")
+    parser.add_argument('--name-column', help="column holding the names (default: 'name' or the first column)")
+    parser.add_argument('--delimiter', help='field delimiter (default: tab for .tsv files, comma otherwise)')
+    parser.add_argument('--batch-size', type=int, default=100, help='rows per batch (default: 100)')
+    parser.add_argument('--workers', type=int, default=4, help='worker threads per stage (default: 4)')
+    parser.add_argument('--queue-size', type=int, default=8, help='batches waiting between stages (default: 8)')
+    parser.add_argument('--processes', type=int, default=0, help='processes parsing responses (default: 0, in the workers)')
+    parser.add_argument('--no-annotate', action='store_true', help='skip the annotation stage')
+    parser.add_argument('--fields', help='comma-separated annotation fields (default: the whole annotation as JSON)')
+    parser.add_argument('--biolink-type', action='append', help='only look up names of this type (repeatable)')
+    parser.add_argument('--only-taxa', help="only look up names of these taxa, e.g. 'NCBITaxon:9606'")
+    args = parser.parse_args(argv)
+
+    lookup_kwargs = {}
+    if args.biolink_type:
+        lookup_kwargs['biolink_types'] = args.biolink_type
+    if args.only_taxa:
+        lookup_kwargs['only_taxa'] = args.only_taxa
+    pipeline = Pipeline(args.name_column, args.batch_size, args.workers, args.queue_size, args.processes,
+        annotate=not args.no_annotate, annotation_fields=args.fields.split(',') if args.fields else None,
+        lookup_kwargs=lookup_kwargs)
+    stats = pipeline.run_file(args.input, args.output, args.delimiter)
+    if args.output != '-':
+        print(f'{stats["rows"]} rows in {stats["seconds"]:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""
+A response cache for TRAPI KP queries, used by `translator_query.query_KP` and `translator_query.parallel_api_query`.
+
+Responses are keyed by (KP name, KP URL, canonicalized query graph). Canonicalization sorts and deduplicates lists of
+identifiers, categories and predicates, so two queries that only differ in the order of their IDs or predicates share
+one entry. The cache has a memory tier (LRU, bounded by entry count and bytes) and an optional disk tier (bounded by
+bytes), and every entry expires after `ttl` seconds.
+
+Examples
+--------
+>>> cache = QueryCache(cache_dir='~/.cache/translator_sdk/kp_responses', ttl=7 * 24 * 3600)
+>>> result = translator_query.parallel_api_query(query_json, selected_APIs, APInames, API_predicates, cache=cache)
+>>> cache.stats()
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from . import instrumentation, json_codec
+
+
+def canonicalize_query(query_json):
+    """
+    Returns a copy of the query in which every list of strings (IDs, categories, predicates) is sorted and
+    deduplicated. Dict key order is normalized by `query_hash`.
+    """
+    if isinstance(query_json, dict):
+        return {k: canonicalize_query(v) for k, v in query_json.items()}
+    if isinstance(query_json, list):
+        if all(isinstance(v, str) for v in query_json):
+            return sorted(set(query_json))
+        return [canonicalize_query(v) for v in query_json]
+    return query_json
+
+
+def query_hash(query_json:dict, *parts:str) -> str:
+    """
+    Returns a hex digest identifying the canonicalized query, combined with any extra `parts` (e.g. KP name and URL).
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    h.update(json.dumps(canonicalize_query(query_json), sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    return h.hexdigest()
+
+
+class QueryCache:
+    """
+    A two-tier (memory and disk) cache of KP responses with TTL and size-based eviction.
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of entries in the memory tier. Default: 1024
+    max_bytes : int
+        Maximum total size (in serialized JSON bytes) of the memory tier. Default: 256 MB
+    ttl : float
+        Time-to-live of each entry in seconds. Default: 86400 (one day)
+    cache_dir : str | None
+        Directory for the disk tier. If None, only the memory tier is used.
+    max_disk_bytes : int
+        Maximum total size of the disk tier. Default: 4 GB
+    name : str
+        Name of the cache in the `instrumentation` metrics. Default: 'kp_query'
+    """
+
+    def __init__(self, max_entries:int=1024, max_bytes:int=256 * 2**20, ttl:float=86400,
+            cache_dir:str | None=None, max_disk_bytes:int=4 * 2**30, name:str='kp_query'):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir is not None else None
+        self.max_disk_bytes = max_disk_bytes
+        self.name = name
+
+        self._memory = OrderedDict()
+        "key : (expires_at, size, value), in least- to most-recently used order"
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        "key : size, in least- to most-recently used order"
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def key(self, API_name:str, API_url:str, query_json:dict) -> str:
+        """Returns the cache key for a query sent to the given KP."""
+        return query_hash(query_json, API_name, API_url)
+
+    def get(self, key:str):
+        """Returns the cached value for `key`, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    instrumentation.count('cache.hits', cache=self.name, tier='memory')
+                    return entry[2]
+                self._remove_memory(key)
+            if key not in self._disk:
+                self.misses += 1
+                instrumentation.count('cache.misses', cache=self.name)
+                return None
+        # Disk reads happen outside of the lock.
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None or entry['expires_at'] <= now:
+                self._remove_disk(key)
+                self.misses += 1
+                instrumentation.count('cache.misses', cache=self.name)
+                return None
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self.disk_hits += 1
+            instrumentation.count('cache.hits', cache=self.name, tier='disk')
+            self._set_memory(key, entry['expires_at'], entry['size'], entry['value'])
+        return entry['value']
+
+    def set(self, key:str, value, size:int | None=None):
+        """
+        Stores `value` (a JSON-serializable object) under `key`. `size` is the size of the value in bytes;
+        if not given, it is computed by serializing the value.
+        """
+        data = None
+        if size is None or self.cache_dir is not None:
+            data = json_codec.dumps(value)
+            size = len(data)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._set_memory(key, expires_at, size, value)
+        if self.cache_dir is not None and size <= self.max_disk_bytes:
+            self._write_disk(key, expires_at, data)
+
+    def clear(self):
+        """Removes all entries from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            keys = list(self._disk)
+        for key in keys:
+            with self._lock:
+                self._remove_disk(key)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and tier sizes."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else None,
+                'evictions': self.evictions,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+            }
+
+    # memory tier; these must be called with self._lock held
+
+    def _set_memory(self, key, expires_at, size, value):
+        if key in self._memory:
+            self._remove_memory(key)
+        if size > self.max_bytes:
+            return
+        self._memory[key] = (expires_at, size, value)
+        self._memory_bytes += size
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            oldest = next(iter(self._memory))
+            self._remove_memory(oldest)
+            self.evictions += 1
+
+    def _remove_memory(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[1]
+
+    # disk tier
+
+    def _path(self, key:str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def _load_disk_index(self):
+        entries = []
+        for subdir in os.scandir(self.cache_dir):
+            if not subdir.is_dir():
+                continue
+            for f in os.scandir(subdir.path):
+                if f.name.endswith('.json'):
+                    stat = f.stat()
+                    entries.append((stat.st_mtime, f.name[:-len('.json')], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _read_disk(self, key:str) -> dict | None:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = json_codec.loads(f.read())
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def _write_disk(self, key:str, expires_at:float, data:bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        content = b'{"expires_at":' + repr(expires_at).encode('ascii') + b',"size":' + str(len(data)).encode('ascii') + b',"value":' + data + b'}'
+        # Write to a temporary file first, so that readers never see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(key, 0)
+            self._disk[key] = len(content)
+            self._disk_bytes += len(content)
+            while self._disk_bytes > self.max_disk_bytes and len(self._disk) > 0:
+                self._remove_disk(next(iter(self._disk)))
+                self.evictions += 1
+
+    def _remove_disk(self, key:str):
+        # must be called with self._lock held
+        size = self._disk.pop(key, None)
+        if size is None:
+            return
+        self._disk_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
@@ -0,0 +1,183 @@
+"""
+Micro-batching of small one-hop TRAPI queries.
+
+Services often receive bursts of queries that only differ in their subject IDs (same predicates, same object
+categories). A `QueryCoalescer` collects such queries for a short window, merges each compatible group into a single
+multi-ID query, sends it with `translator_query.parallel_api_query` (one request per KP instead of one per caller) and
+hands every caller back only the edges for its own subjects.
+
+Examples
+--------
+>>> APInames, metaKG, API_predicates = translator_query.get_translator_API_predicates()
+>>> with QueryCoalescer(selected_APIs, APInames, API_predicates, window=0.05, max_workers=8) as coalescer:
+...     futures = [coalescer.submit(gene, ['biolink:Disease'], ['biolink:related_to']) for gene in genes]
+...     results = [future.result() for future in futures]
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+import time
+
+from . import translator_query
+
+
+class _PendingGroup:
+    """Queries waiting to be sent together."""
+
+    def __init__(self, object_categories:list[str], predicates:list[str]):
+        self.object_categories = object_categories
+        self.predicates = predicates
+        self.created_at = time.monotonic()
+        self.callers = []
+        "list of (subject_ids, future)"
+        self.subject_ids = {}
+        "all subject IDs in the group, in order of arrival (a dict used as an ordered set)"
+
+
+class QueryCoalescer:
+    """
+    Merges compatible pending one-hop queries into one multi-ID query per KP.
+
+    Queries are compatible if they have the same set of predicates and the same set of object categories.
+    A group of compatible queries is sent once it is `window` seconds old or has `max_batch_ids` subject IDs.
+
+    Edges are returned to a caller if their subject is one of the caller's subject IDs (or, for edges that KPs return
+    in the reverse direction, if their object is). KPs that return a different CURIE for the subject than the one
+    that was queried therefore cannot be demultiplexed; normalize the subject IDs first if this matters.
+
+    Parameters
+    ----------
+    selected_APIs : list[str]
+        The KPs to query. See `translator_query.parallel_api_query`.
+    APInames : dict[str, str]
+        dict of API names to URLs. This is the first output of `translator_query.get_translator_API_predicates()`.
+    API_predicates : dict[str, list[str]]
+        A dict of API names to a list of their predicates. This is the third output of `get_translator_API_predicates()`.
+    window : float
+        How long (in seconds) a query may wait for others to join its batch. Default: 0.05
+    max_batch_ids : int
+        A batch is sent as soon as it has this many subject IDs. Default: 1000
+    max_workers : int
+        Number of batches in flight at the same time. Default: 4
+    kp_workers : int
+        Number of KPs queried in parallel for each batch (the `max_workers` of `parallel_api_query`). Default: 8
+    **query_kwargs
+        Other arguments to `translator_query.parallel_api_query`, e.g. `cache` or `shard_size`.
+    """
+
+    def __init__(self, selected_APIs:list[str], APInames:dict[str, str], API_predicates:dict[str, list[str]],
+            window:float=0.05, max_batch_ids:int=1000, max_workers:int=4, kp_workers:int=8, **query_kwargs):
+        self.selected_APIs = selected_APIs
+        self.APInames = APInames
+        self.API_predicates = API_predicates
+        self.window = window
+        self.max_batch_ids = max_batch_ids
+        self.query_kwargs = {'max_workers': kp_workers, **query_kwargs}
+
+        self.submitted = 0
+        self.batches = 0
+        self._groups = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='coalescer')
+        self._flusher = threading.Thread(target=self._run, name='coalescer-flusher', daemon=True)
+        self._flusher.start()
+
+    def submit(self, subject_ids:str | list[str], object_categories:list[str], predicates:list[str]) -> Future:
+        """
+        Queues a one-hop query (see `translator_query.build_query_json`).
+
+        Returns a Future whose result is the merged edges dict for the given subjects, as returned by
+        `translator_query.parallel_api_query`.
+        """
+        if isinstance(subject_ids, str):
+            subject_ids = [subject_ids]
+        key = (frozenset(object_categories), frozenset(predicates))
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('QueryCoalescer is closed')
+            group = self._groups.get(key)
+            if group is None:
+                group = _PendingGroup(list(object_categories), list(predicates))
+                self._groups[key] = group
+            group.callers.append((list(subject_ids), future))
+            group.subject_ids.update(dict.fromkeys(subject_ids))
+            self.submitted += 1
+            if len(group.subject_ids) >= self.max_batch_ids:
+                self._dispatch(key)
+            else:
+                self._condition.notify()
+        return future
+
+    def query(self, subject_ids:str | list[str], object_categories:list[str], predicates:list[str]) -> dict:
+        """Like `submit`, but waits for and returns the result."""
+        return self.submit(subject_ids, object_categories, predicates).result()
+
+    def flush(self):
+        """Sends all pending queries right away."""
+        with self._condition:
+            for key in list(self._groups):
+                self._dispatch(key)
+
+    def close(self, wait:bool=True):
+        """Sends all pending queries and stops accepting new ones."""
+        with self._condition:
+            self._closed = True
+            for key in list(self._groups):
+                self._dispatch(key)
+            self._condition.notify()
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def stats(self) -> dict:
+        """Returns the number of submitted queries and of batches sent."""
+        with self._condition:
+            return {'submitted': self.submitted, 'batches': self.batches, 'pending': sum(len(g.callers) for g in self._groups.values())}
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                if len(self._groups) == 0:
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                for key, group in list(self._groups.items()):
+                    if now - group.created_at >= self.window:
+                        self._dispatch(key)
+                if len(self._groups) > 0:
+                    oldest = min(group.created_at for group in self._groups.values())
+                    self._condition.wait(max(0.0, oldest + self.window - time.monotonic()))
+
+    def _dispatch(self, key):
+        # must be called with self._condition held
+        group = self._groups.pop(key)
+        self.batches += 1
+        self._executor.submit(self._send, group)
+
+    def _send(self, group:_PendingGroup):
+        try:
+            query_json = translator_query.build_query_json(list(group.subject_ids), group.object_categories, group.predicates)
+            edges = translator_query.parallel_api_query(query_json, self.selected_APIs, self.APInames,
+                    self.API_predicates, **self.query_kwargs)
+        except Exception as exc:
+            for _, future in group.callers:
+                future.set_exception(exc)
+            return
+
+        # Index the edges under every endpoint that was queried, so that an edge between two
+        # queried CURIEs (or one returned in reverse) reaches the callers of both ends.
+        by_curie = {}
+        for edge_id, edge in edges.items():
+            for curie in {edge.get('subject'), edge.get('object')}:
+                if curie in group.subject_ids:
+                    by_curie.setdefault(curie, {})[edge_id] = edge
+        for subject_ids, future in group.callers:
+            result = {}
+            for curie in subject_ids:
+                result.update(by_curie.get(curie, {}))
+            future.set_result(result)
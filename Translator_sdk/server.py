@@ -0,0 +1,479 @@
+"""
+A local caching proxy for the Translator services, started with the `tct-server` command.
+
+The proxy speaks the NameRes, NodeNorm, Annotator, SmartAPI and TRAPI endpoints, so that many notebooks and jobs can
+share one cache and one set of upstream connections:
+
+- batch endpoints (NodeNorm `get_normalized_nodes`, NameRes `bulk-lookup`, Annotator `curie`) are cached per
+  identifier; the identifiers that are not cached are coalesced with identical requests of other clients already in
+  flight (`single_flight`) and batched with the requests that arrive within `window` seconds;
+- other GET endpoints (e.g. NameRes `lookup` and `synonyms`, the SmartAPI meta knowledge graph) and TRAPI queries are
+  cached per request (TRAPI queries are canonicalized like in `query_cache`) and coalesced;
+- everything else (e.g. `status`) is forwarded as is.
+
+Upstream requests go through `http_client`, so they share its rate limits and retry policy. Only successful responses
+are cached.
+
+The services are served under `/nameres/`, `/nodenorm/`, `/annotator/` and `/smartapi/`, and the KPs under
+`/kp/<API name>/query`. `use` points the SDK at a running proxy, and `kp_urls` maps the KP URLs of
+`translator_query.get_translator_API_predicates()` to the proxy. `/stats` returns the cache and upstream statistics.
+
+Examples
+--------
+$ tct-server --port 8900 --cache-dir ~/.cache/translator_sdk/proxy
+
+>>> with server.use('http://127.0.0.1:8900/'):
+...     nodes = node_normalizer.get_normalized_nodes(curies, mode='post')
+...     APInames, metaKG, API_predicates = translator_query.get_translator_API_predicates()
+...     result = translator_query.parallel_api_query(query_json, selected_APIs, server.kp_urls('http://127.0.0.1:8900/', APInames), API_predicates)
+"""
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextlib
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import urllib.parse
+import zlib
+
+from . import http_client, instrumentation, json_codec
+from .query_cache import QueryCache, query_hash
+from .single_flight import SingleFlight, make_key
+
+SMARTAPI_URL = 'https://smart-api.info/api/'
+"""The root URL of the SmartAPI registry (the meta knowledge graph is at `metakg/consolidated`)."""
+
+BATCH_FIELDS = {
+    ('nodenorm', 'get_normalized_nodes', 'GET'): 'curie',
+    ('nodenorm', 'get_normalized_nodes', 'POST'): 'curies',
+    ('nameres', 'bulk-lookup', 'POST'): 'strings',
+    ('annotator', 'curie', 'POST'): 'ids',
+}
+"""(service, endpoint, method) : the parameter or body field holding the identifiers of a batch endpoint."""
+
+DEFAULT_BATCH_SIZES = {'nodenorm': 500, 'nameres': 25, 'annotator': 500}
+"""Maximum number of identifiers sent upstream in one request, per service (the SDK's own defaults)."""
+
+
+class UpstreamError(Exception):
+    """An upstream service answered with an error; the proxy returns the same status and body to its clients."""
+
+    def __init__(self, status_code:int, content:bytes):
+        super().__init__(f'Upstream error {status_code}')
+        self.status_code = status_code
+        self.content = content
+
+
+class BadRequest(Exception):
+    """The request of a client is invalid (e.g. a body that isn't JSON); the proxy answers with status 400."""
+
+
+class _Batch:
+    def __init__(self):
+        self.keys = {}
+        "the keys of the batch, in order of arrival (a dict used as an ordered set)"
+        self.full = threading.Event()
+        self.future = Future()
+        self.future.set_running_or_notify_cancel()
+
+
+class _Batcher:
+    """
+    Merges the keys requested by concurrent callers into one batch. The first caller of a batch (the leader) waits up
+    to `window` seconds for others to join, or until the batch has `max_size` keys, and then sends it.
+    """
+
+    def __init__(self, send:Callable[[list], dict], window:float, max_size:int):
+        self.send = send
+        self.window = window
+        self.max_size = max_size
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def fetch(self, keys:list) -> dict:
+        with self._lock:
+            batch = self._pending
+            leader = batch is None
+            if leader:
+                batch = self._pending = _Batch()
+            batch.keys.update(dict.fromkeys(keys))
+            if len(batch.keys) >= self.max_size:
+                # later callers start a new batch
+                self._pending = None
+                batch.full.set()
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._pending is batch:
+                    self._pending = None
+            try:
+                batch.future.set_result(self.send(list(batch.keys)))
+            except BaseException as exc:
+                batch.future.set_exception(exc)
+        values = batch.future.result()
+        return {key: values[key] for key in keys if key in values}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    server: '_Server'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _read_body(self) -> bytes | None:
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            # the rest of the request can't be found, so the connection can't be reused
+            self.close_connection = True
+            raise BadRequest(f'Invalid Content-Length {self.headers.get("Content-Length")!r}') from None
+        if not length:
+            return None
+        body = self.rfile.read(length)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            try:
+                body = gzip.decompress(body)
+            except (OSError, EOFError, zlib.error) as exc:
+                raise BadRequest(f'Invalid gzip body: {exc}') from exc
+        return body
+
+    def _handle(self, method:str):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        service, _, endpoint = url.path.strip('/').partition('/')
+        try:
+            body = self._read_body()
+            status, content = self.server.proxy.handle(method, service, endpoint, params, body,
+                self.headers.get('Content-Type', 'application/json'))
+        except UpstreamError as exc:
+            status, content = exc.status_code, exc.content
+        except BadRequest as exc:
+            status, content = 400, _dumps({'detail': str(exc)})
+        except Exception as exc:
+            # e.g. the upstream service can't be reached
+            status, content = 502, _dumps({'detail': repr(exc)})
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        minimum = self.server.proxy.compress_min_bytes
+        if minimum is not None and len(content) >= minimum and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content, compresslevel=5)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    proxy: 'ProxyServer'
+
+
+def _dumps(value) -> bytes:
+    return json_codec.dumps(value)
+
+
+def _request_json(body:bytes | None) -> dict:
+    """Decodes the JSON object of a client request, raising `BadRequest` if the body is not one."""
+    try:
+        value = json_codec.loads(body) if body else None
+    except ValueError as exc:
+        raise BadRequest(f'Invalid JSON body: {exc}') from exc
+    if not isinstance(value, dict):
+        raise BadRequest('The request body must be a JSON object')
+    return value
+
+
+class ProxyServer:
+    """
+    A caching, coalescing and batching HTTP proxy for the Translator services.
+
+    Parameters
+    ----------
+    host : str
+        Default: '127.0.0.1'
+    port : int
+        Default: 8900 (0 for any free port)
+    cache : QueryCache | None
+        The shared cache. Default: a memory-only `QueryCache` of up to 1,000,000 entries and 1 GB
+    window : float
+        How long (in seconds) a batch waits for the identifiers of other clients. Default: 0.01
+    batch_sizes : dict[str, int] | None
+        Service : maximum number of identifiers per upstream request. Default: `DEFAULT_BATCH_SIZES`
+    max_workers : int
+        Number of upstream requests sent in parallel for one batch. Default: 8
+    nameres_url, nodenorm_url, annotator_url, smartapi_url : str | None
+        Root URLs of the upstream services. Default: the URLs of `name_resolver`, `node_normalizer`, `node_annotator`
+        and `SMARTAPI_URL`
+    kps : dict[str, str] | None
+        API name : TRAPI query URL of the KPs served under `/kp/`. Default: the KPs of
+        `translator_query.get_translator_API_predicates()`, loaded on the first TRAPI query
+    compress_min_bytes : int | None
+        Responses of at least this many bytes are gzip-compressed for the clients that accept it, which is worth it
+        when the clients reach the proxy over a network. Default: None (never compress)
+    """
+
+    def __init__(self, host:str='127.0.0.1', port:int=8900, cache:QueryCache | None=None, window:float=0.01,
+            batch_sizes:dict[str, int] | None=None, max_workers:int=8, nameres_url:str | None=None,
+            nodenorm_url:str | None=None, annotator_url:str | None=None, smartapi_url:str | None=None,
+            kps:dict[str, str] | None=None, compress_min_bytes:int | None=None):
+        from . import name_resolver, node_annotator, node_normalizer
+        self.cache = cache if cache is not None else QueryCache(max_entries=1_000_000, max_bytes=2**30, name='proxy')
+        self.window = window
+        self.batch_sizes = {**DEFAULT_BATCH_SIZES, **(batch_sizes or {})}
+        self.upstreams = {
+            'nameres': nameres_url or name_resolver.URL,
+            'nodenorm': nodenorm_url or node_normalizer.URL,
+            'annotator': annotator_url or node_annotator.URL,
+            'smartapi': smartapi_url or SMARTAPI_URL,
+        }
+        self.kps = kps
+        self.compress_min_bytes = compress_min_bytes
+        self.single_flight = SingleFlight()
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='ProxyUpstream')
+        self._batchers = {}
+        self._lock = threading.Lock()
+        self._stats = {service: {'requests': 0, 'upstream_requests': 0} for service in [*self.upstreams, 'kp']}
+        self._server = _Server((host, port), _Handler)
+        self._server.proxy = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def start(self) -> 'ProxyServer':
+        """Serves requests in a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name='ProxyServer', daemon=True)
+            self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Serves requests in the calling thread until `stop` is called (or the thread is interrupted)."""
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        self._executor.shutdown()
+
+    def __enter__(self) -> 'ProxyServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self) -> dict:
+        """Returns the requests received and sent upstream per service, and the cache and coalescing statistics."""
+        with self._lock:
+            services = {service: dict(stats) for service, stats in self._stats.items()}
+        return {'services': services, 'cache': self.cache.stats(), 'single_flight': self.single_flight.stats()}
+
+    def _count(self, service:str, key:str, value:int=1):
+        with self._lock:
+            self._stats[service][key] += value
+
+    def handle(self, method:str, service:str, endpoint:str, params:dict[str, list[str]], body:bytes | None,
+            content_type:str='application/json') -> tuple[int, bytes]:
+        """Answers a request to `/<service>/<endpoint>` and returns (status code, JSON content)."""
+        if service == 'stats' and not endpoint:
+            return 200, _dumps(self.stats())
+        if service == 'kp' and method == 'POST' and endpoint.endswith('/query'):
+            self._count('kp', 'requests')
+            return self._query_kp(urllib.parse.unquote(endpoint[:-len('/query')]), body)
+        if service not in self.upstreams:
+            return 404, _dumps({'detail': 'Not Found'})
+        self._count(service, 'requests')
+        with instrumentation.span('proxy.request', service=service, endpoint=endpoint):
+            field = BATCH_FIELDS.get((service, endpoint, method))
+            if field is not None:
+                options = dict(params) if method == 'GET' else _request_json(body)
+                keys = options.pop(field, None)
+                if isinstance(keys, str):
+                    keys = [keys]
+                if not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+                    raise BadRequest(f'{field!r} must be a list of strings')
+                return 200, _dumps(self._batch(service, endpoint, method, field, keys, options))
+            url = self.upstreams[service] + endpoint
+            if method == 'GET' and endpoint != 'status':
+                key = query_hash(params, service, endpoint)
+                return self._cached(service, key, lambda: http_client.get(url, params=params))
+            self._count(service, 'upstream_requests')
+            response = http_client.request(method, url, params=params, data=body, headers={'Content-Type': content_type})
+            return response.status_code, response.content
+
+    def _cached(self, service:str, key:str, send:Callable[[], 'requests.Response']) -> tuple[int, bytes]:
+        """Returns the cached response for `key`, or sends the request (once for all concurrent callers)."""
+        content = self.cache.get(key)
+        if content is not None:
+            return 200, content.encode('utf-8')
+
+        def load():
+            self._count(service, 'upstream_requests')
+            response = send()
+            if response.status_code != 200:
+                raise UpstreamError(response.status_code, response.content)
+            self.cache.set(key, response.text, size=len(response.content))
+            return response.content
+
+        return 200, self.single_flight.do(service, key, load)
+
+    def _query_kp(self, API_name:str, body:bytes) -> tuple[int, bytes]:
+        API_url = self._kp_url(API_name)
+        if API_url is None:
+            return 404, _dumps({'detail': f'Unknown KP {API_name}'})
+        key = self.cache.key(API_name, API_url, _request_json(body))
+        return self._cached('kp', key, lambda: http_client.post(API_url, data=body,
+            headers={'Content-Type': 'application/json'}))
+
+    def _kp_url(self, API_name:str) -> str | None:
+        with self._lock:
+            if self.kps is None:
+                from . import translator_query
+                self.kps = translator_query.get_translator_API_predicates()[0]
+            return self.kps.get(API_name)
+
+    def _batch(self, service:str, endpoint:str, method:str, field:str, keys:list, options:dict) -> dict:
+        """Returns the results of a batch endpoint for the given identifiers, in the order of `keys`."""
+        keys = list(dict.fromkeys(keys))
+        options_key = make_key(options)
+        results = {}
+        missing = []
+        for key in keys:
+            # values are cached in a list, so that a null result (e.g. an unknown CURIE) is not a miss
+            entry = self.cache.get(query_hash({'options': options_key, 'key': key}, service, endpoint))
+            if entry is None:
+                missing.append(key)
+            else:
+                results[key] = entry[0]
+        if missing:
+            namespace = (service, endpoint, method, options_key)
+            batcher = self._batcher(namespace, field, options)
+
+            def fetch(new_keys:list) -> dict:
+                values = batcher.fetch(new_keys)
+                for key, value in values.items():
+                    self.cache.set(query_hash({'options': options_key, 'key': key}, service, endpoint), [value])
+                return values
+
+            results.update(self.single_flight.do_batch(namespace, missing, fetch))
+        return {key: results[key] for key in keys if key in results}
+
+    def _batcher(self, namespace:tuple, field:str, options:dict) -> _Batcher:
+        service, endpoint, method, _ = namespace
+        with self._lock:
+            batcher = self._batchers.get(namespace)
+            if batcher is None:
+                url = self.upstreams[service] + endpoint
+                size = self.batch_sizes[service]
+
+                def send(keys:list) -> dict:
+                    chunks = [keys[i:i + size] for i in range(0, len(keys), size)]
+                    values = {}
+                    for result in self._executor.map(lambda chunk: self._send_chunk(service, method, url, field, chunk, options), chunks):
+                        values.update(result)
+                    return values
+
+                batcher = self._batchers[namespace] = _Batcher(send, self.window, size)
+            return batcher
+
+    def _send_chunk(self, service:str, method:str, url:str, field:str, chunk:list, options:dict) -> dict:
+        self._count(service, 'upstream_requests')
+        instrumentation.observe('batch.size', len(chunk), service=f'proxy.{service}')
+        if method == 'GET':
+            response = http_client.get(url, params={**options, field: chunk})
+        else:
+            response = http_client.post(url, json={**options, field: chunk})
+        if response.status_code != 200:
+            raise UpstreamError(response.status_code, response.content)
+        return json_codec.response_json(response)
+
+
+def kp_urls(url:str, APInames:dict[str, str]) -> dict[str, str]:
+    """
+    Returns a copy of `APInames` (API name : TRAPI query URL) in which every KP is queried through the proxy at `url`.
+    """
+    if not url.endswith('/'):
+        url += '/'
+    return {name: f'{url}kp/{urllib.parse.quote(name, safe="")}/query' for name in APInames}
+
+
+@contextlib.contextmanager
+def use(url:str, compress:bool=False):
+    """
+    Points the service URLs of the SDK (`name_resolver.URL`, `node_normalizer.URL`, `node_annotator.URL` and
+    `translator_metakg.METAKG_URL`) at the proxy at `url` for the duration of the `with` block. If `compress` is True,
+    large request bodies sent to the proxy are gzip-compressed (see `http_client.HostLimiter`).
+    """
+    from . import name_resolver, node_annotator, node_normalizer, translator_metakg
+    if not url.endswith('/'):
+        url += '/'
+    limiter = http_client.get_limiter(url)
+    saved_compress, limiter.compress_requests = limiter.compress_requests, compress
+    urls = [(name_resolver, 'URL', f'{url}nameres/'), (node_normalizer, 'URL', f'{url}nodenorm/'),
+        (node_annotator, 'URL', f'{url}annotator/'), (translator_metakg, 'METAKG_URL', f'{url}smartapi/metakg/consolidated')]
+    saved = [(module, attribute, getattr(module, attribute)) for module, attribute, _ in urls]
+    for module, attribute, value in urls:
+        setattr(module, attribute, value)
+    try:
+        yield
+    finally:
+        for module, attribute, value in saved:
+            setattr(module, attribute, value)
+        limiter.compress_requests = saved_compress
+
+
+def main(argv:list[str] | None=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='tct-server', description='Runs a local caching proxy for the Translator services.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--cache-dir', help='directory of the persistent cache (default: memory only)')
+    parser.add_argument('--ttl', type=float, default=86400, help='time-to-live of cached responses in seconds (default: 86400)')
+    parser.add_argument('--max-entries', type=int, default=1_000_000, help='maximum number of entries in memory (default: 1000000)')
+    parser.add_argument('--max-memory', type=float, default=1024, help='maximum size of the memory cache in MB (default: 1024)')
+    parser.add_argument('--window', type=float, default=0.01, help='batching window in seconds (default: 0.01)')
+    parser.add_argument('--batch-size', action='append', default=[], metavar='SERVICE=N',
+        help=f'maximum identifiers per upstream request, e.g. nodenorm=1000 (default: {DEFAULT_BATCH_SIZES})')
+    parser.add_argument('--max-workers', type=int, default=8, help='upstream requests sent in parallel per batch (default: 8)')
+    for service in ('nameres', 'nodenorm', 'annotator', 'smartapi'):
+        parser.add_argument(f'--{service}-url', help=f'root URL of the upstream {service} service')
+    parser.add_argument('--compress', type=int, metavar='MIN_BYTES',
+        help='gzip-compress responses of at least MIN_BYTES bytes for the clients that accept it (default: never)')
+    args = parser.parse_args(argv)
+
+    batch_sizes = {}
+    for item in args.batch_size:
+        service, _, size = item.partition('=')
+        if service not in DEFAULT_BATCH_SIZES or not size.isdigit():
+            parser.error(f'invalid --batch-size {item!r}, expected one of {sorted(DEFAULT_BATCH_SIZES)}=N')
+        batch_sizes[service] = int(size)
+    cache = QueryCache(max_entries=args.max_entries, max_bytes=int(args.max_memory * 2**20), ttl=args.ttl,
+        cache_dir=args.cache_dir, name='proxy')
+    proxy = ProxyServer(args.host, args.port, cache=cache, window=args.window, batch_sizes=batch_sizes,
+        max_workers=args.max_workers, nameres_url=args.nameres_url, nodenorm_url=args.nodenorm_url,
+        annotator_url=args.annotator_url, smartapi_url=args.smartapi_url, compress_min_bytes=args.compress)
+    print(f'Serving the Translator services at {proxy.url} (use Translator_sdk.server.use({proxy.url!r}) in clients)')
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.stop()
+
+
+if __name__ == '__main__':
+    main()
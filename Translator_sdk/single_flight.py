@@ -0,0 +1,176 @@
+"""
+In-process request coalescing ("single-flight").
+
+When several threads or asyncio tasks make the same request at the same time, only the first one (the leader) sends
+it; the others wait for the leader's result. For batch requests, the keys that are already in flight are removed from
+the outgoing request and their results are taken from the pending requests instead.
+
+This is used by `node_normalizer.get_normalized_nodes`, `name_resolver.lookup`, `name_resolver.batch_lookup` and
+`node_annotator.lookup_curies` (and their async versions, and the raw-result functions that `pipeline` uses), through
+`default_single_flight`. Waiting callers get the same result objects as the leader, so results should not be modified
+in place.
+"""
+from collections.abc import Awaitable, Callable, Hashable, Iterable
+from concurrent.futures import Future
+import json
+import sys
+import threading
+import typing
+
+from . import instrumentation
+
+if typing.TYPE_CHECKING:
+    import asyncio
+
+_MISSING = object()
+
+
+def make_key(*parts) -> str:
+    """Returns a key for a request made of JSON-like parts (e.g. the URL and the query parameters)."""
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+def parser_namespace(namespace:str, parse:Callable | None) -> str:
+    """
+    Returns the namespace of requests whose responses are parsed by `parse` (None for the default parser), so that
+    results parsed differently are not shared. The repr identifies a function (and the arguments of a
+    `functools.partial`) within the process.
+    """
+    return namespace if parse is None else make_key(namespace, repr(parse))
+
+
+def _running_loop() -> 'asyncio.AbstractEventLoop | None':
+    asyncio = sys.modules.get('asyncio')
+    if asyncio is None:
+        # asyncio is imported lazily, so no event loop can be running
+        return None
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class _Call:
+    """A request in flight. `loop` is the event loop of an async leader, or None for a thread."""
+
+    def __init__(self, loop:'asyncio.AbstractEventLoop | None'):
+        self.loop = loop
+        self.future = Future()
+        # A running future can't be cancelled by a waiting task that is itself cancelled.
+        self.future.set_running_or_notify_cancel()
+
+
+class SingleFlight:
+    """
+    A table of requests in flight, shared by threads and asyncio tasks.
+
+    A blocking (thread) caller never waits for a request whose leader is a task on the event loop of its own thread,
+    since that would deadlock; it sends its own request instead.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        "(namespace, key) : _Call"
+        self._lock = threading.Lock()
+        self.sent = 0
+        "number of keys that were requested"
+        self.shared = 0
+        "number of keys that were answered by another caller's request"
+
+    def _claim(self, namespace:Hashable, keys:list, loop:'asyncio.AbstractEventLoop | None',
+            blocking:bool) -> tuple[dict, dict]:
+        """Returns (owned, joined): the calls this caller leads, and the calls in flight that it waits for."""
+        owned = {}
+        joined = {}
+        current_loop = _running_loop() if blocking else None
+        with self._lock:
+            for key in keys:
+                call = self._calls.get((namespace, key))
+                if call is not None and not (blocking and call.loop is not None and call.loop is current_loop):
+                    joined[key] = call
+                    continue
+                owned[key] = _Call(loop)
+                if call is None:
+                    self._calls[(namespace, key)] = owned[key]
+            self.sent += len(owned)
+            self.shared += len(joined)
+        if joined:
+            instrumentation.count('single_flight.shared', len(joined))
+        return owned, joined
+
+    def _resolve(self, namespace:Hashable, owned:dict, values:dict | None=None, exception:BaseException | None=None):
+        for key, call in owned.items():
+            if exception is not None:
+                call.future.set_exception(exception)
+            else:
+                call.future.set_result(values.get(key, _MISSING))
+        with self._lock:
+            for key, call in owned.items():
+                if self._calls.get((namespace, key)) is call:
+                    del self._calls[(namespace, key)]
+
+    @staticmethod
+    def _collect(keys:list, owned:dict, values:dict, joined_values:dict) -> dict:
+        results = {}
+        for key in keys:
+            value = values.get(key, _MISSING) if key in owned else joined_values[key]
+            if value is not _MISSING:
+                results[key] = value
+        return results
+
+    def do(self, namespace:Hashable, key:Hashable, fn:Callable[[], object]):
+        """Returns `fn()`, or the result of an identical call (same namespace and key) already in flight."""
+        return self.do_batch(namespace, [key], lambda keys: {key: fn()})[key]
+
+    def do_batch(self, namespace:Hashable, keys:Iterable[Hashable], fetch:Callable[[list], dict]) -> dict:
+        """
+        Returns a dict of key : value for the given keys.
+
+        `fetch` is called with the keys that are not already in flight (if any), and must return a dict of key : value
+        for them. Keys missing from that dict are missing from the result. If `fetch` raises, the exception is raised
+        to every caller waiting for one of its keys.
+        """
+        keys = list(dict.fromkeys(keys))
+        owned, joined = self._claim(namespace, keys, None, blocking=True)
+        values = {}
+        if owned:
+            try:
+                values = fetch(list(owned))
+            except BaseException as exc:
+                self._resolve(namespace, owned, exception=exc)
+                raise
+            self._resolve(namespace, owned, values)
+        return self._collect(keys, owned, values, {key: call.future.result() for key, call in joined.items()})
+
+    async def ado(self, namespace:Hashable, key:Hashable, fn:Callable[[], Awaitable]):
+        """Async version of `do`: returns `await fn()`, or the result of an identical call already in flight."""
+        async def fetch(keys):
+            return {key: await fn()}
+        return (await self.ado_batch(namespace, [key], fetch))[key]
+
+    async def ado_batch(self, namespace:Hashable, keys:Iterable[Hashable], fetch:Callable[[list], Awaitable[dict]]) -> dict:
+        """Async version of `do_batch`, where `fetch` is a coroutine function."""
+        import asyncio
+        keys = list(dict.fromkeys(keys))
+        owned, joined = self._claim(namespace, keys, asyncio.get_running_loop(), blocking=False)
+        values = {}
+        if owned:
+            try:
+                values = await fetch(list(owned))
+            except BaseException as exc:
+                self._resolve(namespace, owned, exception=exc)
+                raise
+            self._resolve(namespace, owned, values)
+        joined_values = {}
+        for key, call in joined.items():
+            joined_values[key] = await asyncio.wrap_future(call.future)
+        return self._collect(keys, owned, values, joined_values)
+
+    def stats(self) -> dict:
+        """Returns the number of keys that were requested and that were shared with another caller's request."""
+        with self._lock:
+            return {'sent': self.sent, 'shared': self.shared, 'in_flight': len(self._calls)}
+
+
+default_single_flight = SingleFlight()
+"The single-flight table used by the service wrappers."
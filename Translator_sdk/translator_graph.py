@@ -0,0 +1,235 @@
+"""
+A compact graph index over merged knowledge graph edges.
+
+`TranslatorGraph` encodes nodes and predicates as integers and stores the adjacency of the edges in compressed sparse
+row (CSR) arrays, in both directions. This takes a few bytes per edge instead of the several hundred used by a
+networkx graph, and neighbor, degree and k-hop queries are answered with vectorized NumPy operations. Small subgraphs
+can be exported to networkx with `to_networkx`.
+
+Examples
+--------
+>>> edges = translator_query.parallel_api_query(query_json, selected_APIs, APInames, API_predicates, max_workers=8)
+>>> graph = TranslatorGraph(edges)
+>>> graph.neighbors('NCBIGene:3845', direction='out', predicates='biolink:related_to')
+>>> graph.k_hop(['NCBIGene:3845'], 2)
+>>> nx_graph = graph.to_networkx(graph.k_hop(['NCBIGene:3845'], 1))
+"""
+from collections.abc import Iterable, Mapping
+
+import numpy as np
+
+DIRECTIONS = ('out', 'in', 'both')
+
+
+def _csr(rows:np.ndarray, n_rows:int) -> tuple[np.ndarray, np.ndarray]:
+    """Returns (indptr, order): the offset of every row's entries in `order`, and the edge indices sorted by row."""
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, order
+
+
+def _gather(indptr:np.ndarray, rows:np.ndarray) -> np.ndarray:
+    """Returns the positions (into the CSR arrays) of all entries of the given rows."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.arange(total) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+
+
+class TranslatorGraph:
+    """
+    A read-only directed multigraph of TRAPI edges, with integer-encoded nodes and predicates and CSR adjacency.
+
+    Parameters
+    ----------
+    edges : Mapping[str, dict]
+        A dict of edge id : TRAPI edge (with 'subject', 'predicate' and 'object'), e.g. the output of
+        `translator_query.parallel_api_query` or `edge_normalization.normalize_edges`.
+    """
+
+    def __init__(self, edges:Mapping[str, dict]):
+        self.node_ids = []
+        "node index : CURIE"
+        self.node_index = {}
+        "CURIE : node index"
+        self.predicates = []
+        "predicate index : predicate"
+        self.predicate_index = {}
+        "predicate : predicate index"
+        self.edge_ids = []
+        "edge index : edge id"
+
+        subjects, objects, predicates = [], [], []
+        for edge_id, edge in edges.items():
+            self.edge_ids.append(edge_id)
+            subjects.append(self._encode(self.node_index, self.node_ids, edge['subject']))
+            objects.append(self._encode(self.node_index, self.node_ids, edge['object']))
+            predicates.append(self._encode(self.predicate_index, self.predicates, edge.get('predicate')))
+        self.subjects = np.array(subjects, dtype=np.int32)
+        self.objects = np.array(objects, dtype=np.int32)
+        self.edge_predicates = np.array(predicates, dtype=np.int32)
+
+        # out[i]: edges with subject i, in[i]: edges with object i. The CSR arrays store edge indices.
+        n_nodes = len(self.node_ids)
+        self._out_indptr, self._out_edges = _csr(self.subjects, n_nodes)
+        self._in_indptr, self._in_edges = _csr(self.objects, n_nodes)
+
+    @staticmethod
+    def _encode(index:dict, values:list, value) -> int:
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(values)
+            values.append(value)
+        return code
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.edge_ids)
+
+    def __len__(self) -> int:
+        return self.n_nodes
+
+    def __contains__(self, node:str) -> bool:
+        return node in self.node_index
+
+    def _node_codes(self, nodes:str | Iterable[str]) -> np.ndarray:
+        if isinstance(nodes, str):
+            nodes = [nodes]
+        return np.array([self.node_index[node] for node in nodes if node in self.node_index], dtype=np.int64)
+
+    def _predicate_mask(self, predicates:str | Iterable[str] | None) -> np.ndarray | None:
+        if predicates is None:
+            return None
+        if isinstance(predicates, str):
+            predicates = [predicates]
+        mask = np.zeros(len(self.predicates), dtype=bool)
+        mask[[self.predicate_index[p] for p in predicates if p in self.predicate_index]] = True
+        return mask
+
+    def _edges_of(self, codes:np.ndarray, direction:str, predicates:str | Iterable[str] | None) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Returns, per direction, the edge indices touching the nodes and the node at the other end of each edge."""
+        if direction not in DIRECTIONS:
+            raise ValueError(f'direction must be one of {DIRECTIONS}')
+        mask = self._predicate_mask(predicates)
+        result = []
+        if direction in ('out', 'both'):
+            edges = self._out_edges[_gather(self._out_indptr, codes)]
+            result.append((edges, self.objects))
+        if direction in ('in', 'both'):
+            edges = self._in_edges[_gather(self._in_indptr, codes)]
+            result.append((edges, self.subjects))
+        if mask is not None:
+            result = [(edges[mask[self.edge_predicates[edges]]], other) for edges, other in result]
+        return [(edges, other[edges]) for edges, other in result]
+
+    def neighbors(self, node:str, direction:str='both', predicates:str | Iterable[str] | None=None) -> list[str]:
+        """
+        Returns the distinct neighbors of a node.
+
+        Parameters
+        ----------
+        node : str
+            A CURIE. Unknown nodes have no neighbors.
+        direction : str
+            'out' (objects of edges with this subject), 'in' (subjects of edges with this object) or 'both'.
+            Default: 'both'
+        predicates : str | list[str] | None
+            Only follow edges with one of these predicates. Default: None (all edges)
+
+        Returns
+        -------
+        A list of CURIEs.
+        """
+        codes = self._node_codes(node)
+        neighbors = [other for _, other in self._edges_of(codes, direction, predicates)]
+        neighbors = np.unique(np.concatenate(neighbors)) if neighbors else []
+        return [self.node_ids[i] for i in neighbors]
+
+    def degree(self, node:str, direction:str='both', predicates:str | Iterable[str] | None=None) -> int:
+        """Returns the number of edges of a node (not the number of distinct neighbors)."""
+        codes = self._node_codes(node)
+        return sum(len(edges) for edges, _ in self._edges_of(codes, direction, predicates))
+
+    def degrees(self, direction:str='both') -> dict[str, int]:
+        """Returns a dict of CURIE : number of edges, for all nodes."""
+        if direction not in DIRECTIONS:
+            raise ValueError(f'direction must be one of {DIRECTIONS}')
+        degrees = np.zeros(self.n_nodes, dtype=np.int64)
+        if direction in ('out', 'both'):
+            degrees += np.diff(self._out_indptr)
+        if direction in ('in', 'both'):
+            degrees += np.diff(self._in_indptr)
+        return dict(zip(self.node_ids, degrees.tolist()))
+
+    def k_hop(self, nodes:str | Iterable[str], k:int, direction:str='both',
+            predicates:str | Iterable[str] | None=None) -> list[str]:
+        """
+        Returns the nodes at most `k` hops away from the given nodes (including them), by breadth-first search.
+
+        Parameters
+        ----------
+        nodes : str | list[str]
+            The starting CURIE(s). Unknown CURIEs are ignored.
+        k : int
+            Maximum number of hops.
+        direction : str
+            Which edges to follow: 'out', 'in' or 'both'. Default: 'both'
+        predicates : str | list[str] | None
+            Only follow edges with one of these predicates. Default: None (all edges)
+
+        Returns
+        -------
+        A list of CURIEs, ordered by distance from the starting nodes.
+        """
+        frontier = np.unique(self._node_codes(nodes))
+        visited = np.zeros(self.n_nodes, dtype=bool)
+        visited[frontier] = True
+        reached = [frontier]
+        for _ in range(k):
+            if len(frontier) == 0:
+                break
+            neighbors = [other for _, other in self._edges_of(frontier, direction, predicates)]
+            neighbors = np.unique(np.concatenate(neighbors))
+            frontier = neighbors[~visited[neighbors]].astype(np.int64)
+            visited[frontier] = True
+            reached.append(frontier)
+        return [self.node_ids[i] for i in np.concatenate(reached)]
+
+    def _induced_edges(self, codes:np.ndarray) -> np.ndarray:
+        """Returns the indices of the edges whose subject and object are both in `codes`."""
+        selected = np.zeros(self.n_nodes, dtype=bool)
+        selected[codes] = True
+        edges = self._out_edges[_gather(self._out_indptr, codes)]
+        return np.sort(edges[selected[self.objects[edges]]])
+
+    def edges_between(self, nodes:Iterable[str]) -> list[str]:
+        """Returns the ids of the edges whose subject and object are both among `nodes`."""
+        return [self.edge_ids[i] for i in self._induced_edges(np.unique(self._node_codes(nodes)))]
+
+    def to_networkx(self, nodes:Iterable[str] | None=None):
+        """
+        Exports the graph, or the subgraph induced by `nodes`, to a `networkx.MultiDiGraph`.
+
+        Edges are keyed by edge id and have a 'predicate' attribute. This is meant for small subgraphs, e.g. the output
+        of `k_hop`.
+        """
+        import networkx as nx
+        nx_graph = nx.MultiDiGraph()
+        if nodes is None:
+            nx_graph.add_nodes_from(self.node_ids)
+            edges = np.arange(self.n_edges)
+        else:
+            nodes = [node for node in nodes if node in self.node_index]
+            nx_graph.add_nodes_from(nodes)
+            edges = self._induced_edges(np.unique(self._node_codes(nodes)))
+        for i in edges.tolist():
+            nx_graph.add_edge(self.node_ids[self.subjects[i]], self.node_ids[self.objects[i]], key=self.edge_ids[i],
+                    predicate=self.predicates[self.edge_predicates[i]])
+        return nx_graph
@@ -1,18 +1,54 @@
 
 # used May 30, 2025
 
-import requests
-import json
-import pandas as pd
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import typing
+
+from . import http_client, json_codec
+
+if typing.TYPE_CHECKING:
+    import pandas as pd
 
 """This is the root URL for the resource."""
 URL = 'https://smart-api.info/api/query?q=tags.name:translator'
 
-def get_translator_kp_info() -> tuple[pd.DataFrame, dict[str, str]]:
+MATURITY_COLUMNS = {
+    'production': 'prod_url',
+    'staging': 'ci_url',
+    'testing': 'test_url',
+}
+"""Maps server maturity levels to the URL columns of the dataframe returned by `get_translator_kp_info`. 'staging' also covers 'development' servers."""
+
+def get_translator_kp_info(probe:bool=False,
+        allowed_maturities:tuple[str, ...]=('production', 'staging', 'testing'),
+        max_latency:float | None=None,
+        probe_timeout:float=5.0,
+        probe_results_path:str | None=None) -> tuple['pd.DataFrame', dict[str, str]]:
     """
     Get the SmartAPI Translator KP info from the smart-api.info API.
     Returns a DataFrame with the SmartAPI Translator KP info.
 
+    By default, APInames uses the production URL of each KP, falling back to the CI URL.
+    If `probe` is True, every candidate server of every KP is probed concurrently (see `probe_kp_endpoints`),
+    and APInames uses the fastest healthy server of each KP within `allowed_maturities` (see `select_fastest_endpoints`).
+
+    Parameters
+    ----------
+    probe : bool
+        If True, probe the health and latency of all candidate servers and pick the fastest one per KP. Default: False
+    allowed_maturities : tuple[str, ...]
+        Server maturities that may be selected when probing. Any of 'production', 'staging', 'testing'.
+    max_latency : float | None
+        When probing, servers slower than this many seconds are treated as unhealthy. Default: None (no limit)
+    probe_timeout : float
+        Timeout in seconds for each probe request. Default: 5.0
+    probe_results_path : str | None
+        If given, the probe measurements are appended to this CSV file.
+
     Returns
     -------
     smartapi_df : pandas.DataFrame
@@ -26,17 +62,18 @@ def get_translator_kp_info() -> tuple[pd.DataFrame, dict[str, str]]:
     --------
     >>> Translator_KP_info, APInames = get_translator_kp_info()
     >>> print(Translator_KP_info.head())
+    >>> Translator_KP_info, APInames = get_translator_kp_info(probe=True, allowed_maturities=('production', 'testing'))
     """
     # Get x-bte smartapi specs
     url = "https://smart-api.info/api/query?q=tags.name:translator AND tags.name:trapi&size=1000&sort=_seq_no&raw=1&fields=paths,servers,tags,components.x-bte*,info,_meta"
-    response = requests.get(url)
+    response = http_client.get(url)
     try:
         response.raise_for_status()
     except Exception:
         print(f"error downloading smartapi specs: {response.status_code}")
         exit()
 
-    content = json.loads(response.content)
+    content = json_codec.response_json(response)
     smartapis = content["hits"]
 
     id_list = []
@@ -119,7 +156,7 @@ def get_translator_kp_info() -> tuple[pd.DataFrame, dict[str, str]]:
                 test_url = test_url_list.append(None)
                 
     # write all the smartapis to a dataframe
-
+    import pandas as pd
     smartapi_df = pd.DataFrame({
         'id': id_list,
         'title': title_list,
@@ -135,4 +172,194 @@ def get_translator_kp_info() -> tuple[pd.DataFrame, dict[str, str]]:
             APInames[smartapi_df['title'].values[i]] = prod_url_list[i]
         else:
             APInames[smartapi_df['title'].values[i]] = ci_url_list[i] 
+
+    if probe:
+        probe_df = probe_kp_endpoints(smartapi_df, maturities=allowed_maturities,
+                timeout=probe_timeout, output_path=probe_results_path)
+        APInames = select_fastest_endpoints(probe_df, allowed_maturities=allowed_maturities,
+                max_latency=max_latency)
     return smartapi_df, APInames
+
+
+def health_check_url(query_url:str) -> str:
+    """
+    Returns the URL used to check the health of a TRAPI server, given its query URL.
+    For TRAPI KPs this is the `meta_knowledge_graph` endpoint next to `query/`; other URLs are returned unchanged.
+    """
+    if query_url.endswith('query/'):
+        return query_url[:-len('query/')] + 'meta_knowledge_graph'
+    if query_url.endswith('query'):
+        return query_url[:-len('query')] + 'meta_knowledge_graph'
+    return query_url
+
+
+def _probe_url(query_url:str, timeout:float, n_probes:int) -> dict:
+    """
+    Probes a single server `n_probes` times, returning a dict of measurements. The server is healthy if most probes
+    succeeded (answered with a status below 400); the latency is the median of the successful probes, the status code
+    is that of the last successful probe (or of the last answer), and the error is only reported if no probe succeeded.
+    """
+    import requests
+    latencies = []
+    status_code = None
+    error = None
+    for _ in range(n_probes):
+        start = time.perf_counter()
+        try:
+            # stream=True so that only the response headers are awaited; the (possibly large) body is never read.
+            response = http_client.get(health_check_url(query_url), timeout=timeout, stream=True, retry=False)
+            response.close()
+        except requests.RequestException as exc:
+            error = type(exc).__name__
+            continue
+        if response.status_code < 400:
+            latencies.append(time.perf_counter() - start)
+            status_code = response.status_code
+        elif len(latencies) == 0:
+            status_code = response.status_code
+    healthy = 2 * len(latencies) > n_probes
+    return {
+        'healthy': healthy,
+        'status_code': status_code,
+        'latency': statistics.median(latencies) if latencies else None,
+        'error': None if latencies else error,
+    }
+
+
+def probe_kp_endpoints(smartapi_df:'pd.DataFrame',
+        maturities:tuple[str, ...]=('production', 'staging', 'testing'),
+        timeout:float=5.0, n_probes:int=1, max_workers:int=32,
+        output_path:str | None=None) -> 'pd.DataFrame':
+    """
+    Concurrently measures the health and latency of every candidate server of every KP.
+
+    Parameters
+    ----------
+    smartapi_df : pandas.DataFrame
+        The first output of `get_translator_kp_info()`.
+    maturities : tuple[str, ...]
+        Which server maturities to probe. Any of 'production', 'staging', 'testing'.
+    timeout : float
+        Timeout in seconds for each probe request. Default: 5.0
+    n_probes : int
+        Number of probes per server; the median latency is reported. Default: 1
+    max_workers : int
+        Number of concurrent probes. Default: 32
+    output_path : str | None
+        If given, the measurements are appended to this CSV file (so repeated runs build up a history).
+
+    Returns
+    -------
+    probe_df : pandas.DataFrame
+        One row per (KP, server), with columns title, maturity, url, healthy, status_code, latency (seconds), error, probed_at.
+
+    Examples
+    --------
+    >>> Translator_KP_info, APInames = get_translator_kp_info()
+    >>> probe_df = probe_kp_endpoints(Translator_KP_info, output_path='kp_probes.csv')
+    """
+    import pandas as pd
+    candidates = []
+    for maturity in maturities:
+        column = MATURITY_COLUMNS[maturity]
+        for title, url in zip(smartapi_df['title'], smartapi_df[column]):
+            if url is not None and not pd.isna(url):
+                candidates.append((title, maturity, url))
+
+    probed_at = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(candidates)))) as executor:
+        measurements = list(executor.map(lambda c: _probe_url(c[2], timeout, n_probes), candidates))
+
+    probe_df = pd.DataFrame({
+        'title': [c[0] for c in candidates],
+        'maturity': [c[1] for c in candidates],
+        'url': [c[2] for c in candidates],
+        'healthy': [m['healthy'] for m in measurements],
+        'status_code': [m['status_code'] for m in measurements],
+        'latency': [m['latency'] for m in measurements],
+        'error': [m['error'] for m in measurements],
+        'probed_at': probed_at,
+    })
+    if output_path is not None:
+        probe_df.to_csv(output_path, mode='a', index=False, header=not os.path.exists(output_path))
+    return probe_df
+
+
+def select_fastest_endpoints(probe_df:'pd.DataFrame',
+        allowed_maturities:tuple[str, ...]=('production', 'staging', 'testing'),
+        max_latency:float | None=None) -> dict[str, str]:
+    """
+    Picks the fastest healthy server for each KP from the output of `probe_kp_endpoints`.
+
+    KPs with no healthy server within `allowed_maturities` (and under `max_latency`, if given) are left out,
+    so that they are not in the critical path of every query.
+
+    Parameters
+    ----------
+    probe_df : pandas.DataFrame
+        The output of `probe_kp_endpoints` (or the CSV it wrote, loaded with `pandas.read_csv`). If it holds several
+        probe runs, only the most recent run for each server is used.
+    allowed_maturities : tuple[str, ...]
+        Server maturities that may be selected.
+    max_latency : float | None
+        Servers slower than this many seconds are not selected. Default: None (no limit)
+
+    Returns
+    -------
+    APInames : dict
+        dict of API names to URLs
+    """
+    df = probe_df.sort_values('probed_at').drop_duplicates(['title', 'url'], keep='last')
+    df = df[df['healthy'].astype(bool) & df['maturity'].isin(allowed_maturities)]
+    if max_latency is not None:
+        df = df[df['latency'] <= max_latency]
+    df = df.sort_values(['latency', 'title'])
+
+    APInames = {}
+    for title, url in zip(df['title'], df['url']):
+        if title not in APInames:
+            APInames[title] = url
+    skipped = sorted(set(probe_df['title']) - set(APInames))
+    if len(skipped) > 0:
+        print("No healthy server found for these KPs: " + ", ".join(skipped))
+    return APInames
+
+
+def get_alternate_endpoints(smartapi_df:'pd.DataFrame', APInames:dict[str, str],
+        allowed_maturities:tuple[str, ...]=('production', 'staging', 'testing')) -> dict[str, list[str]]:
+    """
+    For each KP in APInames, lists the URLs of its other servers (in the order of `allowed_maturities`).
+    This can be passed to `translator_query.HedgePolicy`.
+
+    Parameters
+    ----------
+    smartapi_df : pandas.DataFrame
+        The first output of `get_translator_kp_info()`.
+    APInames : dict
+        dict of API names to the URLs that are normally queried.
+    allowed_maturities : tuple[str, ...]
+        Server maturities that may be used as alternates.
+
+    Returns
+    -------
+    dict of API name : list of alternate URLs. KPs without alternates are left out.
+
+    Examples
+    --------
+    >>> Translator_KP_info, APInames = get_translator_kp_info()
+    >>> alternates = get_alternate_endpoints(Translator_KP_info, APInames)
+    """
+    import pandas as pd
+    alternates = {}
+    for i in range(len(smartapi_df)):
+        title = smartapi_df['title'].values[i]
+        if title not in APInames:
+            continue
+        urls = []
+        for maturity in allowed_maturities:
+            url = smartapi_df[MATURITY_COLUMNS[maturity]].values[i]
+            if url is not None and not pd.isna(url) and url != APInames[title] and url not in urls:
+                urls.append(url)
+        if len(urls) > 0:
+            alternates[title] = urls
+    return alternates
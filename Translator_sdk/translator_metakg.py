@@ -1,11 +1,17 @@
-import requests
-import json
-import pandas as pd
+import typing
+
+from . import http_client, json_codec
+
+if typing.TYPE_CHECKING:
+    import pandas as pd
+
+METAKG_URL = 'https://smart-api.info/api/metakg/consolidated'
+"""This is the URL of the SmartAPI metaKG endpoint."""
 
 
 def find_link(name):
     #pre = "https://dev.smart-api.info/api/metakg/consolidated?size=2000&q=%28api.x-translator.component%3AKP+AND+api.name%3A" # This works for the previous version
-    pre = "https://smart-api.info/api/metakg/consolidated?size=2000&q=%28api.x-translator.component%3AKP+AND+api.name%3A" 
+    pre = METAKG_URL + "?size=2000&q=%28api.x-translator.component%3AKP+AND+api.name%3A"
     end = "%5C%28Trapi+v1.5.0%5C%29%29"
     if '(Trapi v1.5.0)' in name:
         url = pre
@@ -31,7 +37,7 @@ def find_link(name):
     return(url)
 
 
-def get_KP_metadata(APInames:dict[str, str]) -> pd.DataFrame:
+def get_KP_metadata(APInames:dict[str, str]) -> 'pd.DataFrame':
     '''
     This function is used to get the metadata of the KPs in the APInames dictionary.
 
@@ -52,6 +58,7 @@ def get_KP_metadata(APInames:dict[str, str]) -> pd.DataFrame:
     All_categories = list((set(list(set(metaKG['Subject']))+list(set(metaKG['Object'])))))
     '''
 
+    import pandas as pd
     result_df = pd.DataFrame()
     API_list = []
     Predicate_list = []
@@ -62,11 +69,10 @@ def get_KP_metadata(APInames:dict[str, str]) -> pd.DataFrame:
     for KP in APInames.keys():
         json_text ={}
         if KP == "RTX KG2 - TRAPI 1.5.0": 
-            text =requests.get("https://smart-api.info/api/metakg/consolidated?size=20&q=%28api.x-translator.component%3AKP+AND+api.name%3ARTX+KG2+%5C-+TRAPI+1%5C.4%5C.0%29").text  # This works for the previous version
-            json_text = json.loads(text)
+            response = http_client.get(METAKG_URL + "?size=20&q=%28api.x-translator.component%3AKP+AND+api.name%3ARTX+KG2+%5C-+TRAPI+1%5C.4%5C.0%29")  # This works for the previous version
+            json_text = json_codec.response_json(response)
         else:   
-            text = requests.get(find_link(KP)).text
-            json_text = json.loads(text)
+            json_text = json_codec.response_json(http_client.get(find_link(KP)))
 
         for i in (json_text['hits']):
             Predicate_list.append("biolink:"+i['_id'].split("-")[1])
@@ -80,7 +86,7 @@ def get_KP_metadata(APInames:dict[str, str]) -> pd.DataFrame:
     return(result_df)
 
 
-def add_new_API_for_query(APInames:dict[str, str], metaKG:pd.DataFrame, newAPIname:str, newAPIurl:str, newAPIpredicate:str, newAPIsubject:str, newAPIobject:str):
+def add_new_API_for_query(APInames:dict[str, str], metaKG:'pd.DataFrame', newAPIname:str, newAPIurl:str, newAPIpredicate:str, newAPIsubject:str, newAPIobject:str):
     '''
     This function is used to add a new API beyond the current list of APIs for query
 
@@ -111,6 +117,7 @@ def add_new_API_for_query(APInames:dict[str, str], metaKG:pd.DataFrame, newAPIna
     >>> APInames, metaKG = add_new_API_for_query(APInames, metaKG, "BigGIM_BMG", "http://127.0.0.1:8000/find_path_by_predicate", "Gene-physically_interacts_with-gene", "Gene", "Gene")
 
     '''
+    import pandas as pd
     APInames[newAPIname] = newAPIurl
 
     new_row = pd.DataFrame({"API":newAPIname,
@@ -121,7 +128,7 @@ def add_new_API_for_query(APInames:dict[str, str], metaKG:pd.DataFrame, newAPIna
     return APInames, metaKG
 
 
-def add_plover_API(APInames:dict[str, str], metaKG:pd.DataFrame):
+def add_plover_API(APInames:dict[str, str], metaKG:'pd.DataFrame'):
     '''
     This function is used to add the Plover APIs developed by the CATRAX team to the APInames and metaKG.
 
@@ -149,47 +156,46 @@ def add_plover_API(APInames:dict[str, str], metaKG:pd.DataFrame):
     --------
     >>> APInames, metaKG = add_plover_API(APInames, metaKG)
     '''
-    import requests
     url = 'https://multiomics.rtx.ai:9990/BigGIM_DrugResponse_PerformancePhase/meta_knowledge_graph'
-    response = requests.get(url)
-    data = response.json()
+    response = http_client.get(url)
+    data = json_codec.response_json(response)
     for i in range(len(data["edges"])):
         APInames, metaKG = add_new_API_for_query(APInames, metaKG, "CATRAX BigGIM DrugResponse Performance Phase KP - TRAPI 1.5.0", "https://multiomics.rtx.ai:9990/BigGIM_DrugResponse_PerformancePhase/query", data["edges"][i]['predicate'], data["edges"][i]['subject'], data["edges"][i]['object'])
 
     url = 'https://multiomics.rtx.ai:9990/PharmacogenomicsKG/meta_knowledge_graph'
-    response = requests.get(url)
-    data = response.json()
+    response = http_client.get(url)
+    data = json_codec.response_json(response)
     for i in range(len(data["edges"])):
         APInames, metaKG = add_new_API_for_query(APInames, metaKG, "CATRAX Pharmacogenomics KP - TRAPI 1.5.0", "https://multiomics.rtx.ai:9990/PharmacogenomicsKG/query", data["edges"][i]['predicate'], data["edges"][i]['subject'], data["edges"][i]['object'])
 
     url = 'https://multiomics.rtx.ai:9990/ctkp/meta_knowledge_graph'
-    response = requests.get(url)
-    data = response.json()
+    response = http_client.get(url)
+    data = json_codec.response_json(response)
     for i in range(len(data["edges"])):
         APInames, metaKG = add_new_API_for_query(APInames, metaKG, "Clinical Trials KP - TRAPI 1.5.0", "https://multiomics.rtx.ai:9990/ctkp/query", data["edges"][i]['predicate'], data["edges"][i]['subject'], data["edges"][i]['object'])
 
     url = 'https://multiomics.rtx.ai:9990/dakp/meta_knowledge_graph'
-    response = requests.get(url)
-    data = response.json()
+    response = http_client.get(url)
+    data = json_codec.response_json(response)
     for i in range(len(data["edges"])):
         APInames, metaKG = add_new_API_for_query(APInames, metaKG, "Drug Approvals KP - TRAPI 1.5.0", "https://multiomics.rtx.ai:9990/dakp/query", data["edges"][i]['predicate'], data["edges"][i]['subject'], data["edges"][i]['object'])
 
     url = 'https://multiomics.rtx.ai:9990/mokp/meta_knowledge_graph'
-    response = requests.get(url)
-    data = response.json()
+    response = http_client.get(url)
+    data = json_codec.response_json(response)
     for i in range(len(data["edges"])):
         APInames, metaKG = add_new_API_for_query(APInames, metaKG, "Multiomics KP - TRAPI 1.5.0", "https://multiomics.rtx.ai:9990/multiomics/query", data["edges"][i]['predicate'], data["edges"][i]['subject'], data["edges"][i]['object'])
 
     url = 'https://multiomics.rtx.ai:9990/mbkp/meta_knowledge_graph'
-    response = requests.get(url)
-    data = response.json()
+    response = http_client.get(url)
+    data = json_codec.response_json(response)
     for i in range(len(data["edges"])):
         APInames, metaKG = add_new_API_for_query(APInames, metaKG, "Microbiome KP - TRAPI 1.5.0", "https://multiomics.rtx.ai:9990/mbkp/query", data["edges"][i]['predicate'], data["edges"][i]['subject'], data["edges"][i]['object'])
 
 
     url = 'https://kg2cploverdb.ci.transltr.io/meta_knowledge_graph'
-    response = requests.get(url)
-    data = response.json()
+    response = http_client.get(url)
+    data = json_codec.response_json(response)
     for i in range(len(data["edges"])):
         APInames, metaKG = add_new_API_for_query(APInames, metaKG, "RTX KG2 - TRAPI 1.5.0", "https://kg2cploverdb.ci.transltr.io/kg2c/query", data["edges"][i]['predicate'], data["edges"][i]['subject'], data["edges"][i]['object'])
 
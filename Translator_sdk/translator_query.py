@@ -1,12 +1,25 @@
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass
-import json
+import threading
+import time
 import typing
 
-import requests
-from copy import deepcopy
-import pandas
 from . import translator_metakg
 from . import translator_kpinfo
+from . import kp_health
+from . import http_client
+from . import json_codec
+from . import instrumentation
+from .query_cache import QueryCache
+from . import trapi_stream
+from .trapi_stream import MemoryBudget
+from . import edge_normalization
+from .compiled_query import CompiledQuery, optimized_predicates, sharded_node as _sharded_node
+
+if typing.TYPE_CHECKING:
+    import pandas
+    import requests
 
 
 # TODO: query result dataclass?
@@ -89,12 +102,65 @@ def build_query_json(subject_ids:list[str],
         }
     }
     if return_json:
-        return json.dumps(query_dict)
+        return json_codec.dumps(query_dict).decode('utf-8')
+    else:
+        return query_dict
+
+
+def build_multihop_query_json(subject_ids:list[str],
+        object_categories:list[list[str]], predicates:list[list[str]],
+        return_json:bool=False) -> typing.Union[str, dict]:
+    """
+    This constructs a multi-hop query json for use with TRAPI. Queries are paths of the form
+    [subject_ids]-[predicates[0]]-[object_categories[0]]-[predicates[1]]-[object_categories[1]]-...
+
+    The query graph has nodes n00, n01, ... and edges e00 (n00 -> n01), e01 (n01 -> n02), ...
+    Such queries can be sent to KPs that support multi-hop queries, or run hop by hop with
+    `multihop_query.pipelined_multihop_query`.
+
+    Params
+    ------
+    subject_ids
+        A list of subject CURIE IDs for the first node - example: ["NCBIGene:3845"]
+
+    object_categories
+        For every hop, a list of categories of the node at the end of the hop. Example: [["biolink:Gene"], ["biolink:Disease"]]
+
+    predicates
+        For every hop, a list of predicates. Must have the same length as object_categories.
+
+    return_json
+        If True, returns a json string; if False, returns a dict. Default: False.
+
+    Returns
+    -------
+    A dict or a json string
+
+    Examples
+    --------
+    In this example, we want all diseases related to genes that physically interact with gene 3845.
+    >>> build_multihop_query_json(['NCBIGene:3845'], [['biolink:Gene'], ['biolink:Disease']],
+    ...     [['biolink:physically_interacts_with'], ['biolink:related_to']])
+    """
+    if len(object_categories) != len(predicates):
+        raise ValueError('object_categories and predicates must have one entry per hop.')
+    nodes = {'n00': {'ids': subject_ids}}
+    edges = {}
+    for hop, (hop_categories, hop_predicates) in enumerate(zip(object_categories, predicates)):
+        nodes[f'n{hop + 1:02d}'] = {'categories': hop_categories}
+        edges[f'e{hop:02d}'] = {
+            'subject': f'n{hop:02d}',
+            'object': f'n{hop + 1:02d}',
+            'predicates': hop_predicates
+        }
+    query_dict = {'message': {'query_graph': {'edges': edges, 'nodes': nodes}}}
+    if return_json:
+        return json_codec.dumps(query_dict).decode('utf-8')
     else:
         return query_dict
 
 
-def get_translator_API_predicates() -> tuple[dict, pandas.DataFrame, dict]:
+def get_translator_API_predicates() -> tuple[dict, 'pandas.DataFrame', dict]:
     '''
     Get the predicates supported by each API.
 
@@ -137,6 +203,7 @@ def get_translator_API_predicates() -> tuple[dict, pandas.DataFrame, dict]:
 def optimize_query_json(query_json:dict, API_name_query:str, API_predicates:dict[str, list[str]]):
     '''
     Optimize the query JSON by removing predicates that are not supported by the selected APIs. This does not usually need to be called, as it is already called by `query_KP`.
+    Every edge of the query graph is optimized separately. Only the edges are copied; the rest of the returned query is shared with `query_json`.
 
     Parameters
     ----------
@@ -155,27 +222,28 @@ def optimize_query_json(query_json:dict, API_name_query:str, API_predicates:dict
     --------
     >>> 
     '''
-    query_json_cur = query_json.copy()  # copy the query_json to avoid modifying the original query_json
-    # Get the list of APIs that support the predicates in the query
-    shared_predicates = list(set(API_predicates[API_name_query]).intersection(query_json_cur['message']['query_graph']['edges']['e00']['predicates'] ))
-    
-    if len(shared_predicates) > 0:
-        query_json_cur['message']['query_graph']['edges']['e00']['predicates'] = shared_predicates
-        #print(API_name_query + ": Predicates optimized to: " + str(shared_predicates))
-    else:
-        #print(API_name_query + ": No shared predicates found. Using all predicates in the query.")
-        # If no shared predicates, keep the original predicates
-        query_json_cur['message']['query_graph']['edges']['e00']['predicates'] = query_json_cur['message']['query_graph']['edges']['e00']['predicates']
+    # copy the parts of query_json that change, to avoid modifying the original query_json
+    query_graph = query_json['message']['query_graph']
+    edges = {}
+    for edge_id, edge in query_graph['edges'].items():
+        # Keep only the predicates supported by the API. If there are no shared predicates, keep the original predicates.
+        edges[edge_id] = {**edge, 'predicates': optimized_predicates(API_predicates[API_name_query], edge['predicates'])}
+    query_json_cur = {**query_json, 'message': {**query_json['message'], 'query_graph': {**query_graph, 'edges': edges}}}
 
     return query_json_cur
 
 
 def query_KP(API_name_query:str, query_json:dict,
-        APInames:dict[str, str], API_predicates:dict[str, list[str]]):
+        APInames:dict[str, str], API_predicates:dict[str, list[str]],
+        health_registry:kp_health.KPHealthRegistry | None=None,
+        cache:QueryCache | None=None):
     """
     Query an individual API with a TRAPI 1.5.0 query JSON,
     without modifying the original query_json.
 
+    The latency and outcome of the call (error, empty result or success) are recorded in `health_registry`.
+    If a `cache` is given, successful responses are cached and repeated queries are answered without contacting the KP.
+
     Params
     ------
     API_name_query
@@ -185,6 +253,10 @@ def query_KP(API_name_query:str, query_json:dict,
         This is the first output of `get_translator_API_predicates()`. This is a dict of API names to URLs.
     API_predicates
         A dict of API names to a list of their predicates. This is the third output of get_translator_API_predicates().
+    health_registry
+        Where to record the call statistics. Default: `kp_health.default_registry`
+    cache
+        A `query_cache.QueryCache` for KP responses. Default: None (no caching)
 
     Returns
     -------
@@ -194,32 +266,542 @@ def query_KP(API_name_query:str, query_json:dict,
     --------
     (TODO)
     """
-    API_url_cur = APInames[API_name_query]
-    # deep‐copy so we never touch the caller’s data
-    query_copy = deepcopy(query_json)
-    # optimize on our private copy
-    query_json_cur = optimize_query_json(query_copy, API_name_query, API_predicates)
-    response = requests.post(API_url_cur, json=query_json_cur)
+    if health_registry is None:
+        health_registry = kp_health.default_registry
+    # The compiled query renders the optimized request body without touching the caller's data.
+    compiled = CompiledQuery(query_json)
+    predicates = compiled.predicates_for(API_predicates[API_name_query])
+    result, _ = _query_KP(API_name_query, APInames[API_name_query], compiled, predicates, 0, None, health_registry, cache)
+    return _result_with_edges(result)
+
+
+def _result_with_edges(result:dict | None) -> dict | None:
+    """Returns the TRAPI message if it has knowledge graph edges, None otherwise."""
+    if result is None:
+        return None
+    kg = result.get("knowledge_graph", {})
+    if kg and kg.get("edges", {}):
+        return result
+    return None
+
+
+def _query_KP(API_name_query:str, API_url:str, compiled:CompiledQuery, predicates:list[list[str]],
+        start:int, end:int | None, health_registry:kp_health.KPHealthRegistry, cache:QueryCache | None=None,
+        memory_budget:MemoryBudget | None=None, include_nodes:bool=True) -> tuple[dict | None, bool | int]:
+    """
+    Sends a compiled query to a KP, with the given (optimized) per-edge predicates and the IDs `ids[start:end]`.
+
+    Returns a tuple (message, error): message is the TRAPI message (possibly without edges) or None,
+    and error is the HTTP status code if the KP answered with an HTTP error, False otherwise.
+    Exceptions from `requests` are recorded and re-raised.
+
+    If a `memory_budget` is given, the response is parsed incrementally: the message only contains the knowledge graph,
+    whose edges (and nodes, if `include_nodes`) are `trapi_stream.EdgeStore` objects, and it is not cached.
+    """
+    if cache is not None:
+        cache_key = compiled.cache_key(API_name_query, API_url, predicates, start, end)
+        result = cache.get(cache_key)
+        if result is not None:
+            return result, False
+    body = compiled.body(predicates, start, end)
+    start_time = time.perf_counter()
+    try:
+        response = http_client.post(API_url, data=body, headers={'Content-Type': 'application/json'},
+                stream=memory_budget is not None)
+        if response.status_code == 200 and memory_budget is not None:
+            result = _read_streamed_message(response, memory_budget, include_nodes)
+    except Exception as exc:
+        health_registry.record(API_name_query, time.perf_counter() - start_time, error=True, error_message=type(exc).__name__)
+        raise
+    latency = time.perf_counter() - start_time
     if response.status_code == 200:
-        result = response.json().get("message", {})
-        kg = result.get("knowledge_graph", {})
-        edges = kg.get("edges", {})
-        if edges:
-            print(f"{API_name_query}: Success!")
-            return result
-        elif "knowledge_graph" in result:
-            return None
-            #print(f"{API_name_query}: No result returned")
+        if memory_budget is None:
+            with instrumentation.span('json.decode', service='kp', kp=API_name_query):
+                result = json_codec.response_json(response).get("message", {})
+            if cache is not None:
+                cache.set(cache_key, result, size=len(response.content))
+        return _record_KP_message(API_name_query, result, latency, health_registry)
+    else:
+        response.close()
+        return _record_KP_error(API_name_query, response.status_code, latency, health_registry)
+
+
+def _record_KP_message(API_name_query:str, result:dict, latency:float,
+        health_registry:kp_health.KPHealthRegistry) -> tuple[dict, bool]:
+    """Records a successful KP call, returning the (message, error) tuple of `_query_KP`."""
+    kg = result.get("knowledge_graph", {})
+    edges = kg.get("edges", {}) if kg else {}
+    health_registry.record(API_name_query, latency, empty=not edges)
+    if edges:
+        print(f"{API_name_query}: Success!")
+    #else:
+        #print(f"{API_name_query}: No result returned")
+    return result, False
+
+
+def _record_KP_error(API_name_query:str, status_code:int, latency:float,
+        health_registry:kp_health.KPHealthRegistry) -> tuple[None, int]:
+    """Records a KP call that failed with an HTTP error, returning the (message, error) tuple of `_query_KP`."""
+    health_registry.record(API_name_query, latency, error=True, error_message=f"HTTP {status_code}")
+    #print(f"{API_name_query}: Warning Code: {status_code}")
+    return None, status_code
+
+
+def _read_streamed_message(response:'requests.Response', memory_budget:MemoryBudget, include_nodes:bool) -> dict:
+    """Incrementally reads the knowledge graph of a streamed TRAPI response into memory-bounded stores."""
+    response.raw.decode_content = True
+    edges = trapi_stream.EdgeStore(memory_budget)
+    nodes = trapi_stream.EdgeStore(memory_budget) if include_nodes else {}
+    try:
+        for section, key, value in trapi_stream.iter_knowledge_graph(response.raw, include_nodes):
+            if section == 'edges':
+                edges[key] = value
+            else:
+                nodes[key] = value
+    except Exception:
+        edges.close()
+        if include_nodes:
+            nodes.close()
+        raise
+    finally:
+        response.close()
+    return {'knowledge_graph': {'nodes': nodes, 'edges': edges}}
+
+
+DEFAULT_SHARD_SIZE = 1000
+"""Default maximum number of subject IDs sent to a KP in one request by `query_KP_sharded`."""
+
+SIZE_ERROR_STATUSES = (413,)
+"""HTTP statuses after which `query_KP_sharded` lowers a KP's shard size straight away (as it does after timeouts)."""
+
+
+def get_shard_size(API_name_query:str, shard_size:int | dict[str, int] | None=None,
+        health_registry:kp_health.KPHealthRegistry | None=None) -> int:
+    """
+    Returns the number of subject IDs to send to a KP per request: the smaller of the configured size
+    (`shard_size`, either an int or a dict of API name : size) and the size learned for that KP in the
+    `shard_sizes` of `health_registry` (default: `kp_health.default_registry`).
+    """
+    if isinstance(shard_size, dict):
+        shard_size = shard_size.get(API_name_query)
+    if shard_size is None:
+        shard_size = DEFAULT_SHARD_SIZE
+    if health_registry is None:
+        health_registry = kp_health.default_registry
+    return health_registry.shard_sizes.get(API_name_query, shard_size)
+
+
+def _split_failed_shard(API_name_query:str, n_ids:int, error:bool | int, exception:Exception | None,
+        timeout_errors:tuple, health_registry:kp_health.KPHealthRegistry) -> bool:
+    """
+    Called when a shard of `n_ids` IDs failed and is about to be split in half. Lowers the KP's learned shard size if
+    the failure was size-related (a timeout or a `SIZE_ERROR_STATUSES` status), and returns True if it was a server
+    error, which may be size-related if both halves succeed (see `kp_health.ShardSizes.server_error`).
+    """
+    if isinstance(exception, timeout_errors) or (exception is None and error in SIZE_ERROR_STATUSES):
+        health_registry.shard_sizes.failed(API_name_query, n_ids)
+        return False
+    return exception is None and not isinstance(error, bool) and error >= 500
+
+
+def shard_query_json(query_json:dict, shard_size:int, node_id:str | None=None) -> list[dict]:
+    """
+    Splits a query into several queries, each with at most `shard_size` IDs on the sharded node.
+
+    Only the path down to the sharded node is copied; everything else is shared with the input query.
+
+    Parameters
+    ----------
+    query_json
+        A TRAPI query, e.g. the output of `build_query_json`.
+    shard_size
+        The maximum number of IDs per shard.
+    node_id
+        The query node to shard. Default: the node with the most IDs (`n00` for queries from `build_query_json`).
+
+    Returns
+    -------
+    A list of query dicts. If the query doesn't need to be split, this is `[query_json]`.
+
+    Examples
+    --------
+    >>> shards = shard_query_json(build_query_json(gene_ids, ['biolink:Disease'], ['biolink:related_to']), 500)
+    """
+    if node_id is None:
+        node_id = _sharded_node(query_json)
+    if node_id is None:
+        return [query_json]
+    ids = query_json['message']['query_graph']['nodes'][node_id]['ids']
+    if len(ids) <= shard_size:
+        return [query_json]
+    return [_with_node_ids(query_json, node_id, ids[i:i + shard_size]) for i in range(0, len(ids), shard_size)]
+
+
+def _with_node_ids(query_json:dict, node_id:str, ids:list[str]) -> dict:
+    """Returns a copy of query_json in which `node_id` has the given ids, sharing all other parts of the query."""
+    query_graph = query_json['message']['query_graph']
+    node = {**query_graph['nodes'][node_id], 'ids': ids}
+    return {**query_json, 'message': {**query_json['message'],
+        'query_graph': {**query_graph, 'nodes': {**query_graph['nodes'], node_id: node}}}}
+
+
+def add_edge(edges:typing.MutableMapping[str, dict], edge_id:str, edge:dict, suffix:int=0) -> str:
+    """
+    Adds an edge to a dict (or `trapi_stream.EdgeStore`) of edges merged from several sources, returning its id.
+
+    If another edge already has that id, the edge is added under the first free id `{edge_id}_{n}` (n counting up from
+    `suffix`), so that no edge is overwritten. An edge that is already present under one of these ids is not added again.
+    """
+    key = edge_id
+    n = suffix
+    while key in edges:
+        if edges[key] == edge:
+            return key
+        key = f"{edge_id}_{n}"
+        n += 1
+    edges[key] = edge
+    return key
+
+
+def merge_messages(messages:list[dict], memory_budget:MemoryBudget | None=None) -> dict:
+    """
+    Merges the knowledge graphs of several TRAPI messages into one message with `knowledge_graph` nodes and edges.
+    Edges from different messages that have the same id but different content are kept under a suffixed id
+    (see `add_edge`).
+
+    If a `memory_budget` is given, the merged nodes and edges are `trapi_stream.EdgeStore` objects, and the stores
+    of the input messages are closed once they have been merged.
+    """
+    if memory_budget is None:
+        nodes = {}
+        edges = {}
+    else:
+        nodes = trapi_stream.EdgeStore(memory_budget)
+        edges = trapi_stream.EdgeStore(memory_budget)
+    for i, message in enumerate(messages):
+        kg = message.get('knowledge_graph') or {}
+        for node_id, node in (kg.get('nodes') or {}).items():
+            nodes[node_id] = node
+        for edge_id, edge in (kg.get('edges') or {}).items():
+            add_edge(edges, edge_id, edge, i)
+        for part in kg.values():
+            if isinstance(part, trapi_stream.EdgeStore):
+                part.close()
+    return {'knowledge_graph': {'nodes': nodes, 'edges': edges}}
+
+
+def query_KP_sharded(API_name_query:str, query_json:dict | CompiledQuery,
+        APInames:dict[str, str], API_predicates:dict[str, list[str]],
+        shard_size:int | dict[str, int] | None=None, shard_workers:int=4, min_shard_size:int=50,
+        health_registry:kp_health.KPHealthRegistry | None=None,
+        cache:QueryCache | None=None, hedge_policy:'HedgePolicy | None'=None,
+        memory_budget:MemoryBudget | None=None, include_nodes:bool=True):
+    """
+    Like `query_KP`, but large ID lists are split into shards that are sent to the KP concurrently, and the
+    shard results are merged into one message (with `knowledge_graph` nodes and edges, but no `results`).
+
+    If a shard fails (HTTP error or exception) and is larger than `min_shard_size`, it is split in half and retried.
+    If the failure was size-related (a timeout, HTTP 413, or a server error that goes away once the shard is split,
+    twice in a row), the smaller size is remembered for that KP in `health_registry.shard_sizes`; it grows back after
+    successful shards (see `kp_health.ShardSizes`).
+
+    Params
+    ------
+    API_name_query
+        This is the name of the API to be queried
+    query_json
+        A TRAPI query, e.g. the output of `build_query_json`, or a `compiled_query.CompiledQuery` of it
+        (to compile the query only once when sending it to several KPs).
+    APInames
+        This is the first output of `get_translator_API_predicates()`. This is a dict of API names to URLs.
+    API_predicates
+        A dict of API names to a list of their predicates. This is the third output of get_translator_API_predicates().
+    shard_size
+        Maximum number of IDs per request, either an int or a dict of API name : size. Default: `DEFAULT_SHARD_SIZE`
+        (or the size learned for the KP, if smaller).
+    shard_workers
+        Number of shards sent to the KP at the same time. Default: 4
+    min_shard_size
+        Failed shards of at most this size are not split any further. Default: 50
+    health_registry
+        Where to record the call statistics and learned shard sizes. Default: `kp_health.default_registry`
+    cache
+        A `query_cache.QueryCache` for KP responses. Default: None (no caching)
+    hedge_policy
+        Opt-in `HedgePolicy` for hedged requests. Default: None
+    memory_budget
+        If given, responses are parsed incrementally and the returned knowledge graph nodes and edges are
+        `trapi_stream.EdgeStore` objects that spill to disk beyond this `trapi_stream.MemoryBudget`. Default: None
+    include_nodes
+        Whether to keep knowledge graph nodes when `memory_budget` is given. Default: True
+
+    Returns
+    -------
+    The TRAPI message if any edges were returned, None otherwise.
+
+    Examples
+    --------
+    >>> query_json = build_query_json(gene_ids, ['biolink:Disease'], ['biolink:related_to'])
+    >>> result = query_KP_sharded('Multiomics KP - TRAPI 1.5.0', query_json, APInames, API_predicates, shard_size=200)
+    """
+    if health_registry is None:
+        health_registry = kp_health.default_registry
+    compiled = query_json if isinstance(query_json, CompiledQuery) else CompiledQuery(query_json)
+    predicates = compiled.predicates_for(API_predicates[API_name_query])
+    size = get_shard_size(API_name_query, shard_size, health_registry)
+    shards = [(i, i + size) for i in range(0, compiled.n_ids, size)] if compiled.n_ids > size else [(0, None)]
+
+    def send(start:int, end:int | None) -> tuple[dict | None, bool | int]:
+        if hedge_policy is not None:
+            return _hedged_query_KP(API_name_query, compiled, predicates, start, end, APInames, health_registry,
+                    hedge_policy, cache, memory_budget, include_nodes)
+        return _query_KP(API_name_query, APInames[API_name_query], compiled, predicates, start, end,
+                health_registry, cache, memory_budget, include_nodes)
+
+    import requests
+
+    def query_shard(shard:tuple[int, int | None]) -> list:
+        """Returns a list of (message, exception) for the shard, splitting it if it fails."""
+        start, end = shard
+        n_ids = (compiled.n_ids if end is None else end) - start
+        try:
+            message, error = send(start, end)
+            exception = None
+        except Exception as exc:
+            message, error, exception = None, True, exc
+        if not error:
+            health_registry.shard_sizes.succeeded(API_name_query, n_ids)
+            return [(message, None)]
+        if n_ids <= min_shard_size or not health_registry.allow_request(API_name_query):
+            return [(None, exception)]
+        half = (n_ids + 1) // 2
+        server_error = _split_failed_shard(API_name_query, n_ids, error, exception, (requests.Timeout,), health_registry)
+        outcomes = query_shard((start, start + half)) + query_shard((start + half, start + n_ids))
+        if server_error and all(message is not None for message, _ in outcomes):
+            # the server error went away once the shard was split
+            health_registry.shard_sizes.server_error(API_name_query, n_ids)
+        return outcomes
+
+    if len(shards) == 1:
+        outcomes = query_shard(shards[0])
     else:
-        #print(f"{API_name_query}: Warning Code: {response.status_code}")
+        with ThreadPoolExecutor(max_workers=min(shard_workers, len(shards))) as executor:
+            outcomes = [outcome for shard_outcomes in executor.map(query_shard, shards) for outcome in shard_outcomes]
+
+    return _merge_shard_outcomes(API_name_query, outcomes, memory_budget)
+
+
+def _merge_shard_outcomes(API_name_query:str, outcomes:list, memory_budget:MemoryBudget | None=None) -> dict | None:
+    """
+    Merges the (message, exception) outcomes of the shards of a query. Raises the first exception if every shard failed.
+    """
+    messages = [message for message, _ in outcomes if message is not None]
+    if len(messages) == 0:
+        exceptions = [exception for _, exception in outcomes if exception is not None]
+        if len(exceptions) > 0:
+            raise exceptions[0]
         return None
+    if len(messages) < len(outcomes):
+        print(f"{API_name_query}: {len(outcomes) - len(messages)} of {len(outcomes)} shards failed")
+    if len(outcomes) == 1:
+        return _result_with_edges(messages[0])
+    with instrumentation.span('kg.merge', stage='shards', kp=API_name_query):
+        return _result_with_edges(merge_messages(messages, memory_budget))
+
+
+class HedgePolicy:
+    """
+    An opt-in policy for hedged requests in `parallel_api_query`.
+
+    If a KP has not answered within its learned latency percentile (by default p95, taken from the KP health
+    statistics), a duplicate request is sent to one of its alternate servers. Whichever answers first is used, and the
+    other request is abandoned (cancelled if it has not started yet). The number of hedges is capped by a budget
+    relative to the number of primary requests.
+
+    Parameters
+    ----------
+    alternate_urls : dict[str, list[str]]
+        dict of API name : alternate query URLs, e.g. the output of `translator_kpinfo.get_alternate_endpoints`.
+    quantile : float
+        Latency percentile (0-100) after which a hedge is sent. Default: 95
+    min_samples : int
+        Minimum number of recorded calls to a KP before its percentile is trusted. Default: 10
+    default_delay : float | None
+        Hedge delay in seconds used while a KP has fewer than `min_samples` calls. Default: None (don't hedge)
+    min_delay : float
+        Lower bound for the hedge delay in seconds. Default: 0.05
+    budget_ratio : float
+        Fraction of primary requests that may be hedged. Default: 0.1
+    budget_burst : int
+        Number of hedges allowed on top of `budget_ratio`, so that hedging can start before many requests were made. Default: 2
+    max_workers : int
+        Size of the thread pool used for primary and hedge requests. Default: 16
+
+    Examples
+    --------
+    >>> Translator_KP_info, APInames = translator_kpinfo.get_translator_kp_info()
+    >>> policy = HedgePolicy(translator_kpinfo.get_alternate_endpoints(Translator_KP_info, APInames))
+    >>> result = parallel_api_query(query_json, selected_APIs, APInames, API_predicates, max_workers=8, hedge_policy=policy)
+    >>> policy.stats()
+    """
+
+    def __init__(self, alternate_urls:dict[str, list[str]], quantile:float=95, min_samples:int=10,
+            default_delay:float | None=None, min_delay:float=0.05,
+            budget_ratio:float=0.1, budget_burst:int=2, max_workers:int=16):
+        self.alternate_urls = alternate_urls
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.max_workers = max_workers
+        self.primary_requests = 0
+        self.hedges_sent = 0
+        self._kp_stats = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='hedge')
+            return self._executor
+
+    def close(self):
+        """Shuts down the thread pool without waiting for abandoned requests."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def delay_for(self, API_name:str, health_registry:kp_health.KPHealthRegistry) -> float | None:
+        """Returns how long to wait for the given KP before hedging, or None if it should not be hedged."""
+        health = health_registry.get(API_name)
+        if len(health.calls) >= self.min_samples:
+            delay = health.latency_percentile(self.quantile)
+        else:
+            delay = self.default_delay
+        if delay is None:
+            return None
+        return max(delay, self.min_delay)
+
+    def _count(self, API_name:str, key:str):
+        # must be called with self._lock held
+        kp_stats = self._kp_stats.setdefault(API_name, {'requests': 0, 'hedged': 0, 'hedge_won': 0, 'primary_won': 0, 'budget_exhausted': 0})
+        kp_stats[key] += 1
+
+    def record_request(self, API_name:str):
+        with self._lock:
+            self.primary_requests += 1
+            self._count(API_name, 'requests')
+
+    def try_acquire(self, API_name:str) -> bool:
+        """Takes one hedge from the budget, returning False if the budget is exhausted."""
+        with self._lock:
+            if self.hedges_sent >= self.budget_ratio * self.primary_requests + self.budget_burst:
+                self._count(API_name, 'budget_exhausted')
+                return False
+            self.hedges_sent += 1
+            self._count(API_name, 'hedged')
+            return True
+
+    def record_winner(self, API_name:str, hedge_won:bool):
+        with self._lock:
+            self._count(API_name, 'hedge_won' if hedge_won else 'primary_won')
+
+    def stats(self) -> dict[str, dict]:
+        """Returns a dict of API name : counts of requests, hedges sent, hedge/primary wins and budget exhaustion."""
+        with self._lock:
+            return {name: dict(kp_stats) for name, kp_stats in self._kp_stats.items()}
+
+
+def _hedged_query_KP(API_name_query:str, compiled:CompiledQuery, predicates:list[list[str]],
+        start:int, end:int | None, APInames:dict[str, str],
+        health_registry:kp_health.KPHealthRegistry, hedge_policy:HedgePolicy,
+        cache:QueryCache | None=None, memory_budget:MemoryBudget | None=None,
+        include_nodes:bool=True) -> tuple[dict | None, bool]:
+    """
+    Like `_query_KP`, but sends a hedge request to an alternate server if the primary is slow.
+    Returns the (message, error) tuple of whichever request answered first without an error.
+    """
+    hedge_policy.record_request(API_name_query)
+    executor = hedge_policy.executor
+    API_url = APInames[API_name_query]
+    started = threading.Event()
+
+    def run_primary() -> tuple[dict | None, bool]:
+        started.set()
+        return _query_KP(API_name_query, API_url, compiled, predicates, start, end,
+                health_registry, cache, memory_budget, include_nodes)
+
+    primary = executor.submit(run_primary)
+    # also set if the primary is cancelled before it starts
+    primary.add_done_callback(lambda future: started.set())
+
+    # Hedges are recorded under their own name, so that they don't skew the primary latency distribution.
+    hedge_name = f"{API_name_query} (hedge)"
+    alternates = [url for url in hedge_policy.alternate_urls.get(API_name_query, []) if url != API_url]
+    delay = hedge_policy.delay_for(API_name_query, health_registry)
+    if len(alternates) == 0 or delay is None:
+        return primary.result()
+    # The delay counts from when the primary request starts, not from when it was queued in the shared pool.
+    started.wait()
+    done, _ = wait([primary], timeout=delay)
+    if done or not health_registry.allow_request(hedge_name) or not hedge_policy.try_acquire(API_name_query):
+        return primary.result()
+
+    hedge = executor.submit(_query_KP, hedge_name, alternates[0], compiled, predicates, start, end,
+            health_registry, None, memory_budget, include_nodes)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        # a request that failed (HTTP error or exception) never wins, however fast it was
+        winners = [future for future in done if future.exception() is None and not future.result()[1]]
+        if len(winners) > 0:
+            winner = primary if primary in winners else winners[0]
+            for future in (done | pending) - {winner}:
+                future.cancel()
+                # the spill files of a loser that still answers are removed
+                future.add_done_callback(_close_abandoned_message)
+            hedge_policy.record_winner(API_name_query, hedge_won=winner is hedge)
+            return winner.result()
+    # Neither request succeeded.
+    return primary.result()
+
+
+def _close_abandoned_message(future):
+    """Closes the `trapi_stream.EdgeStore` parts of the message of an abandoned request."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    message, _ = future.result()
+    if message is None:
+        return
+    for part in (message.get('knowledge_graph') or {}).values():
+        if isinstance(part, trapi_stream.EdgeStore):
+            part.close()
 
 
 def parallel_api_query(query_json:dict, selected_APIs:list[str],
-        APInames:dict[str, str], API_predicates:dict[str, list[str]], max_workers=1):
+        APInames:dict[str, str], API_predicates:dict[str, list[str]], max_workers=1,
+        skip_unhealthy:bool=True, health_registry:kp_health.KPHealthRegistry | None=None,
+        hedge_policy:HedgePolicy | None=None, cache:QueryCache | None=None,
+        shard_size:int | dict[str, int] | None=None, shard_workers:int=4,
+        memory_budget:int | MemoryBudget | None=None, normalize:bool=False):
     '''
     Queries multiple APIs in parallel and merges the results into a single knowledge graph.
 
+    Large subject ID lists are split into shards per KP (see `query_KP_sharded`).
+
+    If a `memory_budget` (in bytes) is given, KP responses are parsed incrementally, keeping only the knowledge graph
+    edges, and per-KP and merged edges spill to temporary files on disk once the budget is used up. In that case the
+    merged edges are returned as a `trapi_stream.EdgeStore` (a dict-like object; call its `close` method when done).
+
+    KPs whose circuit breaker is open (because they failed repeatedly, see `kp_health`) are skipped,
+    unless `skip_unhealthy` is False. If a `hedge_policy` is given, slow KPs are also queried at an alternate server
+    and the first answer is used (see `HedgePolicy`).
+
     Parameters
     ----------
     query_json: dict
@@ -232,6 +814,24 @@ def parallel_api_query(query_json:dict, selected_APIs:list[str],
         A dict of API names to a list of their predicates. This is the third output of get_translator_API_predicates().
     max_workers
         Number of parallel workers to use for querying. Default: 1
+    skip_unhealthy
+        If True, KPs with an open circuit breaker are not queried. Default: True
+    health_registry
+        Where KP call statistics and breaker states are kept. Default: `kp_health.default_registry`
+    hedge_policy
+        Opt-in policy for hedged requests to alternate KP servers. Default: None (no hedging)
+    cache
+        A `query_cache.QueryCache` for KP responses; cached KPs are answered without being contacted. Default: None
+    shard_size
+        Maximum number of subject IDs per request, either an int or a dict of API name : size.
+        Default: `DEFAULT_SHARD_SIZE`, or the size learned for the KP if smaller.
+    shard_workers
+        Number of shards sent to each KP at the same time. Default: 4
+    memory_budget
+        Approximate number of bytes of edges to hold in memory, or a `trapi_stream.MemoryBudget`. Default: None (no limit)
+    normalize
+        If True, the merged edges are rewritten to canonical node IDs with NodeNorm and duplicate edges from different
+        KPs are collapsed (see `edge_normalization.normalize_edges`). Default: False
 
     Returns
     -------
@@ -242,26 +842,64 @@ def parallel_api_query(query_json:dict, selected_APIs:list[str],
     >>> result = translator_query.parallel_api_query(API_URLs, query_json=query_json, max_workers=len(API_URLs))
 
     '''
+    if health_registry is None:
+        health_registry = kp_health.default_registry
+    if isinstance(memory_budget, int):
+        memory_budget = MemoryBudget(memory_budget)
+    if skip_unhealthy:
+        skipped_APIs = [API_name_query for API_name_query in selected_APIs if not health_registry.allow_request(API_name_query)]
+        if len(skipped_APIs) > 0:
+            print("Skipping KPs with open circuit breakers: " + ", ".join(skipped_APIs))
+            selected_APIs = [API_name_query for API_name_query in selected_APIs if API_name_query not in skipped_APIs]
     # Parallel query
     result = []
     no_results_returned = []
     from concurrent.futures import ThreadPoolExecutor, as_completed
-    from copy import deepcopy
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # copy the query_json for each API to avoid modifying the original query_json
-        query_json_cur = deepcopy(query_json)
-        future_to_url = {executor.submit(query_KP, API_name_query, query_json_cur, APInames, API_predicates): API_name_query for API_name_query in selected_APIs}
+        # serialize the query once; each API's request body is rendered from it without modifying the original query_json
+        compiled = CompiledQuery(query_json)
+        future_to_url = {executor.submit(query_KP_sharded, API_name_query, compiled, APInames, API_predicates,
+                shard_size=shard_size, shard_workers=shard_workers, health_registry=health_registry,
+                cache=cache, hedge_policy=hedge_policy, memory_budget=memory_budget,
+                include_nodes=False): API_name_query for API_name_query in selected_APIs}
 
         for future in as_completed(future_to_url):
             url = future_to_url[future]
             try:
                 data = future.result()
-                if 'knowledge_graph' in data:
+                if data is not None and 'knowledge_graph' in data:
                     result.append(data)
             except Exception:
                 no_results_returned.append(url)
                 #print('%r generated an exception: %s' % (url, exc))
     
+    if memory_budget is not None:
+        result_merged = trapi_stream.EdgeStore(memory_budget)
+        with instrumentation.span('kg.merge', stage='kps'):
+            for kp_result in result:
+                edges = kp_result['knowledge_graph']['edges']
+                for edge_id, edge in edges.items():
+                    result_merged[edge_id] = edge
+                if isinstance(edges, trapi_stream.EdgeStore):
+                    edges.close()
+        if normalize:
+            with result_merged:
+                return edge_normalization.normalize_edges(result_merged)
+        return result_merged
+
+    result_merged = _merge_KP_edges(result)
+    if normalize:
+        return edge_normalization.normalize_edges(result_merged)
+    return(result_merged)
+
+
+def _merge_KP_edges(result:list[dict]) -> dict:
+    """Merges the knowledge graph edges of the KP messages into one dict (later KPs win for identical edge ids)."""
+    with instrumentation.span('kg.merge', stage='kps'):
+        return _merge_edges_of(result)
+
+
+def _merge_edges_of(result:list[dict]) -> dict:
     included_KP_ID = []
     for i in range(0,len(result)):
         if result[i]['knowledge_graph'] is not None:
@@ -273,8 +911,115 @@ def parallel_api_query(query_json:dict, selected_APIs:list[str],
     result_merged = {}
     for i in included_KP_ID:
         result_merged = {**result_merged, **result[i]['knowledge_graph']['edges']}
+    return result_merged
 
-    len(result_merged)
 
-    return(result_merged)
+async def _aquery_KP(API_name_query:str, API_url:str, compiled:CompiledQuery, predicates:list[list[str]],
+        start:int, end:int | None, health_registry:kp_health.KPHealthRegistry,
+        cache:QueryCache | None=None) -> tuple[dict | None, bool | int]:
+    """Async version of `_query_KP` (without memory budget), using the shared connection pool of `async_client`."""
+    if cache is not None:
+        cache_key = compiled.cache_key(API_name_query, API_url, predicates, start, end)
+        result = cache.get(cache_key)
+        if result is not None:
+            return result, False
+    body = compiled.body(predicates, start, end)
+    start_time = time.perf_counter()
+    try:
+        response = await http_client.apost(API_url, content=body, headers={'Content-Type': 'application/json'})
+    except Exception as exc:
+        health_registry.record(API_name_query, time.perf_counter() - start_time, error=True, error_message=type(exc).__name__)
+        raise
+    latency = time.perf_counter() - start_time
+    if response.status_code == 200:
+        with instrumentation.span('json.decode', service='kp', kp=API_name_query):
+            result = json_codec.response_json(response).get("message", {})
+        if cache is not None:
+            cache.set(cache_key, result, size=len(response.content))
+        return _record_KP_message(API_name_query, result, latency, health_registry)
+    else:
+        return _record_KP_error(API_name_query, response.status_code, latency, health_registry)
+
+
+async def aquery_KP_sharded(API_name_query:str, query_json:dict | CompiledQuery,
+        APInames:dict[str, str], API_predicates:dict[str, list[str]],
+        shard_size:int | dict[str, int] | None=None, shard_workers:int=4, min_shard_size:int=50,
+        health_registry:kp_health.KPHealthRegistry | None=None,
+        cache:QueryCache | None=None) -> dict | None:
+    """
+    Async version of `query_KP_sharded`, using the shared connection pool of `async_client`. Returns the same results.
+    Hedged requests and memory budgets are not supported.
+    """
+    if health_registry is None:
+        health_registry = kp_health.default_registry
+    compiled = query_json if isinstance(query_json, CompiledQuery) else CompiledQuery(query_json)
+    predicates = compiled.predicates_for(API_predicates[API_name_query])
+    size = get_shard_size(API_name_query, shard_size, health_registry)
+    shards = [(i, i + size) for i in range(0, compiled.n_ids, size)] if compiled.n_ids > size else [(0, None)]
+    semaphore = asyncio.Semaphore(shard_workers)
+
+    import httpx
+
+    async def query_shard(shard:tuple[int, int | None]) -> list:
+        """Returns a list of (message, exception) for the shard, splitting it if it fails."""
+        start, end = shard
+        n_ids = (compiled.n_ids if end is None else end) - start
+        try:
+            async with semaphore:
+                message, error = await _aquery_KP(API_name_query, APInames[API_name_query], compiled, predicates,
+                        start, end, health_registry, cache)
+            exception = None
+        except Exception as exc:
+            message, error, exception = None, True, exc
+        if not error:
+            health_registry.shard_sizes.succeeded(API_name_query, n_ids)
+            return [(message, None)]
+        if n_ids <= min_shard_size or not health_registry.allow_request(API_name_query):
+            return [(None, exception)]
+        half = (n_ids + 1) // 2
+        server_error = _split_failed_shard(API_name_query, n_ids, error, exception, (httpx.TimeoutException,),
+                health_registry)
+        halves = await asyncio.gather(query_shard((start, start + half)), query_shard((start + half, start + n_ids)))
+        outcomes = halves[0] + halves[1]
+        if server_error and all(message is not None for message, _ in outcomes):
+            health_registry.shard_sizes.server_error(API_name_query, n_ids)
+        return outcomes
+
+    outcomes = [outcome for shard_outcomes in await asyncio.gather(*[query_shard(shard) for shard in shards])
+            for outcome in shard_outcomes]
+    return _merge_shard_outcomes(API_name_query, outcomes)
+
+
+async def aparallel_api_query(query_json:dict, selected_APIs:list[str],
+        APInames:dict[str, str], API_predicates:dict[str, list[str]],
+        skip_unhealthy:bool=True, health_registry:kp_health.KPHealthRegistry | None=None,
+        cache:QueryCache | None=None, shard_size:int | dict[str, int] | None=None, shard_workers:int=4,
+        normalize:bool=False) -> dict:
+    """
+    Async version of `parallel_api_query`: all KPs are queried concurrently on the running event loop, using the
+    shared connection pool of `async_client`. Returns the same merged edges.
+    Hedged requests and memory budgets are not supported.
+
+    Examples
+    --------
+    >>> result = await translator_query.aparallel_api_query(query_json, selected_APIs, APInames, API_predicates)
+    """
+    if health_registry is None:
+        health_registry = kp_health.default_registry
+    if skip_unhealthy:
+        skipped_APIs = [API_name_query for API_name_query in selected_APIs if not health_registry.allow_request(API_name_query)]
+        if len(skipped_APIs) > 0:
+            print("Skipping KPs with open circuit breakers: " + ", ".join(skipped_APIs))
+            selected_APIs = [API_name_query for API_name_query in selected_APIs if API_name_query not in skipped_APIs]
+    compiled = CompiledQuery(query_json)
+    outcomes = await asyncio.gather(*[aquery_KP_sharded(API_name_query, compiled, APInames, API_predicates,
+            shard_size=shard_size, shard_workers=shard_workers, health_registry=health_registry, cache=cache)
+            for API_name_query in selected_APIs], return_exceptions=True)
+    result = [data for data in outcomes
+            if data is not None and not isinstance(data, BaseException) and 'knowledge_graph' in data]
+    result_merged = _merge_KP_edges(result)
+    if normalize:
+        id_map = await edge_normalization.anormalize_curies(edge_normalization.collect_curies(result_merged))
+        return edge_normalization.normalize_edges(result_merged, id_map=id_map)
+    return result_merged
 
@@ -0,0 +1,274 @@
+"""
+Memory-bounded handling of large TRAPI responses.
+
+`iter_knowledge_graph` extracts the knowledge graph edges (and optionally nodes) of a TRAPI response while it is being
+read from the network, without building the whole message in memory. It uses the optional `ijson` package
+(`pip install ijson`); without it, the response is parsed in one go and the memory bound only applies after parsing.
+
+`EdgeStore` is a dict-like container for edges or nodes that counts the (serialized) size of what it holds against a
+shared `MemoryBudget`. When the budget is exceeded, the store that is being written spills its in-memory items to a
+temporary SQLite database, so that the peak memory use stays bounded no matter how large the responses are.
+
+These are used by `translator_query.parallel_api_query(..., memory_budget=...)`.
+"""
+from collections.abc import Iterator, MutableMapping
+import os
+import sqlite3
+import tempfile
+import threading
+import weakref
+
+from . import json_codec
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+
+def iter_knowledge_graph(stream, include_nodes:bool=False) -> Iterator[tuple[str, str, dict]]:
+    """
+    Iterates over the knowledge graph of a TRAPI response, read incrementally from a binary file-like object.
+
+    Parameters
+    ----------
+    stream
+        A binary file-like object containing a TRAPI response (e.g. `response.raw` of a streamed `requests` response).
+    include_nodes : bool
+        If True, knowledge graph nodes are returned as well as edges. Default: False
+
+    Returns
+    -------
+    An iterator of (section, id, value) tuples, where section is 'edges' or 'nodes'.
+    """
+    prefixes = {'message.knowledge_graph.edges': 'edges'}
+    if include_nodes:
+        prefixes['message.knowledge_graph.nodes'] = 'nodes'
+
+    if ijson is None:
+        message = json_codec.loads(stream.read()).get('message', {})
+        kg = message.get('knowledge_graph') or {}
+        for section in prefixes.values():
+            for key, value in (kg.get(section) or {}).items():
+                yield section, key, value
+        return
+
+    current = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if current is not None:
+            current_prefix, section, key, builder = current
+            if prefix == current_prefix and event in ('map_key', 'end_map'):
+                yield section, key, builder.value
+                current = None
+            else:
+                builder.event(event, value)
+                continue
+        if event == 'map_key' and prefix in prefixes:
+            current = (prefix, prefixes[prefix], value, ObjectBuilder())
+
+
+class MemoryBudget:
+    """
+    A byte budget shared by several `EdgeStore` objects.
+
+    Parameters
+    ----------
+    limit : int
+        Maximum total size (of the serialized JSON) held in memory by all stores using this budget.
+    spill_dir : str | None
+        Directory for the temporary SQLite files of spilled stores. Default: the system temporary directory.
+    """
+
+    def __init__(self, limit:int, spill_dir:str | None=None):
+        self.limit = limit
+        self.spill_dir = spill_dir
+        self.used = 0
+        self.peak = 0
+        self.spills = 0
+        self._stores = weakref.WeakValueDictionary()
+        "id(store) : store, for all live stores using this budget"
+        self._lock = threading.Lock()
+
+    def register(self, store:'EdgeStore'):
+        with self._lock:
+            self._stores[id(store)] = store
+
+    def reclaim(self):
+        """Spills the store holding the most memory, if the budget is exceeded."""
+        with self._lock:
+            if self.used <= self.limit or len(self._stores) == 0:
+                return
+            largest = max(self._stores.values(), key=lambda store: store.memory_bytes)
+        largest.spill()
+
+    def charge(self, size:int) -> bool:
+        """Adds `size` bytes, returning True if the budget is now exceeded."""
+        with self._lock:
+            self.used += size
+            self.peak = max(self.peak, self.used)
+            return self.used > self.limit
+
+    def release(self, size:int):
+        with self._lock:
+            self.used -= size
+
+
+class EdgeStore(MutableMapping):
+    """
+    A dict-like store of JSON-serializable values that spills to disk when its `MemoryBudget` is exceeded.
+
+    Iteration yields the items held in memory first and then the spilled ones, so insertion order is not preserved.
+    Values read back from disk are new objects, so modifying them does not change the store.
+    Call `close` (or use the store as a context manager) to release its memory and delete its temporary file.
+    """
+
+    def __init__(self, budget:MemoryBudget):
+        self.budget = budget
+        self._memory = {}
+        "key : (value, size)"
+        self._memory_bytes = 0
+        self._db = None
+        self._db_path = None
+        self._disk_count = 0
+        self._lock = threading.RLock()
+        budget.register(self)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Size of the items held in memory."""
+        return self._memory_bytes
+
+    def __setitem__(self, key:str, value):
+        size = len(key) + len(json_codec.dumps(value))
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= self._memory[key][1]
+                self.budget.release(self._memory[key][1])
+            elif self._db is not None:
+                self._delete_from_disk(key)
+            self._memory[key] = (value, size)
+            self._memory_bytes += size
+            exceeded = self.budget.charge(size)
+        if exceeded:
+            # Spill whichever store sharing the budget holds the most memory (outside of this store's lock).
+            self.budget.reclaim()
+
+    def __getitem__(self, key:str):
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key][0]
+            if self._db is not None:
+                row = self._db.execute('SELECT value FROM items WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    return json_codec.loads(row[0])
+        raise KeyError(key)
+
+    def __delitem__(self, key:str):
+        with self._lock:
+            if key in self._memory:
+                _, size = self._memory.pop(key)
+                self._memory_bytes -= size
+                self.budget.release(size)
+                return
+            if self._db is not None and self._delete_from_disk(key):
+                return
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            if key in self._memory:
+                return True
+            if self._db is not None:
+                return self._db.execute('SELECT 1 FROM items WHERE key = ?', (key,)).fetchone() is not None
+        return False
+
+    def __iter__(self):
+        for key, _ in self.items():
+            yield key
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._memory) + self._disk_count
+
+    def items(self):
+        """Iterates over (key, value) pairs, reading spilled items back from disk."""
+        with self._lock:
+            memory_items = [(key, value) for key, (value, _) in self._memory.items()]
+            if self._db is not None:
+                self._db.commit()
+            db_path = self._db_path if self._disk_count > 0 else None
+        yield from memory_items
+        if db_path is not None:
+            # A separate connection, so that rows are streamed from disk instead of being fetched all at once.
+            db = sqlite3.connect(db_path)
+            try:
+                for key, value in db.execute('SELECT key, value FROM items'):
+                    yield key, json_codec.loads(value)
+            finally:
+                db.close()
+
+    def values(self):
+        for _, value in self.items():
+            yield value
+
+    @property
+    def spilled(self) -> bool:
+        """True if some items are stored on disk."""
+        return self._disk_count > 0
+
+    def spill(self):
+        """Moves all in-memory items to the temporary SQLite database."""
+        with self._lock:
+            if len(self._memory) == 0:
+                return
+            if self._db is None:
+                fd, self._db_path = tempfile.mkstemp(suffix='.sqlite', prefix='trapi_', dir=self.budget.spill_dir)
+                os.close(fd)
+                self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+                self._db.execute('PRAGMA journal_mode = OFF')
+                self._db.execute('PRAGMA synchronous = OFF')
+                self._db.execute('CREATE TABLE items (key TEXT PRIMARY KEY, value TEXT)')
+            self._db.executemany('INSERT OR REPLACE INTO items VALUES (?, ?)',
+                    ((key, json_codec.dumps(value)) for key, (value, _) in self._memory.items()))
+            self._db.commit()
+            self._disk_count = self._db.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+            self.budget.release(self._memory_bytes)
+            self.budget.spills += 1
+            self._memory = {}
+            self._memory_bytes = 0
+
+    def _delete_from_disk(self, key:str) -> bool:
+        # must be called with self._lock held
+        deleted = self._db.execute('DELETE FROM items WHERE key = ?', (key,)).rowcount > 0
+        if deleted:
+            self._disk_count -= 1
+        return deleted
+
+    def to_dict(self) -> dict:
+        """Returns all items as a regular dict (which is not memory-bounded)."""
+        return dict(self.items())
+
+    def close(self):
+        """Releases the memory budget and deletes the temporary database."""
+        with self._lock:
+            self.budget.release(self._memory_bytes)
+            self._memory = {}
+            self._memory_bytes = 0
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+                os.remove(self._db_path)
+            self._disk_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
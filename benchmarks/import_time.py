@@ -0,0 +1,68 @@
+"""
+Import time benchmark.
+
+Times `import <module>` in fresh interpreters (best of `--repeat` runs) and lists the heavy dependencies that each
+import loads. The lightweight modules (the package itself, `name_resolver`, `node_normalizer`, `node_annotator`) must
+not load pandas, numpy, httpx or requests at import time; with `--check`, the script exits with an error if they do or
+if they take longer than `--max-ms`.
+
+Examples
+--------
+$ python benchmarks/import_time.py
+$ python benchmarks/import_time.py --repeat 10 --check --max-ms 100
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+MODULES = ['Translator_sdk', 'Translator_sdk.name_resolver', 'Translator_sdk.node_normalizer',
+    'Translator_sdk.node_annotator', 'Translator_sdk.translator_query']
+LIGHTWEIGHT = MODULES[:4]
+HEAVY = ['pandas', 'numpy', 'httpx', 'requests', 'asyncio', 'networkx', 'ijson']
+
+_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def time_import(module:str, repeat:int=5) -> dict:
+    """Returns the best import time (in ms) of `module` over `repeat` fresh interpreters, and the heavy modules it loads."""
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', _SCRIPT.format(module=module, heavy=HEAVY)],
+                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output)
+        if best is None or result['ms'] < best['ms']:
+            best = result
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs per module (default: 5)')
+    parser.add_argument('--check', action='store_true', help='fail if a lightweight module is slow or loads a heavy dependency')
+    parser.add_argument('--max-ms', type=float, default=100, help='import time limit of the lightweight modules for --check (default: 100)')
+    args = parser.parse_args()
+
+    failures = []
+    print(f'{"module":40} {"ms":>8}  heavy dependencies loaded')
+    for module in MODULES:
+        result = time_import(module, args.repeat)
+        print(f'{module:40} {result["ms"]:8.1f}  {", ".join(result["loaded"]) or "-"}')
+        if module in LIGHTWEIGHT:
+            loaded = [m for m in result['loaded'] if m in ('pandas', 'numpy', 'httpx', 'requests')]
+            if loaded:
+                failures.append(f'{module} loads {", ".join(loaded)}')
+            if result['ms'] > args.max_ms:
+                failures.append(f'{module} takes {result["ms"]:.1f} ms (limit: {args.max_ms} ms)')
+    if args.check and failures:
+        sys.exit('\n'.join(failures))
+
+
+if __name__ == '__main__':
+    main()
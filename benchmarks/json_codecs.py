@@ -0,0 +1,79 @@
+"""
+JSON codec benchmark.
+
+Times decoding and encoding of typical Translator payloads (a TRAPI response, a NodeNorm response and a NameRes
+bulk-lookup response, generated like in `mock_servers`) with every available codec of `json_codec`, in milliseconds
+per MB of JSON, and reports the size and cost of gzip-compressing them.
+
+Examples
+--------
+$ python benchmarks/json_codecs.py
+$ python benchmarks/json_codecs.py --ids 2000 --repeat 20
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import ServiceConfig, kp_response, nameres_results, nodenorm_result  # noqa: E402
+
+from Translator_sdk import json_codec  # noqa: E402
+
+
+def payloads(n_ids:int) -> dict[str, object]:
+    """Returns name : payload of the benchmarked payloads."""
+    config = ServiceConfig(n_results=10, n_synonyms=10, n_attributes=5)
+    curies = [f'NCBIGene:{i}' for i in range(n_ids)]
+    query = {'message': {'query_graph': {
+        'nodes': {'n00': {'ids': curies}, 'n01': {'categories': ['biolink:Disease']}},
+        'edges': {'e00': {'subject': 'n00', 'object': 'n01', 'predicates': ['biolink:related_to']}}}}}
+    return {
+        'trapi': kp_response(config, 'kp', query),
+        'nodenorm': {curie: nodenorm_result(config, curie) for curie in curies},
+        'nameres': {f'name {i}': nameres_results(config, f'name {i}') for i in range(n_ids // 10)},
+    }
+
+
+def best_of(repeat:int, function, *args) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv:list[str] | None=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--ids', type=int, default=1000, help='CURIEs per payload (default: 1000)')
+    parser.add_argument('--repeat', type=int, default=10, help='runs per measurement, the best is kept (default: 10)')
+    args = parser.parse_args(argv)
+
+    codecs = []
+    for name, codec_class in json_codec.CODECS.items():
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            print(f'{name} is not installed, skipping it', file=sys.stderr)
+
+    print(f'{"payload":10} {"MB":>6} {"codec":8} {"decode ms/MB":>13} {"encode ms/MB":>13}')
+    for name, payload in payloads(args.ids).items():
+        data = json_codec.StdlibCodec().dumps(payload)
+        mb = len(data) / 2**20
+        for codec in codecs:
+            decode = best_of(args.repeat, codec.loads, data) * 1000 / mb
+            encode = best_of(args.repeat, codec.dumps, payload) * 1000 / mb
+            print(f'{name:10} {mb:6.2f} {codec.name:8} {decode:13.1f} {encode:13.1f}')
+        compressed = gzip.compress(data, compresslevel=5)
+        compress = best_of(args.repeat, gzip.compress, data, 5) * 1000 / mb
+        decompress = best_of(args.repeat, gzip.decompress, compressed) * 1000 / mb
+        print(f'{name:10} {"":6} gzip: {len(compressed) / len(data):.1%} of the size, '
+            f'{compress:.1f} ms/MB to compress, {decompress:.1f} ms/MB to decompress')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+"""
+Local stand-ins for the Translator services, for offline benchmarks.
+
+`MockTranslatorServer` serves, on one local port:
+
+- NameRes (`/nameres/`): `lookup`, `bulk-lookup`, `synonyms`, `status`
+- NodeNorm (`/nodenorm/`): `get_normalized_nodes` (GET and POST), `status`
+- the Node Annotator (`/annotator/`): `curie`, `status`
+- the SmartAPI metaKG (`/smartapi/metakg/consolidated`)
+- TRAPI KPs (`/kp/<name>/query`), any number of them
+
+Each service has its own `ServiceConfig`: latency (fixed, random and per item of a batch request), error rate and
+payload sizes. Responses are deterministic for a given request, so that repeated runs do the same work.
+
+Examples
+--------
+>>> with MockTranslatorServer({'nodenorm': ServiceConfig(latency=0.02, error_rate=0.01)}) as server, server.use():
+...     node_normalizer.get_normalized_nodes(['MESH:D014867'], mode='post')
+>>> server.stats()
+
+The mock server can also be run on its own (`python benchmarks/mock_servers.py --port 8000`), or in a child process
+with `serve_in_process`.
+"""
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import contextlib
+import gzip
+import json
+import random
+import threading
+import time
+import urllib.parse
+import zlib
+
+SERVICES = ('nameres', 'nodenorm', 'annotator', 'smartapi', 'kp')
+
+
+@dataclass
+class ServiceConfig:
+    """
+    Behavior of one mock service.
+    """
+
+    latency: float = 0.005
+    "Fixed delay of every response, in seconds."
+
+    jitter: float = 0.0
+    "Additional random delay, uniform between 0 and `jitter` seconds."
+
+    latency_per_item: float = 0.0
+    "Additional delay per item (string, CURIE or subject ID) of a request, in seconds."
+
+    error_rate: float = 0.0
+    "Fraction of requests answered with `error_status`."
+
+    error_status: int = 503
+    "HTTP status of the injected errors."
+
+    n_results: int = 5
+    "Results per name (NameRes), hits per KP (metaKG) or edges per subject ID (KPs)."
+
+    n_synonyms: int = 5
+    "Synonyms per result (NameRes) or equivalent identifiers per node (NodeNorm)."
+
+    n_attributes: int = 3
+    "Attributes per edge (KPs) or annotation fields per CURIE (Node Annotator)."
+
+    null_rate: float = 0.0
+    "Fraction of CURIEs that NodeNorm does not know, and of names that NameRes finds no match for."
+
+    compress: bool = False
+    "Gzip-compress responses for the clients that accept it (`Accept-Encoding: gzip`)."
+
+
+def _seed(*parts) -> int:
+    return zlib.crc32(json.dumps(parts, sort_keys=True).encode('utf-8'))
+
+
+def _unknown(config:ServiceConfig, item:str) -> bool:
+    return config.null_rate > 0 and (_seed('null', item) % 10000) < config.null_rate * 10000
+
+
+def nameres_results(config:ServiceConfig, name:str, limit:int | None=None) -> list[dict]:
+    """Returns the NameRes results of a name."""
+    if _unknown(config, name):
+        return []
+    n_results = config.n_results if limit is None else min(limit, config.n_results)
+    base = _seed('nameres', name) % 1000000
+    return [{
+        'curie': f'MONDO:{base + i:07d}',
+        'label': f'{name} {i}' if i else name,
+        'highlighting': {},
+        'synonyms': [f'{name} synonym {j}' for j in range(config.n_synonyms)],
+        'taxa': [],
+        'types': ['biolink:Disease', 'biolink:DiseaseOrPhenotypicFeature', 'biolink:NamedThing'],
+        'score': 100.0 / (i + 1),
+        'clique_identifier_count': config.n_synonyms,
+    } for i in range(n_results)]
+
+
+def nodenorm_result(config:ServiceConfig, curie:str) -> dict | None:
+    """Returns the NodeNorm result of a CURIE (None for unknown CURIEs)."""
+    if _unknown(config, curie):
+        return None
+    prefix, _, local_id = curie.partition(':')
+    identifier = f'{prefix}:{local_id}'
+    return {
+        'id': {'identifier': identifier, 'label': f'label of {identifier}'},
+        'equivalent_identifiers': [{'identifier': identifier, 'label': f'label of {identifier}'}] + [
+            {'identifier': f'EQ{j}:{local_id}', 'label': f'synonym {j} of {identifier}'} for j in range(config.n_synonyms - 1)],
+        'type': ['biolink:Gene', 'biolink:GeneOrGeneProduct', 'biolink:NamedThing'],
+        'information_content': 100.0,
+    }
+
+
+def annotator_result(config:ServiceConfig, curie:str) -> list[dict]:
+    """Returns the Node Annotator annotations of a CURIE."""
+    return [{'_id': curie, 'query': curie, **{f'field_{j}': f'value {j} of {curie}' for j in range(config.n_attributes)}}]
+
+
+def metakg_hits(config:ServiceConfig, query:str) -> dict:
+    """Returns a SmartAPI metaKG response with `n_results` hits."""
+    categories = ['Gene', 'Disease', 'ChemicalEntity', 'Protein', 'PhenotypicFeature']
+    predicates = ['related_to', 'interacts_with', 'treats', 'affects', 'associated_with', 'causes']
+    hits = []
+    for i in range(config.n_results):
+        subject = categories[i % len(categories)]
+        obj = categories[(i // len(categories)) % len(categories)]
+        predicate = predicates[(i // len(categories) ** 2 + _seed(query)) % len(predicates)]
+        hits.append({'_id': f'{subject}-{predicate}-{obj}', 'subject': subject, 'predicate': predicate, 'object': obj})
+    return {'total': len(hits), 'hits': hits}
+
+
+def _query_edge(query:dict) -> tuple[dict, list[str]]:
+    """Returns the first edge of a TRAPI query graph and the IDs of its subject node."""
+    query_graph = query['message']['query_graph']
+    edge = next(iter(query_graph['edges'].values()))
+    return edge, query_graph['nodes'][edge['subject']].get('ids') or []
+
+
+def kp_response(config:ServiceConfig, kp:str, query:dict) -> dict:
+    """Returns a TRAPI response with `n_results` edges per subject ID of the query."""
+    query_graph = query['message']['query_graph']
+    edge, ids = _query_edge(query)
+    predicates = edge.get('predicates') or ['biolink:related_to']
+    edges = {}
+    nodes = {}
+    for curie in ids:
+        nodes[curie] = {'name': f'name of {curie}', 'categories': ['biolink:Gene'], 'attributes': []}
+        for i in range(config.n_results):
+            obj = f'MONDO:{_seed(kp, curie, i) % 1000000:07d}'
+            nodes[obj] = {'name': f'name of {obj}', 'categories': ['biolink:Disease'], 'attributes': []}
+            edges[f'{kp}:{curie}:{i}'] = {
+                'subject': curie,
+                'predicate': predicates[i % len(predicates)],
+                'object': obj,
+                'sources': [{'resource_id': f'infores:{kp}', 'resource_role': 'primary_knowledge_source'}],
+                'attributes': [{'attribute_type_id': f'biolink:attribute_{j}', 'value': f'value {j}'}
+                    for j in range(config.n_attributes)],
+            }
+    return {'message': {'query_graph': query_graph, 'knowledge_graph': {'nodes': nodes, 'edges': edges}, 'results': []}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; with Nagle's algorithm, every response would wait for a delayed ACK.
+    disable_nagle_algorithm = True
+    server: '_Server'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle(None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        if body and self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        self._handle(json.loads(body) if body else None)
+
+    def _handle(self, body:dict | None):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        service, _, endpoint = url.path.strip('/').partition('/')
+        mock = self.server.mock
+        if service not in SERVICES:
+            return self._send(404, {'detail': 'Not Found'}, service)
+        config = mock.configs[service]
+        try:
+            result, n_items = mock.respond(service, endpoint, params, body)
+        except (KeyError, TypeError, ValueError) as exc:
+            return self._send(400, {'detail': repr(exc)}, service)
+        delay = config.latency + config.latency_per_item * n_items
+        if config.jitter:
+            delay += mock.random() * config.jitter
+        if delay:
+            time.sleep(delay)
+        if config.error_rate and mock.random() < config.error_rate:
+            return self._send(config.error_status, {'detail': 'injected error'}, service, error=True)
+        self._send(200, result, service)
+
+    def _send(self, status:int, result, service:str, error:bool=False):
+        content = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        config = self.server.mock.configs.get(service)
+        if config is not None and config.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content, compresslevel=5)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        self.server.mock.record(service, len(content), error or status >= 400)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    mock: 'MockTranslatorServer'
+
+
+class MockTranslatorServer:
+    """
+    A local HTTP server that stands in for all Translator services.
+
+    Parameters
+    ----------
+    configs : dict[str, ServiceConfig] | None
+        Service name ('nameres', 'nodenorm', 'annotator', 'smartapi' or 'kp') : its configuration.
+        Services that are not given use `ServiceConfig()`.
+    host : str
+        Default: '127.0.0.1'
+    port : int
+        Default: 0 (any free port)
+    seed : int
+        Seed of the injected errors and jitter. Default: 0
+    """
+
+    def __init__(self, configs:dict[str, ServiceConfig] | None=None, host:str='127.0.0.1', port:int=0, seed:int=0):
+        unknown = set(configs or {}) - set(SERVICES)
+        if unknown:
+            raise ValueError(f'Unknown services {sorted(unknown)}, expected some of {SERVICES}')
+        self.configs = {service: ServiceConfig() for service in SERVICES}
+        self.configs.update(configs or {})
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {service: {'requests': 0, 'errors': 0, 'bytes': 0} for service in SERVICES}
+        self._server = _Server((host, port), _Handler)
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def service_url(self, service:str) -> str:
+        """Returns the root URL of a service, e.g. `http://127.0.0.1:1234/nameres/`."""
+        return f'{self.url}{service}/'
+
+    def kp_url(self, kp:str) -> str:
+        """Returns the TRAPI query URL of a mock KP."""
+        return kp_url(self.url, kp)
+
+    def start(self) -> 'MockTranslatorServer':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name='MockTranslatorServer', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def __enter__(self) -> 'MockTranslatorServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def random(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def record(self, service:str, n_bytes:int, error:bool):
+        if service not in self._stats:
+            return
+        with self._lock:
+            stats = self._stats[service]
+            stats['requests'] += 1
+            stats['errors'] += error
+            stats['bytes'] += n_bytes
+
+    def stats(self) -> dict[str, dict]:
+        """Returns, per service, the number of requests, injected or client errors, and response bytes."""
+        with self._lock:
+            return {service: dict(stats) for service, stats in self._stats.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            for stats in self._stats.values():
+                stats.update(requests=0, errors=0, bytes=0)
+
+    def respond(self, service:str, endpoint:str, params:dict[str, list[str]], body:dict | None) -> tuple[object, int]:
+        """Returns (result, number of items in the request) for a request to a service endpoint."""
+        config = self.configs[service]
+        if endpoint == 'status':
+            return {'status': 'running'}, 0
+        if service == 'nameres':
+            if endpoint == 'lookup':
+                name = params['string'][0]
+                return nameres_results(config, name, int(params.get('limit', [10])[0])), 1
+            if endpoint == 'bulk-lookup':
+                limit = body.get('limit')
+                return {name: nameres_results(config, name, limit) for name in body['strings']}, len(body['strings'])
+            if endpoint == 'synonyms':
+                curies = params.get('preferred_curies') or (body or {}).get('preferred_curies', [])
+                return {curie: self._synonyms(config, curie) for curie in curies}, len(curies)
+        elif service == 'nodenorm' and endpoint == 'get_normalized_nodes':
+            curies = body['curies'] if body is not None else params['curie']
+            return {curie: nodenorm_result(config, curie) for curie in curies}, len(curies)
+        elif service == 'annotator' and endpoint.startswith('curie'):
+            curies = body['ids'] if body is not None else [endpoint.partition('/')[2]]
+            return {curie: annotator_result(config, curie) for curie in curies}, len(curies)
+        elif service == 'smartapi' and endpoint == 'metakg/consolidated':
+            return metakg_hits(config, params.get('q', [''])[0]), 1
+        elif service == 'kp' and endpoint.endswith('/query'):
+            kp = urllib.parse.unquote(endpoint.rpartition('/')[0])
+            return kp_response(config, kp, body), len(_query_edge(body)[1])
+        raise KeyError(f'{service}/{endpoint}')
+
+    @staticmethod
+    def _synonyms(config:ServiceConfig, curie:str) -> dict | None:
+        if _unknown(config, curie):
+            return None
+        return {'curie': curie, 'preferred_name': f'name of {curie}', 'names': [f'synonym {j} of {curie}' for j in range(config.n_synonyms)],
+            'types': ['Disease', 'NamedThing'], 'taxa': []}
+
+    def use(self, kps:list[str] | None=None):
+        """See `use_services`."""
+        return use_services(self.url, kps)
+
+
+def kp_url(url:str, kp:str) -> str:
+    """Returns the TRAPI query URL of a mock KP, given the root URL of the mock server."""
+    return f'{url}kp/{urllib.parse.quote(kp, safe="")}/query'
+
+
+@contextlib.contextmanager
+def use_services(url:str, kps:list[str] | None=None):
+    """
+    Points the SDK's service URLs at a mock server (given its root URL) for the duration of the `with` block.
+
+    Yields a dict of API name : query URL for the mock KPs `kps` (for `translator_query.parallel_api_query`).
+    """
+    from Translator_sdk import name_resolver, node_annotator, node_normalizer, translator_metakg
+    saved = [(module, attribute, getattr(module, attribute)) for module, attribute in [
+        (name_resolver, 'URL'), (node_normalizer, 'URL'), (node_annotator, 'URL'), (translator_metakg, 'METAKG_URL')]]
+    name_resolver.URL = f'{url}nameres/'
+    node_normalizer.URL = f'{url}nodenorm/'
+    node_annotator.URL = f'{url}annotator/'
+    translator_metakg.METAKG_URL = f'{url}smartapi/metakg/consolidated'
+    try:
+        yield {kp: kp_url(url, kp) for kp in kps or []}
+    finally:
+        for module, attribute, value in saved:
+            setattr(module, attribute, value)
+
+
+def _serve(configs:dict[str, ServiceConfig] | None, host:str, port:int, seed:int, connection):
+    server = MockTranslatorServer(configs, host=host, port=port, seed=seed)
+    connection.send(server.url)
+    server._server.serve_forever()
+
+
+@contextlib.contextmanager
+def serve_in_process(configs:dict[str, ServiceConfig] | None=None, host:str='127.0.0.1', port:int=0, seed:int=0):
+    """
+    Runs a `MockTranslatorServer` in a child process for the duration of the `with` block, and yields its root URL.
+
+    Unlike a server thread, the child process doesn't compete with the benchmarked code for the GIL.
+    """
+    import multiprocessing
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_serve, args=(configs, host, port, seed, sender), daemon=True)
+    process.start()
+    try:
+        if not receiver.poll(30):
+            raise RuntimeError('The mock server did not start')
+        yield receiver.recv()
+    finally:
+        process.terminate()
+        process.join()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Runs the mock Translator services until interrupted.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.005, help='response latency in seconds (default: 0.005)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of failing requests (default: 0)')
+    args = parser.parse_args()
+    config = ServiceConfig(latency=args.latency, error_rate=args.error_rate)
+    server = MockTranslatorServer({service: config for service in SERVICES}, host=args.host, port=args.port)
+    print(f'Serving the mock Translator services at {server.url}')
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+"""
+Offline benchmarks of the SDK's batch and fan-out paths, against the local mock services of `mock_servers`.
+
+Every scenario makes a number of SDK calls (from `--concurrency` threads, or asyncio tasks for the async API) and
+reports:
+
+- throughput: items (names, CURIEs or merged edges) per second,
+- latency percentiles of the SDK calls (p50, p90, p99),
+- the number of HTTP requests and retries,
+- the peak memory allocated by Python during the scenario (measured with `tracemalloc` in a second run, so that
+  tracing doesn't slow down the timed run).
+
+The results can be saved with `--json` and compared to a previous run with `--baseline`; the script fails if the
+throughput dropped, or the p99 latency or peak memory grew, by more than `--tolerance`.
+
+Examples
+--------
+$ python benchmarks/run_benchmarks.py
+$ python benchmarks/run_benchmarks.py --scenarios batch_lookup,normalize --latency 0.05 --error-rate 0.01
+$ python benchmarks/run_benchmarks.py --quick --json baseline.json
+$ python benchmarks/run_benchmarks.py --quick --baseline baseline.json --tolerance 0.3
+$ python benchmarks/run_benchmarks.py --scenarios parallel_query,normalize --codec json --compress
+"""
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_servers import SERVICES, MockTranslatorServer, ServiceConfig, serve_in_process, use_services  # noqa: E402
+
+from Translator_sdk import http_client, json_codec, kp_health, name_resolver, negative_cache, node_annotator, node_normalizer  # noqa: E402
+from Translator_sdk import pipeline as sdk_pipeline, translator_metakg, translator_query  # noqa: E402
+
+
+@dataclass
+class Workload:
+    """The calls of one scenario: each sync call returns its number of items, each async call is a coroutine function."""
+
+    calls: list[Callable]
+    is_async: bool = False
+
+
+@dataclass
+class Result:
+    scenario: str
+    calls: int
+    items: int
+    errors: int
+    seconds: float
+    items_per_s: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    requests: int
+    retries: int
+    peak_mb: float | None = None
+
+
+def _chunks(items:list, size:int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _names(args, tag:str) -> list[str]:
+    return [f'{tag} name {i}' for i in range(args.n)]
+
+
+def _curies(args, tag:str) -> list[str]:
+    return [f'{tag.upper()}:{i}' for i in range(args.n)]
+
+
+def _query_json(args, tag:str, round:int) -> dict:
+    ids = [f'{tag.upper()}{round}:{i}' for i in range(args.ids)]
+    return translator_query.build_query_json(ids, ['biolink:Disease'], ['biolink:related_to'])
+
+
+def lookup(args, kps:dict) -> Workload:
+    return Workload([lambda name=name: int(name_resolver.lookup(name) is not None) for name in _names(args, 'lookup')])
+
+
+def alookup(args, kps:dict) -> Workload:
+    async def call(name):
+        return int(await name_resolver.alookup(name) is not None)
+    return Workload([lambda name=name: call(name) for name in _names(args, 'alookup')], is_async=True)
+
+
+def batch_lookup(args, kps:dict) -> Workload:
+    return Workload([lambda chunk=chunk: len(name_resolver.batch_lookup(chunk))
+        for chunk in _chunks(_names(args, 'batch'), args.batch_size)])
+
+
+def synonyms(args, kps:dict) -> Workload:
+    return Workload([lambda curie=curie: len(name_resolver.synonyms(curie)) for curie in _curies(args, 'syn')])
+
+
+def batch_synonyms(args, kps:dict) -> Workload:
+    return Workload([lambda chunk=chunk: len(name_resolver.batch_synonyms(chunk, size=max(1, args.batch_size // 4)))
+        for chunk in _chunks(_curies(args, 'bsyn'), args.batch_size)])
+
+
+def normalize(args, kps:dict) -> Workload:
+    return Workload([lambda chunk=chunk: len(node_normalizer.get_normalized_nodes(chunk, mode='post'))
+        for chunk in _chunks(_curies(args, 'norm'), args.batch_size)])
+
+
+def anormalize(args, kps:dict) -> Workload:
+    async def call(chunk):
+        return len(await node_normalizer.aget_normalized_nodes(chunk, mode='post'))
+    return Workload([lambda chunk=chunk: call(chunk) for chunk in _chunks(_curies(args, 'anorm'), args.batch_size)],
+        is_async=True)
+
+
+def annotate(args, kps:dict) -> Workload:
+    return Workload([lambda chunk=chunk: len(node_annotator.lookup_curies(chunk))
+        for chunk in _chunks(_curies(args, 'annot'), args.batch_size)])
+
+
+def enrich(args, kps:dict) -> Workload:
+    # the hand-chained workflow: lookup, then normalize, then annotate each chunk
+    def call(chunk):
+        nodes = name_resolver.batch_lookup(chunk)
+        curies = [node.curie for node in nodes.values() if node is not None]
+        normalized = node_normalizer.get_normalized_nodes(curies, mode='post')
+        node_annotator.lookup_curies([node.curie for node in normalized.values() if node is not None])
+        return len(chunk)
+    return Workload([lambda chunk=chunk: call(chunk) for chunk in _chunks(_names(args, 'enrich'), args.batch_size)])
+
+
+def pipeline(args, kps:dict) -> Workload:
+    def call():
+        rows = ({'name': name} for name in _names(args, 'pipeline'))
+        return sum(1 for _ in sdk_pipeline.Pipeline(batch_size=args.batch_size, workers=args.concurrency).run(rows))
+    return Workload([call])
+
+
+def metakg(args, kps:dict) -> Workload:
+    return Workload([lambda: len(translator_metakg.get_KP_metadata(kps)) for _ in range(args.rounds)])
+
+
+def parallel_query(args, kps:dict) -> Workload:
+    API_predicates = {kp: ['biolink:related_to'] for kp in kps}
+
+    def call(round):
+        edges = translator_query.parallel_api_query(_query_json(args, 'pq', round), list(kps), kps, API_predicates,
+                max_workers=len(kps), shard_size=args.shard_size, health_registry=kp_health.KPHealthRegistry())
+        return len(edges)
+    return Workload([lambda round=round: call(round) for round in range(args.rounds)])
+
+
+def aparallel_query(args, kps:dict) -> Workload:
+    API_predicates = {kp: ['biolink:related_to'] for kp in kps}
+
+    async def call(round):
+        edges = await translator_query.aparallel_api_query(_query_json(args, 'apq', round), list(kps), kps, API_predicates,
+                shard_size=args.shard_size, health_registry=kp_health.KPHealthRegistry())
+        return len(edges)
+    return Workload([lambda round=round: call(round) for round in range(args.rounds)], is_async=True)
+
+
+SCENARIOS = {
+    'lookup': lookup,
+    'alookup': alookup,
+    'batch_lookup': batch_lookup,
+    'synonyms': synonyms,
+    'batch_synonyms': batch_synonyms,
+    'normalize': normalize,
+    'anormalize': anormalize,
+    'annotate': annotate,
+    'enrich': enrich,
+    'pipeline': pipeline,
+    'metakg': metakg,
+    'parallel_query': parallel_query,
+    'aparallel_query': aparallel_query,
+}
+"scenario name : function returning its Workload"
+
+ASYNC_SCENARIOS = {'alookup', 'anormalize', 'aparallel_query'}
+
+
+def _timed(call:Callable) -> tuple[float, int, bool]:
+    start = time.perf_counter()
+    try:
+        items, error = call(), False
+    except Exception:
+        items, error = 0, True
+    return time.perf_counter() - start, items, error
+
+
+async def _atimed(call:Callable, semaphore) -> tuple[float, int, bool]:
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            items, error = await call(), False
+        except Exception:
+            items, error = 0, True
+        return time.perf_counter() - start, items, error
+
+
+def run_workload(workload:Workload, concurrency:int) -> tuple[float, list[tuple[float, int, bool]]]:
+    """Runs the calls of a workload, returning the total time and (latency, items, error) of every call."""
+    start = time.perf_counter()
+    if workload.is_async:
+        import asyncio
+        from Translator_sdk import async_client
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+            try:
+                return await asyncio.gather(*[_atimed(call, semaphore) for call in workload.calls])
+            finally:
+                await async_client.aclose()
+        outcomes = asyncio.run(main())
+    else:
+        with ThreadPoolExecutor(concurrency) as executor:
+            outcomes = list(executor.map(_timed, workload.calls))
+    return time.perf_counter() - start, outcomes
+
+
+def percentile(values:list[float], q:float) -> float:
+    """Returns the q-th percentile (0-100) of the values, by linear interpolation."""
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _reset_state(url:str, args):
+    """Clears the per-run state of the SDK, so that every run of a scenario does the same requests."""
+    http_client.reset()
+    http_client.configure_host(url.split('/')[2], max_concurrency=args.max_connections,
+            retry=http_client.RetryPolicy(backoff=args.backoff), adaptive=args.adaptive, compress_requests=args.compress)
+    kp_health.default_registry.reset()
+    negative_cache.configure()
+
+
+@contextlib.contextmanager
+def _serve_in_thread(configs:dict[str, ServiceConfig], seed:int):
+    with MockTranslatorServer(configs, seed=seed) as server:
+        yield server.url
+
+
+def run_scenario(name:str, url:str, kps:dict, args) -> Result:
+    """Runs a scenario against the mock server at `url`."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.warmup:
+            # first calls pay for lazy imports and connection setup
+            workload = SCENARIOS[name](args, kps)
+            run_workload(Workload(workload.calls[:args.warmup], workload.is_async), args.concurrency)
+        _reset_state(url, args)
+        seconds, outcomes = run_workload(SCENARIOS[name](args, kps), args.concurrency)
+    stats = http_client.get_limiter(url).stats()
+    latencies = [latency * 1000 for latency, _, _ in outcomes]
+    items = sum(n for _, n, _ in outcomes)
+    result = Result(name, len(outcomes), items, sum(error for _, _, error in outcomes), round(seconds, 4),
+        round(items / seconds, 1) if seconds else 0.0, round(percentile(latencies, 50), 2),
+        round(percentile(latencies, 90), 2), round(percentile(latencies, 99), 2), stats['requests'], stats['retries'])
+
+    if args.memory:
+        _reset_state(url, args)
+        tracemalloc.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_workload(SCENARIOS[name](args, kps), args.concurrency)
+            result.peak_mb = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def compare(results:list[Result], baseline:list[dict], tolerance:float) -> list[str]:
+    """Returns the regressions of `results` relative to a baseline (the JSON output of a previous run)."""
+    baseline = {entry['scenario']: entry for entry in baseline}
+    regressions = []
+    for result in results:
+        old = baseline.get(result.scenario)
+        if old is None:
+            continue
+        if result.items_per_s < old['items_per_s'] * (1 - tolerance):
+            regressions.append(f'{result.scenario}: throughput {result.items_per_s} items/s (baseline: {old["items_per_s"]})')
+        if result.p99_ms > old['p99_ms'] * (1 + tolerance):
+            regressions.append(f'{result.scenario}: p99 latency {result.p99_ms} ms (baseline: {old["p99_ms"]})')
+        if result.peak_mb is not None and old.get('peak_mb') and result.peak_mb > old['peak_mb'] * (1 + tolerance):
+            regressions.append(f'{result.scenario}: peak memory {result.peak_mb} MB (baseline: {old["peak_mb"]})')
+        if result.errors > old['errors']:
+            regressions.append(f'{result.scenario}: {result.errors} failed calls (baseline: {old["errors"]})')
+    return regressions
+
+
+def print_results(results:list[Result]):
+    columns = ['scenario', 'calls', 'items', 'errors', 'seconds', 'items_per_s', 'p50_ms', 'p90_ms', 'p99_ms',
+        'requests', 'retries', 'peak_mb']
+    rows = [[str(value if value is not None else '-') for value in asdict(result).values()] for result in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print('  '.join(column.rjust(width) if i else column.ljust(width) for i, (column, width) in enumerate(zip(columns, widths))))
+    for row in rows:
+        print('  '.join(value.rjust(width) if i else value.ljust(width) for i, (value, width) in enumerate(zip(row, widths))))
+
+
+def parse_args(argv:list[str] | None=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+            help=f'comma-separated scenarios (default: all of {", ".join(SCENARIOS)})')
+    parser.add_argument('--quick', action='store_true', help='small workloads, e.g. for CI')
+    parser.add_argument('--n', type=int, default=1000, help='names or CURIEs per scenario (default: 1000)')
+    parser.add_argument('--batch-size', type=int, default=100, help='names or CURIEs per batch call (default: 100)')
+    parser.add_argument('--concurrency', type=int, default=16, help='threads or tasks making calls (default: 16)')
+    parser.add_argument('--max-connections', type=int, default=32,
+            help='concurrent requests allowed to the mock host (default: 32)')
+    parser.add_argument('--kps', type=int, default=8, help='mock KPs for the metakg and query scenarios (default: 8)')
+    parser.add_argument('--ids', type=int, default=200, help='subject IDs per KP query (default: 200)')
+    parser.add_argument('--shard-size', type=int, default=50, help='subject IDs per KP request (default: 50)')
+    parser.add_argument('--rounds', type=int, default=5, help='calls of the metakg and query scenarios (default: 5)')
+    parser.add_argument('--latency', type=float, default=0.005, help='response latency in seconds (default: 0.005)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra latency in seconds (default: 0)')
+    parser.add_argument('--latency-per-item', type=float, default=0.0,
+            help='extra latency per item of a batch request in seconds (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of failing requests (default: 0)')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of failing requests (default: 503)')
+    parser.add_argument('--results', type=int, default=5,
+            help='results per name, metaKG hits per KP or edges per subject ID (default: 5)')
+    parser.add_argument('--synonyms', type=int, default=5, help='synonyms per result (default: 5)')
+    parser.add_argument('--attributes', type=int, default=3, help='attributes per edge or annotation (default: 3)')
+    parser.add_argument('--backoff', type=float, default=0.01, help='base retry backoff in seconds (default: 0.01)')
+    parser.add_argument('--no-adaptive', dest='adaptive', action='store_false',
+            help="turn off the SDK's adaptive rate limiting (which only reacts to HTTP 429 and Retry-After)")
+    parser.add_argument('--codec', choices=sorted(json_codec.CODECS),
+            help=f'JSON codec of the SDK (default: {json_codec.get_codec().name})')
+    parser.add_argument('--compress', action='store_true',
+            help='gzip-compress the responses of the mock services and the large request bodies of the SDK')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='skip the peak memory measurement')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed calls before each scenario (default: 1)')
+    parser.add_argument('--in-process', action='store_true',
+            help='run the mock server in a thread of this process instead of a child process')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the injected errors and jitter (default: 0)')
+    parser.add_argument('--json', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare to the results of a previous run (a --json file)')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+            help='allowed relative regression for --baseline (default: 0.25)')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.n, args.kps, args.ids, args.rounds = min(args.n, 200), min(args.kps, 4), min(args.ids, 50), min(args.rounds, 2)
+    return args
+
+
+def main(argv:list[str] | None=None) -> list[Result]:
+    args = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+    if set(scenarios) & ASYNC_SCENARIOS:
+        try:
+            import httpx  # noqa: F401
+        except ImportError:
+            print('httpx is not installed, skipping the async scenarios', file=sys.stderr)
+            scenarios = [name for name in scenarios if name not in ASYNC_SCENARIOS]
+
+    config = ServiceConfig(latency=args.latency, jitter=args.jitter, latency_per_item=args.latency_per_item,
+        error_rate=args.error_rate, error_status=args.error_status, n_results=args.results,
+        n_synonyms=args.synonyms, n_attributes=args.attributes, compress=args.compress)
+    if args.codec is not None:
+        json_codec.set_codec(args.codec)
+    configs = {service: config for service in SERVICES}
+    serving = _serve_in_thread(configs, args.seed) if args.in_process else serve_in_process(configs, seed=args.seed)
+    results = []
+    with serving as url, use_services(url, [f'Mock KP {i}' for i in range(args.kps)]) as kps:
+        for name in scenarios:
+            results.append(run_scenario(name, url, kps, args))
+    http_client.reset()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump([asdict(result) for result in results], f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit('Regressions:\n' + '\n'.join(regressions))
+    return results
+
+
+if __name__ == '__main__':
+    main()
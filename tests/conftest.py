@@ -0,0 +1,109 @@
+import asyncio
+import gzip
+import io
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+
+class FakeServer:
+    """
+    A stand-in for the Translator services, used by the offline tests.
+
+    Routes are matched by HTTP method and URL prefix. A route's handler is called with the parsed JSON body
+    (or None), the query parameters and the full URL, and returns either a JSON-serializable object
+    (sent with status 200), a (status_code, object) tuple or a (status_code, object, headers) tuple.
+    """
+
+    def __init__(self):
+        self.routes = []
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def add(self, method, url_prefix, handler, delay=0.0, headers=None):
+        if not callable(handler):
+            body = handler
+            handler = lambda *args: body  # noqa: E731
+        self.routes.insert(0, (method.upper(), url_prefix, handler, delay, headers or {}))
+
+    def count(self, url_prefix):
+        return sum(1 for _, url in self.calls if url.startswith(url_prefix))
+
+    def request(self, method, url, params=None, json=None, data=None, headers=None, **kwargs):
+        method = method.upper()
+        with self._lock:
+            self.calls.append((method, url))
+        body = json
+        if data is not None:
+            if headers and headers.get('Content-Encoding') == 'gzip':
+                data = gzip.decompress(data)
+            body = _json_loads(data)
+        for route_method, prefix, handler, delay, route_headers in self.routes:
+            if route_method == method and url.startswith(prefix):
+                if delay:
+                    time.sleep(delay)
+                result = handler(body, params or {}, url)
+                status = 200
+                headers = route_headers
+                if isinstance(result, tuple) and len(result) == 3:
+                    status, result, headers = result[0], result[1], {**route_headers, **result[2]}
+                elif isinstance(result, tuple):
+                    status, result = result
+                return make_response(url, status, result, headers)
+        raise requests.ConnectionError(f'No route to {method} {url}')
+
+
+def _json_loads(data):
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode('utf-8')
+    return json.loads(data)
+
+
+def make_response(url, status, body, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.url = url
+    response._content = json.dumps(body).encode('utf-8')
+    response._content_consumed = True
+    response.raw = io.BytesIO(response._content)
+    response.headers['Content-Type'] = 'application/json'
+    response.headers.update(headers or {})
+    return response
+
+
+@pytest.fixture
+def fake_http(monkeypatch):
+    """Routes every `requests` call made during the test to a FakeServer."""
+    from Translator_sdk import http_client, negative_cache
+    http_client.reset()
+    monkeypatch.setattr(negative_cache, 'default_negative_cache', negative_cache.NegativeCache())
+    server = FakeServer()
+
+    def fake_request(self, method, url, **kwargs):
+        return server.request(method, url, **kwargs)
+
+    monkeypatch.setattr(requests.Session, 'request', fake_request)
+    return server
+
+
+@pytest.fixture
+def fake_async_http(fake_http):
+    """Routes the requests of the async API (`async_client`) to the same FakeServer as `fake_http`."""
+    import httpx
+    from Translator_sdk import async_client
+
+    async def handler(request):
+        params = {}
+        for key, value in request.url.params.multi_items():
+            params[key] = params[key] + [value] if key in params else value
+        # in a thread, so that route delays don't block the event loop
+        response = await asyncio.to_thread(fake_http.request, request.method, str(request.url.copy_with(query=None)),
+                params=params, data=request.content or None, headers=dict(request.headers))
+        return httpx.Response(response.status_code, content=response.content, headers=dict(response.headers))
+
+    async_client.configure(transport=httpx.MockTransport(handler))
+    yield fake_http
+    async_client.configure()
@@ -0,0 +1,51 @@
+import asyncio
+
+from Translator_sdk import async_client, kp_health, name_resolver, node_annotator, node_normalizer, translator_query
+
+LOOKUP_RESULT = [{'curie': 'MONDO:0018874', 'label': 'acute myeloid leukemia', 'types': ['Disease'],
+    'synonyms': ['AML']}]
+
+
+def run(coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await async_client.aclose()
+    return asyncio.run(main())
+
+
+def test_service_wrappers_match_sync(fake_async_http):
+    fake_async_http.add('GET', name_resolver.URL + 'lookup', LOOKUP_RESULT)
+    fake_async_http.add('POST', name_resolver.URL + 'bulk-lookup',
+            lambda body, params, url: {s: LOOKUP_RESULT if s == 'AML' else [] for s in body['strings']})
+    fake_async_http.add('POST', node_normalizer.URL + 'get_normalized_nodes',
+            lambda body, params, url: {c: {'id': {'identifier': 'CHEBI:15377', 'label': 'Water'}} for c in body['curies']})
+    fake_async_http.add('POST', node_annotator.URL + 'curie',
+            lambda body, params, url: {c: [{'name': c}] for c in body['ids']})
+
+    assert run(name_resolver.alookup('AML', return_synonyms=True)) == name_resolver.lookup('AML', return_synonyms=True)
+    strings = ['AML', 'CML', 'X']
+    assert run(name_resolver.abatch_lookup(strings, size=2)) == name_resolver.batch_lookup(strings, size=2)
+    curies = ['MESH:D014867', 'CHEBI:15377']
+    assert run(node_normalizer.aget_normalized_nodes(curies, mode='post')) == \
+        node_normalizer.get_normalized_nodes(curies, mode='post')
+    assert run(node_annotator.alookup_curies(curies)) == node_annotator.lookup_curies(curies)
+
+
+def test_aparallel_api_query_matches_sync(fake_async_http):
+    def kp(body, params, url):
+        ids = body['message']['query_graph']['nodes']['n00']['ids']
+        return {'message': {'knowledge_graph': {'nodes': {}, 'edges': {
+            f'{url}{curie}': {'subject': curie, 'predicate': 'biolink:related_to', 'object': 'X'} for curie in ids}}}}
+
+    fake_async_http.add('POST', 'https://kp1.example/', kp)
+    fake_async_http.add('POST', 'https://kp2.example/', lambda body, params, url: (500, {}))
+    APInames = {'KP1': 'https://kp1.example/query/', 'KP2': 'https://kp2.example/query/'}
+    API_predicates = {'KP1': ['biolink:related_to'], 'KP2': []}
+    query_json = translator_query.build_query_json([f'G:{i}' for i in range(10)], ['biolink:Disease'],
+            ['biolink:related_to'])
+    kwargs = dict(shard_size=3, health_registry=kp_health.KPHealthRegistry())
+    result = run(translator_query.aparallel_api_query(query_json, ['KP1', 'KP2'], APInames, API_predicates, **kwargs))
+    assert len(result) == 10
+    assert result == translator_query.parallel_api_query(query_json, ['KP1', 'KP2'], APInames, API_predicates, **kwargs)
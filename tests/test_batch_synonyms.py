@@ -0,0 +1,80 @@
+import asyncio
+
+from Translator_sdk import async_client, name_resolver
+
+URL = name_resolver.URL + 'synonyms'
+
+
+def synonyms(curies):
+    if isinstance(curies, str):
+        curies = [curies]
+    return {c: None if c.startswith('JUNK') else {'curie': c, 'preferred_name': c.lower(), 'names': [c.lower(), c]}
+        for c in curies}
+
+
+def test_batch_synonyms(fake_http):
+    sent = []
+
+    def post(body, params, url):
+        sent.append(body['preferred_curies'])
+        return synonyms(body['preferred_curies'])
+
+    fake_http.add('POST', URL, post)
+    curies = [f'MONDO:{i}' for i in range(25)] + ['JUNK:1', 'MONDO:0', 'JUNK:2']
+    result = name_resolver.batch_synonyms(curies, size=10, max_workers=3)
+    assert list(result) == list(dict.fromkeys(curies))
+    assert result['MONDO:3'].synonyms == ['mondo:3', 'MONDO:3']
+    assert result['JUNK:1'] is None and result['JUNK:2'] is None
+    assert sorted(len(chunk) for chunk in sent) == [7, 10, 10]
+
+    # unknown CURIEs are streamed back without being sent again
+    assert dict(name_resolver.iter_synonyms(iter(['JUNK:1', 'JUNK:2']))) == {'JUNK:1': None, 'JUNK:2': None}
+    assert len(sent) == 3
+
+
+def test_batch_synonyms_get_fallback(fake_http, monkeypatch):
+    monkeypatch.setattr(name_resolver, 'SYNONYMS_GET_CHUNK_SIZE', 4)
+    fake_http.add('POST', URL, (405, {'detail': 'Method Not Allowed'}))
+    fake_http.add('GET', URL, lambda body, params, url: synonyms(params['preferred_curies']))
+    curies = [f'MONDO:{i}' for i in range(10)]
+    assert name_resolver.batch_synonyms(curies) == {c: name_resolver.synonyms(c)[c] for c in curies}
+    assert fake_http.count(URL) == 1 + 3 + 10
+
+
+def test_abatch_synonyms_matches_sync(fake_async_http):
+    fake_async_http.add('POST', URL, lambda body, params, url: synonyms(body['preferred_curies']))
+    curies = [f'MONDO:{i}' for i in range(12)] + ['JUNK:1']
+
+    async def main():
+        try:
+            return await name_resolver.abatch_synonyms(curies, size=5, max_workers=2)
+        finally:
+            await async_client.aclose()
+
+    assert asyncio.run(main()) == name_resolver.batch_synonyms(curies, size=5)
+
+
+def test_iter_synonyms_reads_its_input_lazily(fake_async_http):
+    fake_async_http.add('POST', URL, lambda body, params, url: synonyms(body['preferred_curies']))
+    read = []
+
+    def generate():
+        for i in range(100):
+            read.append(i)
+            yield f'MONDO:{i}'
+
+    # at most max_workers chunks are read ahead of the first result
+    curie, node = next(name_resolver.iter_synonyms(generate(), size=5, max_workers=2))
+    assert node.curie == curie and len(read) <= 15
+
+    async def first():
+        read.clear()
+        results = name_resolver.aiter_synonyms(generate(), size=5, max_workers=2)
+        try:
+            return await results.__anext__()
+        finally:
+            await results.aclose()
+            await async_client.aclose()
+
+    curie, node = asyncio.run(first())
+    assert node.curie == curie and len(read) <= 15
@@ -0,0 +1,37 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import run_benchmarks  # noqa: E402
+from mock_servers import MockTranslatorServer, ServiceConfig  # noqa: E402
+
+from Translator_sdk import http_client, name_resolver, node_normalizer  # noqa: E402
+
+
+def test_sdk_against_mock_services():
+    configs = {'nodenorm': ServiceConfig(latency=0, null_rate=0.5), 'nameres': ServiceConfig(latency=0, n_results=2)}
+    with MockTranslatorServer(configs) as server, server.use():
+        http_client.reset()
+        nodes = node_normalizer.get_normalized_nodes([f'G:{i}' for i in range(20)], mode='post')
+        assert 0 < sum(node is None for node in nodes.values()) < 20
+        assert len(name_resolver.lookup('asthma', return_top_response=False)) == 2
+        assert server.stats()['nodenorm']['requests'] == 1
+    assert name_resolver.URL == 'https://name-lookup.ci.transltr.io/'
+
+
+def test_benchmark_harness(tmp_path):
+    args = ['--quick', '--n', '20', '--batch-size', '10', '--kps', '2', '--ids', '10', '--shard-size', '5', '--rounds', '1',
+        '--latency', '0', '--no-memory', '--in-process', '--json', str(tmp_path / 'results.json'),
+        '--scenarios', 'lookup,batch_lookup,synonyms,normalize,annotate,metakg,parallel_query']
+    results = run_benchmarks.main(args)
+    assert [result.errors for result in results] == [0] * 7
+    assert {result.scenario: result.items for result in results}['parallel_query'] == 2 * 10 * 5
+    http_client.reset()
+
+    baseline = json.loads((tmp_path / 'results.json').read_text())
+    assert run_benchmarks.compare(results, baseline, tolerance=0.25) == []
+    baseline[0]['items_per_s'] = results[0].items_per_s * 2
+    assert run_benchmarks.compare(results, baseline, tolerance=0.25) == [
+        f'lookup: throughput {results[0].items_per_s} items/s (baseline: {baseline[0]["items_per_s"]})']
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from Translator_sdk import bulk_jobs, name_resolver, node_normalizer
+
+
+def test_resume_after_interruption(tmp_path):
+    input_path = tmp_path / 'curies.txt'
+    input_path.write_text(''.join(f'C:{i}\n' for i in range(25)) + '\n')
+    output_path = str(tmp_path / 'out.jsonl')
+    requested = []
+
+    def resolve(items):
+        requested.extend(items)
+        if len(requested) > 10:
+            raise KeyboardInterrupt
+        return {item: item.lower() for item in items if item != 'C:3'}
+
+    job = bulk_jobs.BulkJob(str(input_path), output_path, resolve, chunk_size=4, max_workers=2)
+    with pytest.raises(KeyboardInterrupt):
+        job.run()
+    assert job.status()['items'] == 8
+    # a partial write after the checkpoint is dropped on resume
+    with open(output_path, 'a') as f:
+        f.write('{"input": "C:8", "res')
+
+    requested.clear()
+    resolve_all = lambda items: requested.extend(items) or {item: item.lower() for item in items if item != 'C:3'}  # noqa: E731
+    state = bulk_jobs.BulkJob(str(input_path), output_path, resolve_all, chunk_size=4, max_workers=2).run()
+    assert sorted(requested) == sorted(f'C:{i}' for i in range(8, 25))
+    assert (state['items'], state['done']) == (25, True)
+    assert list(bulk_jobs.read_results(output_path)) == [(f'C:{i}', None if i == 3 else f'c:{i}') for i in range(25)]
+
+    # a finished job is not run again, and a checkpoint can't be resumed by another job
+    assert bulk_jobs.BulkJob(str(input_path), output_path, resolve, chunk_size=4).run()['done']
+    with pytest.raises(ValueError):
+        bulk_jobs.BulkJob(str(input_path), output_path, resolve, chunk_size=5).run()
+    with pytest.raises(FileExistsError):
+        bulk_jobs.BulkJob(str(input_path), output_path, resolve, checkpoint_path=str(tmp_path / 'other')).run()
+
+
+def test_service_jobs(fake_http, tmp_path):
+    fake_http.add('POST', name_resolver.URL + 'bulk-lookup',
+        lambda body, params, url: {s: [{'curie': f'X:{s}', 'label': s, 'types': ['Disease']}] if s != 'none' else [] for s in body['strings']})
+    fake_http.add('POST', node_normalizer.URL, lambda body, params, url: {c: {'id': {'identifier': c, 'label': 'L'}} if c != 'X:none' else None for c in body['curies']})
+    (tmp_path / 'names.txt').write_text('asthma\nnone\nflu\n')
+    (tmp_path / 'curies.txt').write_text('X:asthma\nX:none\n')
+
+    bulk_jobs.batch_lookup_job(str(tmp_path / 'names.txt'), str(tmp_path / 'names.jsonl'), chunk_size=2).run()
+    results = dict(bulk_jobs.read_results(str(tmp_path / 'names.jsonl')))
+    assert results == {'asthma': {'curie': 'X:asthma', 'label': 'asthma', 'types': ['biolink:Disease']}, 'none': None,
+        'flu': {'curie': 'X:flu', 'label': 'flu', 'types': ['biolink:Disease']}}
+
+    bulk_jobs.preferred_names_job(str(tmp_path / 'curies.txt'), str(tmp_path / 'names_out.jsonl')).run()
+    assert dict(bulk_jobs.read_results(str(tmp_path / 'names_out.jsonl'))) == {'X:asthma': 'L', 'X:none': 'X:none'}
+    checkpoint = json.loads((tmp_path / 'names_out.jsonl.checkpoint').read_text())
+    assert checkpoint['done'] and checkpoint['chunks'] == 1
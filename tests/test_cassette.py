@@ -0,0 +1,68 @@
+import asyncio
+import os
+
+import pytest
+
+from Translator_sdk import cassette, http_client, name_resolver, node_normalizer
+
+
+def nodenorm_handler(body, params, url):
+    return {curie: {'id': {'identifier': curie.lower(), 'label': curie}} for curie in body['curies']}
+
+
+def test_record_and_replay(fake_async_http, tmp_path):
+    path = str(tmp_path / 'workload.cassette')
+    fake_async_http.add('POST', node_normalizer.URL, nodenorm_handler)
+    fake_async_http.add('GET', name_resolver.URL + 'lookup', [{'curie': 'MONDO:1', 'label': 'asthma'}])
+    with cassette.use(path, mode='record') as transport:
+        recorded = node_normalizer.get_normalized_nodes(['A:1', 'B:2'], mode='post')
+        name_resolver.lookup('asthma', limit=5)
+    assert transport.cassette.stats()['recorded'] == 2
+    assert os.path.exists(path + '.idx')
+
+    fake_async_http.routes.clear()
+    calls = len(fake_async_http.calls)
+    with cassette.use(path, mode='replay', latency_scale=0) as transport:
+        assert node_normalizer.get_normalized_nodes(['A:1', 'B:2'], mode='post') == recorded
+        # JSON bodies and query parameters match in any order, and sync recordings replay through the async API
+        assert asyncio.run(node_normalizer.aget_normalized_nodes(['A:1', 'B:2'], mode='post')) == recorded
+        assert name_resolver.lookup('asthma', limit=5).curie == 'MONDO:1'
+        with pytest.raises(cassette.CassetteMiss):
+            name_resolver.lookup('diabetes')
+    assert transport.cassette.stats() == {'records': 2, 'hits': 3, 'misses': 1, 'recorded': 0}
+    assert len(fake_async_http.calls) == calls
+    assert http_client.get_transport() is None
+
+
+def test_replay_in_recorded_order(fake_http, tmp_path):
+    path = str(tmp_path / 'workload.cassette')
+    http_client.configure_host('nodenorm.ci.transltr.io', retry=http_client.RetryPolicy(backoff=0))
+    responses = iter([(503, {}), {'A:1': None}])
+    fake_http.add('POST', node_normalizer.URL, lambda *args: next(responses))
+    with cassette.use(path, mode='record'):
+        assert node_normalizer.get_normalized_nodes(['A:1'], mode='post') == {'A:1': None}
+
+    with cassette.use(path, mode='replay', latency_scale=0) as transport:
+        assert node_normalizer.get_normalized_nodes(['A:1'], mode='post') == {'A:1': None}
+    assert transport.cassette.stats()['hits'] == 2
+    assert http_client.get_limiter(node_normalizer.URL).stats()['retries'] == 2
+
+
+def test_index_is_rebuilt(tmp_path):
+    path = str(tmp_path / 'workload.cassette')
+    keys = [cassette.request_key('GET', 'https://example.org/a', params={'q': str(i)}) for i in range(3)]
+    with cassette.Cassette(path, mode='a') as store:
+        for i, key in enumerate(keys):
+            store.append(key, 'GET', 'https://example.org/a', 200, {'Content-Length': '1'}, str(i).encode(), 0.1)
+    assert keys[0] == cassette.request_key('GET', 'https://example.org/a?q=0')
+
+    # a missing index and a partially written record
+    os.remove(path + '.idx')
+    with open(path, 'ab') as f:
+        f.write(b'\0\0\0\x10partial')
+    with cassette.Cassette(path, mode='a') as store:
+        assert len(store) == 3
+        header, body = store.next(keys[2])
+        assert (header['status'], header['headers'], body) == (200, {}, b'2')
+    with cassette.Cassette(path) as store:
+        assert [body for _, body in store] == [b'0', b'1', b'2']
@@ -0,0 +1,32 @@
+import copy
+import json
+
+from Translator_sdk import translator_query
+from Translator_sdk.compiled_query import CompiledQuery
+
+KP_PREDICATES = ['biolink:treats', 'biolink:related_to']
+
+
+def test_body_matches_optimized_query():
+    query_json = translator_query.build_multihop_query_json([f'G:{i}' for i in range(7)] + ['X:"é"'],
+            [['biolink:Gene'], ['biolink:Disease']], [['biolink:treats', 'biolink:affects'], ['biolink:causes']])
+    original = copy.deepcopy(query_json)
+    compiled = CompiledQuery(query_json)
+    predicates = compiled.predicates_for(KP_PREDICATES)
+    optimized = translator_query.optimize_query_json(query_json, 'KP', {'KP': KP_PREDICATES})
+    assert json.loads(compiled.body(predicates)) == optimized
+    assert compiled.body(predicates) == json.dumps(optimized).encode('utf-8')
+    assert compiled.to_dict(predicates) == optimized
+    for start, end in [(0, 3), (3, 6), (6, None)]:
+        shard = translator_query._with_node_ids(optimized, 'n00', compiled.ids[start:end])
+        assert compiled.body(predicates, start, end) == json.dumps(shard).encode('utf-8')
+    # Neither compiling nor optimizing modifies the caller's query.
+    assert query_json == original
+
+
+def test_cache_key_is_order_insensitive():
+    compiled = CompiledQuery(translator_query.build_query_json(['A', 'B'], ['biolink:Disease'], ['biolink:treats']))
+    reordered = CompiledQuery(translator_query.build_query_json(['B', 'A'], ['biolink:Disease'], ['biolink:treats']))
+    predicates = compiled.predicates_for(KP_PREDICATES)
+    assert compiled.cache_key('KP', 'url', predicates) == reordered.cache_key('KP', 'url', predicates)
+    assert compiled.cache_key('KP', 'url', predicates, 0, 1) != compiled.cache_key('KP', 'url', predicates)
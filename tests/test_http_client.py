@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+from Translator_sdk import async_client, http_client
+
+URL = 'https://service.example/'
+
+
+def test_retries_honor_retry_after(fake_http):
+    attempts = []
+
+    def handler(body, params, url):
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            return 429, {}, {'Retry-After': '0.1'}
+        return {'ok': True}
+
+    fake_http.add('GET', URL, handler)
+    http_client.configure_host('service.example', adaptive=False)
+    assert http_client.get(URL).json() == {'ok': True}
+    assert len(attempts) == 3
+    assert attempts[2] - attempts[0] >= 0.2
+    stats = http_client.get_http_stats().set_index('host').loc['service.example']
+    assert (stats['requests'], stats['retries'], stats['throttled']) == (3, 2, 2)
+    assert stats['backoff_wait'] >= 0.2
+
+    # Without retries (or once they are used up) the throttled response is returned.
+    fake_http.add('GET', URL, (503, {}))
+    assert http_client.get(URL, retry=False).status_code == 503
+
+
+def test_rate_and_concurrency_limits(fake_http):
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def handler(body, params, url):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        return {}
+
+    fake_http.add('GET', URL, handler)
+    http_client.configure_host('service.example', max_concurrency=2)
+    threads = [threading.Thread(target=http_client.get, args=(URL,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert in_flight[1] == 2
+    assert http_client.get_limiter(URL).stats()['concurrency_wait'] > 0
+
+    http_client.configure_host('service.example', rate=10, burst=1)
+    start = time.monotonic()
+    for _ in range(4):
+        http_client.get(URL)
+    assert time.monotonic() - start >= 0.29
+    assert http_client.get_limiter(URL).stats()['rate_wait'] > 0
+
+
+def test_throttling_lowers_the_rate_and_async_shares_limits(fake_async_http):
+    responses = iter([(429, {})] + [{}] * 10)
+    fake_async_http.add('GET', URL, lambda body, params, url: next(responses))
+    limiter = http_client.configure_host('service.example', max_concurrency=1,
+            retry=http_client.RetryPolicy(backoff=0.01))
+
+    async def main():
+        try:
+            return await asyncio.gather(*[http_client.aget(URL) for _ in range(4)])
+        finally:
+            await async_client.aclose()
+
+    assert [response.status_code for response in asyncio.run(main())] == [200] * 4
+    stats = limiter.stats()
+    assert stats['throttled'] == 1 and stats['retries'] == 1
+    assert stats['rate'] is not None
+
+
+def test_adaptive_rate_limiting():
+    limiter = http_client.HostLimiter(adapt_interval=0.05, recover_after=0.2)
+    for _ in range(32):
+        limiter.started()
+    # Server errors are retried, but don't impose a rate limit.
+    for _ in range(32):
+        limiter.throttled(rate_limited=False)
+    assert limiter.bucket.rate is None
+
+    # A burst of rate-limited responses to concurrent requests halves the observed rate only once.
+    for _ in range(32):
+        limiter.throttled()
+    assert limiter.bucket.rate == 16
+    time.sleep(0.06)
+    limiter.throttled()
+    assert limiter.bucket.rate == 8
+    limiter.succeeded()
+    assert limiter.bucket.rate == 8.125
+
+    # Once the host stops rate-limiting requests, the imposed limit is removed.
+    time.sleep(0.2)
+    limiter.succeeded()
+    assert limiter.bucket.rate is None
+    assert limiter.stats()['throttled'] == 65
@@ -0,0 +1,60 @@
+import logging
+import time
+
+from Translator_sdk import http_client, instrumentation, name_resolver, node_normalizer
+
+
+def nodenorm_handler(body, params, url):
+    return {curie: {'id': {'identifier': curie.lower()}} for curie in body['curies']}
+
+
+def test_sinks_receive_sdk_events(fake_http, caplog):
+    fake_http.add('POST', node_normalizer.URL, nodenorm_handler)
+    fake_http.add('POST', name_resolver.URL + 'bulk-lookup', lambda body, params, url: {s: [] for s in body['strings']})
+    histograms = instrumentation.HistogramSink()
+    prometheus = instrumentation.PrometheusSink()
+    with caplog.at_level(logging.DEBUG, logger='Translator_sdk.instrumentation'):
+        with instrumentation.use(histograms, prometheus, instrumentation.LoggingSink()):
+            node_normalizer.get_normalized_nodes(['A:1', 'B:2', 'C:3'], mode='post')
+            name_resolver.batch_lookup([f'name {i}' for i in range(5)], size=2)
+    assert not instrumentation.enabled()
+
+    assert histograms.histogram('http.request', method='POST', host='nodenorm.ci.transltr.io', status=200).n == 1
+    assert histograms.histogram('json.decode', service='nodenorm').n == 1
+    assert histograms.histogram('nodes.build', service='nodenorm').n == 1
+    batch_sizes = histograms.histogram('batch.size', service='nameres')
+    assert (batch_sizes.n, batch_sizes.sum, batch_sizes.max) == (3, 5, 2)
+    assert histograms.counter('http.bytes_received', host='nodenorm.ci.transltr.io') > 0
+    assert {row['name'] for row in histograms.summary()} >= {'http.request', 'json.decode', 'nodes.build', 'batch.size'}
+
+    text = prometheus.exposition()
+    assert '# TYPE translator_sdk_http_request_seconds histogram' in text
+    assert 'translator_sdk_batch_size_count{service="nameres"} 3' in text
+    assert 'translator_sdk_http_bytes_received_total{host="nodenorm.ci.transltr.io"}' in text
+    assert any(record.getMessage().startswith('span http.request') for record in caplog.records)
+
+
+def test_retries_and_percentiles(fake_http):
+    http_client.configure_host('nodenorm.ci.transltr.io', retry=http_client.RetryPolicy(backoff=0))
+    responses = iter([(503, {}), {'A:1': None}])
+    fake_http.add('POST', node_normalizer.URL, lambda *args: next(responses))
+    with instrumentation.use(instrumentation.HistogramSink()) as (histograms,):
+        node_normalizer.get_normalized_nodes(['A:1'], mode='post')
+    assert histograms.counter('http.retries') == 1
+    assert histograms.histogram('http.request', method='POST', host='nodenorm.ci.transltr.io', status=503).n == 1
+
+    histogram = instrumentation.Histogram(instrumentation.LOG_BUCKETS)
+    for value in range(1, 1001):
+        histogram.add(value / 1000)
+    assert abs(histogram.percentile(50) - 0.5) < 0.5 * 0.26
+    assert abs(histogram.percentile(99) - 0.99) < 0.99 * 0.26
+
+
+def test_disabled_overhead():
+    n = 100000
+    start = time.perf_counter()
+    for _ in range(n):
+        with instrumentation.span('http.request', method='GET', host='example.org'):
+            pass
+        instrumentation.count('http.retries', host='example.org')
+    assert (time.perf_counter() - start) / n < 5e-6
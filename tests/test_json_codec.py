@@ -0,0 +1,56 @@
+import math
+
+import pytest
+
+from Translator_sdk import http_client, json_codec
+
+URL = 'https://service.example/'
+
+
+@pytest.mark.parametrize('name', sorted(json_codec.CODECS))
+def test_codecs_round_trip(name):
+    if name == 'orjson':
+        pytest.importorskip('orjson')
+    codec = json_codec.CODECS[name]()
+    value = {'b': [1, 2.5, None, True], 'a': 'Ménière', 'big': 2**70}
+    assert codec.dumps(value, sort_keys=True) == '{"a":"Ménière","b":[1,2.5,null,true],"big":1180591620717411303424}'.encode()
+    assert codec.loads(codec.dumps(value)) == value
+    assert math.isnan(codec.loads(b'[NaN]')[0])
+    # Only the standard library writes the non-standard NaN literal; orjson encodes it as null.
+    assert codec.dumps([math.nan]) == {'json': b'[NaN]', 'orjson': b'[null]'}[name]
+    with pytest.raises(ValueError):
+        codec.loads(b'{"a": ')
+
+    previous = json_codec.set_codec(codec)
+    try:
+        assert json_codec.get_codec() is codec
+        assert json_codec.loads('{"a":1}') == {'a': 1}
+    finally:
+        json_codec.set_codec(previous)
+
+
+def test_compressed_requests(fake_http, monkeypatch):
+    sent = []
+    request = fake_http.request
+
+    def record(method, url, data=None, headers=None, **kwargs):
+        sent.append((headers or {}).get('Content-Encoding'))
+        return request(method, url, data=data, headers=headers, **kwargs)
+
+    monkeypatch.setattr(fake_http, 'request', record)
+    fake_http.add('POST', URL, lambda body, params, url: {'n': len(body['curies'])})
+    curies = [f'NCBIGene:{i}' for i in range(1000)]
+
+    # only large bodies of the hosts configured for it are compressed
+    assert http_client.post(URL, json={'curies': curies}).json() == {'n': 1000}
+    http_client.configure_host('service.example', compress_requests=True, compress_min_bytes=1024)
+    assert http_client.post(URL, json={'curies': curies[:10]}).json() == {'n': 10}
+    assert http_client.post(URL, json={'curies': curies}).json() == {'n': 1000}
+    assert sent == [None, None, 'gzip']
+
+    # a host that rejects compressed bodies gets the request again uncompressed, and no compressed requests after that
+    fake_http.add('POST', URL, lambda body, params, url: (415, {}) if sent[-1] == 'gzip' else {'n': len(body['curies'])})
+    assert http_client.post(URL, json={'curies': curies}).json() == {'n': 1000}
+    assert http_client.post(URL, json={'curies': curies}).json() == {'n': 1000}
+    assert sent[3:] == ['gzip', None, None]
+    assert not http_client.get_limiter(URL).compress_requests
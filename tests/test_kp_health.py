@@ -0,0 +1,128 @@
+import time
+
+from Translator_sdk import kp_health, translator_query
+
+APInames = {'Good KP': 'https://good.kp/query/', 'Bad KP': 'https://bad.kp/query/'}
+API_predicates = {'Good KP': ['biolink:treats'], 'Bad KP': ['biolink:treats']}
+
+
+def trapi_message(edges):
+    return {'message': {'knowledge_graph': {'nodes': {}, 'edges': edges}}}
+
+
+def test_breaker_opens_and_recovers():
+    health = kp_health.KPHealth(consecutive_failures=3, open_seconds=0.05)
+    for _ in range(3):
+        assert health.allow_request()
+        health.record(0.1, error=True, error_message='HTTP 503')
+    assert health.state == kp_health.OPEN
+    assert not health.allow_request()
+
+    # After open_seconds a single trial request is let through.
+    time.sleep(0.06)
+    assert health.allow_request()
+    assert health.state == kp_health.HALF_OPEN
+    assert not health.allow_request()
+
+    # A failed trial reopens the breaker, for twice as long.
+    health.record(0.1, error=True)
+    assert health.state == kp_health.OPEN
+    assert health.current_open_seconds == 0.1
+
+    time.sleep(0.11)
+    assert health.allow_request()
+    health.record(0.2)
+    assert health.state == kp_health.CLOSED
+    assert health.stats()['calls'] == 0
+
+
+def test_rolling_stats():
+    health = kp_health.KPHealth(window=4, min_calls=100)
+    for latency, error, empty in [(9.0, True, False), (1.0, False, False), (2.0, False, True), (3.0, False, False), (4.0, True, False)]:
+        health.record(latency, error=error, empty=empty)
+    stats = health.stats()
+    # The first call has rolled out of the window.
+    assert stats['calls'] == 4
+    assert stats['total_calls'] == 5
+    assert stats['error_rate'] == 0.25
+    assert stats['empty_rate'] == 0.25
+    assert stats['latency_p50'] == 2.0
+    assert stats['latency_p99'] == 4.0
+    assert stats['state'] == kp_health.CLOSED
+
+
+def test_parallel_api_query_skips_open_breakers(fake_http):
+    registry = kp_health.KPHealthRegistry(consecutive_failures=2, open_seconds=60)
+    fake_http.add('POST', 'https://good.kp/', trapi_message({'e1': {'subject': 'A', 'object': 'B', 'predicate': 'biolink:treats'}}))
+    fake_http.add('POST', 'https://bad.kp/', (500, {}))
+    query_json = translator_query.build_query_json(['A'], ['biolink:Disease'], ['biolink:treats'])
+
+    for _ in range(2):
+        result = translator_query.parallel_api_query(query_json, list(APInames), APInames, API_predicates, max_workers=2, health_registry=registry)
+        assert list(result) == ['e1']
+    assert fake_http.count('https://bad.kp/') == 2
+
+    # The bad KP's breaker is now open, so it is not queried any more.
+    translator_query.parallel_api_query(query_json, list(APInames), APInames, API_predicates, max_workers=2, health_registry=registry)
+    assert fake_http.count('https://bad.kp/') == 2
+    assert fake_http.count('https://good.kp/') == 3
+
+    stats = kp_health.get_kp_stats(registry)
+    assert list(stats['API']) == ['Bad KP', 'Good KP']
+    assert list(stats['state']) == [kp_health.OPEN, kp_health.CLOSED]
+    assert stats.set_index('API').loc['Bad KP', 'last_error'] == 'HTTP 500'
+
+
+def test_hedged_request_to_alternate_server(fake_http):
+    registry = kp_health.KPHealthRegistry()
+    for _ in range(10):
+        registry.record('Good KP', 0.05)
+    fake_http.add('POST', 'https://good.kp/', trapi_message({'slow': {'subject': 'A', 'object': 'B', 'predicate': 'biolink:treats'}}), delay=0.5)
+    fake_http.add('POST', 'https://good-ci.kp/', trapi_message({'fast': {'subject': 'A', 'object': 'B', 'predicate': 'biolink:treats'}}))
+    query_json = translator_query.build_query_json(['A'], ['biolink:Disease'], ['biolink:treats'])
+
+    policy = translator_query.HedgePolicy({'Good KP': ['https://good-ci.kp/query/']}, budget_ratio=0, budget_burst=1)
+    start = time.perf_counter()
+    result = translator_query.parallel_api_query(query_json, ['Good KP'], APInames, API_predicates, health_registry=registry, hedge_policy=policy)
+    assert time.perf_counter() - start < 0.4
+    assert list(result) == ['fast']
+    assert policy.stats()['Good KP'] == {'requests': 1, 'hedged': 1, 'hedge_won': 1, 'primary_won': 0, 'budget_exhausted': 0}
+
+    # The budget is used up, so the next query waits for the primary server.
+    result = translator_query.parallel_api_query(query_json, ['Good KP'], APInames, API_predicates, health_registry=registry, hedge_policy=policy)
+    assert list(result) == ['slow']
+    assert policy.stats()['Good KP']['budget_exhausted'] == 1
+    policy.close()
+
+
+def test_hedge_that_fails_fast_does_not_win(fake_http):
+    registry = kp_health.KPHealthRegistry()
+    for _ in range(10):
+        registry.record('Good KP', 0.05)
+    fake_http.add('POST', 'https://good.kp/', trapi_message({'slow': {'subject': 'A', 'object': 'B', 'predicate': 'biolink:treats'}}), delay=0.2)
+    fake_http.add('POST', 'https://good-ci.kp/', (400, {}))
+    query_json = translator_query.build_query_json(['A'], ['biolink:Disease'], ['biolink:treats'])
+
+    policy = translator_query.HedgePolicy({'Good KP': ['https://good-ci.kp/query/']}, budget_ratio=0, budget_burst=1)
+    result = translator_query.parallel_api_query(query_json, ['Good KP'], APInames, API_predicates, health_registry=registry, hedge_policy=policy)
+    assert list(result) == ['slow']
+    assert policy.stats()['Good KP']['hedge_won'] == 0
+    policy.close()
+
+
+def test_hedge_delay_starts_when_the_request_starts(fake_http):
+    registry = kp_health.KPHealthRegistry()
+    for _ in range(10):
+        registry.record('Good KP', 0.05)
+    fake_http.add('POST', 'https://good.kp/', trapi_message({'e1': {'subject': 'A', 'object': 'B', 'predicate': 'biolink:treats'}}))
+    query_json = translator_query.build_query_json(['A'], ['biolink:Disease'], ['biolink:treats'])
+
+    # The primary request waits in the busy pool for longer than the hedge delay, but is fast once it runs.
+    policy = translator_query.HedgePolicy({'Good KP': ['https://good-ci.kp/query/']}, budget_ratio=0, budget_burst=1, max_workers=1)
+    policy.executor.submit(time.sleep, 0.2)
+    result = translator_query.parallel_api_query(query_json, ['Good KP'], APInames, API_predicates, health_registry=registry, hedge_policy=policy)
+    assert list(result) == ['e1']
+    assert policy.stats()['Good KP']['hedged'] == 0
+    assert fake_http.count('https://good-ci.kp/') == 0
+    policy.close()
+
@@ -0,0 +1,80 @@
+import time
+
+import pandas as pd
+
+from Translator_sdk import translator_kpinfo
+
+SMARTAPI_DF = pd.DataFrame({
+    'id': ['https://smart-api.info/ui/a', 'https://smart-api.info/ui/b', 'https://smart-api.info/ui/c'],
+    'title': ['KP A', 'KP B', 'KP C'],
+    'prod_url': ['https://a.prod/query/', 'https://b.prod/query/', 'https://c.prod/query/'],
+    'ci_url': ['https://a.ci/query/', None, None],
+    'test_url': [None, 'https://b.test/query/', None],
+})
+
+
+def test_health_check_url():
+    assert translator_kpinfo.health_check_url('https://a.prod/query/') == 'https://a.prod/meta_knowledge_graph'
+    assert translator_kpinfo.health_check_url('https://a.prod/kg2c/query') == 'https://a.prod/kg2c/meta_knowledge_graph'
+    assert translator_kpinfo.health_check_url('https://ars.ci.transltr.io/ars/api/submit/') == 'https://ars.ci.transltr.io/ars/api/submit/'
+
+
+def test_probe_and_select_fastest(fake_http, tmp_path):
+    """
+    The fastest healthy server is picked per KP, unhealthy KPs are dropped, and the measurements are persisted.
+    """
+    fake_http.add('GET', 'https://a.prod/', {}, delay=0.2)
+    fake_http.add('GET', 'https://a.ci/', {})
+    fake_http.add('GET', 'https://b.prod/', (503, {}))
+    fake_http.add('GET', 'https://b.test/', {})
+    # KP C has no route at all, so it is unreachable.
+
+    output_path = str(tmp_path / 'probes.csv')
+    probe_df = translator_kpinfo.probe_kp_endpoints(SMARTAPI_DF, output_path=output_path)
+    assert len(probe_df) == 5
+    assert not probe_df[probe_df['url'] == 'https://b.prod/query/']['healthy'].iloc[0]
+    assert probe_df[probe_df['url'] == 'https://c.prod/query/']['error'].iloc[0] == 'ConnectionError'
+
+    APInames = translator_kpinfo.select_fastest_endpoints(probe_df)
+    assert APInames == {'KP A': 'https://a.ci/query/', 'KP B': 'https://b.test/query/'}
+
+    # Restricting the maturity policy to production leaves only KP A.
+    APInames = translator_kpinfo.select_fastest_endpoints(probe_df, allowed_maturities=('production',))
+    assert APInames == {'KP A': 'https://a.prod/query/'}
+    APInames = translator_kpinfo.select_fastest_endpoints(probe_df, allowed_maturities=('production',), max_latency=0.1)
+    assert APInames == {}
+
+    # A second run is appended to the same file, and only the latest run is used for selection.
+    translator_kpinfo.probe_kp_endpoints(SMARTAPI_DF, output_path=output_path)
+    history = pd.read_csv(output_path)
+    assert len(history) == 10
+    assert translator_kpinfo.select_fastest_endpoints(history)['KP B'] == 'https://b.test/query/'
+
+
+def test_probe_with_mixed_results(fake_http):
+    import requests
+
+    def answers(*outcomes, success_delay=0.0):
+        outcomes = iter(outcomes)
+
+        def handler(body, params, url):
+            outcome = next(outcomes)
+            if outcome is None:
+                raise requests.ConnectionError()
+            if outcome < 400:
+                time.sleep(success_delay)
+            return outcome, {}
+        return handler
+
+    fake_http.add('GET', 'https://a.prod/', answers(200, 200, None))
+    fake_http.add('GET', 'https://b.prod/', answers(None, 200, 200))
+    fake_http.add('GET', 'https://c.prod/', answers(503, 503, 200, success_delay=0.05))
+    df = SMARTAPI_DF.assign(ci_url=None, test_url=None)
+    probe_df = translator_kpinfo.probe_kp_endpoints(df, n_probes=3).set_index('url')
+
+    # A transient failure doesn't make a server unhealthy, and a recovered server has no error.
+    assert probe_df.loc['https://a.prod/query/', ['healthy', 'status_code', 'error']].tolist() == [True, 200, None]
+    assert probe_df.loc['https://b.prod/query/', ['healthy', 'status_code', 'error']].tolist() == [True, 200, None]
+    # Mostly failing servers are unhealthy, and failed answers don't count towards the latency.
+    assert not probe_df.loc['https://c.prod/query/', 'healthy']
+    assert probe_df.loc['https://c.prod/query/', 'latency'] >= 0.05
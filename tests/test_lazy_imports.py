@@ -0,0 +1,33 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+
+def _loaded_after(statement):
+    script = f'import sys\n{statement}\nimport json\nprint(json.dumps(sorted(sys.modules)))'
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    return set(json.loads(output))
+
+
+def test_lightweight_imports_skip_heavy_dependencies():
+    for module in ['Translator_sdk', 'Translator_sdk.name_resolver', 'Translator_sdk.node_normalizer',
+            'Translator_sdk.node_annotator']:
+        loaded = _loaded_after(f'import {module}')
+        assert not loaded & {'pandas', 'numpy', 'httpx', 'requests'}, module
+
+
+def test_submodules_load_on_attribute_access():
+    import Translator_sdk
+    assert 'translator_query' in dir(Translator_sdk)
+    assert Translator_sdk.translator_query.parallel_api_query
+    assert 'Translator_sdk.translator_query' in _loaded_after('import Translator_sdk; Translator_sdk.translator_query')
+    with pytest.raises(AttributeError):
+        Translator_sdk.not_a_module
+
+
+def test_star_import_exports_only_the_public_names():
+    loaded = _loaded_after('from Translator_sdk import *')
+    assert 'Translator_sdk.translator_query' in loaded
+    assert not loaded & {'pandas', 'Translator_sdk.pipeline', 'Translator_sdk.server'}
@@ -0,0 +1,60 @@
+import pytest
+
+from Translator_sdk import name_index, name_resolver
+from Translator_sdk.translator_node import TranslatorNode
+
+RECORDS = [
+    {'curie': 'MONDO:0018874', 'label': 'acute myeloid leukemia', 'synonyms': ['AML', 'acute myelogenous leukaemia'],
+        'types': ['biolink:Disease', 'biolink:NamedThing'], 'taxa': [], 'clique_identifier_count': 20},
+    {'curie': 'MONDO:0011996', 'label': 'chronic myeloid leukemia', 'synonyms': ['CML'],
+        'types': ['biolink:Disease'], 'clique_identifier_count': 10},
+    # from the NameRes `synonyms` endpoint or a dump
+    {'curie': 'NCBIGene:3458', 'preferred_name': 'IFNG', 'names': ['IFNG', 'interferon gamma'], 'types': ['Gene'],
+        'taxa': ['NCBITaxon:9606'], 'clique_identifier_count': 5},
+    TranslatorNode('NCBIGene:15978', 'Ifng', ['biolink:Gene'], synonyms=['interferon gamma'], taxa=['NCBITaxon:10090']),
+    {'curie': 'MONDO:0004979', 'label': 'asthma', 'types': ['biolink:Disease']},
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / 'names.idx')
+    name_index.build_index(RECORDS, path, top_k=2)
+    with name_index.NameIndex(path) as index:
+        yield index
+
+
+def curies(nodes):
+    return [node.curie for node in nodes]
+
+
+def test_complete(index):
+    assert len(index) == 5
+    assert curies(index.complete('Acute Myel')) == ['MONDO:0018874']
+    # matches start at any word, labels and popular nodes rank first
+    assert curies(index.complete('myeloid')) == ['MONDO:0018874', 'MONDO:0011996']
+    assert curies(index.complete('leuk', limit=1)) == ['MONDO:0018874']
+    assert curies(index.complete('leukaemia')) == ['MONDO:0018874']
+    assert index.complete('aml')[0] == TranslatorNode('MONDO:0018874', 'acute myeloid leukemia',
+        ['biolink:Disease', 'biolink:NamedThing'])
+    assert index.complete('') and index.complete('zebra') == []
+
+    # both match 'interferon' with a synonym, so the more popular node (more clique identifiers) ranks first
+    assert curies(index.complete('interferon')) == ['NCBIGene:3458', 'NCBIGene:15978']
+    assert curies(index.complete('i', biolink_types=['biolink:Gene'], only_taxa='NCBITaxon:10090')) == ['NCBIGene:15978']
+    # nodes without taxa pass taxon filters, like in NameRes
+    assert set(curies(index.complete('a', only_taxa=['NCBITaxon:9606']))) == {'MONDO:0018874', 'MONDO:0004979'}
+    assert curies(index.exact('myeloid leukemia')) == ['MONDO:0018874', 'MONDO:0011996']
+    assert index.exact('myeloid leuk') == []
+
+
+def test_fuzzy_and_fallback(index, fake_http):
+    assert curies(index.fuzzy('leukemia myelod acute', limit=1)) == ['MONDO:0018874']
+    assert curies(index.fuzzy('astma')) == ['MONDO:0004979']
+    assert index.fuzzy('gamma ray burst') == []
+
+    assert curies(index.lookup('asthmaa')) == ['MONDO:0004979']
+    fake_http.add('GET', name_resolver.URL + 'lookup', lambda body, params, url: [
+        {'curie': 'MONDO:0005148', 'label': 'type 2 diabetes mellitus', 'types': ['biolink:Disease']}])
+    assert curies(index.lookup('diabetes')) == ['MONDO:0005148']
+    assert index.lookup('diabetes', fallback=False) == []
@@ -0,0 +1,53 @@
+import time
+
+from Translator_sdk import name_resolver, negative_cache, node_normalizer
+
+
+def test_negative_cache(tmp_path):
+    path = tmp_path / 'negative.jsonl'
+    cache = negative_cache.NegativeCache(ttl=60, path=str(path))
+    cache.add('ns', [f'JUNK:{i}' for i in range(2000)])
+    cache.add('other', ['MESH:D014867'])
+    curies = ['MESH:D014867', 'JUNK:1', 'NCBIGene:1017', 'JUNK:1999']
+    assert cache.split('ns', curies) == (['MESH:D014867', 'NCBIGene:1017'], ['JUNK:1', 'JUNK:1999'])
+
+    # the Bloom filter lets few unknown items through to the exact store
+    cache.split('ns', [f'NCBIGene:{i}' for i in range(10000)])
+    assert cache.stats()['false_positives'] < 300
+
+    # the entries are loaded again by another process, until they expire
+    reloaded = negative_cache.NegativeCache(path=str(path))
+    assert reloaded.split('other', ['MESH:D014867']) == ([], ['MESH:D014867'])
+    short = negative_cache.NegativeCache(ttl=0.01, path=str(tmp_path / 'short.jsonl'))
+    short.add('ns', ['JUNK:1'])
+    time.sleep(0.02)
+    assert short.split('ns', ['JUNK:1']) == (['JUNK:1'], [])
+    assert negative_cache.NegativeCache(path=str(tmp_path / 'short.jsonl')).stats()['entries'] == 0
+    assert (tmp_path / 'short.jsonl').read_bytes() == b''
+
+
+def test_unknown_items_are_not_sent_again(fake_http):
+    sent = []
+
+    def normalize(body, params, url):
+        sent.append(body['curies'])
+        return {c: None if c.startswith('JUNK') else {'id': {'identifier': c, 'label': c.lower()}} for c in body['curies']}
+
+    fake_http.add('POST', node_normalizer.URL, normalize)
+    curies = ['MESH:D014867', 'JUNK:1', 'JUNK:2']
+    expected = {'MESH:D014867': 'mesh:d014867', 'JUNK:1': 'JUNK:1', 'JUNK:2': 'JUNK:2'}
+    assert node_normalizer.get_preferred_names(curies) == expected
+    assert node_normalizer.get_preferred_names(curies) == expected
+    assert node_normalizer.get_normalized_nodes(['JUNK:1', 'JUNK:2'], mode='post') == {'JUNK:1': None, 'JUNK:2': None}
+    assert sent == [curies, ['MESH:D014867']]
+
+    # negative results depend on the parameters
+    node_normalizer.get_normalized_nodes(['JUNK:1'], mode='post', conflate=False)
+    assert sent[-1] == ['JUNK:1']
+
+    fake_http.add('POST', name_resolver.URL + 'bulk-lookup', lambda body, params, url: {
+        s: [] if s == 'unknown' else [{'curie': f'NAME:{s}', 'label': s}] for s in body['strings']})
+    name_resolver.batch_lookup(['aspirin', 'unknown'])
+    assert name_resolver.batch_lookup(['unknown']) == {'unknown': None}
+    assert name_resolver.batch_lookup(['unknown'], return_top_response=False) == {'unknown': []}
+    assert fake_http.count(name_resolver.URL) == 1
@@ -0,0 +1,55 @@
+import csv
+
+import pytest
+
+from Translator_sdk import name_resolver, node_annotator, node_normalizer, pipeline
+
+
+def add_services(fake_http):
+    fake_http.add('POST', name_resolver.URL + 'bulk-lookup', lambda body, params, url: {
+        s: [] if s == 'unknown' else [{'curie': f'NAME:{s}', 'label': s.upper()}] for s in body['strings']}, delay=0.01)
+    fake_http.add('POST', node_normalizer.URL, lambda body, params, url: {
+        c: {'id': {'identifier': c.replace('NAME', 'NORM'), 'label': c}, 'type': ['biolink:Gene']} for c in body['curies']}, delay=0.01)
+    fake_http.add('POST', node_annotator.URL, lambda body, params, url: {
+        c: [{'symbol': c[5:], 'go': {'BP': [1, 2]}}] for c in body['ids']}, delay=0.01)
+
+
+@pytest.mark.parametrize('processes', [0, 1])
+def test_pipeline_file(fake_http, tmp_path, processes):
+    add_services(fake_http)
+    input_path = tmp_path / 'genes.tsv'
+    names = [f'gene{i}' for i in range(45)] + ['unknown']
+    input_path.write_text('id\tgene\n' + ''.join(f'{i}\t{name}\n' for i, name in enumerate(names)))
+
+    stats = pipeline.Pipeline(name_column='gene', batch_size=10, workers=2, queue_size=1, processes=processes,
+        annotation_fields=['symbol', 'go.BP']).run_file(str(input_path), str(tmp_path / 'out.tsv'))
+    assert stats['rows'] == 46
+    with open(tmp_path / 'out.tsv', newline='') as f:
+        rows = list(csv.DictReader(f, delimiter='\t'))
+    assert [row['gene'] for row in rows] == names
+    assert rows[3] == {'id': '3', 'gene': 'gene3', 'curie': 'NAME:gene3', 'label': 'GENE3', 'normalized_curie': 'NORM:gene3',
+        'normalized_label': 'NAME:gene3', 'category': 'biolink:Gene', 'symbol': 'gene3', 'go.BP': '[1,2]'}
+    assert rows[-1]['curie'] == rows[-1]['symbol'] == ''
+    assert fake_http.count(node_annotator.URL) == 5
+
+
+def test_pipeline_errors_and_early_stop(fake_http):
+    add_services(fake_http)
+    rows = [{'name': f'gene{i}'} for i in range(100)]
+    results = pipeline.Pipeline(batch_size=5, annotate=False).run(rows)
+    assert next(results)['normalized_curie'] == 'NORM:gene0'
+    results.close()
+
+    fake_http.add('POST', node_normalizer.URL, lambda *args: (400, {'detail': 'bad request'}))
+    with pytest.raises(Exception, match='400'):
+        list(pipeline.Pipeline(batch_size=5).run(rows))
+
+
+def test_pipeline_shares_the_sdk_caches(fake_http):
+    add_services(fake_http)
+    rows = [{'name': 'unknown'}, {'name': 'gene1'}]
+    assert [row['curie'] for row in pipeline.Pipeline(annotate=False).run(rows)] == [None, 'NAME:gene1']
+    assert fake_http.count(name_resolver.URL) == 1
+    # the name that matched nothing is not sent again by the SDK with the same arguments
+    assert name_resolver.batch_lookup(['unknown'], limit=1) == {'unknown': None}
+    assert fake_http.count(name_resolver.URL) == 1
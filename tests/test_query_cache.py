@@ -0,0 +1,65 @@
+import time
+
+from Translator_sdk import kp_health, query_cache, translator_query
+
+APInames = {'KP': 'https://kp.example/query/'}
+API_predicates = {'KP': ['biolink:treats', 'biolink:affects']}
+
+
+def test_query_hash_is_order_insensitive():
+    q1 = translator_query.build_query_json(['A', 'B'], ['biolink:Disease'], ['biolink:treats', 'biolink:affects'])
+    q2 = translator_query.build_query_json(['B', 'A', 'A'], ['biolink:Disease'], ['biolink:affects', 'biolink:treats'])
+    q3 = translator_query.build_query_json(['A', 'C'], ['biolink:Disease'], ['biolink:treats', 'biolink:affects'])
+    assert query_cache.query_hash(q1, 'KP') == query_cache.query_hash(q2, 'KP')
+    assert query_cache.query_hash(q1, 'KP') != query_cache.query_hash(q3, 'KP')
+    assert query_cache.query_hash(q1, 'KP') != query_cache.query_hash(q1, 'Other KP')
+
+
+def test_memory_eviction_and_ttl():
+    cache = query_cache.QueryCache(max_entries=2, ttl=0.1)
+    cache.set('a', {'x': 1})
+    cache.set('b', {'x': 2})
+    assert cache.get('a') == {'x': 1}
+    cache.set('c', {'x': 3})
+    # 'b' was the least recently used entry.
+    assert cache.get('b') is None
+    assert cache.get('a') == {'x': 1}
+    time.sleep(0.11)
+    assert cache.get('a') is None
+    stats = cache.stats()
+    assert stats['memory_hits'] == 2
+    assert stats['misses'] == 2
+    assert stats['evictions'] == 1
+
+
+def test_disk_tier(tmp_path):
+    cache = query_cache.QueryCache(cache_dir=str(tmp_path))
+    cache.set('k1', {'edges': {'e1': {}}})
+    cache.set('k2', {'edges': {}})
+
+    # A new cache on the same directory sees the entries.
+    cache = query_cache.QueryCache(cache_dir=str(tmp_path), max_disk_bytes=10_000)
+    assert cache.stats()['disk_entries'] == 2
+    assert cache.get('k1') == {'edges': {'e1': {}}}
+    assert cache.stats()['disk_hits'] == 1
+    assert cache.get('k1') == {'edges': {'e1': {}}}
+    assert cache.stats()['memory_hits'] == 1
+
+    small_cache = query_cache.QueryCache(cache_dir=str(tmp_path), max_disk_bytes=150)
+    small_cache.set('k3', {'edges': {'e3': {}}})
+    assert small_cache.stats()['disk_bytes'] <= 150
+    assert small_cache.get('k1') is None
+
+
+def test_query_KP_uses_cache(fake_http):
+    fake_http.add('POST', 'https://kp.example/', {'message': {'knowledge_graph': {'nodes': {}, 'edges': {'e1': {'subject': 'A', 'object': 'B'}}}}})
+    cache = query_cache.QueryCache()
+    registry = kp_health.KPHealthRegistry()
+    q1 = translator_query.build_query_json(['A', 'B'], ['biolink:Disease'], ['biolink:treats', 'biolink:affects'])
+    q2 = translator_query.build_query_json(['B', 'A'], ['biolink:Disease'], ['biolink:affects', 'biolink:treats'])
+
+    r1 = translator_query.parallel_api_query(q1, ['KP'], APInames, API_predicates, health_registry=registry, cache=cache)
+    r2 = translator_query.parallel_api_query(q2, ['KP'], APInames, API_predicates, health_registry=registry, cache=cache)
+    assert r1 == r2 == {'e1': {'subject': 'A', 'object': 'B'}}
+    assert fake_http.count('https://kp.example/') == 1
+    assert cache.stats()['memory_hits'] == 1
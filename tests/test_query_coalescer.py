@@ -0,0 +1,63 @@
+from Translator_sdk import kp_health, query_coalescer
+
+APInames = {'KP 1': 'https://kp1.example/query/', 'KP 2': 'https://kp2.example/query/'}
+API_predicates = {'KP 1': ['biolink:related_to'], 'KP 2': ['biolink:related_to']}
+
+
+def fake_kp(name):
+    def handler(body, params, url):
+        ids = body['message']['query_graph']['nodes']['n00']['ids']
+        edges = {f'{name}-{curie}': {'subject': curie, 'predicate': 'biolink:related_to', 'object': f'{name}:X'} for curie in ids}
+        # One edge is returned in the reverse direction.
+        edges[f'{name}-reverse'] = {'subject': f'{name}:Y', 'predicate': 'biolink:related_to', 'object': ids[0]}
+        return {'message': {'knowledge_graph': {'nodes': {}, 'edges': edges}}}
+    return handler
+
+
+def test_coalescer_batches_and_demultiplexes(fake_http):
+    fake_http.add('POST', 'https://kp1.example/', fake_kp('kp1'))
+    fake_http.add('POST', 'https://kp2.example/', fake_kp('kp2'))
+    genes = [f'G:{i}' for i in range(50)]
+
+    with query_coalescer.QueryCoalescer(list(APInames), APInames, API_predicates, window=0.2,
+            health_registry=kp_health.KPHealthRegistry()) as coalescer:
+        futures = [coalescer.submit(gene, ['biolink:Disease'], ['biolink:related_to']) for gene in genes]
+        # A query with different predicates goes into a separate batch.
+        other = coalescer.submit(['G:0', 'G:1'], ['biolink:Disease'], ['biolink:treats', 'biolink:related_to'])
+        results = [future.result(timeout=5) for future in futures]
+        other_result = other.result(timeout=5)
+        assert coalescer.stats()['batches'] == 2
+
+    # One request per KP per batch, instead of one per caller.
+    assert fake_http.count('https://kp1.example/') == 2
+    assert fake_http.count('https://kp2.example/') == 2
+    for gene, result in zip(genes, results):
+        assert {edge['subject'] for edge in result.values()} <= {gene, 'kp1:Y', 'kp2:Y'}
+        assert f'kp1-{gene}' in result and f'kp2-{gene}' in result
+    assert 'kp1-reverse' in results[0]
+    assert 'kp1-reverse' not in results[1]
+    assert sorted(other_result) == ['kp1-G:0', 'kp1-G:1', 'kp1-reverse', 'kp2-G:0', 'kp2-G:1', 'kp2-reverse']
+
+
+def test_coalescer_sends_full_batches_immediately(fake_http):
+    fake_http.add('POST', 'https://kp1.example/', fake_kp('kp1'))
+    coalescer = query_coalescer.QueryCoalescer(['KP 1'], APInames, API_predicates, window=60, max_batch_ids=3,
+            health_registry=kp_health.KPHealthRegistry())
+    futures = [coalescer.submit(f'G:{i}', ['biolink:Disease'], ['biolink:related_to']) for i in range(3)]
+    assert all('kp1-G:%d' % i in future.result(timeout=5) for i, future in enumerate(futures))
+    coalescer.close()
+
+
+def test_coalescer_delivers_edges_between_callers_to_both(fake_http):
+    def handler(body, params, url):
+        edges = {'A-B': {'subject': 'G:A', 'predicate': 'biolink:related_to', 'object': 'G:B'}}
+        return {'message': {'knowledge_graph': {'nodes': {}, 'edges': edges}}}
+    fake_http.add('POST', 'https://kp1.example/', handler)
+
+    with query_coalescer.QueryCoalescer(['KP 1'], APInames, API_predicates, window=0.2,
+            health_registry=kp_health.KPHealthRegistry()) as coalescer:
+        first = coalescer.submit('G:A', ['biolink:Gene'], ['biolink:related_to'])
+        second = coalescer.submit('G:B', ['biolink:Gene'], ['biolink:related_to'])
+        assert list(first.result(timeout=5)) == ['A-B']
+        assert list(second.result(timeout=5)) == ['A-B']
+        assert coalescer.stats()['batches'] == 1
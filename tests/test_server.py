@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from mock_servers import MockTranslatorServer, ServiceConfig  # noqa: E402
+
+from Translator_sdk import http_client, name_resolver, node_annotator, node_normalizer, server, translator_query  # noqa: E402
+
+
+def make_proxy(upstream, **kwargs):
+    return server.ProxyServer(port=0, nameres_url=upstream.service_url('nameres'),
+        nodenorm_url=upstream.service_url('nodenorm'), annotator_url=upstream.service_url('annotator'),
+        smartapi_url=upstream.service_url('smartapi'), kps={'KP 1': upstream.kp_url('KP 1')}, **kwargs)
+
+
+def test_sdk_through_proxy():
+    configs = {service: ServiceConfig(latency=0, null_rate=0.3) for service in ('nodenorm', 'annotator', 'kp')}
+    configs['nameres'] = ServiceConfig(latency=0)
+    curies = [f'G:{i}' for i in range(30)]
+    with MockTranslatorServer(configs) as upstream, make_proxy(upstream) as proxy:
+        http_client.reset()
+        with upstream.use():
+            direct = node_normalizer.get_normalized_nodes(curies, mode='post')
+            direct_names = name_resolver.batch_lookup(['asthma', 'flu'])
+        upstream.reset_stats()
+
+        with server.use(proxy.url):
+            for _ in range(2):
+                assert node_normalizer.get_normalized_nodes(curies, mode='post') == direct
+                assert node_normalizer.get_normalized_nodes(curies[:3]) == {curie: direct[curie] for curie in curies[:3]}
+                assert name_resolver.batch_lookup(['asthma', 'flu']) == direct_names
+                assert name_resolver.lookup('asthma') == direct_names['asthma']
+                assert set(node_annotator.lookup_curies(curies[:5])) == set(curies[:5])
+        assert name_resolver.URL == 'https://name-lookup.ci.transltr.io/'
+
+        query_json = translator_query.build_query_json(['G:1'], ['biolink:Disease'], ['biolink:related_to'])
+        API_url = server.kp_urls(proxy.url, {'KP 1': 'https://kp.example.org/query'})['KP 1']
+        for ids in (['G:1', 'G:2'], ['G:2', 'G:1']):
+            query_json['message']['query_graph']['nodes']['n00']['ids'] = ids
+            response = http_client.post(API_url, json=query_json)
+            assert response.status_code == 200 and response.json()['message']['knowledge_graph']['edges']
+
+        # every identifier and request was sent upstream once, and the second round was served from the cache
+        assert {service: stats['requests'] for service, stats in upstream.stats().items()} == \
+            {'nameres': 2, 'nodenorm': 1, 'annotator': 1, 'smartapi': 0, 'kp': 1}
+        assert proxy.stats()['services']['nodenorm'] == {'requests': 4, 'upstream_requests': 1}
+        assert http_client.get(proxy.url + 'nameres/status').json() == {'status': 'running'}
+        assert http_client.post(server.kp_urls(proxy.url, {'Other KP': ''})['Other KP'], json=query_json).status_code == 404
+
+
+def test_concurrent_clients_are_batched():
+    configs = {'nodenorm': ServiceConfig(latency=0.05), 'nameres': ServiceConfig(latency=0, error_rate=1, error_status=400)}
+    with MockTranslatorServer(configs) as upstream, make_proxy(upstream, window=0.1) as proxy, server.use(proxy.url):
+        http_client.reset()
+        batches = [[f'G:{i}', f'G:{i + 1}'] for i in range(16)]
+        with ThreadPoolExecutor(16) as executor:
+            results = list(executor.map(lambda batch: node_normalizer.get_normalized_nodes(batch, mode='post'), batches))
+        assert [sorted(result) for result in results] == [sorted(batch) for batch in batches]
+        assert upstream.stats()['nodenorm']['requests'] < 4
+
+        # errors are passed on to the clients and not cached
+        for _ in range(2):
+            response = http_client.post(proxy.url + 'nameres/bulk-lookup', json={'strings': ['asthma']})
+            assert response.status_code == 400
+        assert upstream.stats()['nameres']['requests'] == 2
+
+
+def test_client_and_upstream_errors():
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import threading
+
+    import requests
+
+    class NotJSON(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            self.send_response(200)
+            self.send_header('Content-Length', '8')
+            self.end_headers()
+            self.wfile.write(b'not json')
+
+    upstream = ThreadingHTTPServer(('127.0.0.1', 0), NotJSON)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    nodenorm_url = 'http://127.0.0.1:%d/' % upstream.server_address[1]
+    try:
+        with server.ProxyServer(port=0, nodenorm_url=nodenorm_url, kps={}) as proxy:
+            # plain requests, so that the 502 is not retried
+            url = proxy.url + 'nodenorm/get_normalized_nodes'
+            for data, headers in [(b'not json', {}), (b'[]', {}), (b'{"curie": ["G:1"]}', {}), (b'{"curies": [1]}', {}),
+                    (b'not gzip', {'Content-Encoding': 'gzip'})]:
+                response = requests.post(url, data=data, headers={'Content-Type': 'application/json', **headers})
+                assert response.status_code == 400, data
+            # an invalid upstream response is not the client's fault
+            assert requests.post(url, json={'curies': ['G:1']}).status_code == 502
+    finally:
+        upstream.shutdown()
+        upstream.server_close()
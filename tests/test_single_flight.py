@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import pytest
+
+from Translator_sdk import async_client, name_resolver, node_normalizer
+from Translator_sdk.single_flight import SingleFlight
+
+
+def test_batch_keys_in_flight_are_not_resent(fake_http):
+    sent = []
+
+    def handler(body, params, url):
+        sent.extend(body['curies'])
+        return {curie: {'id': {'identifier': curie.lower()}} for curie in body['curies']}
+
+    fake_http.add('POST', node_normalizer.URL + 'get_normalized_nodes', handler, delay=0.2)
+    queries = [['A', 'B', 'C'], ['B', 'C', 'D'], ['A', 'D'], ['C']]
+    results = [None] * len(queries)
+
+    def run(i):
+        results[i] = node_normalizer.get_normalized_nodes(queries[i], mode='post')
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(queries))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(sent) == ['A', 'B', 'C', 'D']
+    for query, result in zip(queries, results):
+        assert list(result) == query
+        assert [node.curie for node in result.values()] == [curie.lower() for curie in query]
+
+
+def test_async_lookups_share_one_request(fake_async_http):
+    fake_async_http.add('GET', name_resolver.URL + 'lookup', [{'curie': 'MONDO:0018874', 'label': 'AML'}], delay=0.1)
+
+    async def main():
+        try:
+            return await asyncio.gather(*[name_resolver.alookup('AML') for _ in range(20)],
+                    asyncio.to_thread(name_resolver.lookup, 'AML'))
+        finally:
+            await async_client.aclose()
+
+    nodes = asyncio.run(main())
+    assert fake_async_http.count(name_resolver.URL) == 1
+    assert all(node.curie == 'MONDO:0018874' for node in nodes)
+
+
+def test_errors_are_shared():
+    flights = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def fail(keys):
+        started.set()
+        threading.Event().wait(0.1)
+        raise LookupError('no match')
+
+    def follower():
+        started.wait()
+        try:
+            flights.do_batch('ns', ['x'], lambda keys: {'x': 1})
+        except LookupError as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    with pytest.raises(LookupError):
+        flights.do_batch('ns', ['x', 'y'], fail)
+    thread.join()
+    assert len(errors) == 1
+    assert flights.stats() == {'sent': 2, 'shared': 1, 'in_flight': 0}
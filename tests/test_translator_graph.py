@@ -0,0 +1,35 @@
+from Translator_sdk.translator_graph import TranslatorGraph
+
+EDGES = {
+    'e0': {'subject': 'A', 'predicate': 'biolink:treats', 'object': 'B'},
+    'e1': {'subject': 'A', 'predicate': 'biolink:affects', 'object': 'C'},
+    'e2': {'subject': 'B', 'predicate': 'biolink:treats', 'object': 'D'},
+    'e3': {'subject': 'E', 'predicate': 'biolink:treats', 'object': 'A'},
+    'e4': {'subject': 'A', 'predicate': 'biolink:affects', 'object': 'B'},
+}
+
+
+def test_neighbors_and_degree():
+    graph = TranslatorGraph(EDGES)
+    assert graph.n_nodes == 5 and graph.n_edges == 5
+    assert sorted(graph.neighbors('A', direction='out')) == ['B', 'C']
+    assert graph.neighbors('A', direction='in') == ['E']
+    assert sorted(graph.neighbors('A', predicates='biolink:treats')) == ['B', 'E']
+    assert graph.neighbors('unknown') == []
+    assert graph.degree('A') == 4
+    assert graph.degree('A', direction='out', predicates=['biolink:affects']) == 2
+    assert graph.degrees('in') == {'A': 1, 'B': 2, 'C': 1, 'D': 1, 'E': 0}
+
+
+def test_k_hop_and_networkx_export():
+    graph = TranslatorGraph(EDGES)
+    assert graph.k_hop('A', 0) == ['A']
+    assert sorted(graph.k_hop('A', 1, direction='out')) == ['A', 'B', 'C']
+    assert sorted(graph.k_hop(['A'], 2, direction='out', predicates='biolink:treats')) == ['A', 'B', 'D']
+    assert sorted(graph.k_hop('D', 3, direction='in')) == ['A', 'B', 'D', 'E']
+    assert graph.edges_between(['A', 'B']) == ['e0', 'e4']
+    nx_graph = graph.to_networkx(['A', 'B', 'C'])
+    assert sorted(nx_graph.nodes) == ['A', 'B', 'C']
+    assert sorted(key for _, _, key in nx_graph.edges(keys=True)) == ['e0', 'e1', 'e4']
+    assert nx_graph.edges['A', 'C', 'e1']['predicate'] == 'biolink:affects'
+    assert graph.to_networkx().number_of_edges() == 5
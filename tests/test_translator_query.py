@@ -0,0 +1,199 @@
+from Translator_sdk import http_client, kp_health, translator_query
+
+APInames = {'KP': 'https://kp.example/query/'}
+API_predicates = {'KP': ['biolink:related_to']}
+
+
+def fake_kp(max_ids=None):
+    """A KP handler returning one edge per subject ID, which fails with HTTP 413 on more than max_ids IDs."""
+    def handler(body, params, url):
+        ids = body['message']['query_graph']['nodes']['n00']['ids']
+        if max_ids is not None and len(ids) > max_ids:
+            return 413, {}
+        edges = {'e0': {'subject': ids[0], 'predicate': 'biolink:related_to', 'object': 'X'}}
+        for curie in ids[1:]:
+            edges[f'e_{curie}'] = {'subject': curie, 'predicate': 'biolink:related_to', 'object': 'X'}
+        return {'message': {'knowledge_graph': {'nodes': {}, 'edges': edges}}}
+    return handler
+
+
+def test_shard_query_json():
+    query_json = translator_query.build_query_json([f'G:{i}' for i in range(10)], ['biolink:Disease'], ['biolink:related_to'])
+    shards = translator_query.shard_query_json(query_json, 4)
+    assert [s['message']['query_graph']['nodes']['n00']['ids'] for s in shards] == [
+        ['G:0', 'G:1', 'G:2', 'G:3'], ['G:4', 'G:5', 'G:6', 'G:7'], ['G:8', 'G:9']]
+    # The rest of the query is shared, and the original query is untouched.
+    assert all(s['message']['query_graph']['edges'] is query_json['message']['query_graph']['edges'] for s in shards)
+    assert len(query_json['message']['query_graph']['nodes']['n00']['ids']) == 10
+    assert translator_query.shard_query_json(query_json, 10) == [query_json]
+
+
+def test_parallel_api_query_shards_and_merges(fake_http):
+    fake_http.add('POST', 'https://kp.example/', fake_kp())
+    ids = [f'G:{i}' for i in range(10)]
+    query_json = translator_query.build_query_json(ids, ['biolink:Disease'], ['biolink:related_to'])
+    result = translator_query.parallel_api_query(query_json, ['KP'], APInames, API_predicates,
+            shard_size=3, health_registry=kp_health.KPHealthRegistry())
+    assert fake_http.count('https://kp.example/') == 4
+    # Every shard used the edge id 'e0', and none of them were lost in the merge.
+    assert sorted(edge['subject'] for edge in result.values()) == sorted(ids)
+
+
+def test_merge_messages_keeps_conflicting_edges():
+    def message(edges):
+        return {'knowledge_graph': {'nodes': {}, 'edges': edges}}
+
+    edge = lambda subject: {'subject': subject, 'predicate': 'biolink:related_to', 'object': 'X'}
+    merged = translator_query.merge_messages([
+        message({'e': edge('A'), 'e_1': edge('B')}), message({'e': edge('C')}), message({'e': edge('A'), 'e_1': edge('D')})])
+    # The suffixed ids that are already taken are skipped, and identical edges are only kept once.
+    assert merged['knowledge_graph']['edges'] == {'e': edge('A'), 'e_1': edge('B'), 'e_2': edge('C'), 'e_1_2': edge('D')}
+
+
+def test_shard_size_is_learned(fake_http):
+    fake_http.add('POST', 'https://kp.example/', fake_kp(max_ids=3))
+    ids = [f'G:{i}' for i in range(12)]
+    query_json = translator_query.build_query_json(ids, ['biolink:Disease'], ['biolink:related_to'])
+    registry = kp_health.KPHealthRegistry(consecutive_failures=100, failure_threshold=1.0)
+
+    result = translator_query.query_KP_sharded('KP', query_json, APInames, API_predicates, min_shard_size=1, health_registry=registry)
+    assert sorted(edge['subject'] for edge in result['knowledge_graph']['edges'].values()) == sorted(ids)
+    assert registry.shard_sizes.learned() == {'KP': 3}
+
+    # The next query uses the learned size straight away.
+    calls = fake_http.count('https://kp.example/')
+    translator_query.query_KP_sharded('KP', query_json, APInames, API_predicates, min_shard_size=1, health_registry=registry)
+    assert fake_http.count('https://kp.example/') - calls == 4
+
+    # After enough successful shards the size is raised again; a failure brings it back to the size that worked.
+    assert registry.shard_sizes.learned() == {'KP': 4}
+    translator_query.query_KP_sharded('KP', query_json, APInames, API_predicates, min_shard_size=1, health_registry=registry)
+    assert registry.shard_sizes.learned() == {'KP': 3}
+
+
+def test_transient_failures_are_not_learned(fake_http):
+    failed = []
+
+    def flaky(body, params, url):
+        # every query fails once, on its first shard
+        if not failed:
+            failed.append(True)
+            return 500, {}
+        return fake_kp()(body, params, url)
+
+    fake_http.add('POST', 'https://kp.example/', flaky)
+    http_client.configure_host('kp.example', retry=http_client.RetryPolicy(max_retries=0))
+    registry = kp_health.KPHealthRegistry(consecutive_failures=100, failure_threshold=1.0)
+    query_json = translator_query.build_query_json([f'G:{i}' for i in range(40)], ['biolink:Disease'], ['biolink:related_to'])
+    for _ in range(3):
+        failed.clear()
+        translator_query.query_KP_sharded('KP', query_json, APInames, API_predicates, shard_size=10, health_registry=registry)
+    # a server error that goes away once the shard is split, but doesn't happen again at that size, is transient
+    assert registry.shard_sizes.learned() == {}
+
+    fake_http.add('POST', 'https://kp.example/', (503, {}))
+    translator_query.query_KP_sharded('KP', query_json, APInames, API_predicates, shard_size=10, min_shard_size=1,
+            health_registry=registry)
+    # failures that splitting doesn't fix say nothing about the size
+    assert registry.shard_sizes.learned() == {}
+
+
+def test_build_multihop_query_and_optimize():
+    query_json = translator_query.build_multihop_query_json(['G:1'], [['biolink:Gene'], ['biolink:Disease']],
+            [['biolink:related_to', 'biolink:interacts_with'], ['biolink:related_to', 'biolink:treats']])
+    query_graph = query_json['message']['query_graph']
+    assert query_graph['edges']['e01'] == {'subject': 'n01', 'object': 'n02', 'predicates': ['biolink:related_to', 'biolink:treats']}
+    assert query_graph['nodes']['n02'] == {'categories': ['biolink:Disease']}
+
+    optimized = translator_query.optimize_query_json(query_json, 'KP', API_predicates)
+    assert [edge['predicates'] for edge in optimized['message']['query_graph']['edges'].values()] == [['biolink:related_to']] * 2
+
+
+def test_pipelined_multihop_query(fake_http):
+    from Translator_sdk import multihop_query
+
+    def handler(body, params, url):
+        # Every node X has edges to X.a, X.b and X.c.
+        ids = body['message']['query_graph']['nodes']['n00']['ids']
+        edges = {f'{curie}->{suffix}': {'subject': curie, 'predicate': 'biolink:related_to', 'object': f'{curie}.{suffix}'}
+                 for curie in ids for suffix in 'abc'}
+        return {'message': {'knowledge_graph': {'nodes': {}, 'edges': edges}}}
+
+    fake_http.add('POST', 'https://kp.example/', handler)
+    query_json = translator_query.build_multihop_query_json(['G'], [['biolink:Gene']] * 3, [['biolink:related_to']] * 3)
+    result = multihop_query.pipelined_multihop_query(query_json, ['KP'], APInames, API_predicates, batch_size=2,
+            health_registry=kp_health.KPHealthRegistry())
+    assert [len(hop_edges) for hop_edges in result.edges] == [3, 9, 27]
+    assert result.node_ids[1] == ['G.a', 'G.b', 'G.c']
+    assert len(result.node_ids[3]) == 27
+    # One query for hop 1, two batches for hop 2 and five batches for hop 3.
+    assert result.requests == 8
+    assert result.truncated == [False] * 4
+
+    result = multihop_query.pipelined_multihop_query(query_json, ['KP'], APInames, API_predicates,
+            max_intermediate_nodes=2, health_registry=kp_health.KPHealthRegistry())
+    assert result.node_ids[1] == ['G.a', 'G.b']
+    assert len(result.node_ids[2]) == 2
+    assert result.truncated == [False, True, True, False]
+    assert len(result.edges[2]) == 6
+
+
+def test_multihop_query_keeps_conflicting_edges(fake_http):
+    from Translator_sdk import multihop_query
+
+    def handler(body, params, url):
+        # Every KP answer uses the same edge ids.
+        curie = body['message']['query_graph']['nodes']['n00']['ids'][0]
+        return {'message': {'knowledge_graph': {'nodes': {}, 'edges': {
+            'e': {'subject': curie, 'predicate': 'biolink:related_to', 'object': f'{curie}.a'},
+            'e_2': {'subject': curie, 'predicate': 'biolink:related_to', 'object': f'{curie}.b'}}}}}
+
+    fake_http.add('POST', 'https://kp.example/', handler)
+    query_json = translator_query.build_multihop_query_json(['G'], [['biolink:Gene']] * 2, [['biolink:related_to']] * 2)
+    result = multihop_query.pipelined_multihop_query(query_json, ['KP'], APInames, API_predicates, batch_size=1,
+            health_registry=kp_health.KPHealthRegistry())
+    assert len(result.edges[1]) == 4
+    assert sorted(edge['object'] for edge in result.edges[1].values()) == ['G.a.a', 'G.a.b', 'G.b.a', 'G.b.b']
+
+
+def test_multihop_query_without_predicates(fake_http):
+    from Translator_sdk import multihop_query
+
+    def handler(body, params, url):
+        assert body['message']['query_graph']['edges']['e00']['predicates'] == []
+        curie = body['message']['query_graph']['nodes']['n00']['ids'][0]
+        return {'message': {'knowledge_graph': {'nodes': {}, 'edges': {
+            f'{curie}->a': {'subject': curie, 'predicate': 'biolink:related_to', 'object': f'{curie}.a'}}}}}
+
+    fake_http.add('POST', 'https://kp.example/', handler)
+    query_json = translator_query.build_multihop_query_json(['G'], [['biolink:Gene']] * 2, [['biolink:related_to']] * 2)
+    for edge in query_json['message']['query_graph']['edges'].values():
+        del edge['predicates']
+    result = multihop_query.pipelined_multihop_query(query_json, ['KP'], APInames, API_predicates,
+            health_registry=kp_health.KPHealthRegistry())
+    assert result.node_ids[2] == ['G.a.a']
+
+def test_parallel_query_normalizes_edges(fake_http):
+    edges_by_kp = {
+        'https://kp1.example/query/': {'a': {'subject': 'HGNC:5', 'predicate': 'biolink:treats', 'object': 'MESH:D1',
+            'sources': [{'resource_id': 'infores:kp1', 'resource_role': 'primary_knowledge_source'}]}},
+        'https://kp2.example/query/': {'b': {'subject': 'NCBIGene:1', 'predicate': 'biolink:treats', 'object': 'MONDO:1',
+            'sources': [{'resource_id': 'infores:kp2', 'resource_role': 'primary_knowledge_source'}]},
+            'c': {'subject': 'NCBIGene:1', 'predicate': 'biolink:affects', 'object': 'MONDO:1'}},
+    }
+    for url, edges in edges_by_kp.items():
+        fake_http.add('POST', url, {'message': {'knowledge_graph': {'nodes': {}, 'edges': edges}}})
+    canonical = {'HGNC:5': 'NCBIGene:1', 'NCBIGene:1': 'NCBIGene:1', 'MESH:D1': 'MONDO:1', 'MONDO:1': 'MONDO:1'}
+    fake_http.add('POST', 'https://nodenorm.ci.transltr.io/get_normalized_nodes',
+            lambda body, params, url: {curie: {'id': {'identifier': canonical[curie]}} for curie in body['curies']})
+    APInames = {'KP1': 'https://kp1.example/query/', 'KP2': 'https://kp2.example/query/'}
+    API_predicates = {'KP1': ['biolink:treats'], 'KP2': ['biolink:treats']}
+    query_json = translator_query.build_query_json(['NCBIGene:1'], ['biolink:Disease'], ['biolink:treats'])
+    result = translator_query.parallel_api_query(query_json, ['KP1', 'KP2'], APInames, API_predicates, max_workers=2,
+            health_registry=kp_health.KPHealthRegistry(), normalize=True)
+    assert len(result) == 2
+    assert fake_http.count('https://nodenorm.ci.transltr.io/') == 1
+    treats = [edge for edge in result.values() if edge['predicate'] == 'biolink:treats']
+    assert len(treats) == 1
+    assert (treats[0]['subject'], treats[0]['object']) == ('NCBIGene:1', 'MONDO:1')
+    assert sorted(source['resource_id'] for source in treats[0]['sources']) == ['infores:kp1', 'infores:kp2']
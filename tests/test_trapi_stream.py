@@ -0,0 +1,77 @@
+import io
+import json
+
+import pytest
+
+from Translator_sdk import kp_health, trapi_stream, translator_query
+
+APInames = {'KP 1': 'https://kp1.example/query/', 'KP 2': 'https://kp2.example/query/'}
+API_predicates = {'KP 1': ['biolink:related_to'], 'KP 2': ['biolink:related_to']}
+
+
+def trapi_message(name, n_edges):
+    edges = {f'{name}-{i}': {'subject': f'G:{i}', 'predicate': 'biolink:related_to', 'object': f'D:{i}',
+             'attributes': [{'attribute_type_id': 'biolink:score', 'value': i / 2}]} for i in range(n_edges)}
+    nodes = {f'G:{i}': {'name': f'gene {i}'} for i in range(n_edges)}
+    return {'message': {'query_graph': {}, 'knowledge_graph': {'nodes': nodes, 'edges': edges},
+                        'results': [{'node_bindings': {}} for _ in range(n_edges)]}}
+
+
+@pytest.mark.parametrize('use_ijson', [True, False])
+def test_iter_knowledge_graph(monkeypatch, use_ijson):
+    if not use_ijson:
+        monkeypatch.setattr(trapi_stream, 'ijson', None)
+    elif trapi_stream.ijson is None:
+        pytest.skip('ijson is not installed')
+    message = trapi_message('kp', 3)
+    stream = io.BytesIO(json.dumps(message).encode('utf-8'))
+    items = list(trapi_stream.iter_knowledge_graph(stream, include_nodes=True))
+    edges = {key: value for section, key, value in items if section == 'edges'}
+    nodes = {key: value for section, key, value in items if section == 'nodes'}
+    assert edges == message['message']['knowledge_graph']['edges']
+    assert nodes == message['message']['knowledge_graph']['nodes']
+
+    stream = io.BytesIO(json.dumps(message).encode('utf-8'))
+    assert {section for section, _, _ in trapi_stream.iter_knowledge_graph(stream)} == {'edges'}
+
+
+def test_edge_store_spills_to_disk():
+    budget = trapi_stream.MemoryBudget(limit=1000)
+    store = trapi_stream.EdgeStore(budget)
+    expected = {f'e{i}': {'subject': f'G:{i}', 'object': 'X'} for i in range(100)}
+    for key, value in expected.items():
+        store[key] = value
+    assert store.spilled
+    assert budget.used <= 1000
+    assert len(store) == 100
+    assert store.to_dict() == expected
+    assert store['e0'] == expected['e0']
+    assert 'e99' in store and 'nope' not in store
+
+    # Overwriting and deleting spilled items.
+    store['e0'] = {'subject': 'new'}
+    del store['e1']
+    assert len(store) == 99
+    assert store['e0'] == {'subject': 'new'}
+
+    store.close()
+    assert budget.used == 0
+    assert len(store) == 0
+
+
+def test_parallel_api_query_with_memory_budget(fake_http):
+    fake_http.add('POST', 'https://kp1.example/', trapi_message('kp1', 200))
+    fake_http.add('POST', 'https://kp2.example/', trapi_message('kp2', 100))
+    query_json = translator_query.build_query_json(['G:1'], ['biolink:Disease'], ['biolink:related_to'])
+    budget = trapi_stream.MemoryBudget(limit=5000)
+
+    result = translator_query.parallel_api_query(query_json, list(APInames), APInames, API_predicates, max_workers=2,
+            health_registry=kp_health.KPHealthRegistry(), memory_budget=budget)
+    assert isinstance(result, trapi_stream.EdgeStore)
+    assert result.spilled
+    assert budget.peak < 10_000
+    expected = translator_query.parallel_api_query(query_json, list(APInames), APInames, API_predicates,
+            health_registry=kp_health.KPHealthRegistry())
+    assert result.to_dict() == expected
+    result.close()
+    assert budget.used == 0